@@ -3,12 +3,23 @@ from .endpoints import (
     EndpointListResource,
     EndpointPublicResultsResource,
 )
-from .streams import StreamListResource, StreamResource
+from .streams import (
+    StreamDeadLettersReplayResource,
+    StreamDeadLettersResource,
+    StreamListResource,
+    StreamMetricsResource,
+    StreamProvisionResource,
+    StreamResource,
+)
 
 __all__ = [
     "EndpointDetailsResource",
     "EndpointListResource",
     "EndpointPublicResultsResource",
+    "StreamDeadLettersReplayResource",
+    "StreamDeadLettersResource",
     "StreamListResource",
+    "StreamMetricsResource",
+    "StreamProvisionResource",
     "StreamResource",
 ]
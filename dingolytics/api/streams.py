@@ -1,7 +1,21 @@
+import logging
+
 from flask import request
 from flask_restful import abort
+from funcy import project
+from pydantic import ValidationError
 from sqlalchemy.exc import IntegrityError
 
+from dingolytics.ingest import (
+    get_stream_dead_letter_stats,
+    get_stream_metrics,
+    schedule_vector_config_sync,
+)
+from dingolytics.ingest.provisioning import STREAM_PENDING, STREAM_READY
+from dingolytics.ingest.vector import (
+    VECTOR_DEFAULT_INGEST_VOLUME,
+    get_ingest_tuning,
+)
 from dingolytics.presets import default_presets
 from redash import models
 from redash.handlers.base import (
@@ -9,13 +23,33 @@ from redash.handlers.base import (
     get_object_or_404,
     require_fields
 )
+from redash.utils import utcnow
 from redash.permissions import (
+    not_view_only,
     require_access,
     require_admin,
     require_permission,
     view_only,
 )
 
+logger = logging.getLogger(__name__)
+
+
+def validate_table_options(db_type: str, preset: str, options: dict) -> None:
+    try:
+        default_presets().get_table_options(db_type, preset, options)
+    except (TypeError, ValueError) as exc:  # incl. `ValidationError`
+        abort(400, message=f"Invalid table options: {exc}")
+
+
+def validate_ingest_tuning(volume: str, options: dict) -> None:
+    try:
+        get_ingest_tuning(volume, options)
+    except KeyError:
+        abort(400, message=f"Unsupported ingest volume: {volume}")
+    except (TypeError, ValidationError) as exc:
+        abort(400, message=f"Invalid ingest options: {exc}")
+
 
 class StreamResource(BaseResource):
     @require_permission("list_data_sources")
@@ -28,6 +62,134 @@ class StreamResource(BaseResource):
             "object_id": stream.id,
             "object_type": "stream",
         })
+        metrics = get_stream_metrics(stream.id, limit=1)
+        return dict(stream.to_dict(), metrics=metrics[0] if metrics else None)
+
+    @require_admin
+    def post(self, stream_id):
+        stream = get_object_or_404(models.Stream.get_by_id, stream_id)
+        require_access(stream.data_source, self.current_user, not_view_only)
+        req = request.get_json(True)
+
+        updates = project(
+            req, ("name", "description", "ingest_volume", "ingest_options")
+        )
+        validate_ingest_tuning(
+            updates.get("ingest_volume", stream.ingest_volume),
+            updates.get("ingest_options", stream.ingest_options),
+        )
+        self.update_model(stream, updates)
+        models.db.session.commit()
+
+        if "ingest_volume" in updates or "ingest_options" in updates:
+            schedule_vector_config_sync()
+
+        self.record_event({
+            "action": "edit",
+            "object_id": stream.id,
+            "object_type": "stream",
+        })
+
+        return stream.to_dict()
+
+
+class StreamMetricsResource(BaseResource):
+    @require_permission("list_data_sources")
+    def get(self, stream_id):
+        """
+        Get ingestion metrics samples of the stream, the newest first.
+
+        Accepts optional `limit` for the number of samples.
+        """
+        stream = get_object_or_404(models.Stream.get_by_id, stream_id)
+        require_access(stream.data_source, self.current_user, view_only)
+        limit = request.args.get("limit", type=int)
+        if limit is not None and limit < 1:
+            abort(400, message="Limit must be a positive integer")
+        return {"metrics": get_stream_metrics(stream.id, limit=limit)}
+
+
+class StreamDeadLettersResource(BaseResource):
+    @require_permission("list_data_sources")
+    def get(self, stream_id):
+        """Count rejected events of the stream by source and reason."""
+        stream = get_object_or_404(models.Stream.get_by_id, stream_id)
+        require_access(stream.data_source, self.current_user, view_only)
+        try:
+            stats = get_stream_dead_letter_stats(stream)
+        except Exception:
+            logger.exception("Failed to read dead letters: %s", stream.id)
+            abort(502, message="Failed to read dead letters from the data source.")
+        return stats
+
+
+class StreamDeadLettersReplayResource(BaseResource):
+    @require_admin
+    def post(self, stream_id):
+        """
+        Replay dead letters of the stream in background.
+
+        Accepts optional `batch_size`, `max_rows` and `rows_per_second`
+        to control the replay throughput. Returns a job to poll with
+        `/api/jobs/<job_id>`.
+        """
+        from dingolytics.tasks.replay_dead_letters import (
+            replay_dead_letters_task,
+        )
+
+        stream = get_object_or_404(models.Stream.get_by_id, stream_id)
+        require_access(stream.data_source, self.current_user, not_view_only)
+        req = request.get_json(force=True, silent=True) or {}
+
+        options = project(req, ("batch_size", "max_rows", "rows_per_second"))
+        for key, value in options.items():
+            if value is not None and (
+                not isinstance(value, (int, float)) or value <= 0
+            ):
+                abort(400, message=f"Invalid {key}: {value}")
+        task = replay_dead_letters_task(stream.id, **options)
+
+        self.record_event({
+            "action": "replay_dead_letters",
+            "object_id": stream.id,
+            "object_type": "stream",
+        })
+
+        return {
+            "job": {
+                "id": f"huey:{task.id}",
+                "updated_at": utcnow(),
+                "status": 1,  # QUEUED
+                "error": None,
+                "result": None,
+            }
+        }
+
+
+class StreamProvisionResource(BaseResource):
+    @require_admin
+    def post(self, stream_id):
+        """
+        Retry provisioning of the stream tables, e.g. after a failure.
+
+        Provisioning is idempotent, ready streams are returned as is.
+        """
+        from dingolytics.tasks.provision_stream import provision_stream_task
+
+        stream = get_object_or_404(models.Stream.get_by_id, stream_id)
+        require_access(stream.data_source, self.current_user, not_view_only)
+        if stream.provisioning_state != STREAM_READY:
+            stream.provisioning_state = STREAM_PENDING
+            stream.provisioning_error = None
+            models.db.session.commit()
+            provision_stream_task(stream.id)
+
+            self.record_event({
+                "action": "provision",
+                "object_id": stream.id,
+                "object_type": "stream",
+            })
+
         return stream.to_dict()
 
 
@@ -81,6 +243,12 @@ class StreamListResource(BaseResource):
             abort(400, message=f"Unsupported stream preset: {db_table_preset}")
         db_table_query = presets[db_type][db_table_preset]
 
+        ingest_volume = req.get("ingest_volume", VECTOR_DEFAULT_INGEST_VOLUME)
+        ingest_options = req.get("ingest_options") or {}
+        validate_ingest_tuning(ingest_volume, ingest_options)
+        db_table_options = req.get("db_table_options") or {}
+        validate_table_options(db_type, db_table_preset, db_table_options)
+
         try:
             stream = models.Stream(
                 data_source=data_source,
@@ -89,6 +257,9 @@ class StreamListResource(BaseResource):
                 db_table=req.get("db_table", ""),
                 db_table_preset=db_table_preset,
                 db_table_query=db_table_query,
+                db_table_options=db_table_options,
+                ingest_volume=ingest_volume,
+                ingest_options=ingest_options,
             )
             models.db.session.commit()
         except IntegrityError as exc:
@@ -0,0 +1,271 @@
+"""
+Audit log pipeline.
+
+`record_event` appends events to a Redis stream, which is the only work
+done on the request path. The flush loop, see `tasks.auditlog_events`,
+reads events in batches, inserts them with a single `executemany` per
+batch and schedules delivery of the batch to every webhook. Optionally,
+events are inserted into ClickHouse as well, see `clickhouse`.
+"""
+import logging
+from functools import lru_cache
+from typing import Callable, Optional
+
+from redis.exceptions import RedisError
+from sqlalchemy.exc import DataError, IntegrityError
+
+from .clickhouse import AUDIT_EVENTS_PRESET, AuditEventsStore
+from .recent import RECENT_ACTIONS, RecentActivity
+from .stream import (
+    AUDITLOG_CLICKHOUSE_GROUP,
+    AUDITLOG_CONSUMER,
+    AUDITLOG_GROUP,
+    AuditLogStream,
+)
+
+__all__ = [
+    "AUDITLOG_FLUSH_LOOP_KEY",
+    "AUDIT_EVENTS_PRESET",
+    "AuditEventsStore",
+    "AuditLogStream",
+    "RECENT_ACTIONS",
+    "RecentActivity",
+    "backfill_recent_activity",
+    "flush_auditlog_events",
+    "get_audit_events_store",
+    "get_auditlog_stream",
+    "get_recent_activity",
+    "get_usage_stats",
+    "record_event",
+]
+
+# Errors of events which can't be inserted, rather than of the database
+MALFORMED_EVENT_ERRORS = (
+    DataError, IntegrityError, KeyError, TypeError, ValueError,
+)
+
+AUDITLOG_FLUSH_LOOP_KEY = "auditlog:flush:loop"
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache
+def get_auditlog_stream() -> AuditLogStream:
+    from redash import redis_connection, settings
+
+    return AuditLogStream(
+        redis=redis_connection, maxlen=settings.S.AUDITLOG_STREAM_MAXLEN
+    )
+
+
+@lru_cache
+def get_recent_activity() -> RecentActivity:
+    from redash import redis_connection, settings
+
+    return RecentActivity(
+        redis=redis_connection, days=settings.S.RECENT_ACTIVITY_DAYS
+    )
+
+
+@lru_cache
+def _get_clickhouse_writer():
+    from dingolytics.ingest.gateway import ClickHouseWriter
+
+    return ClickHouseWriter()
+
+
+def get_audit_events_store() -> Optional[AuditEventsStore]:
+    """Get the store of the audit events stream, if enabled and ready."""
+    from dingolytics.ingest.gateway import StreamTarget
+    from dingolytics.ingest.provisioning import STREAM_READY
+    from redash import models, settings
+
+    if not settings.S.AUDITLOG_CLICKHOUSE_ENABLED:
+        return None
+    stream = (
+        models.Stream.query.join(models.DataSource)
+        .filter(
+            models.DataSource.type == "clickhouse",
+            models.Stream.db_table_preset == AUDIT_EVENTS_PRESET,
+            models.Stream.is_enabled.is_(True),
+            models.Stream.is_archived.is_(False),
+            models.Stream.provisioning_state == STREAM_READY,
+        )
+        .order_by(models.Stream.id)
+        .first()
+    )
+    if stream is None:
+        logger.warning("No stream for audit events, see %s", AUDIT_EVENTS_PRESET)
+        return None
+    return AuditEventsStore(
+        _get_clickhouse_writer(), StreamTarget.from_stream(stream)
+    )
+
+
+def record_event(event: dict) -> None:
+    """Append the raw event to the stream, never failing the caller."""
+    try:
+        get_auditlog_stream().append(event)
+    except RedisError:
+        logger.exception("Failed to record event: %s", event.get("action"))
+
+
+def store_events(events: list[dict]) -> list[dict]:
+    """
+    Insert events, return the rows inserted.
+
+    When the batch is rejected, events are inserted one by one, so that
+    a malformed event doesn't block the stream. Other errors, e.g. of the
+    database connection, are raised, so the events are read again later.
+    """
+    from redash import models
+
+    try:
+        rows = models.Event.record_many(events)
+        models.db.session.commit()
+        return rows
+    except MALFORMED_EVENT_ERRORS:
+        models.db.session.rollback()
+        logger.exception("Failed to insert %d events, retrying", len(events))
+    except Exception:
+        models.db.session.rollback()
+        raise
+
+    rows = []
+    for event in events:
+        try:
+            rows.extend(models.Event.record_many([event]))
+            models.db.session.commit()
+        except MALFORMED_EVENT_ERRORS:
+            models.db.session.rollback()
+            logger.exception("Dropped malformed event: %r", event)
+        except Exception:
+            models.db.session.rollback()
+            raise
+    return rows
+
+
+def deliver_events(rows: list[dict]) -> None:
+    from dingolytics.tasks.auditlog_events import deliver_auditlog_events_task
+    from redash import settings
+
+    from .webhooks import serialize_event
+
+    if rows and settings.S.EVENT_REPORTING_WEBHOOKS:
+        events = [serialize_event(row) for row in rows]
+        for hook in settings.S.EVENT_REPORTING_WEBHOOKS:
+            deliver_auditlog_events_task(hook, events)
+
+
+def store_events_in_clickhouse(
+    store: AuditEventsStore, events: list[dict]
+) -> list[dict]:
+    from redash import models
+
+    rows = []
+    for event in events:
+        try:
+            rows.append(models.Event.get_row(dict(event)))
+        except (KeyError, TypeError, ValueError):
+            logger.warning("Dropped malformed event: %r", event)
+    store.insert(rows)
+    return rows
+
+
+def _flush_group(
+    stream: AuditLogStream, group: str,
+    store: Callable[[list[dict]], list[dict]], max_batches: int,
+) -> int:
+    from redash import settings
+
+    batch_size = settings.S.AUDITLOG_BATCH_SIZE
+    total = 0
+    for _ in range(max_batches):
+        entries = stream.read(group, AUDITLOG_CONSUMER, count=batch_size)
+        if not entries:
+            break
+        try:
+            rows = store([event for _, event in entries])
+        except Exception:
+            # Left pending, read again by the next flush
+            logger.exception("Failed to store %d events of %s", len(entries), group)
+            break
+        stream.ack(group, [entry_id for entry_id, _ in entries])
+        total += len(rows)
+        if len(entries) < batch_size:
+            break
+    return total
+
+
+def flush_auditlog_events(max_batches: int = 10) -> int:
+    """Store events from the stream, return number of events stored."""
+    from redash import settings
+
+    stream = get_auditlog_stream()
+
+    def store(events: list[dict]) -> list[dict]:
+        rows = store_events(events)
+        # Events are committed, so they are acknowledged whatever happens
+        # next, not to be stored and delivered twice
+        try:
+            get_recent_activity().record(rows)
+        except Exception:
+            logger.exception("Failed to count %d events as recent activity", len(rows))
+        try:
+            deliver_events(rows)
+        except Exception:
+            logger.exception("Failed to schedule delivery of %d events", len(rows))
+        return rows
+
+    total = _flush_group(stream, AUDITLOG_GROUP, store, max_batches)
+    groups = [AUDITLOG_GROUP]
+
+    if settings.S.AUDITLOG_CLICKHOUSE_ENABLED:
+        # Kept in trimming while the store is unavailable, so that its
+        # events are stored once it's ready again
+        groups.append(AUDITLOG_CLICKHOUSE_GROUP)
+        clickhouse_store = get_audit_events_store()
+        if clickhouse_store is not None:
+            _flush_group(
+                stream, AUDITLOG_CLICKHOUSE_GROUP,
+                lambda events: store_events_in_clickhouse(clickhouse_store, events),
+                max_batches,
+            )
+
+    stream.trim(groups)
+    return total
+
+
+def backfill_recent_activity() -> int:
+    """
+    Rebuild the recent activity feed from stored events.
+
+    Events are counted in ClickHouse when stored there, otherwise in the
+    `events` table. Returns number of events counted.
+    """
+    from redash import models
+
+    recent = get_recent_activity()
+    store = get_audit_events_store()
+
+    def get_counts():
+        if store is not None:
+            return store.get_daily_counts(RECENT_ACTIONS, days=recent.days)
+        return models.Event.get_daily_counts(RECENT_ACTIONS, days=recent.days)
+
+    return recent.rebuild(get_counts)
+
+
+def get_usage_stats(org_id: int, days: int = 30) -> list[dict]:
+    """
+    Count events and users by day, action and object type.
+
+    Counted in ClickHouse when audit events are stored there, otherwise
+    in the `events` table.
+    """
+    from redash import models
+
+    store = get_audit_events_store()
+    if store is not None:
+        return store.get_usage(org_id, days=days)
+    return models.Event.get_usage(org_id, days=days)
@@ -0,0 +1,96 @@
+"""
+Audit events in ClickHouse.
+
+With `AUDITLOG_CLICKHOUSE_ENABLED`, the flush loop also inserts events
+into the table of the internal `_internal_audit_events` stream, and
+analytical reads, i.e. usage stats and the recent activity backfill,
+are answered by ClickHouse aggregates instead of the `events` table,
+which then only needs to keep `AUDITLOG_POSTGRES_RETENTION_DAYS` of
+events.
+"""
+import json
+from typing import Any
+
+AUDIT_EVENTS_PRESET = "_internal_audit_events"
+
+
+def to_clickhouse_row(row: dict) -> dict:
+    """Convert an event row, see `Event.get_row`, to a table row."""
+    object_id = row["object_id"]
+    return {
+        "timestamp": row["created_at"],
+        "org_id": row["org_id"],
+        "user_id": row["user_id"],
+        "action": row["action"],
+        "object_type": row["object_type"],
+        "object_id": "" if object_id is None else str(object_id),
+        "additional_properties": json.dumps(
+            row["additional_properties"], default=str
+        ),
+    }
+
+
+class AuditEventsStore:
+    """
+    Insert and aggregate audit events of the internal stream table.
+
+    Attributes:
+        writer: ClickHouse client, see `gateway.ClickHouseWriter`.
+        target: Stream table, see `gateway.StreamTarget`.
+    """
+
+    def __init__(self, writer: Any, target: Any) -> None:
+        self.writer = writer
+        self.target = target
+
+    def insert(self, rows: list[dict]) -> None:
+        from dingolytics.ingest.schema import to_column_blocks
+
+        for column_names, columns in to_column_blocks(
+            [to_clickhouse_row(row) for row in rows]
+        ):
+            self.writer.insert(self.target, column_names, columns)
+
+    def get_daily_counts(self, actions: dict, days: int = 7) -> dict:
+        """Count events per object and day, see `Event.get_daily_counts`."""
+        rows = self.writer.query(
+            self.target,
+            "SELECT org_id, user_id, object_type, object_id, "
+            "toDate(timestamp) AS day, action, count() "
+            f"FROM {self.target.table} "
+            "WHERE object_type IN {object_types:Array(String)} "
+            "AND timestamp >= today() - {days:UInt32} "
+            "AND object_id != '' "
+            "GROUP BY org_id, user_id, object_type, object_id, day, action",
+            {"object_types": list(actions), "days": days},
+        )
+        counts = {}
+        for *key, action, count in rows:
+            if action in actions[key[2]]:
+                key = tuple(key)
+                counts[key] = counts.get(key, 0) + count
+        return counts
+
+    def get_usage(self, org_id: int, days: int = 30) -> list[dict]:
+        """Count events and users by day, action and object type."""
+        rows = self.writer.query(
+            self.target,
+            "SELECT toDate(timestamp) AS day, action, object_type, "
+            "count(), uniqExact(user_id) "
+            f"FROM {self.target.table} "
+            "WHERE org_id = {org_id:UInt64} "
+            "AND timestamp > now() - INTERVAL {days:UInt32} DAY "
+            "GROUP BY day, action, object_type "
+            "ORDER BY day, action, object_type",
+            {"org_id": org_id, "days": days},
+        )
+        return [
+            {
+                "day": day.isoformat(),
+                "action": action,
+                "object_type": object_type,
+                "events": events,
+                "users": users,
+            }
+            for day, action, object_type, events, users in rows
+        ]
@@ -0,0 +1,197 @@
+"""
+Materialised feed of recently used objects.
+
+For every organization, and every user of it, a Redis sorted set counts
+events per object over the last `days` days, so the most used objects
+are read with a single `ZREVRANGE`. Counts are added as events are
+flushed, and also kept per day in bucket sets. Once a day falls out of
+the window, `expire` subtracts its buckets from the windows.
+
+Object ids are members of the sets, scores are event counts. The feed is
+rebuilt into keys of a temporary prefix, renamed over the feed keys once
+done.
+"""
+import datetime
+import uuid
+from collections import Counter
+from typing import Any, Callable, Iterable, Optional
+
+RECENT_ACTIONS = {
+    "query": ["edit", "execute", "edit_name", "edit_description", "view_source"],
+}
+RECENT_PREFIX = "recent"
+RECENT_KEY = "{}:{}:{}"
+RECENT_USER_KEY = "{}:{}:{}:user:{}"
+RECENT_BUCKETS_KEY = "{}:buckets:{:%Y%m%d}"
+# Holds the prefix of the feed being rebuilt
+RECENT_REBUILD_KEY = "{}-rebuild"
+RECENT_REBUILD_TIMEOUT = 3600
+
+# (org_id, user_id, object_type, object_id, day) -> count
+DailyCounts = dict[tuple[int, Optional[int], str, str, datetime.date], int]
+
+
+def _bucket_key(window_key: str, day: datetime.date) -> str:
+    return f"{window_key}:{day:%Y%m%d}"
+
+
+class RecentActivity:
+    """
+    Rolling counts of events per object, by organization and user.
+
+    Attributes:
+        redis: Redis connection, with responses decoded.
+        days: Number of days counted, besides the current one.
+        prefix: Prefix of the keys.
+    """
+
+    def __init__(
+        self, redis: Any, days: int = 7, prefix: str = RECENT_PREFIX
+    ) -> None:
+        self.redis = redis
+        self.days = days
+        self.prefix = prefix
+
+    @property
+    def ttl(self) -> int:
+        # Buckets outlive the window, so that missed expiries catch up
+        return (self.days * 2 + 1) * 86400
+
+    def record(
+        self, rows: Iterable[dict], today: Optional[datetime.date] = None
+    ) -> int:
+        """Count event rows, see `Event.get_row`, return number counted."""
+        counts = Counter()
+        for row in rows:
+            actions = RECENT_ACTIONS.get(row["object_type"])
+            if not actions or row["action"] not in actions:
+                continue
+            if row["object_id"] is None:
+                continue
+            key = (
+                row["org_id"],
+                row["user_id"],
+                row["object_type"],
+                str(row["object_id"]),
+                row["created_at"].date(),
+            )
+            counts[key] += 1
+        added = self.add_counts(counts, today=today)
+        # Also counted in the feed being rebuilt, which replaces this one
+        rebuilding = self.redis.get(RECENT_REBUILD_KEY.format(self.prefix))
+        if rebuilding:
+            RecentActivity(self.redis, self.days, prefix=rebuilding).add_counts(
+                counts, today=today
+            )
+        return added
+
+    def add_counts(
+        self, counts: DailyCounts, today: Optional[datetime.date] = None
+    ) -> int:
+        today = today or datetime.datetime.utcnow().date()
+        first_day = today - datetime.timedelta(days=self.days)
+        pipe = self.redis.pipeline(transaction=False)
+        added = 0
+        for (org_id, user_id, object_type, object_id, day), count in counts.items():
+            if not first_day <= day <= today:
+                continue
+            window_keys = [RECENT_KEY.format(self.prefix, org_id, object_type)]
+            if user_id is not None:
+                window_keys.append(
+                    RECENT_USER_KEY.format(self.prefix, org_id, object_type, user_id)
+                )
+            buckets_key = RECENT_BUCKETS_KEY.format(self.prefix, day)
+            for window_key in window_keys:
+                bucket_key = _bucket_key(window_key, day)
+                pipe.zincrby(window_key, count, object_id)
+                pipe.zincrby(bucket_key, count, object_id)
+                pipe.expire(window_key, self.ttl)
+                pipe.expire(bucket_key, self.ttl)
+                # Without the prefix, so that it's kept by renaming
+                pipe.sadd(buckets_key, self._strip_prefix(window_key))
+            pipe.expire(buckets_key, self.ttl)
+            added += count
+        pipe.execute()
+        return added
+
+    def get(
+        self, org_id: int, object_type: str, user_id: Optional[int] = None,
+        limit: int = 20,
+    ) -> list[str]:
+        """Get ids of the objects with the most events, the most first."""
+        if user_id is None:
+            key = RECENT_KEY.format(self.prefix, org_id, object_type)
+        else:
+            key = RECENT_USER_KEY.format(self.prefix, org_id, object_type, user_id)
+        return self.redis.zrevrange(key, 0, limit - 1)
+
+    def expire(self, today: Optional[datetime.date] = None) -> int:
+        """Subtract days out of the window, return number of days expired."""
+        today = today or datetime.datetime.utcnow().date()
+        expired = 0
+        for offset in range(self.days + 1, self.days * 2 + 1):
+            day = today - datetime.timedelta(days=offset)
+            buckets_key = RECENT_BUCKETS_KEY.format(self.prefix, day)
+            window_keys = self.redis.smembers(buckets_key)
+            if not window_keys:
+                continue
+            pipe = self.redis.pipeline(transaction=False)
+            for window_key in window_keys:
+                window_key = f"{self.prefix}:{window_key}"
+                bucket_key = _bucket_key(window_key, day)
+                pipe.zunionstore(
+                    window_key, {window_key: 1, bucket_key: -1}, aggregate="SUM"
+                )
+                pipe.zremrangebyscore(window_key, "-inf", 0)
+                pipe.expire(window_key, self.ttl)
+                pipe.delete(bucket_key)
+            pipe.delete(buckets_key)
+            pipe.execute()
+            expired += 1
+        return expired
+
+    def rebuild(
+        self, get_counts: Callable[[], DailyCounts],
+        today: Optional[datetime.date] = None,
+    ) -> int:
+        """
+        Replace the feed with counts of stored events, return number counted.
+
+        Counts are added to keys of a temporary prefix, renamed over the
+        feed keys once done. Events recorded meanwhile are counted in both
+        feeds, so they aren't lost, though events stored while counting
+        may be counted twice.
+        """
+        rebuild_key = RECENT_REBUILD_KEY.format(self.prefix)
+        rebuilding = RecentActivity(
+            self.redis, self.days, prefix=f"{rebuild_key}:{uuid.uuid4().hex}"
+        )
+        self.redis.set(rebuild_key, rebuilding.prefix, ex=RECENT_REBUILD_TIMEOUT)
+        try:
+            added = rebuilding.add_counts(get_counts(), today=today)
+            stale = set(self._scan_keys())
+            pipe = self.redis.pipeline(transaction=True)
+            for key in rebuilding._scan_keys():
+                target = f"{self.prefix}:{rebuilding._strip_prefix(key)}"
+                pipe.rename(key, target)
+                stale.discard(target)
+            self._delete(pipe, list(stale))
+            pipe.execute()
+        finally:
+            self.redis.delete(rebuild_key)
+            rebuilding.clear()
+        return added
+
+    def clear(self) -> None:
+        self._delete(self.redis, list(self._scan_keys()))
+
+    def _scan_keys(self) -> Iterable[str]:
+        return self.redis.scan_iter(match=f"{self.prefix}:*", count=1000)
+
+    def _strip_prefix(self, key: str) -> str:
+        return key[len(self.prefix) + 1:]
+
+    @staticmethod
+    def _delete(redis: Any, keys: list[str]) -> None:
+        for i in range(0, len(keys), 1000):
+            redis.delete(*keys[i:i + 1000])
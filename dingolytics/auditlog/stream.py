@@ -0,0 +1,110 @@
+"""
+Redis stream buffering audit events.
+
+Events are appended to a capped Redis stream on the request path and
+consumed in batches by the audit log flush loop. Every sink reads the
+stream through a consumer group of its own, so a sink which is down
+doesn't hold back the others: its unacknowledged events are read again
+by the next flush. Entries are trimmed once read by all the sinks.
+"""
+import json
+from typing import Any, Iterable
+
+from redis.exceptions import ResponseError
+
+AUDITLOG_STREAM_KEY = "auditlog:events"
+AUDITLOG_GROUP = "auditlog"
+AUDITLOG_CLICKHOUSE_GROUP = "auditlog-clickhouse"
+AUDITLOG_CONSUMER = "auditlog-flush"
+
+
+def _parse_id(entry_id: str) -> tuple[int, int]:
+    ms, _, seq = entry_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+class AuditLogStream:
+    """
+    Append audit events to a Redis stream and read them in batches.
+
+    Attributes:
+        redis: Redis connection, with responses decoded.
+        maxlen: Approximate number of events to keep when sinks lag.
+    """
+
+    def __init__(
+        self, redis: Any, maxlen: int = 100000, key: str = AUDITLOG_STREAM_KEY,
+    ) -> None:
+        self.redis = redis
+        self.maxlen = maxlen
+        self.key = key
+        self._groups = set()
+
+    def append(self, event: dict) -> str:
+        return self.redis.xadd(
+            self.key, {"event": json.dumps(event, default=str)},
+            maxlen=self.maxlen, approximate=True,
+        )
+
+    def read(
+        self, group: str = AUDITLOG_GROUP, consumer: str = AUDITLOG_CONSUMER,
+        count: int = 500,
+    ) -> list[tuple[str, dict]]:
+        """
+        Read a batch of events of the group, as `(entry_id, event)` tuples.
+
+        Events read by the consumer but not acknowledged yet are returned
+        first, then new ones.
+        """
+        self._ensure_group(group)
+        for stream_id in ("0", ">"):
+            response = self.redis.xreadgroup(
+                group, consumer, {self.key: stream_id}, count=count
+            )
+            entries = response[0][1] if response else []
+            # Entries trimmed while pending are returned without fields
+            events = [
+                (entry_id, json.loads(fields["event"]))
+                for entry_id, fields in entries if fields
+            ]
+            trimmed = [entry_id for entry_id, fields in entries if not fields]
+            if trimmed:
+                self.ack(group, trimmed)
+            if events:
+                return events
+        return []
+
+    def ack(self, group: str, entry_ids: list[str]) -> None:
+        if entry_ids:
+            self.redis.xack(self.key, group, *entry_ids)
+
+    def trim(self, groups: Iterable[str]) -> None:
+        """
+        Remove entries read and acknowledged by all the groups.
+
+        Groups not created yet are created, so that their entries are
+        kept until they are read.
+        """
+        groups = set(groups)
+        for group in groups:
+            self._ensure_group(group)
+        min_ids = []
+        for info in self.redis.xinfo_groups(self.key):
+            if info["name"] not in groups:
+                continue
+            if info["pending"]:
+                min_ids.append(self.redis.xpending(self.key, info["name"])["min"])
+            else:
+                min_ids.append(info["last-delivered-id"])
+        if min_ids:
+            self.redis.xtrim(self.key, minid=min(min_ids, key=_parse_id))
+
+    def _ensure_group(self, group: str) -> None:
+        if group in self._groups:
+            return
+        try:
+            self.redis.xgroup_create(self.key, group, id="0", mkstream=True)
+        except ResponseError as exc:
+            if "BUSYGROUP" not in str(exc):
+                raise
+        self._groups.add(group)
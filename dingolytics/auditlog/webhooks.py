@@ -0,0 +1,46 @@
+"""
+Delivery of audit events to `EVENT_REPORTING_WEBHOOKS`.
+
+Events are posted in batches as `{"data": [event, ...]}`, every event
+in the format of `Event.to_dict`. Failed deliveries raise, so that the
+delivery task is retried.
+"""
+import datetime
+import logging
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookDeliveryError(Exception):
+    pass
+
+
+def serialize_event(row: dict) -> dict:
+    """Serialize an event row, see `Event.get_row`, for webhooks."""
+    created_at = row["created_at"]
+    if isinstance(created_at, datetime.datetime):
+        created_at = created_at.isoformat()
+    return {
+        "org_id": row["org_id"],
+        "user_id": row["user_id"],
+        "action": row["action"],
+        "object_type": row["object_type"],
+        "object_id": row["object_id"],
+        "additional_properties": row["additional_properties"],
+        "created_at": created_at,
+    }
+
+
+def post_events(hook: str, events: list[dict], timeout: float = 10.0) -> None:
+    logger.debug("Forwarding %d events to: %s", len(events), hook)
+    try:
+        response = requests.post(hook, json={"data": events}, timeout=timeout)
+    except requests.RequestException as exc:
+        raise WebhookDeliveryError(f"Failed posting to {hook}: {exc}") from exc
+    if not 200 <= response.status_code < 300:
+        raise WebhookDeliveryError(
+            f"Failed posting to {hook}: {response.status_code} "
+            f"{response.content[:200]!r}"
+        )
@@ -24,6 +24,11 @@ class ClickHouseSettings(BaseSettings):
         "db_table": "vector_logs",
         "description": "Internal logs from Vector ingested into ClickHouse",
     }
+    CLICKHOUSE_AUDIT_EVENTS: dict = {
+        "name": "Internal audit events",
+        "db_table": "audit_events",
+        "description": "Audit log events, see AUDITLOG_CLICKHOUSE_ENABLED",
+    }
 
     class Config:
         env_file = ".env"
@@ -164,11 +169,16 @@ class DynamicSettings(BaseDynamicSettings):
     def setup_default_streams(self, data_source: Any) -> None:
         from dingolytics.models.streams import Stream
 
-        return Stream.create(
+        Stream.create(
             data_source=data_source,
             db_table_preset="_internal_vector_logs",
             **self.clickhouse_settings.CLICKHOUSE_VECTOR_LOGS,
         )
+        Stream.create(
+            data_source=data_source,
+            db_table_preset="_internal_audit_events",
+            **self.clickhouse_settings.CLICKHOUSE_AUDIT_EVENTS,
+        )
 
 
 class HueySettings(BaseSettings):
@@ -1,14 +1,26 @@
+from functools import lru_cache
+
+from .provisioning import STREAM_READY
 from .vector import VectorConfig
 from .vector import get_vector_config
 from .vector import update_vector_config
 
 __all__ = [
     'VectorConfig',
+    'collect_stream_metrics',
     'get_vector_config',
+    'get_stream_dead_letter_stats',
+    'get_stream_metrics',
+    'get_stream_metrics_collector',
+    'replay_stream_dead_letters',
     'update_vector_config',
+    'schedule_vector_config_sync',
     'sync_vector_config_to_streams'
 ]
 
+VECTOR_CONFIG_SYNC_KEY = "vector:config:sync_pending"
+STREAM_METRICS_LOOP_KEY = "stream:metrics:loop"
+
 
 def sync_vector_config_to_streams() -> None:
     """Sync Vector ingest config to all enabled streams."""
@@ -18,6 +30,97 @@ def sync_vector_config_to_streams() -> None:
         models.DataSource.type.in_(["clickhouse"]),
         models.Stream.is_enabled.is_(True),
         models.Stream.is_archived.is_(False),
+        models.Stream.provisioning_state == STREAM_READY,
     )
 
     update_vector_config(streams, clean=True)
+
+
+def schedule_vector_config_sync() -> None:
+    """
+    Schedule Vector ingest config sync after a short delay.
+
+    Bursts of stream changes within the delay are coalesced into a single
+    sync, so Vector reloads its config only once for all of them.
+    """
+    from dingolytics.tasks.sync_vector_config import sync_vector_config_task
+    from redash import redis_connection, settings
+
+    delay = settings.S.VECTOR_CONFIG_SYNC_DELAY
+    # Expiration is a safety net in case the scheduled task gets lost.
+    is_scheduled = redis_connection.set(
+        VECTOR_CONFIG_SYNC_KEY, 1, nx=True, ex=max(delay * 10, 60)
+    )
+    if is_scheduled:
+        sync_vector_config_task.schedule(delay=delay)
+
+
+def get_stream_dead_letter_stats(stream) -> dict:
+    """Count dead letters of a stream by source and reason."""
+    from .dlq import get_dead_letter_stats
+    from .gateway import ClickHouseWriter, StreamTarget
+
+    return get_dead_letter_stats(
+        StreamTarget.from_stream(stream), ClickHouseWriter()
+    )
+
+
+def replay_stream_dead_letters(stream, **options) -> dict:
+    """
+    Replay dead letters of a stream into the stream table.
+
+    Options are passed to `dlq.replay_dead_letters`.
+    """
+    from dingolytics.presets import TableSchema
+
+    from .dlq import replay_dead_letters
+    from .gateway import ClickHouseWriter, StreamTarget
+    from .schema import RowCoercer
+
+    target = StreamTarget.from_stream(stream)
+    writer = ClickHouseWriter()
+    # Convert rows with the actual table columns rather than the preset,
+    # as the table may have been altered to fix the rejections.
+    coercer = RowCoercer(
+        TableSchema.from_types(target.table, writer.get_columns(target))
+    )
+    return replay_dead_letters(target, writer, coercer, **options).to_dict()
+
+
+@lru_cache
+def get_stream_metrics_collector():
+    """Get the collector, which keeps ClickHouse clients between runs."""
+    from redash import redis_connection, settings
+
+    from .gateway import ClickHouseWriter
+    from .metrics import StreamMetricsCollector
+
+    return StreamMetricsCollector(
+        redis=redis_connection,
+        writer=ClickHouseWriter(),
+        vector_api_url=settings.S.VECTOR_API_URL,
+        interval=settings.S.STREAM_METRICS_INTERVAL,
+        retention=settings.S.STREAM_METRICS_RETENTION,
+    )
+
+
+def collect_stream_metrics() -> int:
+    """Collect metrics of all enabled streams, return number of samples."""
+    from redash import models
+
+    streams = models.Stream.query.join(models.DataSource).filter(
+        models.DataSource.type.in_(["clickhouse"]),
+        models.Stream.is_enabled.is_(True),
+        models.Stream.is_archived.is_(False),
+        models.Stream.provisioning_state == STREAM_READY,
+    )
+    return len(get_stream_metrics_collector().collect(list(streams)))
+
+
+def get_stream_metrics(stream_id: int, limit: int = None) -> list[dict]:
+    """Get metrics samples of a stream, the newest first."""
+    from redash import redis_connection
+
+    from .metrics import get_stream_metrics as _get_stream_metrics
+
+    return _get_stream_metrics(redis_connection, stream_id, limit)
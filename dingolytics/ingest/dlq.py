@@ -0,0 +1,168 @@
+"""
+Dead-letter tables of streams.
+
+Every stream table has a companion `<db_table>_dlq` table, created from
+the `_dlq` preset, which keeps raw JSON payloads of events rejected at
+ingest, with the reason. Once the stream schema or the producer is fixed,
+dead letters are replayed in bulk into the stream table with
+`replay_dead_letters`, and the replayed rows are deleted.
+
+Only events rejected before the insert are dead-lettered: rows failing
+the schema conversion in the gateway, and events dropped by the lookup
+and coercion remap in Vector. Vector sinks have no output for failed
+requests, so batches rejected by a ClickHouse insert are retried by the
+sink and then dropped, and only show up in the Vector internal logs.
+The gateway spools such batches instead, see `gateway.DiskSpool`.
+"""
+import json
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Optional
+
+from .schema import RowCoercer, to_column_blocks
+
+DLQ_PRESET = "_dlq"
+DLQ_TABLE_SUFFIX = "_dlq"
+DLQ_SOURCE_GATEWAY = "gateway"
+DLQ_SOURCE_VECTOR = "vector"
+
+logger = logging.getLogger(__name__)
+
+
+def get_dlq_table(table: str) -> str:
+    return f"{table}{DLQ_TABLE_SUFFIX}"
+
+
+def dead_letter_row(
+    stream_id: int, source: str, reason: str, payload: Any
+) -> dict:
+    """Create a dead-letter table row for a rejected event."""
+    return {
+        "stream_id": stream_id,
+        "source": source,
+        "reason": reason,
+        "payload": json.dumps(payload, ensure_ascii=False, default=str),
+    }
+
+
+def get_dead_letter_stats(target: Any, writer: Any, limit: int = 100) -> dict:
+    """Count dead letters of the stream table by source and reason."""
+    rows = writer.query(
+        target,
+        f"SELECT source, reason, count(), min(timestamp), max(timestamp) "
+        f"FROM {get_dlq_table(target.table)} "
+        f"GROUP BY source, reason ORDER BY count() DESC LIMIT {int(limit)}",
+    )
+    reasons = [
+        {
+            "source": source,
+            "reason": reason,
+            "count": count,
+            "first_at": first_at,
+            "last_at": last_at,
+        }
+        for source, reason, count, first_at, last_at in rows
+    ]
+    return {
+        "total": sum(item["count"] for item in reasons),
+        "reasons": reasons,
+    }
+
+
+class ReplayResult:
+    def __init__(self) -> None:
+        self.replayed = 0
+        self.rejected = 0
+        self.batches = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "replayed": self.replayed,
+            "rejected": self.rejected,
+            "batches": self.batches,
+        }
+
+
+def replay_dead_letters(
+    target: Any,
+    writer: Any,
+    coercer: RowCoercer,
+    batch_size: int = 1000,
+    max_rows: Optional[int] = None,
+    rows_per_second: Optional[float] = None,
+    until: Optional[datetime] = None,
+    sleep: Callable[[float], None] = time.sleep,
+) -> ReplayResult:
+    """
+    Replay dead letters of the stream table into the table itself.
+
+    Dead letters are read in batches of `batch_size` rows, ordered by
+    the table key, up to `max_rows` rows and not faster than
+    `rows_per_second`. Only dead letters recorded before `until`, the
+    start of the replay by default, are replayed, so events rejected
+    again during the replay are not read twice.
+
+    Rows converted with the current schema are inserted into the stream
+    table and deleted from the dead-letter table, rows rejected again
+    are kept there.
+    """
+    if until is None:
+        until = datetime.now(timezone.utc)
+    dlq_table = get_dlq_table(target.table)
+    result = ReplayResult()
+    last_key = None
+    started_at = time.monotonic()
+
+    while max_rows is None or result.replayed + result.rejected < max_rows:
+        limit = batch_size
+        if max_rows is not None:
+            limit = min(limit, max_rows - result.replayed - result.rejected)
+        conditions = ["timestamp < {until:DateTime64(3)}"]
+        parameters = {"until": until, "limit": limit}
+        if last_key is not None:
+            conditions.append(
+                "(timestamp, id) > ({timestamp:DateTime64(3)}, {id:UUID})"
+            )
+            parameters.update(timestamp=last_key[0], id=last_key[1])
+        batch = writer.query(
+            target,
+            f"SELECT id, timestamp, payload FROM {dlq_table} "
+            f"WHERE {' AND '.join(conditions)} "
+            f"ORDER BY timestamp, id LIMIT {{limit:UInt32}}",
+            parameters,
+        )
+        if not batch:
+            break
+        last_key = batch[-1][1], batch[-1][0]
+
+        rows, replayed_ids = [], []
+        for row_id, _, payload in batch:
+            try:
+                rows.append(coercer.coerce(json.loads(payload)))
+            except ValueError:  # invalid JSON or `RowRejected`
+                result.rejected += 1
+            else:
+                replayed_ids.append(row_id)
+        for column_names, columns in to_column_blocks(rows):
+            writer.insert(target, column_names, columns)
+        if replayed_ids:
+            writer.command(
+                target,
+                f"DELETE FROM {dlq_table} WHERE id IN {{ids:Array(UUID)}}",
+                {"ids": replayed_ids},
+            )
+        result.replayed += len(replayed_ids)
+        result.batches += 1
+
+        if rows_per_second:
+            # Throttle to the average rate since the start of the replay
+            expected = (result.replayed + result.rejected) / rows_per_second
+            delay = expected - (time.monotonic() - started_at)
+            if delay > 0:
+                sleep(delay)
+
+    logger.info(
+        "Replayed dead letters of %s: %s", target.table, result.to_dict()
+    )
+    return result
@@ -0,0 +1,659 @@
+"""
+Native ingest gateway, an alternative to Vector for small deployments.
+
+Accepts events with `POST /ingest/<ingest_key>`, the same contract as the
+Vector HTTP source, batches rows per stream table and flushes them to
+ClickHouse in columnar blocks. Batches failed to insert are saved to a
+local disk spool and retried later, with a backoff per batch.
+
+Run with:
+
+    gunicorn -b 0.0.0.0:8180 -k gthread --threads 8 \\
+        "dingolytics.ingest.gateway:create_app()"
+"""
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Optional
+from uuid import uuid4
+
+from pydantic import BaseSettings
+
+from dingolytics.presets import TableSchema
+
+from .dlq import (
+    DLQ_PRESET,
+    DLQ_SOURCE_GATEWAY,
+    dead_letter_row,
+    get_dlq_table,
+)
+from .schema import (
+    RowCoercer,
+    RowRejected,
+    get_preset_coercer,
+    to_column_blocks,
+)
+from .provisioning import STREAM_READY
+from .vector import VECTOR_IP_ADDR_FIELD, is_internal_stream
+
+logger = logging.getLogger(__name__)
+
+
+class IngestGatewaySettings(BaseSettings):
+    # Flush a table batch when it reaches any of the limits
+    INGEST_BATCH_ROWS: int = 10000
+    INGEST_BATCH_BYTES: int = 8 * 1024 * 1024
+    INGEST_FLUSH_INTERVAL: float = 2.0
+    # Reject events when that many rows are waiting for a flush
+    INGEST_MAX_PENDING_ROWS: int = 200000
+    INGEST_STREAMS_TTL: float = 30.0
+    # Table columns are described again after that many seconds
+    INGEST_COLUMNS_TTL: float = 300.0
+    INGEST_SPOOL_DIR: str = "/var/lib/dingolytics/spool"
+    INGEST_SPOOL_RETRY_INTERVAL: float = 30.0
+    INGEST_SPOOL_MAX_RETRY_INTERVAL: float = 3600.0
+    INGEST_SPOOL_MAX_ATTEMPTS: int = 10
+    # Number of rejected rows reported back to the client
+    INGEST_MAX_REPORTED_ERRORS: int = 10
+
+    class Config:
+        env_file = ".env"
+
+
+class IngestError(Exception):
+    status_code = 400
+
+
+class StreamNotFound(IngestError):
+    status_code = 404
+
+
+class IngestBackpressure(IngestError):
+    status_code = 503
+
+
+class StreamTarget:
+    """
+    ClickHouse table of a stream and the connection options.
+
+    The coercer is compiled from the stream preset schema. Without one,
+    the gateway compiles it from the actual table columns.
+    """
+
+    @classmethod
+    def from_stream(cls, stream: Any) -> "StreamTarget":
+        return cls(
+            stream_id=stream.id,
+            data_source_id=stream.data_source_id,
+            table=stream.db_table,
+            options=stream.data_source.options.to_dict(),
+            coercer=get_preset_coercer(
+                stream.data_source.type, stream.db_table_preset
+            ),
+        )
+
+    def __init__(
+        self, stream_id: int, data_source_id: int, table: str, options: dict,
+        coercer: Optional[RowCoercer] = None,
+    ) -> None:
+        self.stream_id = stream_id
+        self.data_source_id = data_source_id
+        self.table = table
+        self.options = options
+        self.coercer = coercer
+
+    @property
+    def key(self) -> tuple:
+        return (self.data_source_id, self.table)
+
+    @property
+    def dlq(self) -> "StreamTarget":
+        """Target of the stream dead-letter table."""
+        return StreamTarget(
+            stream_id=self.stream_id,
+            data_source_id=self.data_source_id,
+            table=get_dlq_table(self.table),
+            options=self.options,
+            coercer=get_preset_coercer("clickhouse", DLQ_PRESET),
+        )
+
+
+def load_stream_targets() -> dict[str, StreamTarget]:
+    """Load targets of all enabled ClickHouse streams by ingest key."""
+    from redash import models
+
+    streams = models.Stream.query.join(models.DataSource).filter(
+        models.DataSource.type.in_(["clickhouse"]),
+        models.Stream.is_enabled.is_(True),
+        models.Stream.is_archived.is_(False),
+        models.Stream.provisioning_state == STREAM_READY,
+    )
+    return {
+        stream.ingest_key: StreamTarget.from_stream(stream)
+        for stream in streams
+        if not is_internal_stream(stream)
+    }
+
+
+class StreamCache:
+    """
+    In-memory cache of stream targets by ingest key.
+
+    Targets are reloaded when the cache is older than `ttl` seconds, or
+    on an unknown key, but not more often than every `min_reload` seconds
+    so unknown keys don't hit the database on every request.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[], dict[str, StreamTarget]] = load_stream_targets,
+        ttl: float = 30.0,
+        min_reload: float = 1.0,
+    ) -> None:
+        self.loader = loader
+        self.ttl = ttl
+        self.min_reload = min_reload
+        self._targets = {}
+        self._targets_by_key = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def resolve(self, ingest_key: str) -> Optional[StreamTarget]:
+        age = self._age()
+        if age > self.ttl or (
+            ingest_key not in self._targets and age > self.min_reload
+        ):
+            self.reload()
+        return self._targets.get(ingest_key)
+
+    def get_target(self, data_source_id: int, table: str) -> Optional[StreamTarget]:
+        return self._targets_by_key.get((data_source_id, table))
+
+    def reload(self) -> None:
+        with self._lock:
+            targets = self.loader()
+            self._targets = targets
+            self._targets_by_key = {t.key: t for t in targets.values()}
+            self._targets_by_key.update(
+                {t.dlq.key: t.dlq for t in targets.values()}
+            )
+            self._loaded_at = time.monotonic()
+
+    def _age(self) -> float:
+        if self._loaded_at is None:
+            return float("inf")
+        return time.monotonic() - self._loaded_at
+
+
+class ClickHouseWriter:
+    """
+    Insert columnar blocks into ClickHouse tables.
+
+    Table columns are described once per table and cached for
+    `columns_ttl` seconds, so inserts don't need an extra round-trip.
+    They are described again sooner when an insert fails, e.g. after
+    the table is altered.
+    """
+
+    def __init__(self, columns_ttl: float = 300.0) -> None:
+        self.columns_ttl = columns_ttl
+        self._clients = {}
+        self._columns = {}
+
+    def get_columns(self, target: StreamTarget) -> dict[str, str]:
+        """Get column types of the target table by column names."""
+        cached = self._columns.get(target.key)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        result = self._get_client(target).query(f"DESCRIBE TABLE {target.table}")
+        columns = {row[0]: row[1] for row in result.result_rows}
+        self._columns[target.key] = (time.monotonic() + self.columns_ttl, columns)
+        return columns
+
+    def query(
+        self, target: StreamTarget, sql: str,
+        parameters: Optional[dict] = None,
+    ) -> list[tuple]:
+        """Run a query in the target database and return result rows."""
+        return self._get_client(target).query(
+            sql, parameters=parameters
+        ).result_rows
+
+    def command(
+        self, target: StreamTarget, sql: str,
+        parameters: Optional[dict] = None,
+    ) -> None:
+        self._get_client(target).command(sql, parameters=parameters)
+
+    def insert(
+        self, target: StreamTarget, column_names: list[str], columns: list[list]
+    ) -> None:
+        types = self.get_columns(target)
+        try:
+            self._get_client(target).insert(
+                target.table,
+                columns,
+                column_names=column_names,
+                column_type_names=[types[name] for name in column_names],
+                column_oriented=True,
+            )
+        except Exception:
+            self._columns.pop(target.key, None)
+            raise
+
+    def _get_client(self, target: StreamTarget) -> Any:
+        from clickhouse_connect import get_client as clickhouse_client
+
+        if target.data_source_id not in self._clients:
+            options = target.options
+            self._clients[target.data_source_id] = clickhouse_client(
+                database=options.get("dbname"),
+                dsn=options.get("url", "http://localhost:8123"),
+                username=options.get("user", "default"),
+                password=options.get("password", ""),
+                verify=bool(options.get("verify")),
+            )
+        return self._clients[target.data_source_id]
+
+
+class DiskSpool:
+    """
+    Local directory of batches waiting to be inserted again.
+
+    Every batch is a JSON file, written atomically. Batches which failed
+    too many times are moved to the `failed` subdirectory.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = Path(path)
+        self.failed_path = self.path / "failed"
+
+    def put(self, record: dict, path: Optional[Path] = None) -> Path:
+        self.path.mkdir(parents=True, exist_ok=True)
+        if path is None:
+            path = self.path / f"{time.time_ns()}-{uuid4().hex}.json"
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix=".")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(record, f, default=str)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return path
+
+    def paths(self) -> list[Path]:
+        if not self.path.exists():
+            return []
+        return sorted(self.path.glob("*.json"))
+
+    def load(self, path: Path) -> dict:
+        with open(path) as f:
+            return json.load(f)
+
+    def remove(self, path: Path) -> None:
+        path.unlink(missing_ok=True)
+
+    def fail(self, path: Path) -> None:
+        self.failed_path.mkdir(parents=True, exist_ok=True)
+        os.replace(path, self.failed_path / path.name)
+
+
+class IngestResult:
+    """Numbers of accepted and rejected rows of a payload."""
+
+    def __init__(self) -> None:
+        self.accepted = 0
+        self.rejected = 0
+        self.rejected_columns = Counter()
+        self.errors = []
+        # Rows of the dead-letter table for rejected rows
+        self.dead_letters = []
+
+    def to_dict(self) -> dict:
+        result = {"accepted": self.accepted, "rejected": self.rejected}
+        if self.errors:
+            result["errors"] = self.errors
+        return result
+
+
+class TableBatch:
+    def __init__(self, target: StreamTarget) -> None:
+        self.target = target
+        self.rows = []
+        self.size = 0
+        self.created_at = time.monotonic()
+
+    def add(self, rows: list[dict], size: int) -> None:
+        self.rows.extend(rows)
+        self.size += size
+
+
+class IngestGateway:
+    """
+    Accept stream events, batch them per table and flush to ClickHouse.
+
+    A batch is flushed when it reaches `batch_rows` rows or `batch_bytes`
+    bytes of payload, or after `flush_interval` seconds. Rows of a batch
+    are grouped by the set of present columns, so omitted columns get
+    their table defaults.
+
+    Rows are converted to the table schema before batching, and rows
+    which don't match the schema are rejected one by one and counted
+    in `stats` by stream, so they never fail a whole insert. Rejected
+    rows are written to the stream dead-letter table to be replayed.
+    """
+
+    def __init__(
+        self,
+        streams: StreamCache,
+        writer: ClickHouseWriter,
+        spool: DiskSpool,
+        batch_rows: int = 10000,
+        batch_bytes: int = 8 * 1024 * 1024,
+        flush_interval: float = 2.0,
+        max_pending_rows: int = 200000,
+        spool_retry_interval: float = 30.0,
+        spool_max_retry_interval: float = 3600.0,
+        spool_max_attempts: int = 10,
+        max_reported_errors: int = 10,
+    ) -> None:
+        self.streams = streams
+        self.writer = writer
+        self.spool = spool
+        self.batch_rows = batch_rows
+        self.batch_bytes = batch_bytes
+        self.flush_interval = flush_interval
+        self.max_pending_rows = max_pending_rows
+        self.spool_retry_interval = spool_retry_interval
+        self.spool_max_retry_interval = spool_max_retry_interval
+        self.spool_max_attempts = spool_max_attempts
+        self.max_reported_errors = max_reported_errors
+        # Row counters by (stream_id, "accepted" | "rejected"), and
+        # rejected rows by (stream_id, "rejected", column)
+        self.stats = Counter()
+        self._coercers = {}
+        self._batches = {}
+        self._pending_rows = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_settings(cls, settings: IngestGatewaySettings) -> "IngestGateway":
+        return cls(
+            streams=StreamCache(ttl=settings.INGEST_STREAMS_TTL),
+            writer=ClickHouseWriter(columns_ttl=settings.INGEST_COLUMNS_TTL),
+            spool=DiskSpool(settings.INGEST_SPOOL_DIR),
+            batch_rows=settings.INGEST_BATCH_ROWS,
+            batch_bytes=settings.INGEST_BATCH_BYTES,
+            flush_interval=settings.INGEST_FLUSH_INTERVAL,
+            max_pending_rows=settings.INGEST_MAX_PENDING_ROWS,
+            spool_retry_interval=settings.INGEST_SPOOL_RETRY_INTERVAL,
+            spool_max_retry_interval=settings.INGEST_SPOOL_MAX_RETRY_INTERVAL,
+            spool_max_attempts=settings.INGEST_SPOOL_MAX_ATTEMPTS,
+            max_reported_errors=settings.INGEST_MAX_REPORTED_ERRORS,
+        )
+
+    @property
+    def pending_rows(self) -> int:
+        return self._pending_rows
+
+    def ingest(
+        self, ingest_key: str, payload: Any, size: int = 0,
+        ip_addr: Optional[str] = None,
+    ) -> IngestResult:
+        """
+        Accept a JSON payload, an object or a list of objects, for the
+        stream and return the numbers of accepted and rejected rows.
+        """
+        target = self.streams.resolve(ingest_key)
+        if target is None:
+            raise StreamNotFound(f"Unknown ingest key: {ingest_key}")
+
+        result = IngestResult()
+        rows = self.prepare_rows(target, payload, ip_addr, result)
+        pending_rows = len(rows) + len(result.dead_letters)
+
+        with self._lock:
+            if (
+                pending_rows
+                and self._pending_rows + pending_rows > self.max_pending_rows
+            ):
+                raise IngestBackpressure("Too many pending rows, retry later")
+            self.stats[(target.stream_id, "accepted")] += result.accepted
+            self.stats[(target.stream_id, "rejected")] += result.rejected
+            for column, count in result.rejected_columns.items():
+                self.stats[(target.stream_id, "rejected", column)] += count
+            if rows:
+                self._add_rows(target, rows, size)
+            if result.dead_letters:
+                self._add_rows(target.dlq, result.dead_letters, 0)
+
+        return result
+
+    def prepare_rows(
+        self, target: StreamTarget, payload: Any,
+        ip_addr: Optional[str] = None, result: Optional[IngestResult] = None,
+    ) -> list[dict]:
+        """
+        Convert payload rows to the table schema, skipping unknown fields.
+
+        Rejected rows are counted in the result, with the first errors.
+        """
+        if isinstance(payload, dict):
+            payload = [payload]
+        if not isinstance(payload, list):
+            raise IngestError("Payload must be an object or list of objects")
+        if result is None:
+            result = IngestResult()
+        coercer = self.get_coercer(target)
+        set_ip_addr = bool(ip_addr) and VECTOR_IP_ADDR_FIELD in coercer.columns
+        rows = []
+        for index, item in enumerate(payload):
+            if set_ip_addr and isinstance(item, dict):
+                # Overrides the payload, which clients could spoof
+                item[VECTOR_IP_ADDR_FIELD] = ip_addr
+            try:
+                rows.append(coercer.coerce(item))
+            except RowRejected as exc:
+                result.rejected += 1
+                result.rejected_columns[exc.column] += 1
+                result.dead_letters.append(dead_letter_row(
+                    target.stream_id, DLQ_SOURCE_GATEWAY, str(exc), item
+                ))
+                if len(result.errors) < self.max_reported_errors:
+                    result.errors.append({
+                        "index": index,
+                        "column": exc.column,
+                        "message": exc.reason,
+                    })
+        result.accepted = len(rows)
+        return rows
+
+    def get_coercer(self, target: StreamTarget) -> RowCoercer:
+        """
+        Get coercer of the stream preset or the actual table columns,
+        rebuilt when the writer describes the columns again.
+        """
+        if target.coercer is not None:
+            return target.coercer
+        columns = self.writer.get_columns(target)
+        cached = self._coercers.get(target.key)
+        if cached is not None and cached[0] is columns:
+            return cached[1]
+        coercer = RowCoercer(TableSchema.from_types(target.table, columns))
+        self._coercers[target.key] = (columns, coercer)
+        return coercer
+
+    def flush(self, force: bool = False) -> None:
+        """Flush full or expired batches, or all batches if `force`."""
+        with self._flush_lock:
+            with self._lock:
+                keys = [
+                    key for key, batch in self._batches.items()
+                    if force or self._is_full(batch) or self._is_expired(batch)
+                ]
+                batches = [self._batches.pop(key) for key in keys]
+            for batch in batches:
+                try:
+                    self._write(batch.target, batch.rows)
+                finally:
+                    with self._lock:
+                        self._pending_rows -= len(batch.rows)
+
+    def retry_spool(self) -> None:
+        """
+        Insert spooled batches which are due for a retry.
+
+        A failed batch is retried after a backoff doubling with every
+        attempt, and moved aside after `spool_max_attempts`. Batches of a
+        table are inserted in order, so a failure skips the later batches
+        of that table until the next retry, but not of other tables.
+        """
+        now = time.time()
+        failed_tables = set()
+        for path in self.spool.paths():
+            record = self.spool.load(path)
+            table_key = (record["data_source_id"], record["table"])
+            if table_key in failed_tables:
+                continue
+            if record.get("retry_at", 0) > now:
+                failed_tables.add(table_key)
+                continue
+            target = self.streams.get_target(*table_key)
+            try:
+                if target is None:
+                    raise StreamNotFound(f"Unknown stream table: {record['table']}")
+                self.writer.insert(
+                    target, record["column_names"], record["columns"]
+                )
+            except Exception:
+                logger.exception("Failed to insert spooled batch: %s", path)
+                failed_tables.add(table_key)
+                record["attempts"] = record.get("attempts", 1) + 1
+                if record["attempts"] > self.spool_max_attempts:
+                    self.spool.fail(path)
+                else:
+                    record["retry_at"] = now + self._get_retry_delay(
+                        record["attempts"]
+                    )
+                    self.spool.put(record, path=path)
+            else:
+                self.spool.remove(path)
+
+    def start(self) -> None:
+        """Start background flushing."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop background flushing and flush all pending batches."""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush(force=True)
+
+    def _run(self) -> None:
+        retried_at = time.monotonic()
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval / 2)
+            self._wakeup.clear()
+            try:
+                self.flush()
+                if time.monotonic() - retried_at > self.spool_retry_interval:
+                    retried_at = time.monotonic()
+                    self.retry_spool()
+            except Exception:
+                logger.exception("Ingest gateway flush failed")
+
+    def _add_rows(
+        self, target: StreamTarget, rows: list[dict], size: int
+    ) -> None:
+        batch = self._batches.get(target.key)
+        if batch is None:
+            batch = self._batches[target.key] = TableBatch(target)
+        batch.add(rows, size)
+        self._pending_rows += len(rows)
+        if self._is_full(batch):
+            self._wakeup.set()
+
+    def _write(self, target: StreamTarget, rows: list[dict]) -> None:
+        for column_names, columns in to_column_blocks(rows):
+            try:
+                self.writer.insert(target, column_names, columns)
+            except Exception:
+                logger.exception(
+                    "Failed to insert %d rows into %s, spooling",
+                    len(columns[0]), target.table,
+                )
+                self.spool.put({
+                    "data_source_id": target.data_source_id,
+                    "table": target.table,
+                    "column_names": column_names,
+                    "columns": columns,
+                    "attempts": 1,
+                })
+
+    def _get_retry_delay(self, attempts: int) -> float:
+        delay = self.spool_retry_interval * 2 ** (attempts - 2)
+        return min(delay, self.spool_max_retry_interval)
+
+    def _is_full(self, batch: TableBatch) -> bool:
+        return (
+            len(batch.rows) >= self.batch_rows or batch.size >= self.batch_bytes
+        )
+
+    def _is_expired(self, batch: TableBatch) -> bool:
+        return time.monotonic() - batch.created_at >= self.flush_interval
+
+
+def create_app(gateway: Optional[IngestGateway] = None) -> Any:
+    """Create WSGI app serving the ingest gateway."""
+    from flask import jsonify, request
+
+    from redash.app import Redash
+    from redash.models import db
+
+    app = Redash()
+    db.init_app(app)
+
+    if gateway is None:
+        gateway = IngestGateway.from_settings(IngestGatewaySettings())
+        gateway.start()
+        atexit.register(gateway.stop)
+    app.extensions["ingest_gateway"] = gateway
+
+    def ingest(ingest_key: str):
+        try:
+            result = gateway.ingest(
+                ingest_key,
+                json.loads(request.get_data() or b"null"),
+                size=request.content_length or 0,
+                ip_addr=request.headers.get("X-Real-IP"),
+            )
+        except json.JSONDecodeError:
+            return jsonify({"message": "Invalid JSON payload"}), 400
+        except IngestBackpressure as exc:
+            return jsonify({"message": str(exc)}), exc.status_code, {
+                "Retry-After": str(int(gateway.flush_interval) + 1)
+            }
+        except IngestError as exc:
+            return jsonify({"message": str(exc)}), exc.status_code
+        return jsonify(result.to_dict())
+
+    app.add_url_rule(
+        "/ingest/<ingest_key>", "ingest", ingest, methods=["POST"]
+    )
+    return app
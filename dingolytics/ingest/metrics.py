@@ -0,0 +1,302 @@
+"""
+Per-stream ingestion metrics.
+
+`StreamMetricsCollector` samples, for every enabled ClickHouse stream:
+
+* table totals and lag from `system.parts`, i.e. rows, bytes on disk,
+  active parts and seconds since the last part was written,
+* inserted rows and bytes, inserts and failed inserts from
+  `system.query_log` since the previous sample,
+* events and bytes sent by the stream Vector sink, from the Vector API.
+
+The cost doesn't grow with the number of streams: ClickHouse is queried
+twice per data source, Vector once, and Redis with one pipeline for
+reads and one for writes. Samples are kept in Redis as capped lists,
+the newest first.
+"""
+import logging
+import time
+from collections import defaultdict
+from typing import Any, Optional
+
+import requests
+from pydantic import BaseModel
+
+from .vector import get_stream_route_key, is_internal_stream
+
+STREAM_METRICS_KEY = "stream:{}:metrics"
+# Entries appear in `system.query_log` with a delay, 7.5 seconds by default
+QUERY_LOG_DELAY = 10
+
+VECTOR_SINK_METRICS_QUERY = """
+{
+  components(first: 1000) {
+    edges {
+      node {
+        componentId
+        ... on Sink {
+          metrics {
+            receivedEventsTotal { receivedEventsTotal }
+            sentEventsTotal { sentEventsTotal }
+            sentBytesTotal { sentBytesTotal }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class SinkMetrics(BaseModel):
+    id: str
+    received_events_total: float = 0
+    sent_events_total: float = 0
+    sent_bytes_total: float = 0
+    events_per_second: Optional[float] = None
+    bytes_per_second: Optional[float] = None
+
+
+class StreamMetricsSample(BaseModel):
+    timestamp: float
+    # Table totals
+    rows: int = 0
+    bytes: int = 0
+    parts: int = 0
+    lag_seconds: Optional[int] = None
+    # Inserts within the window
+    window_start: int
+    window_end: int
+    inserts: int = 0
+    insert_errors: int = 0
+    inserted_rows: int = 0
+    inserted_bytes: int = 0
+    events_per_second: float = 0
+    bytes_per_second: float = 0
+    error_rate: float = 0
+    # Vector sink the stream is routed to, shared by streams of the
+    # same data source and volume preset
+    sink: Optional[SinkMetrics] = None
+
+
+def get_vector_sink_metrics(url: str, timeout: float = 2.0) -> dict:
+    """Get cumulative metrics of Vector sinks by component id."""
+    response = requests.post(
+        url, json={"query": VECTOR_SINK_METRICS_QUERY}, timeout=timeout
+    )
+    response.raise_for_status()
+    edges = (
+        ((response.json().get("data") or {}).get("components") or {})
+        .get("edges") or []
+    )
+    sinks = {}
+    for edge in edges:
+        node = edge.get("node") or {}
+        metrics = node.get("metrics")
+        if not metrics:
+            continue
+
+        def total(name: str) -> float:
+            return (metrics.get(name) or {}).get(name) or 0
+
+        sinks[node["componentId"]] = SinkMetrics(
+            id=node["componentId"],
+            received_events_total=total("receivedEventsTotal"),
+            sent_events_total=total("sentEventsTotal"),
+            sent_bytes_total=total("sentBytesTotal"),
+        )
+    return sinks
+
+
+class StreamMetricsCollector:
+    """
+    Collect stream metrics and store them as rolling series in Redis.
+
+    Attributes:
+        redis: Redis connection, with responses decoded.
+        writer: ClickHouse client, see `gateway.ClickHouseWriter`.
+        vector_api_url: Vector GraphQL API URL, or `None` to skip.
+        interval: Expected seconds between samples.
+        retention: Number of samples to keep per stream.
+    """
+
+    def __init__(
+        self, redis: Any, writer: Any, vector_api_url: Optional[str] = None,
+        interval: int = 10, retention: int = 360,
+    ) -> None:
+        self.redis = redis
+        self.writer = writer
+        self.vector_api_url = vector_api_url
+        self.interval = interval
+        self.retention = retention
+
+    def collect(self, streams: list) -> dict[int, StreamMetricsSample]:
+        """Collect and store samples of the streams."""
+        from .gateway import StreamTarget
+
+        streams = [s for s in streams if not is_internal_stream(s)]
+        if not streams:
+            return {}
+        now = time.time()
+        previous = self.get_latest([stream.id for stream in streams])
+
+        sinks = {}
+        if self.vector_api_url:
+            try:
+                sinks = get_vector_sink_metrics(self.vector_api_url)
+            except (requests.RequestException, ValueError) as exc:
+                logger.warning("Failed to get Vector metrics: %s", exc)
+
+        by_data_source = defaultdict(list)
+        for stream in streams:
+            by_data_source[stream.data_source_id].append(stream)
+
+        samples = {}
+        for group in by_data_source.values():
+            target = StreamTarget.from_stream(group[0])
+            window_end = int(now) - QUERY_LOG_DELAY
+            window_start = min(
+                (
+                    previous[s.id].window_end for s in group
+                    if s.id in previous
+                ),
+                default=window_end - self.interval,
+            )
+            window_start = max(
+                window_start, window_end - self.interval * self.retention
+            )
+            if window_start >= window_end:
+                # Sampled too early, the previous window is still current
+                continue
+            try:
+                parts, inserts = self._query_clickhouse(
+                    target, [s.db_table for s in group],
+                    window_start, window_end,
+                )
+            except Exception as exc:
+                logger.warning(
+                    "Failed to get metrics of data source %s: %s",
+                    target.data_source_id, exc,
+                )
+                continue
+            for stream in group:
+                samples[stream.id] = self._get_sample(
+                    now, window_start, window_end,
+                    parts.get(stream.db_table),
+                    inserts.get(stream.db_table),
+                    sinks.get(f"sink-{get_stream_route_key(stream)}"),
+                    previous.get(stream.id),
+                )
+
+        self.store(samples)
+        return samples
+
+    def store(self, samples: dict[int, StreamMetricsSample]) -> None:
+        pipe = self.redis.pipeline(transaction=False)
+        ttl = self.interval * self.retention
+        for stream_id, sample in samples.items():
+            key = STREAM_METRICS_KEY.format(stream_id)
+            pipe.lpush(key, sample.json())
+            pipe.ltrim(key, 0, self.retention - 1)
+            pipe.expire(key, ttl)
+        pipe.execute()
+
+    def get_latest(
+        self, stream_ids: list[int]
+    ) -> dict[int, StreamMetricsSample]:
+        pipe = self.redis.pipeline(transaction=False)
+        for stream_id in stream_ids:
+            pipe.lindex(STREAM_METRICS_KEY.format(stream_id), 0)
+        return {
+            stream_id: StreamMetricsSample.parse_raw(value)
+            for stream_id, value in zip(stream_ids, pipe.execute())
+            if value
+        }
+
+    def _query_clickhouse(
+        self, target: Any, tables: list[str], window_start: int,
+        window_end: int,
+    ) -> tuple[dict, dict]:
+        database = target.options.get("dbname") or "default"
+        parts = self.writer.query(
+            target,
+            "SELECT table, sum(rows), sum(bytes_on_disk), count(), "
+            "dateDiff('second', max(modification_time), now()) "
+            "FROM system.parts "
+            "WHERE active AND database = {database:String} "
+            "AND table IN {tables:Array(String)} "
+            "GROUP BY table",
+            {"database": database, "tables": tables},
+        )
+        inserts = self.writer.query(
+            target,
+            "SELECT splitByChar('.', table)[2] AS table_name, "
+            "countIf(type = 'QueryFinish'), "
+            "countIf(type != 'QueryFinish'), "
+            "sumIf(written_rows, type = 'QueryFinish'), "
+            "sumIf(written_bytes, type = 'QueryFinish') "
+            "FROM system.query_log ARRAY JOIN tables AS table "
+            "WHERE event_time >= toDateTime({start:UInt32}) "
+            "AND event_time < toDateTime({end:UInt32}) "
+            "AND query_kind = 'Insert' AND type != 'QueryStart' "
+            "AND table IN {tables:Array(String)} "
+            "GROUP BY table_name",
+            {
+                "start": window_start,
+                "end": window_end,
+                "tables": [f"{database}.{table}" for table in tables],
+            },
+        )
+        return (
+            {row[0]: row[1:] for row in parts},
+            {row[0]: row[1:] for row in inserts},
+        )
+
+    def _get_sample(
+        self, now: float, window_start: int, window_end: int,
+        parts: Optional[tuple], inserts: Optional[tuple],
+        sink: Optional[SinkMetrics],
+        previous: Optional[StreamMetricsSample],
+    ) -> StreamMetricsSample:
+        sample = StreamMetricsSample(
+            timestamp=now, window_start=window_start, window_end=window_end
+        )
+        if parts:
+            sample.rows, sample.bytes, sample.parts, sample.lag_seconds = parts
+        if inserts:
+            (
+                sample.inserts, sample.insert_errors,
+                sample.inserted_rows, sample.inserted_bytes,
+            ) = inserts
+            duration = max(window_end - window_start, 1)
+            sample.events_per_second = sample.inserted_rows / duration
+            sample.bytes_per_second = sample.inserted_bytes / duration
+            total = sample.inserts + sample.insert_errors
+            sample.error_rate = sample.insert_errors / total if total else 0
+        if sink:
+            sample.sink = sink.copy()
+            if previous and previous.sink and previous.sink.id == sink.id:
+                duration = max(now - previous.timestamp, 1)
+                sent_events = (
+                    sink.sent_events_total - previous.sink.sent_events_total
+                )
+                sent_bytes = (
+                    sink.sent_bytes_total - previous.sink.sent_bytes_total
+                )
+                # Counters are reset when Vector restarts
+                if sent_events >= 0 and sent_bytes >= 0:
+                    sample.sink.events_per_second = sent_events / duration
+                    sample.sink.bytes_per_second = sent_bytes / duration
+        return sample
+
+
+def get_stream_metrics(
+    redis: Any, stream_id: int, limit: Optional[int] = None
+) -> list[dict]:
+    """Get stored samples of a stream, the newest first."""
+    values = redis.lrange(
+        STREAM_METRICS_KEY.format(stream_id), 0, (limit or 0) - 1
+    )
+    return [StreamMetricsSample.parse_raw(value).dict() for value in values]
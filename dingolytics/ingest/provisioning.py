@@ -0,0 +1,104 @@
+"""
+Provisioning of stream tables.
+
+Creating a stream only inserts the row: tables are created afterwards by
+`provision_stream_task`, out of the ORM flush and the request. All DDL
+statements are `IF NOT EXISTS`, so provisioning is safe to retry, and
+the stream is added to the ingest config once its tables are ready.
+"""
+import logging
+from typing import Any
+
+from dingolytics.presets import (
+    TableOptions,
+    default_presets,
+    render_rollup_queries,
+    render_table_query,
+)
+
+from .dlq import DLQ_PRESET, get_dlq_table
+from .vector import is_internal_stream
+
+STREAM_PENDING = "pending"
+STREAM_PROVISIONING = "provisioning"
+STREAM_READY = "ready"
+STREAM_FAILED = "failed"
+
+logger = logging.getLogger(__name__)
+
+
+class StreamProvisioningError(Exception):
+    pass
+
+
+def _run_ddl(stream: Any, sql: str) -> None:
+    data, error = stream.data_source.query_runner.run_query(sql, None)
+    if error:
+        raise StreamProvisioningError(error)
+
+
+def create_table_for_stream(stream: Any) -> TableOptions:
+    """Create the stream table, return the table options applied."""
+    data_source = stream.data_source
+    try:
+        options = default_presets().get_table_options(
+            data_source.type, stream.db_table_preset, stream.db_table_options
+        )
+    except ValueError as exc:  # including `pydantic.ValidationError`
+        logger.error("Invalid table options of stream %s: %s", stream.id, exc)
+        options = TableOptions()
+    query = stream.db_table_query
+    if not query:
+        query = default_presets()[data_source.type][stream.db_table_preset]
+    sql = render_table_query(query, stream.db_table, options)
+    _run_ddl(stream, sql)
+    logger.info("Created table for stream %s: %s", stream.id, stream.db_table)
+    return options
+
+
+def create_dlq_table_for_stream(stream: Any) -> None:
+    """Create the dead-letter table for rejected events of the stream."""
+    db_presets = default_presets()[stream.data_source.type]
+    if DLQ_PRESET not in db_presets:
+        return
+    db_table = get_dlq_table(stream.db_table)
+    _run_ddl(stream, render_table_query(db_presets[DLQ_PRESET], db_table))
+    logger.info(
+        "Created dead-letter table for stream %s: %s", stream.id, db_table
+    )
+
+
+def create_rollup_for_stream(
+    stream: Any, rollup: str, query: str, options: TableOptions
+) -> None:
+    """Create the rollup table and the materialized view filling it."""
+    for sql in render_rollup_queries(query, stream.db_table, rollup, options):
+        _run_ddl(stream, sql)
+    logger.info("Created rollup %s for stream %s", rollup, stream.id)
+
+
+def create_tables_for_stream(stream: Any) -> None:
+    """Create the stream table, its dead-letter table and rollups."""
+    options = create_table_for_stream(stream)
+    if is_internal_stream(stream):
+        return
+    create_dlq_table_for_stream(stream)
+    rollups = default_presets().get_rollups(
+        stream.data_source.type, stream.db_table_preset
+    )
+    for rollup in options.rollups:
+        create_rollup_for_stream(stream, rollup, rollups[rollup], options)
+
+
+def schedule_stream_provisioning(stream_id: int) -> None:
+    """
+    Schedule provisioning of the stream after a short delay.
+
+    Called once the transaction inserting the stream is committed.
+    """
+    from dingolytics.tasks.provision_stream import provision_stream_task
+    from redash import settings
+
+    provision_stream_task.schedule(
+        (stream_id,), delay=settings.S.STREAM_PROVISIONING_DELAY
+    )
@@ -0,0 +1,339 @@
+"""
+Validation and coercion of ingested events by table schema.
+
+A schema is compiled once per stream preset into a `RowCoercer`, a list
+of per-column converter functions, which is used by the native ingest
+gateway. The same rules are emitted as VRL for the Vector config, see
+`get_vrl_coercion`.
+
+Values are converted to the representation ClickHouse accepts for the
+column type, e.g. date and time values become integer ticks since epoch.
+Rows which can't be converted are rejected one by one with `RowRejected`,
+so a single malformed event doesn't fail the whole insert.
+"""
+import ipaddress
+import json
+import uuid
+from datetime import date, datetime, timezone
+from functools import lru_cache
+from typing import Any, Callable, Optional
+
+from dingolytics.presets import ColumnSchema, TableSchema, default_presets
+
+EPOCH_DATE = date(1970, 1, 1)
+BOOL_VALUES = {"true": True, "false": False, "1": True, "0": False}
+INT_TYPES = {
+    f"{prefix}Int{bits}": (
+        (0, 2 ** bits - 1) if prefix else (-2 ** (bits - 1), 2 ** (bits - 1) - 1)
+    )
+    for prefix in ("", "U")
+    for bits in (8, 16, 32, 64, 128, 256)
+}
+FLOAT_TYPES = {"Float32", "Float64", "Decimal", "Decimal32", "Decimal64"}
+STRING_TYPES = {"String", "FixedString", "Enum8", "Enum16"}
+# VRL integers are 64-bit signed
+VRL_INT_RANGE = (-2 ** 63, 2 ** 63 - 1)
+
+
+class RowRejected(ValueError):
+    """Row can't be converted to the table schema."""
+
+    def __init__(self, column: Optional[str], reason: str) -> None:
+        self.column = column
+        self.reason = reason
+        super().__init__(f"{column}: {reason}" if column else reason)
+
+
+def _to_string(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return str(value)
+    raise TypeError(f"Unexpected {type(value).__name__}")
+
+
+def _to_int_factory(low: int, high: int) -> Callable[[Any], int]:
+    def to_int(value: Any) -> int:
+        if isinstance(value, float):
+            if not value.is_integer():
+                raise ValueError("Not an integer")
+            value = int(value)
+        elif isinstance(value, str):
+            value = int(value.strip())
+        elif not isinstance(value, int):
+            raise TypeError(f"Unexpected {type(value).__name__}")
+        if not low <= value <= high:
+            raise ValueError("Out of range")
+        return int(value)
+    return to_int
+
+
+def _to_float(value: Any) -> float:
+    if isinstance(value, (dict, list)):
+        raise TypeError(f"Unexpected {type(value).__name__}")
+    return float(value)
+
+
+def _to_bool(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.lower() in BOOL_VALUES:
+        return BOOL_VALUES[value.lower()]
+    raise ValueError("Not a boolean")
+
+
+def _parse_datetime(value: Any) -> datetime:
+    """Parse ISO 8601 string or Unix timestamp in seconds, UTC by default."""
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise TypeError(f"Unexpected {type(value).__name__}")
+    if isinstance(value, str):
+        result = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+        if result.tzinfo is None:
+            result = result.replace(tzinfo=timezone.utc)
+        return result
+    return datetime.fromtimestamp(value, tz=timezone.utc)
+
+
+def _to_datetime_factory(precision: int) -> Callable[[Any], int]:
+    scale = 10 ** precision
+
+    def to_datetime(value: Any) -> int:
+        if isinstance(value, str):
+            result = _parse_datetime(value)
+            return (
+                int(result.replace(microsecond=0).timestamp()) * scale
+                + result.microsecond * scale // 1000000
+            )
+        return int(_parse_datetime(value).timestamp() * scale)
+    return to_datetime
+
+
+def _to_date(value: Any) -> int:
+    if isinstance(value, str) and len(value.strip()) == 10:
+        return (date.fromisoformat(value.strip()) - EPOCH_DATE).days
+    return (_parse_datetime(value).date() - EPOCH_DATE).days
+
+
+def _to_ipv4(value: Any) -> str:
+    return str(ipaddress.IPv4Address(value))
+
+
+def _to_ipv6(value: Any) -> str:
+    return str(ipaddress.ip_address(value))
+
+
+def _to_uuid(value: Any) -> str:
+    if not isinstance(value, str):
+        raise TypeError(f"Unexpected {type(value).__name__}")
+    return str(uuid.UUID(value))
+
+
+def get_converter(column: ColumnSchema) -> Optional[Callable[[Any], Any]]:
+    """
+    Get converter function for the column type, if there's one.
+
+    Values of column types without converters are passed to ClickHouse
+    as is, e.g. arrays, maps and JSON.
+    """
+    base_type = column.base_type
+    if base_type in STRING_TYPES:
+        return _to_string
+    if base_type in INT_TYPES:
+        return _to_int_factory(*INT_TYPES[base_type])
+    if base_type in FLOAT_TYPES:
+        return _to_float
+    if base_type == "Bool":
+        return _to_bool
+    if base_type == "DateTime":
+        return _to_datetime_factory(0)
+    if base_type == "DateTime64":
+        return _to_datetime_factory(int(column.args[0]) if column.args else 3)
+    if base_type in ("Date", "Date32"):
+        return _to_date
+    if base_type == "IPv4":
+        return _to_ipv4
+    if base_type == "IPv6":
+        return _to_ipv6
+    if base_type == "UUID":
+        return _to_uuid
+    return None
+
+
+class RowCoercer:
+    """
+    Validate and convert event rows to the table schema.
+
+    Unknown fields and non-insertable columns are skipped. NULL values of
+    non-nullable columns are skipped too, so the column gets its default.
+    """
+
+    def __init__(self, schema: TableSchema) -> None:
+        self.schema = schema
+        self.columns = {
+            column.name: (get_converter(column), column.nullable)
+            for column in schema.columns
+            if column.is_insertable
+        }
+
+    def coerce(self, row: Any) -> dict:
+        """Convert a row or raise `RowRejected`."""
+        if not isinstance(row, dict):
+            raise RowRejected(None, "Event must be an object")
+        result = {}
+        columns = self.columns
+        for name, value in row.items():
+            column = columns.get(name)
+            if column is None:
+                continue
+            converter, nullable = column
+            if value is None:
+                if nullable:
+                    result[name] = None
+                continue
+            if converter is None:
+                result[name] = value
+                continue
+            try:
+                result[name] = converter(value)
+            except (TypeError, ValueError, OverflowError) as exc:
+                raise RowRejected(name, str(exc) or "Invalid value")
+        return result
+
+
+def to_column_blocks(rows: list[dict]) -> list[tuple[list[str], list[list]]]:
+    """
+    Group rows by the set of present columns into columnar blocks.
+
+    Every block is a pair of column names and column values, so omitted
+    columns get their table defaults on insert.
+    """
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    return [
+        (list(names), [[row[name] for row in group] for name in names])
+        for names, group in groups.items()
+    ]
+
+
+@lru_cache(maxsize=256)
+def get_preset_coercer(db_type: str, preset: str) -> Optional[RowCoercer]:
+    """Get coercer for the table schema of a stream preset."""
+    schema = default_presets().get_schema(db_type, preset)
+    return RowCoercer(schema) if schema else None
+
+
+def _vrl_string(column: str) -> list[str]:
+    return [
+        f"if is_object({column}) || is_array({column}) {{",
+        f"    {column} = encode_json({column})",
+        "} else {",
+        f"    {column} = to_string!({column})",
+        "}",
+    ]
+
+
+def _vrl_int(column: str, low: int, high: int) -> list[str]:
+    low, high = max(low, VRL_INT_RANGE[0]), min(high, VRL_INT_RANGE[1])
+    return [
+        f"if is_float({column}) && floor(to_float!({column})) != {column} {{",
+        "    abort",
+        "}",
+        f"{column} = to_int!({column})",
+        f"if {column} < {low} || {column} > {high} {{",
+        "    abort",
+        "}",
+    ]
+
+
+def _vrl_datetime(column: str, time_format: str) -> list[str]:
+    return [
+        f"if is_string({column}) {{",
+        f'    {column} = parse_timestamp({column}, format: "%+") ?? '
+        f'parse_timestamp!({column}, format: "%Y-%m-%d %H:%M:%S%.f")',
+        f"}} else if !is_timestamp({column}) {{",
+        f"    {column} = from_unix_timestamp!("
+        f'to_int(to_float!({column}) * 1000), unit: "milliseconds")',
+        "}",
+        f'{column} = format_timestamp!({column}, '
+        f'format: "{time_format}", timezone: "UTC")',
+    ]
+
+
+def _vrl_pattern(column: str, check: str) -> list[str]:
+    return [
+        f"if !{check}(to_string!({column})) {{",
+        "    abort",
+        "}",
+    ]
+
+
+def get_vrl_column_coercion(column: ColumnSchema) -> list[str]:
+    """Get VRL statements converting the column like `get_converter`."""
+    path = f".{json.dumps(column.name)}"
+    base_type = column.base_type
+    if base_type in STRING_TYPES:
+        body = _vrl_string(path)
+    elif base_type in INT_TYPES:
+        body = _vrl_int(path, *INT_TYPES[base_type])
+    elif base_type in FLOAT_TYPES:
+        body = [f"{path} = to_float!({path})"]
+    elif base_type == "Bool":
+        body = [f"{path} = to_bool!({path})"]
+    elif base_type == "DateTime":
+        body = _vrl_datetime(path, "%Y-%m-%d %H:%M:%S")
+    elif base_type == "DateTime64":
+        # Fractional seconds format supports 3, 6 or 9 digits only
+        precision = int(column.args[0]) if column.args else 3
+        digits = next(d for d in (0, 3, 6, 9) if d >= min(precision, 9))
+        body = _vrl_datetime(
+            path, f"%Y-%m-%d %H:%M:%S%.{digits}f" if digits else
+            "%Y-%m-%d %H:%M:%S"
+        )
+    elif base_type in ("Date", "Date32"):
+        body = _vrl_datetime(path, "%Y-%m-%d")
+    elif base_type == "IPv4":
+        body = _vrl_pattern(path, "is_ipv4")
+    elif base_type == "IPv6":
+        body = [
+            f"if !is_ipv4(to_string!({path})) && "
+            f"!is_ipv6(to_string!({path})) {{",
+            "    abort",
+            "}",
+        ]
+    elif base_type == "UUID":
+        body = [
+            f"if !match(to_string!({path}), "
+            r"r'^[0-9a-fA-F]{8}-?([0-9a-fA-F]{4}-?){3}[0-9a-fA-F]{12}$') {",
+            "    abort",
+            "}",
+        ]
+    else:
+        return []
+    if column.nullable:
+        lines = [f"if {path} != null {{"]
+    else:
+        lines = [f"if {path} == null {{", f"    del({path})", "} else {"]
+    lines += [f"    {line}" for line in body]
+    lines.append("}")
+    return lines
+
+
+def get_vrl_coercion(schema: TableSchema) -> str:
+    """
+    Get VRL program converting events to the table schema.
+
+    Events which can't be converted abort the program or fail with
+    an error, so the remap transform drops them one by one.
+    """
+    lines = []
+    for column in schema.columns:
+        if column.is_insertable:
+            lines += get_vrl_column_coercion(column)
+    return "\n".join(lines)
@@ -1,59 +1,105 @@
+import json
+import logging
 import os
+import tempfile
+from copy import deepcopy
 from functools import lru_cache
 from pathlib import Path
-from typing import Any
-from pydantic import BaseModel
+from typing import Any, Literal, Optional
+from pydantic import BaseModel, Extra, root_validator
 from yaml import safe_load as load_yaml
 from yaml import dump as dump_yaml
 
+from dingolytics.auditlog.clickhouse import AUDIT_EVENTS_PRESET
+from dingolytics.presets import TableSchema, default_presets
+
+from .dlq import DLQ_SOURCE_VECTOR, DLQ_TABLE_SUFFIX
+from .schema import get_vrl_coercion
+
 VECTOR_CONFIG_TEMPLATE = """
 data_dir: /var/lib/vector
 
 api:
     enabled: true
 """
+# The API is unauthenticated, so it's only served on loopback unless the
+# metrics collector runs on another host, e.g. in another container.
+VECTOR_DEFAULT_API_ADDRESS = "127.0.0.1:8686"
 
 VECTOR_HTTP_INPUT = "http_input"
+VECTOR_HTTP_LOOKUP = "http_lookup"
+VECTOR_HTTP_DEAD_LETTERS = "http_dead_letters"
 VECTOR_HTTP_ROUTER = "http_router"
 VECTOR_HTTP_PATH_KEY = "_path_"
+VECTOR_TABLE_FIELD = "_table_"
+VECTOR_ROUTE_FIELD = "_route_"
 VECTOR_SINK_PREFIX = "sink-"
 VECTOR_INTERNAL_INPUT = "vector_internal_logs"
 VECTOR_IP_ADDR_FIELD = "ip_addr_v4"
 VECTOR_IP_ADDR_HEADER = "x-real-ip"
 VECTOR_IP_ADDR_REMAP = "ip_addr_remap"
 # VECTOR_INTERNAL_REMAP = "vector_internal_remap"
+VECTOR_CONFIG_SECTIONS = ("sources", "transforms", "sinks")
+VECTOR_DEFAULT_INGEST_VOLUME = "medium"
+
+logger = logging.getLogger(__name__)
 
 
 @lru_cache
 def get_vector_config() -> "VectorConfig":
     config_path = os.environ.get("VECTOR_CONFIG_PATH") or "vector.yaml"
-    return VectorConfig(config_path)
+    api_address = os.environ.get("VECTOR_API_ADDRESS")
+    return VectorConfig(config_path, api_address=api_address)
 
 
 def is_internal_stream(stream: Any) -> bool:
     return stream.db_table_preset.startswith("_")
 
 
+def get_stream_route_key(stream: Any) -> str:
+    """
+    Get route and sink key of a stream ingest.
+
+    Streams of the same data source and volume preset share a route,
+    streams with custom tuning options get a route of their own.
+    """
+    if stream.ingest_options:
+        return f"stream-{stream.id}"
+    volume = stream.ingest_volume or VECTOR_DEFAULT_INGEST_VOLUME
+    return f"ds-{stream.data_source.id}-{volume}"
+
+
 def update_vector_config(
-    streams: list, clean: bool = False, router_key: str = VECTOR_HTTP_ROUTER
+    streams: list, clean: bool = False, router_key: str = VECTOR_HTTP_ROUTER,
+    vector_config: Optional["VectorConfig"] = None,
 ) -> "VectorConfig":
-    vector_config = get_vector_config()
+    vector_config = vector_config or get_vector_config()
+    current_config = vector_config.read()
     if clean:
         vector_config.clean()
     else:
-        vector_config.load()
-    router = VectorRouteTransform(key=router_key)
+        vector_config.config = deepcopy(current_config) or vector_config.config
+    lookup = VectorLookupTransform(key=VECTOR_HTTP_LOOKUP)
+    router = VectorRouteTransform(
+        key=router_key, inputs=[lookup.key, VECTOR_HTTP_DEAD_LETTERS]
+    )
     for stream in streams:
         # TODO: More flexible stream source configuration.
         # Current implementation only supports ingest via HTTP
         # and internal logs.
+        if stream.db_table_preset == AUDIT_EVENTS_PRESET:
+            # Written by the audit log flush, not by Vector
+            continue
         if is_internal_stream(stream):
             sink = vector_config.get_sink_for_internal_logs(
                 stream=stream
             )
         else:
             sink = vector_config.get_sink_for_stream_ingest(
-                stream=stream, router=router,
+                stream=stream, lookup=lookup, router=router,
+            )
+            vector_config.add_sink(
+                vector_config.get_dlq_sink_for_stream(stream, router)
             )
         if sink:
             vector_config.add_sink(sink)
@@ -61,8 +107,21 @@ def update_vector_config(
         # print(stream)
         # print(stream.data_source)
         # print(stream.data_source.options.to_dict())
+    # Events dropped by the lookup go to the dead-letter tables
+    dead_letters = VectorDeadLetterTransform(
+        key=VECTOR_HTTP_DEAD_LETTERS,
+        inputs=[f"{lookup.key}.dropped"],
+        lookup=lookup,
+    )
+    vector_config.add_transform(lookup)
+    vector_config.add_transform(dead_letters)
     vector_config.add_transform(router)
-    vector_config.save()
+    # Vector reloads the whole file on every write, so it's only
+    # rewritten when the generated components actually differ.
+    diff = vector_config.diff(current_config)
+    if diff:
+        logger.info("Updating Vector config: %s", diff)
+        vector_config.save()
     return vector_config
 
 
@@ -103,6 +162,103 @@ class VectorClickHouseAuth(BaseModel):
     password: str = ""
 
 
+class VectorClickHouseTuning(BaseModel):
+    """
+    Batching, buffering and insert settings for a ClickHouse sink.
+
+    Larger and less frequent batches mean fewer MergeTree parts. Low
+    volume streams rely on async inserts instead, so ClickHouse itself
+    collects small inserts into bigger parts.
+    """
+    batch_max_bytes: Optional[int] = None
+    batch_max_events: Optional[int] = None
+    batch_timeout_secs: Optional[float] = None
+    buffer_type: Literal["memory", "disk"] = "memory"
+    # Events limit for memory buffer, or size in bytes for disk buffer
+    # (Vector requires at least 256MB for the latter).
+    buffer_max_events: Optional[int] = None
+    buffer_max_size: Optional[int] = None
+    compression: Literal["none", "gzip", "zlib", "zstd", "snappy"] = "gzip"
+    async_insert: bool = False
+    wait_for_async_insert: bool = True
+
+    class Config:
+        extra = Extra.forbid
+
+    @root_validator(skip_on_failure=True)
+    def validate_buffer(cls, values: dict) -> dict:
+        # A memory buffer smaller than the batch blocks senders before
+        # the batch can fill, so batches would only flush on timeout
+        buffer_max_events = values.get("buffer_max_events")
+        batch_max_events = values.get("batch_max_events")
+        if (
+            values.get("buffer_type") == "memory"
+            and buffer_max_events and batch_max_events
+            and buffer_max_events < batch_max_events
+        ):
+            raise ValueError("Buffer must hold at least one batch of events")
+        return values
+
+    def get_batch(self) -> dict:
+        batch = {
+            "max_bytes": self.batch_max_bytes,
+            "max_events": self.batch_max_events,
+            "timeout_secs": self.batch_timeout_secs,
+        }
+        return {k: v for k, v in batch.items() if v is not None}
+
+    def get_buffer(self) -> dict:
+        buffer = {"type": self.buffer_type, "when_full": "block"}
+        if self.buffer_type == "disk":
+            buffer["max_size"] = self.buffer_max_size or 268435488
+        elif self.buffer_max_events:
+            buffer["max_events"] = self.buffer_max_events
+        return buffer
+
+    def get_query_settings(self) -> dict:
+        return {
+            "async_insert_settings": {
+                "enabled": self.async_insert,
+                "wait_for_processing": self.wait_for_async_insert,
+            }
+        }
+
+
+# Tuning presets by expected stream volume
+VECTOR_INGEST_VOLUMES = {
+    "low": VectorClickHouseTuning(
+        batch_max_events=10000,
+        batch_timeout_secs=10,
+        buffer_max_events=20000,
+        async_insert=True,
+    ),
+    "medium": VectorClickHouseTuning(
+        batch_max_bytes=10 * 1024 * 1024,
+        batch_timeout_secs=5,
+        buffer_max_events=10000,
+    ),
+    "high": VectorClickHouseTuning(
+        batch_max_bytes=64 * 1024 * 1024,
+        batch_max_events=500000,
+        batch_timeout_secs=2,
+        buffer_type="disk",
+        buffer_max_size=1024 * 1024 * 1024,
+        compression="zstd",
+    ),
+}
+
+
+def get_ingest_tuning(volume: str, options: dict) -> VectorClickHouseTuning:
+    """
+    Get sink tuning for a volume preset with options overrides.
+
+    Raises `KeyError` for unknown presets and `pydantic.ValidationError`
+    for invalid options.
+    """
+    preset = VECTOR_INGEST_VOLUMES[volume]
+    return VectorClickHouseTuning(**{**preset.dict(), **(options or {})})
+
+
 class VectorClickHouseSink(VectorSection):
     database: str
     table: str
@@ -111,6 +267,18 @@ class VectorClickHouseSink(VectorSection):
     inputs: list = [VECTOR_HTTP_INPUT]
     encoding: dict = {"timestamp_format": "rfc3339"}
     endpoint: str = "http://clickhouse:8123"
+    # Routing fields are not table columns:
+    skip_unknown_fields: bool = True
+    batch: dict = {}
+    buffer: dict = {"type": "memory"}
+    compression: str = "gzip"
+    query_settings: dict = {}
+
+    def set_tuning(self, tuning: VectorClickHouseTuning) -> None:
+        self.batch = tuning.get_batch()
+        self.buffer = tuning.get_buffer()
+        self.compression = tuning.compression
+        self.query_settings = tuning.get_query_settings()
 
 
 class VectorIPAddressTransform(VectorSection):
@@ -119,20 +287,151 @@ class VectorIPAddressTransform(VectorSection):
     source: str = f'.{VECTOR_IP_ADDR_FIELD} = del(."{VECTOR_IP_ADDR_HEADER}")'
 
 
-class VectorRouteTransform(VectorSection):
-    type: str = "route"
+class VectorLookupTransform(VectorSection):
+    """
+    Remap transform resolving the ingest path of events to destinations.
+
+    All streams are compiled into a single VRL object literal, mapping
+    ingest path to the target table and route, so resolving an event
+    takes one lookup regardless of the number of streams. Events with
+    unknown paths are dropped.
+
+    Events are then converted to the table schema of the stream preset,
+    compiled once per preset, and events which don't match the schema
+    are dropped one by one, to the `dropped` output.
+    """
+    type: str = "remap"
     # inputs: list = [VECTOR_HTTP_INPUT]  # use original input
     inputs: list = [VECTOR_IP_ADDR_REMAP]  # use remapped input
-    route: dict = {}
+    drop_on_abort: bool = True
+    drop_on_error: bool = True
+    reroute_dropped: bool = True
+    destinations: dict = {}
+    schemas: dict = {}
     _path_key: str = VECTOR_HTTP_PATH_KEY
 
+    def add_destination(
+        self, path: str, table: str, route: str,
+        schema: Optional[TableSchema] = None,
+        stream_id: Optional[int] = None, dlq_route: Optional[str] = None,
+    ) -> None:
+        self.destinations[path] = {"table": table, "route": route}
+        if stream_id is not None:
+            self.destinations[path]["stream"] = stream_id
+        if dlq_route is not None:
+            self.destinations[path]["dlq"] = dlq_route
+        if schema is not None:
+            self.destinations[path]["schema"] = schema.name
+            self.schemas[schema.name] = schema
+
+    def get_lookup_source(self) -> list[str]:
+        # JSON object with plain values is a valid VRL literal.
+        destinations = json.dumps(
+            self.destinations, sort_keys=True, ensure_ascii=False
+        )
+        return [
+            f"destination = get!(value: {destinations}, "
+            f'path: [string(.{self._path_key}) ?? ""])',
+            "if !is_object(destination) {",
+            "    abort",
+            "}",
+        ]
+
+    def get_source(self) -> str:
+        lines = self.get_lookup_source() + [
+            f".{VECTOR_TABLE_FIELD} = destination.table",
+            f".{VECTOR_ROUTE_FIELD} = destination.route",
+        ]
+        if self.schemas:
+            lines.append('schema = string(destination.schema) ?? ""')
+        for i, name in enumerate(sorted(self.schemas)):
+            condition = f"if schema == {json.dumps(name)} {{"
+            lines.append(condition if i == 0 else f"}} else {condition}")
+            coercion = get_vrl_coercion(self.schemas[name])
+            lines += [f"    {line}" for line in coercion.splitlines()]
+        if self.schemas:
+            lines.append("}")
+        return "\n".join(lines)
+
+    def dict(self, **kwargs) -> dict:
+        result = super().dict(exclude={"destinations", "schemas"}, **kwargs)
+        result["source"] = self.get_source()
+        return result
+
+
+class VectorDeadLetterTransform(VectorSection):
+    """
+    Remap transform turning events dropped by the lookup into rows of
+    the stream dead-letter tables.
+
+    The original event is kept as a JSON payload with the drop reason,
+    and routed to the dead-letter sink of the stream data source.
+    """
+    type: str = "remap"
+    inputs: list = [f"{VECTOR_HTTP_LOOKUP}.dropped"]
+    drop_on_abort: bool = True
+    drop_on_error: bool = True
+    lookup: VectorLookupTransform
+
+    def get_source(self) -> str:
+        path_key = self.lookup._path_key
+        return "\n".join(self.lookup.get_lookup_source() + [
+            "if destination.dlq == null {",
+            "    abort",
+            "}",
+            f"del(.{path_key})",
+            "payload = encode_json(.)",
+            ". = {",
+            f'    "{VECTOR_TABLE_FIELD}": '
+            f'string!(destination.table) + "{DLQ_TABLE_SUFFIX}",',
+            f'    "{VECTOR_ROUTE_FIELD}": destination.dlq,',
+            '    "stream_id": destination.stream,',
+            f'    "source": "{DLQ_SOURCE_VECTOR}",',
+            '    "reason": string(%vector.dropped.message) ?? "dropped",',
+            '    "payload": payload,',
+            "}",
+        ])
+
+    def dict(self, **kwargs) -> dict:
+        result = super().dict(exclude={"lookup"}, **kwargs)
+        result["source"] = self.get_source()
+        return result
+
+
+class VectorRouteTransform(VectorSection):
+    type: str = "route"
+    inputs: list = [VECTOR_HTTP_LOOKUP, VECTOR_HTTP_DEAD_LETTERS]
+    route: dict = {}
+    _route_key: str = VECTOR_ROUTE_FIELD
+
     def add_route(self, key: str, condition: str) -> None:
         self.route[key] = condition
 
 
+class VectorConfigDiff(BaseModel):
+    """Component keys added, removed or changed per config section."""
+    added: dict = {}
+    removed: dict = {}
+    changed: dict = {}
+    options_changed: bool = False
+
+    def __bool__(self) -> bool:
+        return bool(
+            self.added or self.removed or self.changed or self.options_changed
+        )
+
+    def __str__(self) -> str:
+        return " ".join(
+            f"{name}={value}" for name, value in self.dict().items() if value
+        )
+
+
 class VectorConfig:
-    def __init__(self, config_path: str) -> None:
+    def __init__(
+        self, config_path: str, api_address: Optional[str] = None
+    ) -> None:
         self.config_path = Path(config_path)
+        self.api_address = api_address or VECTOR_DEFAULT_API_ADDRESS
         self.config = {}
         self.add_defaults()
 
@@ -140,18 +439,72 @@ class VectorConfig:
         self.config = {}
         self.add_defaults()
 
+    def read(self) -> dict:
+        """Read the config saved on disk, empty if there's none yet."""
+        if not self.config_path.exists():
+            return {}
+        with open(self.config_path) as f:
+            return load_yaml(f) or {}
+
     def load(self) -> None:
         if self.config_path.exists():
-            with open(self.config_path) as f:
-                self.config = load_yaml(f)
+            self.config = self.read()
 
     def save(self) -> None:
+        """
+        Save the config atomically.
+
+        The config is written to a temporary file in the same directory
+        and then renamed, so Vector never sees a partially written file.
+        """
         self.config_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(self.config_path, "w") as f:
-            dump_yaml(self.config, f)
+        fd, tmp_path = tempfile.mkstemp(
+            dir=self.config_path.parent, prefix=f".{self.config_path.name}."
+        )
+        try:
+            with os.fdopen(fd, "w") as f:
+                dump_yaml(self.config, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self.config_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def diff(self, other: dict) -> VectorConfigDiff:
+        """
+        Compare components with another config, e.g. the one on disk.
+
+        Result lists the component keys of this config which are missing,
+        absent or different in the other config, per section.
+        """
+        diff = VectorConfigDiff()
+        for section in VECTOR_CONFIG_SECTIONS:
+            ours = self.config.get(section) or {}
+            theirs = other.get(section) or {}
+            added = sorted(set(ours) - set(theirs))
+            removed = sorted(set(theirs) - set(ours))
+            changed = sorted(
+                key for key in set(ours) & set(theirs)
+                if ours[key] != theirs[key]
+            )
+            if added:
+                diff.added[section] = added
+            if removed:
+                diff.removed[section] = removed
+            if changed:
+                diff.changed[section] = changed
+        diff.options_changed = any(
+            self.config.get(key) != other.get(key)
+            for key in set(self.config) | set(other)
+            if key not in VECTOR_CONFIG_SECTIONS
+        )
+        return diff
 
     def add_defaults(self) -> None:
         self.config = load_yaml(VECTOR_CONFIG_TEMPLATE)
+        self.config["api"]["address"] = self.api_address
         self.add_source(VectorInternalSource(key=VECTOR_INTERNAL_INPUT))
         self.add_source(VectorHTTPSource(key=VECTOR_HTTP_INPUT))
         self.add_sink(VectorConsoleSink(key="console"))
@@ -179,27 +532,70 @@ class VectorConfig:
         self.add_section(transform, "transforms")
 
     def get_sink_for_stream_ingest(
+        self, stream: Any, lookup: VectorLookupTransform,
+        router: VectorRouteTransform, prefix: str = VECTOR_SINK_PREFIX,
+    ) -> VectorSection:
+        """
+        Create a sink configuration for a stream ingest.
+
+        Streams of the same data source and volume preset share a single
+        ClickHouse sink, which takes the table name from the event, while
+        streams with custom tuning options get a sink of their own. The
+        lookup resolves the stream table and route by the ingest path,
+        and the router passes events to the sink.
+        """
+        volume = stream.ingest_volume or VECTOR_DEFAULT_INGEST_VOLUME
+        route_key = get_stream_route_key(stream)
+        lookup.add_destination(
+            path=f"/ingest/{stream.ingest_key}",
+            table=stream.db_table,
+            route=route_key,
+            schema=default_presets().get_schema(
+                stream.data_source.type, stream.db_table_preset
+            ),
+            stream_id=stream.id,
+            dlq_route=self.get_dlq_route_key(stream),
+        )
+        router.add_route(route_key, f'.{router._route_key} == "{route_key}"')
+        options = stream.data_source.options.to_dict()
+        sink = VectorClickHouseSink(
+            key=f"{prefix}{route_key}",
+            inputs=[f"{router.key}.{route_key}"],
+            table=f"{{{{ {VECTOR_TABLE_FIELD} }}}}",
+            auth=VectorClickHouseAuth(**options),
+            endpoint=options["url"],
+            database=options["dbname"],
+        )
+        sink.set_tuning(get_ingest_tuning(volume, stream.ingest_options))
+        return sink
+
+    @staticmethod
+    def get_dlq_route_key(stream: Any) -> str:
+        return f"dlq-ds-{stream.data_source.id}"
+
+    def get_dlq_sink_for_stream(
         self, stream: Any, router: VectorRouteTransform,
         prefix: str = VECTOR_SINK_PREFIX,
     ) -> VectorSection:
         """
-        Create a sink configuration for a stream ingest.
+        Create a dead-letter sink configuration for a stream ingest.
 
-        The sink will be connected to the HTTP source and the ClickHouse
-        database, and the router will route the incoming data to the sink.
+        Streams of the same data source share a single sink, which takes
+        the dead-letter table name from the event.
         """
-        route_key = stream.db_table.replace("_", "-").replace(".", "-")
-        path_match = f'.{router._path_key} == "/ingest/{stream.ingest_key}"'
-        router.add_route(route_key, path_match)
+        route_key = self.get_dlq_route_key(stream)
+        router.add_route(route_key, f'.{router._route_key} == "{route_key}"')
         options = stream.data_source.options.to_dict()
-        return VectorClickHouseSink(
+        sink = VectorClickHouseSink(
             key=f"{prefix}{route_key}",
             inputs=[f"{router.key}.{route_key}"],
-            table=stream.db_table,
+            table=f"{{{{ {VECTOR_TABLE_FIELD} }}}}",
             auth=VectorClickHouseAuth(**options),
             endpoint=options["url"],
             database=options["dbname"],
         )
+        sink.set_tuning(VECTOR_INGEST_VOLUMES["low"])
+        return sink
 
     def get_sink_for_internal_logs(
         self, stream: Any, prefix: str = VECTOR_SINK_PREFIX
@@ -10,7 +10,6 @@ from sqlalchemy.event import listens_for
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import contains_eager, joinedload
 from sqlalchemy_utils.models import generic_repr
-from sqlalchemy_utils.types import TSVectorType
 
 from dingolytics.models.results import QueryResult
 from redash.models.base import Column, db, gfk_type, key_type, primary_key
@@ -18,6 +17,12 @@ from redash.models.datasources import DataSource, DataSourceGroup
 from redash.models.mixins import BelongsToOrgMixin, TimestampMixin
 from redash.models.organizations import Organization
 from redash.models.parameterized_query import ParameterizedQuery
+from redash.models.search import (
+    SEARCH_MAX_TEXT_LENGTH,
+    search_match,
+    search_vector_expression,
+    trigram_index,
+)
 from redash.models.types import MutableDict, MutableList, json_cast_property
 from redash.models.users import User
 from redash.query_runner import BaseQueryRunner
@@ -80,22 +85,37 @@ class Query(TimestampMixin, BelongsToOrgMixin, db.Model):
         MutableDict.as_mutable(postgresql.JSONB),
         server_default="{}", default={}
     )
-    search_vector = Column(
-        TSVectorType(
-            "id",
-            "name",
-            "description",
-            "query",
-            weights={"name": "A", "id": "B", "description": "C", "query": "D"},
-        ),
-        nullable=True,
+    search_vector = db.deferred(
+        Column(
+            postgresql.TSVECTOR,
+            db.Computed(
+                search_vector_expression(
+                    ("coalesce(name, '')", "A"),
+                    ("id::text", "B"),
+                    ("coalesce(description, '')", "C"),
+                    (
+                        "left(coalesce(query, ''), {})".format(SEARCH_MAX_TEXT_LENGTH),
+                        "D",
+                    ),
+                ),
+                persisted=True,
+            ),
+            nullable=True,
+        )
     )
     tags = Column(
         "tags", MutableList.as_mutable(postgresql.ARRAY(db.Unicode)), nullable=True
     )
 
-    # query_class = SearchBaseQuery
     __tablename__ = "queries"
+    __table_args__ = (
+        db.Index("ix_queries_search_vector", "search_vector", postgresql_using="gin"),
+        trigram_index("ix_queries_name_trgm", "name"),
+        trigram_index("ix_queries_description_trgm", "description"),
+        # Sort keys of the lists, see `order_results`
+        db.Index("ix_queries_created_at_id", "created_at", "id"),
+        db.Index("ix_queries_lower_name_id", db.text("lower(name)"), "id"),
+    )
     __mapper_args__ = {"version_id_col": version, "version_id_generator": False}
 
     def __str__(self):
@@ -300,30 +320,38 @@ class Query(TimestampMixin, BelongsToOrgMixin, db.Model):
             include_drafts=include_drafts,
             include_archived=include_archived,
         )
-
-        if multi_byte_search:
-            # Since tsvector doesn't work well with CJK languages, use `ilike` too
-            pattern = "%{}%".format(term)
-            return (
-                all_queries.filter(
-                    or_(cls.name.ilike(pattern), cls.description.ilike(pattern))
-                )
-                .order_by(Query.id)
-                .limit(limit)
-            )
-
-        # Sort the result using the weight as defined in the search vector column
-        return all_queries.limit(limit)
-        # return all_queries.search(term, sort=True).limit(limit)
+        return cls._search(all_queries, term, multi_byte_search).limit(limit)
 
     @classmethod
     def search_by_user(cls, term, user, limit=None):
-        return cls.by_user(user).search(term, sort=True).limit(limit)
+        return cls._search(cls.by_user(user), term).limit(limit)
 
     @classmethod
-    def recent(cls, group_ids, user_id=None, limit=20):
+    def _search(cls, queries, term, multi_byte_search=False):
+        # Since tsvector doesn't work well with CJK languages, match
+        # substrings too, served by the trigram indexes
+        substring_columns = (cls.name, cls.description) if multi_byte_search else ()
+        match, rank = search_match(cls.search_vector, term, substring_columns)
+        return queries.filter(match).order_by(rank.desc(), cls.id.desc())
+
+    @classmethod
+    def recent(cls, group_ids, user_id=None, limit=20, org_id=None):
+        """
+        Get queries with the most events in the last 7 days.
+
+        With `org_id`, queries are read from the recent activity feed,
+        otherwise events are counted in the `events` table.
+        """
+        from dingolytics.auditlog import RECENT_ACTIONS, get_recent_activity
         from redash.models import DataSourceGroup, Event
 
+        if org_id is not None:
+            # Some of the queries may be archived or not accessible
+            object_ids = get_recent_activity().get(
+                org_id, "query", user_id=user_id, limit=limit * 5
+            )
+            return cls._recent_by_ids(object_ids, org_id, group_ids, user_id, limit)
+
         query = (
             cls.query.filter(Event.created_at > (db.func.current_date() - 7))
             .join(Event, Query.id == Event.object_id.cast(db.Integer))
@@ -331,9 +359,7 @@ class Query(TimestampMixin, BelongsToOrgMixin, db.Model):
                 DataSourceGroup, Query.data_source_id == DataSourceGroup.data_source_id
             )
             .filter(
-                Event.action.in_(
-                    ["edit", "execute", "edit_name", "edit_description", "view_source"]
-                ),
+                Event.action.in_(RECENT_ACTIONS["query"]),
                 Event.object_id != None,
                 Event.object_type == "query",
                 DataSourceGroup.group_id.in_(group_ids),
@@ -351,18 +377,43 @@ class Query(TimestampMixin, BelongsToOrgMixin, db.Model):
 
         return query
 
+    @classmethod
+    def _recent_by_ids(cls, object_ids, org_id, group_ids, user_id, limit):
+        ids = [int(i) for i in object_ids if i.isdigit()]
+        data_source_ids = db.session.query(DataSourceGroup.data_source_id).filter(
+            DataSourceGroup.group_id.in_(group_ids)
+        )
+        query = cls.query.filter(
+            cls.id.in_(ids),
+            cls.org_id == org_id,
+            cls.data_source_id.in_(data_source_ids),
+            or_(Query.is_draft == False, Query.user_id == user_id),
+            Query.is_archived == False,
+        )
+        if ids:
+            position = {query_id: i for i, query_id in enumerate(ids)}
+            query = query.order_by(db.case(position, value=cls.id))
+        return query.limit(limit)
+
     @classmethod
     def get_by_id(cls, _id) -> 'Query':
         return cls.query.filter(cls.id == _id).one()
 
     @classmethod
     def all_groups_for_query_ids(cls, query_ids):
-        query = """SELECT group_id, view_only
-                   FROM queries
-                   JOIN data_source_groups ON queries.data_source_id = data_source_groups.data_source_id
-                   WHERE queries.id in :ids"""
-
-        return db.session.execute(query, {"ids": tuple(query_ids)}).fetchall()
+        """Get `(group_id, view_only)` of data sources of the queries."""
+        data_source_ids = [
+            data_source_id
+            for data_source_id, in db.session.query(cls.data_source_id).filter(
+                cls.id.in_(query_ids), cls.data_source_id.isnot(None)
+            )
+        ]
+        groups = DataSource.get_groups_by_id(data_source_ids)
+        return [
+            (group_id, view_only)
+            for data_source_id in data_source_ids
+            for group_id, view_only in groups[data_source_id].items()
+        ]
 
     @classmethod
     def update_latest_result(cls, query_result):
@@ -428,10 +479,11 @@ class Query(TimestampMixin, BelongsToOrgMixin, db.Model):
 
     @property
     def groups(self):
-        if self.data_source is None:
-            return {}
+        if self.data_source_id is None:
+            # The data source may be set but not flushed yet
+            return self.data_source.groups if self.data_source else {}
 
-        return self.data_source.groups
+        return DataSource.get_groups_by_id([self.data_source_id])[self.data_source_id]
 
     @hybrid_property
     def lowercase_name(self):
@@ -121,4 +121,4 @@ class QueryResult(db.Model, QueryResultPersistence, BelongsToOrgMixin):
 
     @property
     def groups(self):
-        return self.data_source.groups
+        return DataSource.get_groups_by_id([self.data_source_id])[self.data_source_id]
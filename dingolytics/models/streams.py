@@ -1,6 +1,7 @@
 from json import dumps as json_dumps
 from secrets import token_urlsafe
 from sqlalchemy import UniqueConstraint
+from sqlalchemy.dialects import postgresql
 from sqlalchemy_utils.models import generic_repr
 
 from dingolytics.presets import default_presets
@@ -8,6 +9,7 @@ from redash.settings import get_settings
 from redash.models.base import db, Column, primary_key, key_type
 from redash.models.datasources import DataSource
 from redash.models.mixins import TimestampMixin
+from redash.models.types import MutableDict
 
 
 def default_ingest_key(n: int = 16) -> str:
@@ -49,6 +51,27 @@ class Stream(TimestampMixin, db.Model):
     db_table = Column(db.String(255), index=True)
     db_table_preset = Column(db.String(255), index=True, default="app_events")
     db_table_query = Column(db.Text, nullable=True)
+    # Partitioning, TTL and rollups overrides, see `TableOptions`
+    db_table_options = Column(
+        MutableDict.as_mutable(postgresql.JSONB),
+        server_default="{}", default={}
+    )
+
+    # Sink tuning preset by expected volume, see `VECTOR_INGEST_VOLUMES`
+    ingest_volume = Column(
+        db.String(32), server_default="medium", default="medium"
+    )
+    # Sink tuning overrides, see `VectorClickHouseTuning`
+    ingest_options = Column(
+        MutableDict.as_mutable(postgresql.JSONB),
+        server_default="{}", default={}
+    )
+
+    # Tables are created in background, see `provision_stream_task`
+    provisioning_state = Column(
+        db.String(32), server_default="ready", default="pending", index=True
+    )
+    provisioning_error = Column(db.Text, nullable=True)
 
     is_enabled = Column(db.Boolean, default=True, index=True)
     is_archived = Column(db.Boolean, default=False, index=True)
@@ -89,6 +112,11 @@ class Stream(TimestampMixin, db.Model):
             "db_table": self.db_table,
             "db_table_preset": self.db_table_preset,
             "db_table_query": self.db_table_query,
+            "db_table_options": self.db_table_options,
+            "ingest_volume": self.ingest_volume,
+            "ingest_options": self.ingest_options,
+            "provisioning_state": self.provisioning_state,
+            "provisioning_error": self.provisioning_error,
             "is_enabled": self.is_enabled,
             "is_archived": self.is_archived,
         }
@@ -107,6 +135,7 @@ class Stream(TimestampMixin, db.Model):
             * name -- the name of the stream
             * description -- the description of the stream
             * db_table -- the name of the table in the database
+            * db_table_options -- partitioning, TTL and rollups overrides
         """
         presets = default_presets()
         db_type = data_source.type
@@ -1,10 +1,34 @@
 import json
+import logging
 from functools import lru_cache
 from pathlib import Path
+from typing import Optional
 # from re import sub as re_sub
 
+from .schema import ColumnSchema, TableSchema, parse_table_schema
+from .storage import (
+    RollupSpec,
+    TableOptions,
+    get_table_options,
+    render_rollup_queries,
+    render_table_query,
+)
+
+__all__ = [
+    "ColumnSchema",
+    "PresetLoader",
+    "RollupSpec",
+    "TableOptions",
+    "TableSchema",
+    "default_presets",
+    "render_rollup_queries",
+    "render_table_query",
+]
+
 DEFAULT_PRESETS_PATH = Path(__file__).parent.absolute()
 
+logger = logging.getLogger(__name__)
+
 
 @lru_cache
 def default_presets() -> "PresetLoader":
@@ -24,6 +48,18 @@ class PresetLoader:
         get_item(group: str, name: str) -> str:
             Retrieves the preset with the specified group and name.
 
+        get_schema(group: str, name: str) -> TableSchema:
+            Retrieves the table schema parsed from the preset.
+
+        get_rollups(group: str, name: str) -> dict:
+            Retrieves rollup queries of the preset by rollup name.
+
+        get_rollup_spec(group: str, name: str, rollup: str) -> RollupSpec:
+            Retrieves queries the rollup of the preset can answer.
+
+        get_table_options(group: str, name: str, options: dict) -> TableOptions:
+            Retrieves storage options of the preset with overrides.
+
         load_all() -> None:
             Loads all presets from the base path and its subdirectories.
 
@@ -41,6 +77,10 @@ class PresetLoader:
         self.base_path = Path(base_path)
         self._presets = {}
         self._examples = {}
+        self._schemas = {}
+        self._options = {}
+        self._rollups = {}
+        self._rollup_specs = {}
 
     def __getitem__(self, key):
         return self._presets[key]
@@ -63,6 +103,29 @@ class PresetLoader:
     def get_example(self, group: str, name: str) -> dict:
         return self._examples.get(group, {}).get(name, {})
 
+    def get_schema(self, group: str, name: str) -> Optional[TableSchema]:
+        return self._schemas.get(group, {}).get(name)
+
+    def get_rollups(self, group: str, name: str) -> dict:
+        return self._rollups.get(group, {}).get(name, {})
+
+    def get_rollup_spec(
+        self, group: str, name: str, rollup: str
+    ) -> Optional[RollupSpec]:
+        return self._rollup_specs.get(group, {}).get(name, {}).get(rollup)
+
+    def get_table_options(
+        self, group: str, name: str, options: Optional[dict] = None
+    ) -> TableOptions:
+        """
+        Get storage options of the preset table, see `get_table_options`.
+        """
+        return get_table_options(
+            self._options.get(group, {}).get(name, {}),
+            options,
+            rollups=self.get_rollups(group, name),
+        )
+
     def load_all(self) -> None:
         for item in self.base_path.iterdir():
             if item.is_dir():
@@ -73,15 +136,30 @@ class PresetLoader:
         for item in path.glob("*.sql"):
             presets = self._presets.setdefault(group, {})
             self._load_sql(path=item, presets=presets)
+            schemas = self._schemas.setdefault(group, {})
+            self._load_schema(path=item, presets=presets, schemas=schemas)
         for item in path.glob("*.example.json"):
             examples = self._examples.setdefault(group, {})
-            self._load_example(path=item, examples=examples)
-
-    def _load_example(self, path: Path, examples: dict) -> None:
+            self._load_json(path=item, items=examples)
+        for item in path.glob("*.options.json"):
+            options = self._options.setdefault(group, {})
+            self._load_json(path=item, items=options)
+        for item in path.glob("rollups/*/*.sql"):
+            rollups = self._rollups.setdefault(group, {})
+            rollups = rollups.setdefault(item.parent.name, {})
+            self._load_sql(path=item, presets=rollups)
+        for item in path.glob("rollups/*/*.json"):
+            specs = self._rollup_specs.setdefault(group, {})
+            specs = specs.setdefault(item.parent.name, {})
+            self._load_json(path=item, items=specs)
+            key = item.name.split(".")[0]
+            specs[key] = RollupSpec(**specs[key])
+
+    def _load_json(self, path: Path, items: dict) -> None:
         assert path.is_file()
         with open(path, "r") as fp:
             key = path.name.split(".")[0]
-            examples[key] = json.load(fp)
+            items[key] = json.load(fp)
 
     def _load_sql(self, path: Path, presets: dict) -> None:
         assert path.is_file()
@@ -95,3 +173,13 @@ class PresetLoader:
                 text += line
         key = path.name.split(".")[0]
         presets[key] = text.strip()
+
+    def _load_schema(self, path: Path, presets: dict, schemas: dict) -> None:
+        key = path.name.split(".")[0]
+        try:
+            schema = parse_table_schema(key, presets[key])
+        except Exception:
+            logger.exception("Failed to parse schema of preset: %s", path)
+            return
+        if schema is not None:
+            schemas[key] = schema
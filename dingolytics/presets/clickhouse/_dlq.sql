@@ -0,0 +1,12 @@
+-- Dead-letter table of a stream, created as `<db_table>_dlq`.
+-- Events rejected at ingest are kept as raw JSON payloads until replayed.
+CREATE TABLE ${db_table} (
+  id UUID DEFAULT generateUUIDv4(),
+  timestamp DateTime64(3) DEFAULT now64(),
+  stream_id UInt32 DEFAULT 0,
+  source LowCardinality(String) DEFAULT '',
+  reason String DEFAULT '',
+  payload String DEFAULT '',
+) ENGINE = MergeTree()
+ORDER BY (timestamp, id)
+TTL toDateTime(timestamp) + INTERVAL 30 DAY;
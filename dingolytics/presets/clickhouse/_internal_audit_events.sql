@@ -0,0 +1,12 @@
+CREATE TABLE ${db_table} (
+  timestamp DateTime64(3) DEFAULT now(),
+  org_id UInt64,
+  user_id Nullable(UInt64),
+  action String,
+  object_type String,
+  object_id String DEFAULT '',
+  additional_properties String DEFAULT '{}',
+) ENGINE = MergeTree()
+${partition_by}
+ORDER BY (org_id, object_type, action, timestamp)
+${ttl};
@@ -5,4 +5,6 @@ CREATE TABLE ${db_table} (
   pid UInt32 DEFAULT 0,
   metadata JSON DEFAULT '{}',
 ) ENGINE = MergeTree()
-ORDER BY (timestamp, host);
+${partition_by}
+ORDER BY (timestamp, host)
+${ttl};
@@ -19,4 +19,6 @@ CREATE TABLE ${db_table} (
 
   timestamp DateTime64(3) DEFAULT now(),
 ) ENGINE = MergeTree()
-ORDER BY (timestamp, app, event, path);
+${partition_by}
+ORDER BY (timestamp, app, event, path)
+${ttl};
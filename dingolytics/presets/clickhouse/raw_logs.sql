@@ -18,4 +18,6 @@ CREATE TABLE ${db_table} (
 
   timestamp DateTime64(3) DEFAULT now(),
 ) ENGINE = MergeTree()
-ORDER BY (timestamp, app, path);
+${partition_by}
+ORDER BY (timestamp, app, path)
+${ttl};
@@ -0,0 +1,22 @@
+-- Events and unique users per minute, by app and event.
+-- Query with `sum(events)` and `uniqMerge(users)`.
+CREATE TABLE ${rollup_table} (
+  minute DateTime,
+  app String,
+  event String,
+  events SimpleAggregateFunction(sum, UInt64),
+  users AggregateFunction(uniq, Nullable(String)),
+) ENGINE = AggregatingMergeTree()
+${partition_by}
+ORDER BY (minute, app, event)
+${ttl}
+COMMENT 'rollup:app_events/per_minute';
+CREATE MATERIALIZED VIEW ${rollup_table}_mv TO ${rollup_table} AS
+SELECT
+  toStartOfMinute(timestamp) AS minute,
+  app,
+  event,
+  count() AS events,
+  uniqState(user_id) AS users
+FROM ${db_table}
+GROUP BY minute, app, event;
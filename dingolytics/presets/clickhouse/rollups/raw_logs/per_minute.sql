@@ -0,0 +1,20 @@
+-- Log messages per minute, by app and level.
+-- Query with `sum(messages)`.
+CREATE TABLE ${rollup_table} (
+  minute DateTime,
+  app String,
+  level String,
+  messages SimpleAggregateFunction(sum, UInt64),
+) ENGINE = AggregatingMergeTree()
+${partition_by}
+ORDER BY (minute, app, level)
+${ttl}
+COMMENT 'rollup:raw_logs/per_minute';
+CREATE MATERIALIZED VIEW ${rollup_table}_mv TO ${rollup_table} AS
+SELECT
+  toStartOfMinute(timestamp) AS minute,
+  app,
+  level,
+  count() AS messages
+FROM ${db_table}
+GROUP BY minute, app, level;
@@ -0,0 +1,170 @@
+"""
+Table schemas parsed from `CREATE TABLE` presets.
+
+Only the column list is parsed, which is enough to validate and coerce
+ingested events. Indexes, projections and constraints are skipped.
+"""
+import re
+from typing import Optional
+
+from pydantic import BaseModel
+
+TYPE_WRAPPERS = ("LowCardinality", "SimpleAggregateFunction")
+COLUMN_OPTIONS = (
+    "DEFAULT", "MATERIALIZED", "EPHEMERAL", "ALIAS", "CODEC", "TTL",
+    "COMMENT", "NULL", "NOT", "PRIMARY", "SETTINGS",
+)
+SKIPPED_ITEMS = ("INDEX", "PROJECTION", "CONSTRAINT", "PRIMARY")
+
+_identifier_re = re.compile(r"`([^`]+)`|\"([^\"]+)\"|([A-Za-z_][A-Za-z0-9_.]*)")
+
+
+class ColumnSchema(BaseModel):
+    """
+    Column of a table schema.
+
+    Attributes:
+        name: Column name.
+        type: Full column type, e.g. `Nullable(String)`.
+        base_type: Type without `Nullable` and `LowCardinality` wrappers
+            and arguments, e.g. `String` or `DateTime64`.
+        args: Type arguments, e.g. `["3"]` for `DateTime64(3)`.
+        nullable: Whether the column accepts NULL.
+        has_default: Whether the column has an explicit default value.
+        is_insertable: False for `MATERIALIZED` and `ALIAS` columns.
+    """
+    name: str
+    type: str
+    base_type: str
+    args: list[str] = []
+    nullable: bool = False
+    has_default: bool = False
+    is_insertable: bool = True
+
+    @classmethod
+    def from_type(cls, name: str, type_: str, **kwargs) -> "ColumnSchema":
+        nullable = False
+        base_type, args = split_type(type_)
+        while base_type in TYPE_WRAPPERS + ("Nullable",):
+            if base_type == "Nullable":
+                nullable = True
+            base_type, args = split_type(args[-1])
+        return cls(
+            name=name, type=type_, base_type=base_type, args=args,
+            nullable=nullable, **kwargs
+        )
+
+
+class TableSchema(BaseModel):
+    name: str
+    columns: list[ColumnSchema] = []
+
+    def get_column(self, name: str) -> Optional[ColumnSchema]:
+        for column in self.columns:
+            if column.name == name:
+                return column
+        return None
+
+    @classmethod
+    def from_types(cls, name: str, types: dict[str, str]) -> "TableSchema":
+        """Create schema from column types, e.g. `DESCRIBE TABLE` result."""
+        return cls(name=name, columns=[
+            ColumnSchema.from_type(column, type_)
+            for column, type_ in types.items()
+        ])
+
+
+def split_type(type_: str) -> tuple[str, list[str]]:
+    """
+    Split type into name and top-level arguments.
+
+    >>> split_type("Map(String, Array(UInt8))")
+    ('Map', ['String', 'Array(UInt8)'])
+    """
+    type_ = type_.strip()
+    if "(" not in type_ or not type_.endswith(")"):
+        return type_, []
+    name, _, rest = type_.partition("(")
+    return name.strip(), split_top_level(rest[:-1])
+
+
+def split_top_level(text: str, sep: str = ",") -> list[str]:
+    """Split text by separator outside of parentheses and quotes."""
+    items, depth, quote, current = [], 0, None, []
+    for char in text:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "'`\"":
+            quote = char
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == sep and depth == 0:
+            items.append("".join(current).strip())
+            current = []
+            continue
+        current.append(char)
+    if "".join(current).strip():
+        items.append("".join(current).strip())
+    return items
+
+
+def parse_column(definition: str) -> Optional[ColumnSchema]:
+    """Parse a column definition of `CREATE TABLE` statement."""
+    match = _identifier_re.match(definition)
+    if match is None:
+        return None
+    name = next(group for group in match.groups() if group)
+    if name.upper() in SKIPPED_ITEMS:
+        return None
+    rest = definition[match.end():].strip()
+
+    # Type ends at the first column option outside of parentheses
+    depth, end = 0, len(rest)
+    for word in re.finditer(r"\S+", rest):
+        keyword = word[0].split("(")[0].upper()
+        if depth == 0 and word.start() and keyword in COLUMN_OPTIONS:
+            end = word.start()
+            break
+        depth += word[0].count("(") - word[0].count(")")
+    type_ = rest[:end].strip()
+    options = rest[end:].upper()
+    if not type_:
+        return None
+    return ColumnSchema.from_type(
+        name, type_,
+        has_default=options.startswith("DEFAULT"),
+        is_insertable=not options.startswith(("MATERIALIZED", "ALIAS")),
+    )
+
+
+def parse_table_schema(name: str, query: str) -> Optional[TableSchema]:
+    """
+    Parse columns of a `CREATE TABLE` preset.
+
+    Returns `None` if the query is not a `CREATE TABLE` statement with
+    a column list, e.g. `CREATE TABLE ... AS SELECT`.
+    """
+    match = re.match(r"\s*CREATE\s+TABLE\b[^(]*\(", query, re.IGNORECASE)
+    if match is None:
+        return None
+    depth, end = 1, None
+    for i in range(match.end(), len(query)):
+        if query[i] == "(":
+            depth += 1
+        elif query[i] == ")":
+            depth -= 1
+            if depth == 0:
+                end = i
+                break
+    if end is None:
+        return None
+    columns = [
+        parse_column(item)
+        for item in split_top_level(query[match.end():end])
+    ]
+    return TableSchema(
+        name=name, columns=[column for column in columns if column]
+    )
@@ -0,0 +1,213 @@
+"""
+Storage options of tables created from presets.
+
+Presets place `${partition_by}` and `${ttl}` after the table engine, which
+are rendered from `TableOptions`: preset defaults from the optional
+`<preset>.options.json` file, overridden by options of the stream.
+
+Rollups are `AggregatingMergeTree` tables filled by materialized views,
+loaded from `rollups/<preset>/<rollup>.sql` files. A rollup file has
+two statements, for the rollup table `${rollup_table}` and for the view
+reading from the stream table `${db_table}`. The optional `<rollup>.json`
+file next to it describes which queries the rollup can answer, see
+`RollupSpec`.
+"""
+import re
+from string import Template
+from typing import Iterable, Literal, Optional
+
+from pydantic import BaseModel, Extra, PositiveInt, root_validator, validator
+
+from .schema import parse_table_schema, split_top_level
+
+TIME_TYPES = ("DateTime64", "DateTime", "Date32", "Date")
+PARTITION_EXPRESSIONS = {
+    "day": "toDate({})",
+    "month": "toYYYYMM({})",
+}
+
+_storage_name_re = re.compile(r"^[A-Za-z0-9_\-]+$")
+_create_re = re.compile(
+    r"^(\s*CREATE\s+(?:TABLE|MATERIALIZED\s+VIEW))\s+(?!IF\s+NOT\s+EXISTS\b)",
+    re.IGNORECASE,
+)
+
+
+class TableTTLMove(BaseModel):
+    """Move of parts older than `after_days` to a volume or a disk."""
+    after_days: PositiveInt
+    volume: Optional[str] = None
+    disk: Optional[str] = None
+
+    class Config:
+        extra = Extra.forbid
+
+    @validator("volume", "disk")
+    def validate_name(cls, value: Optional[str]) -> Optional[str]:
+        if value is not None and not _storage_name_re.match(value):
+            raise ValueError(f"Invalid storage name: {value}")
+        return value
+
+    @root_validator(skip_on_failure=True)
+    def validate_target(cls, values: dict) -> dict:
+        if bool(values.get("volume")) == bool(values.get("disk")):
+            raise ValueError("Either volume or disk is required")
+        return values
+
+    def get_target(self) -> str:
+        if self.volume:
+            return f"TO VOLUME '{self.volume}'"
+        return f"TO DISK '{self.disk}'"
+
+
+class TableOptions(BaseModel):
+    """
+    Partitioning, expiry and rollups of a stream table.
+
+    Attributes:
+        partition_by: Partition by "day" or "month" of the time column.
+        ttl_days: Delete rows older than the number of days.
+        ttl_moves: Move older parts to other volumes or disks.
+        rollups: Names of the preset rollups to create.
+        rollup_ttl_days: Delete rollup rows older than the number of days.
+    """
+    partition_by: Optional[Literal["day", "month"]] = None
+    ttl_days: Optional[PositiveInt] = None
+    ttl_moves: list[TableTTLMove] = []
+    rollups: list[str] = []
+    rollup_ttl_days: Optional[PositiveInt] = None
+
+    class Config:
+        extra = Extra.forbid
+
+    @root_validator(skip_on_failure=True)
+    def validate_ttl(cls, values: dict) -> dict:
+        ttl_days = values.get("ttl_days")
+        for move in values.get("ttl_moves") or []:
+            if ttl_days and move.after_days >= ttl_days:
+                raise ValueError("Parts must be moved before deletion")
+        return values
+
+    def get_clauses(self, time_column: Optional[str]) -> dict:
+        """Get `${partition_by}` and `${ttl}` clauses of the stream table."""
+        if time_column is None:
+            return {"partition_by": "", "ttl": ""}
+        partition_by = ""
+        if self.partition_by:
+            expression = PARTITION_EXPRESSIONS[self.partition_by]
+            partition_by = f"PARTITION BY {expression.format(time_column)}"
+        rules = [
+            f"{_ttl_expression(time_column, move.after_days)} "
+            f"{move.get_target()}"
+            for move in sorted(self.ttl_moves, key=lambda m: m.after_days)
+        ]
+        if self.ttl_days:
+            rules.append(f"{_ttl_expression(time_column, self.ttl_days)} DELETE")
+        return {
+            "partition_by": partition_by,
+            "ttl": f"TTL {', '.join(rules)}" if rules else "",
+        }
+
+    def get_rollup_clauses(self, time_column: Optional[str]) -> dict:
+        """
+        Get clauses of rollup tables.
+
+        Rollups are small, so they're partitioned by month whenever the
+        stream table is partitioned, and only expire by `rollup_ttl_days`.
+        """
+        if time_column is None:
+            return {"partition_by": "", "ttl": ""}
+        options = TableOptions(
+            partition_by="month" if self.partition_by else None,
+            ttl_days=self.rollup_ttl_days,
+        )
+        return options.get_clauses(time_column)
+
+
+class RollupSpec(BaseModel):
+    """
+    Queries over the stream table which a rollup can answer.
+
+    Attributes:
+        granularity: Seconds per row of the rollup time column.
+        time_column: Time column of the rollup table.
+        source_time_column: Time column of the stream table.
+        dimensions: Columns of both the stream and the rollup tables.
+        measures: Aggregates over the stream table and their equivalents
+            over the rollup table, e.g. `count()` and `sum(events)`.
+    """
+    granularity: PositiveInt = 60
+    time_column: str
+    source_time_column: str = "timestamp"
+    dimensions: list[str] = []
+    measures: dict[str, str] = {}
+
+    class Config:
+        extra = Extra.forbid
+
+
+def _ttl_expression(time_column: str, days: int) -> str:
+    return f"toDateTime({time_column}) + INTERVAL {days} DAY"
+
+
+def get_table_options(
+    defaults: dict, options: Optional[dict], rollups: Iterable[str] = ()
+) -> TableOptions:
+    """
+    Get table options of a preset with stream options overrides.
+
+    Raises `pydantic.ValidationError` for invalid options and `ValueError`
+    for rollups not available for the preset.
+    """
+    result = TableOptions(**{**(defaults or {}), **(options or {})})
+    unknown = set(result.rollups) - set(rollups)
+    if unknown:
+        raise ValueError(f"Unsupported rollups: {', '.join(sorted(unknown))}")
+    return result
+
+
+def get_time_column(query: str) -> Optional[str]:
+    """Get the first date or time column of a `CREATE TABLE` query."""
+    schema = parse_table_schema("", query)
+    for column in schema.columns if schema else []:
+        if column.base_type in TIME_TYPES:
+            return column.name
+    return None
+
+
+def if_not_exists(sql: str) -> str:
+    """Make `CREATE TABLE` or `CREATE MATERIALIZED VIEW` idempotent."""
+    return _create_re.sub(r"\1 IF NOT EXISTS ", sql, count=1)
+
+
+def get_rollup_table(db_table: str, rollup: str) -> str:
+    return f"{db_table}_{rollup}"
+
+
+def render_table_query(
+    query: str, db_table: str, options: Optional[TableOptions] = None
+) -> str:
+    """Render a stream table preset with the table options."""
+    options = options or TableOptions()
+    return if_not_exists(Template(query).substitute(
+        db_table=db_table, **options.get_clauses(get_time_column(query))
+    ))
+
+
+def render_rollup_queries(
+    query: str, db_table: str, rollup: str,
+    options: Optional[TableOptions] = None,
+) -> list[str]:
+    """Render statements of a rollup table and its materialized view."""
+    options = options or TableOptions()
+    statements = split_top_level(query, sep=";")
+    time_column = get_time_column(statements[0]) if statements else None
+    variables = {
+        "db_table": db_table,
+        "rollup_table": get_rollup_table(db_table, rollup),
+        **options.get_rollup_clauses(time_column),
+    }
+    return [
+        if_not_exists(Template(statement).substitute(variables))
+        for statement in statements
+    ]
@@ -0,0 +1,520 @@
+"""
+Routing of aggregate queries over stream tables to their rollups.
+
+`rewrite_query` handles a deliberately small subset of SQL: a single
+`SELECT ... FROM <table> [WHERE] [GROUP BY] [HAVING] [ORDER BY] [LIMIT]`
+over a stream table, which only refers to rollup dimensions, time
+buckets at least as coarse as the rollup granularity, and measures of
+the rollup spec. Time filters must be aligned to the granularity, e.g.
+`timestamp >= toStartOfDay(now()) - INTERVAL 7 DAY`. Anything else,
+including joins, subqueries and unknown functions, is left as is, so
+a rewrite never changes query results.
+
+Rollups may expire at another age than their stream table. When either
+table has a TTL, queries are only rewritten if their time filter has a
+lower bound within the retention of both tables, e.g. `timestamp >=
+toStartOfDay(now()) - INTERVAL 7 DAY` with TTLs of 30 and 365 days.
+
+Queries with a `no_rollup` comment are never rewritten.
+"""
+import logging
+import re
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+from pydantic import BaseModel
+
+from dingolytics.presets import RollupSpec
+from dingolytics.presets.schema import split_top_level
+
+ROLLUP_COMMENT_PREFIX = "rollup:"
+
+BUCKET_FUNCTIONS = {
+    "toStartOfMinute": 60,
+    "toStartOfFiveMinute": 300,
+    "toStartOfFiveMinutes": 300,
+    "toStartOfTenMinutes": 600,
+    "toStartOfFifteenMinutes": 900,
+    "toStartOfHour": 3600,
+    "toStartOfDay": 86400,
+    "toDate": 86400,
+    "toMonday": 86400 * 7,
+    "toStartOfWeek": 86400 * 7,
+    "toStartOfMonth": 86400,
+    "toStartOfQuarter": 86400,
+    "toStartOfYear": 86400,
+}
+INTERVAL_UNITS = {
+    "MINUTE": 60,
+    "HOUR": 3600,
+    "DAY": 86400,
+    "WEEK": 86400 * 7,
+    "MONTH": 86400,
+    "QUARTER": 86400,
+    "YEAR": 86400,
+}
+# Functions giving the same result over rollup rows as over stream rows
+# when applied to dimensions, and scalar functions of constants.
+ALLOWED_FUNCTIONS = {
+    name.lower() for name in (
+        *BUCKET_FUNCTIONS,
+        "now", "now64", "today", "yesterday", "toDateTime", "toDateTime64",
+        "lower", "upper", "lowerUTF8", "upperUTF8", "length", "concat",
+        "substring", "startsWith", "endsWith", "like", "ilike", "match",
+        "if", "multiIf", "coalesce", "ifNull", "isNull", "isNotNull",
+        "toString", "formatDateTime", "round", "floor", "ceil", "intDiv",
+        "abs", "tuple", "uniq", "uniqExact", "min", "max", "any", "anyLast",
+        "groupUniqArray",
+    )
+}
+# Longest periods of the units, for the age of time filter bounds
+PERIOD_SECONDS = {
+    **INTERVAL_UNITS,
+    "SECOND": 1,
+    "MONTH": 86400 * 31,
+    "QUARTER": 86400 * 92,
+    "YEAR": 86400 * 366,
+}
+BUCKET_PERIODS = {
+    "toStartOfMonth": "MONTH",
+    "toStartOfQuarter": "QUARTER",
+    "toStartOfYear": "YEAR",
+}
+KEYWORDS = {
+    "AND", "OR", "NOT", "IN", "IS", "NULL", "LIKE", "ILIKE", "BETWEEN",
+    "INTERVAL", "ASC", "DESC", "NULLS", "FIRST", "LAST", "TRUE", "FALSE",
+    "CASE", "WHEN", "THEN", "ELSE", "END", *INTERVAL_UNITS, "SECOND",
+}
+CLAUSES = ("SELECT", "FROM", "WHERE", "GROUP BY", "HAVING", "ORDER BY", "LIMIT")
+
+_no_rollup_re = re.compile(r"(--|/\*)\s*no_rollup\b", re.IGNORECASE)
+_leading_comments_re = re.compile(r"^(\s*(?:--[^\n]*\n|/\*.*?\*/))*\s*", re.S)
+_comment_re = re.compile(r"('(?:[^'\\]|\\.)*')|--[^\n]*|/\*.*?\*/", re.S)
+_string_re = re.compile(r"'(?:[^'\\]|\\.)*'")
+_clause_re = re.compile(
+    r"\b(SELECT|FROM|WHERE|GROUP\s+BY|HAVING|ORDER\s+BY|LIMIT)\b", re.I
+)
+_unsupported_re = re.compile(
+    r"\b(PREWHERE|JOIN|UNION|INTERSECT|EXCEPT|SETTINGS|FORMAT|SAMPLE|FINAL"
+    r"|ARRAY|WITH|WINDOW|QUALIFY|INTO|DISTINCT)\b", re.I
+)
+_table_re = re.compile(r"^(?:`?(\w+)`?\.)?`?(\w+)`?$")
+_alias_re = re.compile(r"^(.+)\s+AS\s+(`[^`]+`|\w+)\s*$", re.I | re.S)
+_limit_re = re.compile(r"^\d+(\s*,\s*\d+|\s+OFFSET\s+\d+)?$", re.I)
+_identifier_re = re.compile(r"(?<![\w.\x00`])([A-Za-z_]\w*)(\s*\(|\.)?")
+_placeholder_re = re.compile(r"\x00(\d+)\x00")
+_interval_re = re.compile(r"\s*([-+])\s*INTERVAL\s+(\d+)\s+([A-Za-z]+)\s*$", re.I)
+_and_re = re.compile(r"\s+AND\s+", re.I)
+_or_re = re.compile(r"\bOR\b", re.I)
+_ttl_re = re.compile(r"\bTTL\b(.*?)(?:\bSETTINGS\b|$)", re.I | re.S)
+_ttl_delete_re = re.compile(
+    r"\+\s*(?:toIntervalDay\s*\(\s*(\d+)\s*\)|INTERVAL\s+(\d+)\s+DAY)"
+    r"(?!\s+TO\b)", re.I
+)
+
+logger = logging.getLogger(__name__)
+
+
+class RollupTable(BaseModel):
+    """
+    Rollup table of a stream table, with queries it can answer.
+
+    TTLs are the days after which rows of the rollup and of the stream
+    table are deleted, if they expire.
+    """
+    table: str
+    source_table: str
+    spec: RollupSpec
+    ttl_days: Optional[int] = None
+    source_ttl_days: Optional[int] = None
+
+    @property
+    def retention_days(self) -> Optional[int]:
+        """Days of data both the rollup and the stream table keep."""
+        days = [d for d in (self.ttl_days, self.source_ttl_days) if d]
+        return min(days) if days else None
+
+
+def has_no_rollup_hint(query: str) -> bool:
+    return _no_rollup_re.search(query) is not None
+
+
+def parse_rollup_comment(comment: str) -> Optional[tuple[str, str]]:
+    """Get preset and rollup names from the rollup table comment."""
+    if not comment.startswith(ROLLUP_COMMENT_PREFIX):
+        return None
+    preset, _, rollup = comment[len(ROLLUP_COMMENT_PREFIX):].partition("/")
+    return (preset, rollup) if preset and rollup else None
+
+
+def parse_ttl_days(engine_full: str) -> Optional[int]:
+    """
+    Get days after which rows are deleted from the table engine clause
+    of `system.tables`, e.g. `... TTL toDateTime(t) + toIntervalDay(7)`.
+    """
+    match = _ttl_re.search(engine_full or "")
+    if match is None:
+        return None
+    days = [
+        int(m[1] or m[2]) for m in _ttl_delete_re.finditer(match[1])
+    ]
+    return min(days) if days else None
+
+
+def _mask_strings(text: str) -> str:
+    """Replace contents of string literals with spaces."""
+    return _string_re.sub(lambda m: "'" + " " * (len(m[0]) - 2) + "'", text)
+
+
+def _mask_parens(masked: str) -> str:
+    """Replace parentheses and their contents with spaces."""
+    chars, depth = [], 0
+    for char in masked:
+        if char == "(":
+            depth += 1
+        chars.append(" " if depth else char)
+        if char == ")":
+            depth = max(depth - 1, 0)
+    return "".join(chars)
+
+
+def _closing_paren(text: str, start: int) -> int:
+    """Get position of the parenthesis closing the one at `start`."""
+    depth = 0
+    for i in range(start, len(text)):
+        if text[i] == "(":
+            depth += 1
+        elif text[i] == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+    return -1
+
+
+def _split_clauses(query: str) -> Optional[dict[str, str]]:
+    masked = _mask_parens(_mask_strings(query))
+    if _unsupported_re.search(masked):
+        return None
+    matches = list(_clause_re.finditer(masked))
+    if not matches or matches[0].start() != 0:
+        return None
+    names = [" ".join(match[1].upper().split()) for match in matches]
+    if names[:2] != ["SELECT", "FROM"] or names != sorted(
+        set(names), key=CLAUSES.index
+    ):
+        return None
+    ends = [match.start() for match in matches[1:]] + [len(query)]
+    return {
+        name: query[match.end():end].strip()
+        for name, match, end in zip(names, matches, ends)
+    }
+
+
+def _is_aligned(value: str, granularity: int) -> bool:
+    """Check whether the time value is a multiple of the granularity."""
+    value = value.strip()
+    while True:
+        match = _interval_re.search(value)
+        if match is None:
+            break
+        seconds = INTERVAL_UNITS.get(match[3].upper().rstrip("S"))
+        if seconds is None or int(match[2]) * seconds % granularity:
+            return False
+        value = value[:match.start()].strip()
+
+    if _string_re.fullmatch(value):
+        try:
+            moment = datetime.fromisoformat(value[1:-1])
+        except ValueError:
+            return False
+        seconds = moment.hour * 3600 + moment.minute * 60 + moment.second
+        return not moment.microsecond and seconds % min(granularity, 86400) == 0
+    match = re.match(r"(\w+)\s*\(", value)
+    if match is None or _closing_paren(value, match.end() - 1) != len(value) - 1:
+        return False
+    name, argument = match[1], value[match.end():-1].strip()
+    if name in ("today", "yesterday"):
+        return not argument and 86400 % granularity == 0
+    if name in ("toDateTime", "toDateTime64"):
+        return _is_aligned(split_top_level(argument)[0], granularity)
+    seconds = BUCKET_FUNCTIONS.get(name)
+    return seconds is not None and seconds % granularity == 0
+
+
+def _get_age(value: str, now: datetime) -> Optional[float]:
+    """
+    Get the longest age in seconds of a time filter bound, or `None` if
+    it's not a constant or relative to now.
+    """
+    value = value.strip()
+    age = 0.0
+    while True:
+        match = _interval_re.search(value)
+        if match is None:
+            break
+        seconds = PERIOD_SECONDS.get(match[3].upper().rstrip("S"))
+        if seconds is None:
+            return None
+        age += int(match[2]) * seconds * (1 if match[1] == "-" else -1)
+        value = value[:match.start()].strip()
+
+    if _string_re.fullmatch(value):
+        try:
+            moment = datetime.fromisoformat(value[1:-1])
+        except ValueError:
+            return None
+        if moment.tzinfo is None:
+            # The server time zone is unknown, so allow for any
+            moment = moment.replace(tzinfo=timezone.utc)
+            age += 86400
+        return age + (now - moment).total_seconds()
+    match = re.match(r"(\w+)\s*\(", value)
+    if match is None or _closing_paren(value, match.end() - 1) != len(value) - 1:
+        return None
+    name, argument = match[1], value[match.end():-1].strip()
+    if name in ("now", "now64", "today", "yesterday"):
+        # Dates start up to a day before now in the server time zone
+        days = {"today": 1, "yesterday": 2}.get(name, 0)
+        return age + days * 86400
+    if name not in BUCKET_FUNCTIONS and name not in ("toDateTime", "toDateTime64"):
+        return None
+    inner = _get_age(split_top_level(argument)[0], now)
+    if inner is None:
+        return None
+    if name in BUCKET_PERIODS:
+        age += PERIOD_SECONDS[BUCKET_PERIODS[name]]
+    else:
+        age += BUCKET_FUNCTIONS.get(name, 0)
+    return age + inner
+
+
+def _get_lookback(
+    where: Optional[str], time_column: str, now: datetime
+) -> Optional[float]:
+    """
+    Get the longest age in seconds of rows the query filters by time,
+    or `None` if the time column has no lower bound.
+    """
+    if not where:
+        return None
+    masked = _mask_parens(_mask_strings(where))
+    if _or_re.search(masked):
+        return None
+    pattern = re.compile(rf"^`?{re.escape(time_column)}`?\s*>=?\s*(.+)$", re.S)
+    lookback, position = None, 0
+    for separator in [*_and_re.finditer(masked), None]:
+        end = separator.start() if separator else len(where)
+        match = pattern.match(where[position:end].strip())
+        if match is not None:
+            age = _get_age(match[1], now)
+            if age is not None and (lookback is None or age < lookback):
+                lookback = age
+        position = separator.end() if separator else end
+    return lookback
+
+
+class _ExpressionRewriter:
+    """
+    Rewrite expressions of a query clause for the rollup table.
+
+    Covered parts are replaced with placeholders first, then all the
+    remaining identifiers and functions are checked, so any reference to
+    stream table columns not in the rollup fails the rewrite.
+    """
+
+    def __init__(self, rollup: RollupTable) -> None:
+        spec = rollup.spec
+        self.spec = spec
+        self.placeholders = []
+        self.measures = [
+            (self._measure_pattern(source), target)
+            for source, target in spec.measures.items()
+        ]
+        time_column = re.escape(spec.source_time_column)
+        self.bucket_re = re.compile(
+            rf"(?<![\w.])(\w+)\s*\(\s*`?{time_column}`?\s*"
+            r"((?:,\s*(?:'[^']*'|\d+)\s*)*)\)"
+        )
+        self.comparison_re = re.compile(
+            rf"(?<![\w.`])`?{time_column}`?\s*(>=|<(?![=>]))"
+        )
+
+    @staticmethod
+    def _measure_pattern(measure: str) -> re.Pattern:
+        tokens = re.findall(r"\w+|\S", measure)
+        return re.compile(
+            r"(?<![\w.])" + r"\s*".join(map(re.escape, tokens)), re.I
+        )
+
+    def _hold(self, value: str) -> str:
+        self.placeholders.append(value)
+        return f"\x00{len(self.placeholders) - 1}\x00"
+
+    def _substitute(
+        self, text: str, masked: str, pattern: re.Pattern,
+        replace: Callable[[re.Match, str], Optional[str]],
+    ) -> tuple[str, str, int]:
+        result, result_masked, position, count = [], [], 0, 0
+        for match in pattern.finditer(masked):
+            replacement = replace(match, text)
+            if replacement is None:
+                continue
+            result.append(text[position:match.start()] + replacement)
+            result_masked.append(masked[position:match.start()] + replacement)
+            position = match.end()
+            count += 1
+        result.append(text[position:])
+        result_masked.append(masked[position:])
+        return "".join(result), "".join(result_masked), count
+
+    def _replace_bucket(self, match: re.Match, text: str) -> Optional[str]:
+        seconds = BUCKET_FUNCTIONS.get(match[1])
+        if seconds is None or seconds % self.spec.granularity:
+            return None
+        arguments = text[match.start(2):match.end(2)]
+        return self._hold(f"{match[1]}({self.spec.time_column}{arguments})")
+
+    def _replace_comparison(self, match: re.Match, text: str) -> Optional[str]:
+        masked = _mask_strings(text)
+        depth, end = 0, len(text)
+        for i in range(match.end(), len(text)):
+            if masked[i] == "(":
+                depth += 1
+            elif masked[i] == ")":
+                if depth == 0:
+                    end = i
+                    break
+                depth -= 1
+            elif depth == 0 and re.match(r"\s(AND|OR)\b", masked[i:], re.I):
+                end = i
+                break
+        if not _is_aligned(text[match.end():end], self.spec.granularity):
+            return None
+        return self._hold(f"{self.spec.time_column} {match[1]}")
+
+    def rewrite(
+        self, text: str, allowed: set[str], comparisons: bool = False
+    ) -> tuple[Optional[str], int]:
+        """
+        Rewrite an expression, return `None` if it's not covered, and
+        the number of measures replaced.
+        """
+        masked = _mask_strings(text)
+        measures = 0
+        for pattern, target in self.measures:
+            text, masked, count = self._substitute(
+                text, masked, pattern, lambda m, t: self._hold(target)
+            )
+            measures += count
+        text, masked, _ = self._substitute(
+            text, masked, self.bucket_re, self._replace_bucket
+        )
+        if comparisons:
+            text, masked, _ = self._substitute(
+                text, masked, self.comparison_re, self._replace_comparison
+            )
+        for match in _identifier_re.finditer(masked):
+            name, suffix = match[1], (match[2] or "").strip()
+            if name.upper() in KEYWORDS and suffix != ".":
+                continue
+            if suffix == "(":
+                if name.lower() not in ALLOWED_FUNCTIONS:
+                    return None, 0
+            elif suffix == "." or name not in allowed:
+                return None, 0
+        text = _placeholder_re.sub(
+            lambda m: self.placeholders[int(m[1])], text
+        )
+        return text, measures
+
+
+def rewrite_query(
+    query: str, rollups: dict[str, list[RollupTable]],
+    database: Optional[str] = None, now: Optional[datetime] = None,
+) -> Optional[tuple[str, RollupTable]]:
+    """
+    Rewrite a query over a stream table to read its rollup.
+
+    Returns the rewritten query and the rollup, or `None` if the query
+    is not covered by any rollup of the table.
+    """
+    if now is None:
+        now = datetime.now(timezone.utc)
+    if has_no_rollup_hint(query):
+        return None
+    leading = _leading_comments_re.match(query)[0]
+    body = _comment_re.sub(lambda m: m[1] or " ", query[len(leading):])
+    body = body.strip().rstrip(";").strip()
+    clauses = _split_clauses(body)
+    if clauses is None:
+        return None
+    match = _table_re.match(clauses["FROM"])
+    if match is None or (match[1] and match[1] != database):
+        return None
+    for rollup in rollups.get(match[2], []):
+        retention_days = rollup.retention_days
+        if retention_days is not None:
+            lookback = _get_lookback(
+                clauses.get("WHERE"), rollup.spec.source_time_column, now
+            )
+            if lookback is None or lookback > retention_days * 86400:
+                continue
+        result = _rewrite_clauses(clauses, rollup, match[1])
+        if result is not None:
+            return f"{leading}{result}", rollup
+    return None
+
+
+def _rewrite_clauses(
+    clauses: dict[str, str], rollup: RollupTable, database: Optional[str]
+) -> Optional[str]:
+    spec = rollup.spec
+    dimensions = set(spec.dimensions)
+    reserved = {spec.source_time_column, spec.time_column} | {
+        name
+        for target in spec.measures.values()
+        for name in re.findall(r"[A-Za-z_]\w*", target)
+    }
+    rewriter = _ExpressionRewriter(rollup)
+
+    items, aliases, measures = [], set(), 0
+    for item in split_top_level(clauses["SELECT"]):
+        match = _alias_re.match(_mask_parens(_mask_strings(item)))
+        expression, alias = item, None
+        if match is not None:
+            expression, alias = item[:match.end(1)].strip(), match[2]
+            name = alias.strip("`")
+            if name in reserved or (
+                name in dimensions and expression.strip() != name
+            ):
+                return None
+            aliases.add(name)
+        rewritten, count = rewriter.rewrite(expression, dimensions)
+        if rewritten is None:
+            return None
+        measures += count
+        if alias is None and rewritten != expression:
+            # Keep the result column names of the original query
+            alias = "`{}`".format(expression.strip().replace("`", ""))
+        items.append(f"{rewritten} AS {alias}" if alias else rewritten)
+    if not measures:
+        return None
+
+    table = rollup.table if not database else f"{database}.{rollup.table}"
+    parts = [f"SELECT {', '.join(items)}", f"FROM {table}"]
+    for clause in ("WHERE", "GROUP BY", "HAVING", "ORDER BY"):
+        if clause not in clauses:
+            continue
+        rewritten, _ = rewriter.rewrite(
+            clauses[clause],
+            dimensions if clause == "WHERE" else dimensions | aliases,
+            comparisons=clause in ("WHERE", "HAVING"),
+        )
+        if rewritten is None:
+            return None
+        parts.append(f"{clause} {rewritten}")
+    if "LIMIT" in clauses:
+        if not _limit_re.match(clauses["LIMIT"]):
+            return None
+        parts.append(f"LIMIT {clauses['LIMIT']}")
+    return "\n".join(parts)
@@ -1,23 +1,90 @@
 import logging
+from uuid import uuid4
 
-import requests
+from huey import crontab
 
+from dingolytics.auditlog import (
+    AUDITLOG_FLUSH_LOOP_KEY,
+    flush_auditlog_events,
+    get_recent_activity,
+    record_event,
+)
+from dingolytics.auditlog.webhooks import post_events
 from dingolytics.defaults import TaskPriority, workers
-from redash import models, settings
+from redash import models, redis_connection, settings
 
 logger = logging.getLogger(__name__)
 
 
 @workers.default.task(priority=TaskPriority.top)
 def record_auditlog_event_task(raw_event: dict) -> None:
-    event = models.Event.record(raw_event)
-    models.db.session.commit()
-
-    for hook in settings.S.EVENT_REPORTING_WEBHOOKS:
-        logger.debug("Forwarding event to: %s", hook)
-        try:
-            response = requests.post(hook, json={"data": event.to_dict()})
-            if response.status_code != 200:
-                logger.error("Failed posting to %s: %s", hook, response.content)
-        except Exception:
-            logger.exception("Failed posting to %s", hook)
+    """Kept for tasks enqueued before events were buffered in Redis."""
+    record_event(raw_event)
+
+
+@workers.periodic.periodic_task(crontab(minute="*/1"))
+def schedule_auditlog_flush_task() -> None:
+    """
+    Start the audit log flush loop, unless it's running already.
+
+    Like the stream metrics loop, the flush task reschedules itself
+    every `AUDITLOG_FLUSH_INTERVAL` seconds, and this task restarts it
+    when the loop is lost.
+    """
+    loop_id = uuid4().hex
+    is_started = redis_connection.set(
+        AUDITLOG_FLUSH_LOOP_KEY, loop_id, nx=True,
+        ex=settings.S.AUDITLOG_FLUSH_INTERVAL * 3,
+    )
+    if is_started:
+        logger.info("Starting audit log flush loop %s...", loop_id)
+        flush_auditlog_events_task(loop_id)
+
+
+@workers.periodic.task(expires=60)
+def flush_auditlog_events_task(loop_id: str) -> None:
+    interval = settings.S.AUDITLOG_FLUSH_INTERVAL
+    # Only a single loop runs, the stale ones stop here.
+    if redis_connection.get(AUDITLOG_FLUSH_LOOP_KEY) != loop_id:
+        return
+    redis_connection.set(AUDITLOG_FLUSH_LOOP_KEY, loop_id, ex=interval * 3)
+    try:
+        flushed = flush_auditlog_events()
+        logger.debug("Flushed %d audit log events", flushed)
+    except Exception:
+        logger.exception("Failed to flush audit log events")
+    finally:
+        flush_auditlog_events_task.schedule((loop_id,), delay=interval)
+
+
+@workers.default.task(
+    priority=TaskPriority.low,
+    retries=settings.S.AUDITLOG_WEBHOOK_RETRIES,
+    retry_delay=settings.S.AUDITLOG_WEBHOOK_RETRY_DELAY,
+)
+def deliver_auditlog_events_task(hook: str, events: list[dict]) -> None:
+    post_events(hook, events)
+
+
+@workers.periodic.periodic_task(crontab(minute="30"))
+def cleanup_auditlog_events_task() -> None:
+    """Delete events older than `AUDITLOG_POSTGRES_RETENTION_DAYS`."""
+    days = settings.S.AUDITLOG_POSTGRES_RETENTION_DAYS
+    if days <= 0:
+        return
+    batch_size = settings.S.AUDITLOG_CLEANUP_BATCH_SIZE
+    total = 0
+    while True:
+        deleted = models.Event.delete_older_than(days, batch_size=batch_size)
+        models.db.session.commit()
+        total += deleted
+        if deleted < batch_size:
+            break
+    logger.info("Deleted %d events older than %d days", total, days)
+
+
+@workers.periodic.periodic_task(crontab(minute="5", hour="0"))
+def expire_recent_activity_task() -> None:
+    """Subtract days out of the window from the recent activity feed."""
+    expired = get_recent_activity().expire()
+    logger.info("Expired %d days of recent activity", expired)
@@ -0,0 +1,50 @@
+import logging
+from uuid import uuid4
+
+from huey import crontab
+
+from dingolytics.defaults import workers
+from dingolytics.ingest import STREAM_METRICS_LOOP_KEY, collect_stream_metrics
+from redash import redis_connection, settings
+
+logger = logging.getLogger(__name__)
+
+
+@workers.periodic.periodic_task(crontab(minute="*/1"))
+def schedule_stream_metrics_task() -> None:
+    """
+    Start the stream metrics loop, unless it's running already.
+
+    Huey periodic tasks run once a minute at most, so metrics are
+    collected by a task rescheduling itself every few seconds, and this
+    task restarts it when the loop is lost, e.g. on a worker restart.
+    """
+    if not settings.S.STREAM_METRICS_ENABLED:
+        return
+    loop_id = uuid4().hex
+    is_started = redis_connection.set(
+        STREAM_METRICS_LOOP_KEY, loop_id, nx=True,
+        ex=settings.S.STREAM_METRICS_INTERVAL * 3,
+    )
+    if is_started:
+        logger.info("Starting stream metrics loop %s...", loop_id)
+        collect_stream_metrics_task(loop_id)
+
+
+@workers.periodic.task(expires=60)
+def collect_stream_metrics_task(loop_id: str) -> None:
+    interval = settings.S.STREAM_METRICS_INTERVAL
+    # Only a single loop runs, the stale ones stop here.
+    if redis_connection.get(STREAM_METRICS_LOOP_KEY) != loop_id:
+        return
+    if not settings.S.STREAM_METRICS_ENABLED:
+        redis_connection.delete(STREAM_METRICS_LOOP_KEY)
+        return
+    redis_connection.set(STREAM_METRICS_LOOP_KEY, loop_id, ex=interval * 3)
+    try:
+        collected = collect_stream_metrics()
+        logger.debug("Collected metrics of %d streams", collected)
+    except Exception:
+        logger.exception("Failed to collect stream metrics")
+    finally:
+        collect_stream_metrics_task.schedule((loop_id,), delay=interval)
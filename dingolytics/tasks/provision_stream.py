@@ -0,0 +1,51 @@
+import logging
+
+from huey.api import Task
+
+from dingolytics.defaults import workers
+from dingolytics.ingest import schedule_vector_config_sync
+from dingolytics.ingest.provisioning import (
+    STREAM_FAILED,
+    STREAM_PENDING,
+    STREAM_PROVISIONING,
+    STREAM_READY,
+    StreamProvisioningError,
+    create_tables_for_stream,
+)
+from redash import models, settings
+
+logger = logging.getLogger(__name__)
+
+
+@workers.default.task(
+    retries=settings.S.STREAM_PROVISIONING_RETRIES,
+    retry_delay=settings.S.STREAM_PROVISIONING_RETRY_DELAY,
+    context=True,
+)
+def provision_stream_task(
+    stream_id: int,
+    task: Task,  # provided by wrapper, see `context=True`
+) -> None:
+    stream = models.Stream.query.get(stream_id)
+    if stream is None:
+        # Not committed yet, or rolled back
+        raise StreamProvisioningError(f"Stream {stream_id} not found")
+    if stream.provisioning_state == STREAM_READY:
+        return
+
+    logger.info("Provisioning stream %s...", stream_id)
+    stream.provisioning_state = STREAM_PROVISIONING
+    models.db.session.commit()
+    try:
+        create_tables_for_stream(stream)
+    except Exception as exc:
+        is_retried = task is not None and task.retries > 0
+        stream.provisioning_state = STREAM_PENDING if is_retried else STREAM_FAILED
+        stream.provisioning_error = str(exc)
+        models.db.session.commit()
+        raise
+
+    stream.provisioning_state = STREAM_READY
+    stream.provisioning_error = None
+    models.db.session.commit()
+    schedule_vector_config_sync()
@@ -1,14 +1,53 @@
 import logging
 import time
+from collections import defaultdict
+from typing import Any
+from urllib.parse import urlparse
 
 from huey import crontab
+from sqlalchemy.orm import joinedload
 
 from dingolytics.defaults import workers
-from redash import models, redis_connection
+from redash import models, redis_connection, settings
 
 logger = logging.getLogger(__name__)
 
 
+def get_cluster_key(ds: Any) -> str:
+    """
+    Get the key of the server or cluster behind the data source.
+
+    Data sources are grouped by type and host, so that refreshes of data
+    sources sharing a server are bounded together.
+    """
+    host, port = ds.options.get("host"), ds.options.get("port")
+    url = ds.options.get("url")
+    if url and not host:
+        try:
+            parsed = urlparse(url)
+            host, port = parsed.hostname, parsed.port
+        except ValueError:
+            host = None
+    if not host:
+        return f"{ds.type}:{ds.id}"
+    return f"{ds.type}:{host}:{port or ''}"
+
+
+def get_refresh_lanes(data_sources: list, concurrency: int) -> list[list[int]]:
+    """
+    Split data sources into lanes refreshed in parallel, at most
+    `concurrency` lanes per cluster.
+    """
+    clusters = defaultdict(list)
+    for ds in data_sources:
+        clusters[get_cluster_key(ds)].append(ds.id)
+    lanes = []
+    for ids in clusters.values():
+        count = min(max(concurrency, 1), len(ids))
+        lanes.extend(ids[i::count] for i in range(count))
+    return lanes
+
+
 @workers.periodic.periodic_task(crontab(minute='*/15'))
 def refresh_all_schemas_task() -> None:
     """Refreshes the data sources schemas."""
@@ -21,12 +60,20 @@ def refresh_all_schemas_task() -> None:
 
     logger.info("task=refresh_schemas state=start")
 
-    for ds in models.DataSource.query:
-        if ds.paused:
+    data_sources = (
+        models.DataSource.query
+        .options(joinedload(models.DataSource.org))
+        .order_by(models.DataSource.id)
+        .all()
+    )
+    pause_reasons = models.DataSource.get_pause_reasons(data_sources)
+    eligible = []
+    for ds in data_sources:
+        if ds.id in pause_reasons:
             logger.info(
                 "task=refresh_schema state=skip ds_id=%s reason=paused(%s)",
                 ds.id,
-                ds.pause_reason,
+                pause_reasons[ds.id],
             )
         elif ds.id in blacklist:
             logger.info(
@@ -37,17 +84,22 @@ def refresh_all_schemas_task() -> None:
                 "task=refresh_schema state=skip ds_id=%s reason=org_disabled", ds.id
             )
         else:
-            refresh_schema_task(ds.id)
+            eligible.append(ds)
+
+    lanes = get_refresh_lanes(eligible, settings.S.SCHEMA_REFRESH_CONCURRENCY)
+    for lane in lanes:
+        refresh_schemas_task(lane)
 
     logger.info(
-        "task=refresh_schemas state=finish total_runtime=%.2f",
+        "task=refresh_schemas state=finish data_sources=%s lanes=%s "
+        "total_runtime=%.2f",
+        len(eligible),
+        len(lanes),
         time.time() - global_start_time,
     )
 
 
-@workers.default.task(expires=120)
-def refresh_schema_task(data_source_id: int) -> None:
-    ds = models.DataSource.get_by_id(data_source_id)
+def refresh_schema(ds: Any) -> None:
     logger.info(u"task=refresh_schema state=start ds_id=%s", ds.id)
     start_time = time.time()
     try:
@@ -68,3 +120,22 @@ def refresh_schema_task(data_source_id: int) -> None:
             ds.id,
             time.time() - start_time,
         )
+
+
+@workers.default.task(expires=120)
+def refresh_schema_task(data_source_id: int) -> None:
+    refresh_schema(models.DataSource.get_by_id(data_source_id))
+
+
+@workers.default.task(expires=600)
+def refresh_schemas_task(data_source_ids: list[int]) -> None:
+    """Refresh schemas of the data sources of a lane one by one."""
+    data_sources = {
+        ds.id: ds
+        for ds in models.DataSource.query.filter(
+            models.DataSource.id.in_(data_source_ids)
+        )
+    }
+    for data_source_id in data_source_ids:
+        if data_source_id in data_sources:
+            refresh_schema(data_sources[data_source_id])
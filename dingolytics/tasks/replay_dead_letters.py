@@ -0,0 +1,25 @@
+import logging
+from typing import Optional
+
+from dingolytics.defaults import workers
+from dingolytics.ingest import replay_stream_dead_letters
+from redash import models
+
+logger = logging.getLogger(__name__)
+
+
+@workers.default.task()
+def replay_dead_letters_task(
+    stream_id: int,
+    batch_size: int = 1000,
+    max_rows: Optional[int] = None,
+    rows_per_second: Optional[float] = None,
+) -> dict:
+    stream = models.Stream.get_by_id(stream_id)
+    logger.info("Replaying dead letters of stream %s...", stream_id)
+    return replay_stream_dead_letters(
+        stream,
+        batch_size=batch_size,
+        max_rows=max_rows,
+        rows_per_second=rows_per_second,
+    )
@@ -0,0 +1,18 @@
+import logging
+
+from dingolytics.defaults import workers
+from dingolytics.ingest import (
+    VECTOR_CONFIG_SYNC_KEY,
+    sync_vector_config_to_streams,
+)
+from redash import redis_connection
+
+logger = logging.getLogger(__name__)
+
+
+@workers.default.task()
+def sync_vector_config_task() -> None:
+    # Changes arriving while syncing schedule another run.
+    redis_connection.delete(VECTOR_CONFIG_SYNC_KEY)
+    logger.info("Syncing Vector config to streams...")
+    sync_vector_config_to_streams()
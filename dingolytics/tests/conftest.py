@@ -1,9 +1,179 @@
+import fnmatch
 from pathlib import Path
+
 from pytest import fixture
+from redis.exceptions import ResponseError
 
 BASE_DIR = Path(__file__).parent.absolute()
 
 
+class FakeRedis:
+    """
+    In-memory stand-in for the Redis commands in use.
+
+    Strings, lists, sorted sets and sets are kept in `data`, the audit log
+    stream in `entries` and its consumer groups in `groups`. Commands run
+    by every pipeline are recorded in `commands`.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.entries = []
+        self.groups = {}
+        self.counter = 0
+        self.commands = []
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    # Keys
+
+    def expire(self, key, ttl):
+        pass
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def rename(self, key, new_key):
+        if key not in self.data:
+            raise ResponseError("ERR no such key")
+        self.data[new_key] = self.data.pop(key)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def scan_iter(self, match, count=None):
+        return [key for key in list(self.data) if fnmatch.fnmatch(key, match)]
+
+    # Lists
+
+    def lpush(self, key, value):
+        self.data.setdefault(key, []).insert(0, value)
+
+    def ltrim(self, key, start, end):
+        self.data[key] = self.data.get(key, [])[start:end + 1]
+
+    def lindex(self, key, index):
+        values = self.data.get(key, [])
+        return values[index] if index < len(values) else None
+
+    def lrange(self, key, start, end):
+        values = self.data.get(key, [])
+        return values[start:] if end == -1 else values[start:end + 1]
+
+    # Sorted sets and sets
+
+    def zincrby(self, key, amount, member):
+        zset = self.data.setdefault(key, {})
+        zset[member] = zset.get(member, 0) + amount
+
+    def zrevrange(self, key, start, end):
+        zset = self.data.get(key, {})
+        members = sorted(zset, key=lambda m: (zset[m], m), reverse=True)
+        return members[start:end + 1]
+
+    def zunionstore(self, dest, keys, aggregate="SUM"):
+        result = {}
+        for key, weight in keys.items():
+            for member, score in self.data.get(key, {}).items():
+                result[member] = result.get(member, 0) + score * weight
+        self.data[dest] = result
+
+    def zremrangebyscore(self, key, min, max):
+        zset = self.data.get(key, {})
+        for member in [m for m, score in zset.items() if score <= max]:
+            del zset[member]
+
+    def sadd(self, key, member):
+        self.data.setdefault(key, set()).add(member)
+
+    def smembers(self, key):
+        return self.data.get(key, set())
+
+    # Streams
+
+    def xadd(self, key, fields, maxlen=None, approximate=True):
+        self.counter += 1
+        entry_id = f"{self.counter}-0"
+        self.entries.append((entry_id, fields))
+        if maxlen is not None:
+            self.entries = self.entries[-maxlen:]
+        return entry_id
+
+    def xgroup_create(self, key, group, id="$", mkstream=False):
+        if group in self.groups:
+            raise ResponseError("BUSYGROUP Consumer Group name already exists")
+        self.groups[group] = {"delivered": 0, "pending": []}
+
+    def xreadgroup(self, group, consumer, streams, count=None):
+        (key, stream_id), = streams.items()
+        state = self.groups[group]
+        fields = dict(self.entries)
+        if stream_id == "0":
+            entries = [(i, fields.get(i, {})) for i in state["pending"]]
+        else:
+            entries = [
+                (entry_id, value) for entry_id, value in self.entries
+                if _seq(entry_id) > state["delivered"]
+            ][:count]
+            if entries:
+                state["delivered"] = _seq(entries[-1][0])
+            state["pending"].extend(entry_id for entry_id, _ in entries)
+        entries = entries[:count]
+        return [[key, entries]] if entries else []
+
+    def xack(self, key, group, *entry_ids):
+        pending = self.groups[group]["pending"]
+        self.groups[group]["pending"] = [
+            i for i in pending if i not in entry_ids
+        ]
+
+    def xinfo_groups(self, key):
+        return [
+            {
+                "name": name,
+                "pending": len(state["pending"]),
+                "last-delivered-id": f"{state['delivered']}-0",
+            }
+            for name, state in self.groups.items()
+        ]
+
+    def xpending(self, key, group):
+        pending = self.groups[group]["pending"]
+        return {"pending": len(pending), "min": min(pending, key=_seq)}
+
+    def xtrim(self, key, minid):
+        self.entries = [e for e in self.entries if _seq(e[0]) >= _seq(minid)]
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+        return call
+
+    def execute(self):
+        self.redis.commands.append([name for name, _, _ in self.calls])
+        return [getattr(self.redis, n)(*a, **kw) for n, a, kw in self.calls]
+
+
+def _seq(entry_id):
+    return int(entry_id.split("-")[0])
+
+
 @fixture
 def presets_dir():
     return BASE_DIR / "presets"
+
+
+@fixture
+def redis():
+    return FakeRedis()
@@ -0,0 +1,218 @@
+import datetime
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from redis.exceptions import RedisError
+from sqlalchemy.exc import DataError, OperationalError
+
+from dingolytics.auditlog import flush_auditlog_events, store_events
+from dingolytics.auditlog.clickhouse import AuditEventsStore, to_clickhouse_row
+from dingolytics.auditlog.stream import AuditLogStream
+from dingolytics.auditlog.webhooks import (
+    WebhookDeliveryError,
+    post_events,
+    serialize_event,
+)
+
+
+def test_stream_reads_appended_events(redis):
+    stream = AuditLogStream(redis)
+    for i in range(3):
+        stream.append({"action": "view", "object_id": i})
+    entries = stream.read("auditlog", count=2)
+    assert [event["object_id"] for _, event in entries] == [0, 1]
+
+
+def test_stream_reads_pending_events_again(redis):
+    stream = AuditLogStream(redis)
+    stream.append({"action": "view"})
+    stream.append({"action": "list"})
+    entries = stream.read("auditlog")
+    # Not acknowledged, e.g. the flush failed
+    assert stream.read("auditlog") == entries
+    stream.ack("auditlog", [entry_id for entry_id, _ in entries])
+    assert stream.read("auditlog") == []
+
+
+def test_stream_groups_read_independently(redis):
+    stream = AuditLogStream(redis)
+    for i in range(4):
+        stream.append({"action": "view", "object_id": i})
+    entries = stream.read("auditlog")
+    stream.ack("auditlog", [entry_id for entry_id, _ in entries])
+    other = stream.read("auditlog-clickhouse", count=2)
+    assert [event["object_id"] for _, event in other] == [0, 1]
+
+    # Pending events of the other group are kept
+    stream.trim(["auditlog", "auditlog-clickhouse"])
+    assert len(redis.entries) == 4
+    stream.ack("auditlog-clickhouse", [entry_id for entry_id, _ in other])
+    stream.trim(["auditlog", "auditlog-clickhouse"])
+    assert [entry_id for entry_id, _ in redis.entries] == ["2-0", "3-0", "4-0"]
+    stream.read("auditlog-clickhouse")
+    stream.trim(["auditlog"])
+    assert [entry_id for entry_id, _ in redis.entries] == ["4-0"]
+
+
+def test_stream_keeps_events_of_groups_not_created(redis):
+    stream = AuditLogStream(redis)
+    stream.append({"action": "view"})
+    stream.ack("auditlog", [entry_id for entry_id, _ in stream.read("auditlog")])
+    stream.trim(["auditlog", "auditlog-clickhouse"])
+    assert len(redis.entries) == 1
+    assert len(stream.read("auditlog-clickhouse")) == 1
+
+
+def test_stream_acknowledges_trimmed_events(redis):
+    stream = AuditLogStream(redis, maxlen=2)
+    stream.append({"action": "view"})
+    stream.read("auditlog")
+    stream.append({"action": "list"})
+    stream.append({"action": "execute"})
+    entries = stream.read("auditlog")
+    assert [event["action"] for _, event in entries] == ["list", "execute"]
+    assert redis.groups["auditlog"]["pending"] == ["2-0", "3-0"]
+
+
+def test_serialize_event():
+    created_at = datetime.datetime(2024, 1, 2, 3, 4, 5)
+    event = serialize_event({
+        "org_id": 1,
+        "user_id": 2,
+        "action": "view",
+        "object_type": "query",
+        "object_id": 3,
+        "additional_properties": {"ip": "127.0.0.1"},
+        "created_at": created_at,
+    })
+    assert event["created_at"] == "2024-01-02T03:04:05"
+    assert event["additional_properties"] == {"ip": "127.0.0.1"}
+
+
+def test_post_events_raises_on_failures():
+    events = [{"action": "view"}]
+    with patch("dingolytics.auditlog.webhooks.requests.post") as post:
+        post.return_value.status_code = 204
+        post_events("http://hook", events)
+        post.assert_called_once_with(
+            "http://hook", json={"data": events}, timeout=10.0
+        )
+
+        post.return_value.status_code = 500
+        post.return_value.content = b"error"
+        with pytest.raises(WebhookDeliveryError):
+            post_events("http://hook", events)
+
+
+def test_store_events_drops_malformed_events():
+    def record_many(events):
+        if len(events) > 1 or events[0]["action"] == "bad":
+            raise DataError("INSERT", {}, Exception("invalid input"))
+        return events
+
+    with patch("redash.models.Event.record_many", side_effect=record_many), \
+            patch("redash.models.db") as db:
+        rows = store_events([{"action": "view"}, {"action": "bad"}])
+    assert rows == [{"action": "view"}]
+    assert db.session.rollback.call_count == 2
+
+
+def test_store_events_raises_on_database_errors():
+    error = OperationalError("INSERT", {}, Exception("connection reset"))
+    with patch("redash.models.Event.record_many", side_effect=error), \
+            patch("redash.models.db") as db:
+        with pytest.raises(OperationalError):
+            store_events([{"action": "view"}])
+    db.session.rollback.assert_called_once()
+
+
+def test_flush_keeps_events_while_clickhouse_unavailable(redis):
+    stream = AuditLogStream(redis)
+    stream.append({"action": "view"})
+    settings = SimpleNamespace(
+        AUDITLOG_CLICKHOUSE_ENABLED=True, AUDITLOG_BATCH_SIZE=500
+    )
+    with patch("dingolytics.auditlog.get_auditlog_stream", return_value=stream), \
+            patch("dingolytics.auditlog.get_audit_events_store", return_value=None), \
+            patch("dingolytics.auditlog.get_recent_activity"), \
+            patch("dingolytics.auditlog.store_events", side_effect=lambda e: e), \
+            patch("dingolytics.auditlog.deliver_events"), \
+            patch("redash.settings.S", settings):
+        assert flush_auditlog_events() == 1
+    assert len(redis.entries) == 1
+    assert len(stream.read("auditlog-clickhouse")) == 1
+
+
+def test_flush_acknowledges_events_once_stored(redis):
+    stream = AuditLogStream(redis)
+    stream.append({"action": "view"})
+    settings = SimpleNamespace(
+        AUDITLOG_CLICKHOUSE_ENABLED=False, AUDITLOG_BATCH_SIZE=500
+    )
+    with patch("dingolytics.auditlog.get_auditlog_stream", return_value=stream), \
+            patch("dingolytics.auditlog.get_recent_activity", side_effect=RedisError), \
+            patch("dingolytics.auditlog.store_events", side_effect=lambda e: e), \
+            patch("dingolytics.auditlog.deliver_events", side_effect=RedisError), \
+            patch("redash.settings.S", settings):
+        assert flush_auditlog_events() == 1
+    assert stream.read("auditlog") == []
+
+
+class FakeWriter:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.inserts = []
+        self.queries = []
+
+    def insert(self, target, column_names, columns):
+        self.inserts.append((target, column_names, columns))
+
+    def query(self, target, sql, parameters=None):
+        self.queries.append((sql, parameters))
+        return self.rows
+
+
+def event_row(**overrides):
+    row = {
+        "org_id": 1,
+        "user_id": 2,
+        "action": "view",
+        "object_type": "query",
+        "object_id": 3,
+        "additional_properties": {"ip": "127.0.0.1"},
+        "created_at": datetime.datetime(2024, 1, 2, 3, 4, 5),
+    }
+    row.update(overrides)
+    return row
+
+
+def test_to_clickhouse_row():
+    row = to_clickhouse_row(event_row(object_id=None))
+    assert row["object_id"] == ""
+    assert row["additional_properties"] == '{"ip": "127.0.0.1"}'
+    assert row["timestamp"] == datetime.datetime(2024, 1, 2, 3, 4, 5)
+
+
+def test_store_inserts_columns():
+    writer = FakeWriter()
+    target = SimpleNamespace(table="audit_events")
+    AuditEventsStore(writer, target).insert([event_row(), event_row(user_id=None)])
+    (_, column_names, columns), = writer.inserts
+    assert columns[column_names.index("user_id")] == [2, None]
+    assert columns[column_names.index("object_id")] == ["3", "3"]
+
+
+def test_store_daily_counts():
+    day = datetime.date(2024, 1, 2)
+    writer = FakeWriter(rows=[
+        (1, 2, "query", "3", day, "execute", 2),
+        (1, 2, "query", "3", day, "edit", 1),
+        (1, 2, "query", "3", day, "view", 5),
+    ])
+    store = AuditEventsStore(writer, SimpleNamespace(table="audit_events"))
+    counts = store.get_daily_counts({"query": ["edit", "execute"]})
+    assert counts == {(1, 2, "query", "3", day): 3}
+    sql, parameters = writer.queries[0]
+    assert "FROM audit_events" in sql
+    assert parameters["object_types"] == ["query"]
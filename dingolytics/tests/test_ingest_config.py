@@ -1,11 +1,20 @@
+from shutil import which
+from subprocess import run
+from unittest import skipUnless
 from unittest.mock import patch
 
 from tests import BaseTestCase
-from dingolytics.ingest import update_vector_config
+from dingolytics.ingest import (
+    get_vector_config,
+    schedule_vector_config_sync,
+    update_vector_config,
+)
+from dingolytics.ingest.vector import VectorConfig
+from redash import settings
 
 
 class TestIngestVectorConfig(BaseTestCase):
-    @patch("dingolytics.triggers.streams.create_table_for_stream")
+    @patch("dingolytics.triggers.streams.schedule_stream_provisioning")
     def test_update_vector_config(self, _):
         vector_config = update_vector_config([], clean=True)
         # One HTTP source and one internal logs source:
@@ -29,8 +38,172 @@ class TestIngestVectorConfig(BaseTestCase):
             ),
         ]
 
-        # After adding streams 3 sinks are created
+        # After adding streams 1 sink and 1 dead-letter sink for the data
+        # source are created
         vector_config = update_vector_config(streams, clean=False)
         self.assertEqual(len(vector_config.config["sources"]), 2)
-        self.assertEqual(len(vector_config.config["transforms"]), 2)
+        self.assertEqual(len(vector_config.config["transforms"]), 4)
         self.assertEqual(len(vector_config.config["sinks"]), 3)
+
+        # Streams are resolved with a single lookup in the remap transform
+        sink_key = f"sink-ds-{data_source.id}-medium"
+        route_key = f"ds-{data_source.id}-medium"
+        lookup = vector_config.config["transforms"]["http_lookup"]
+        for stream in streams:
+            self.assertIn(
+                f'"/ingest/{stream.ingest_key}": '
+                f'{{"dlq": "dlq-ds-{data_source.id}", "route": "{route_key}", '
+                f'"schema": "app_events", "stream": {stream.id}, '
+                f'"table": "{stream.db_table}"}}',
+                lookup["source"],
+            )
+        # Events are converted once per preset schema
+        self.assertEqual(lookup["source"].count('schema == "app_events"'), 1)
+        self.assertTrue(lookup["reroute_dropped"])
+        router = vector_config.config["transforms"]["http_router"]
+        dlq_route_key = f"dlq-ds-{data_source.id}"
+        self.assertEqual(router["route"], {
+            route_key: f'._route_ == "{route_key}"',
+            dlq_route_key: f'._route_ == "{dlq_route_key}"',
+        })
+        sink = vector_config.config["sinks"][sink_key]
+        self.assertEqual(sink["inputs"], [f"http_router.{route_key}"])
+        self.assertEqual(sink["table"], "{{ _table_ }}")
+
+        # Events dropped by the lookup go to the dead-letter tables
+        dead_letters = vector_config.config["transforms"]["http_dead_letters"]
+        self.assertEqual(dead_letters["inputs"], ["http_lookup.dropped"])
+        self.assertIn('"_table_": string!(destination.table) + "_dlq"',
+                      dead_letters["source"])
+        sink = vector_config.config["sinks"][f"sink-{dlq_route_key}"]
+        self.assertEqual(sink["inputs"], [f"http_router.{dlq_route_key}"])
+
+    def test_update_vector_config_tuning(self):
+        data_source = self.factory.create_data_source(
+            type="clickhouse", options={
+                "dbname": "default",
+                "url": "http://localhost:8123",
+            }
+        )
+        streams = [
+            self.factory.create_stream(
+                db_table="stream_1", data_source=data_source,
+                ingest_volume="low",
+            ),
+            self.factory.create_stream(
+                db_table="stream_2", data_source=data_source,
+                ingest_volume="high", ingest_options={"batch_timeout_secs": 30},
+            ),
+        ]
+        vector_config = update_vector_config(streams, clean=True)
+        sinks = vector_config.config["sinks"]
+
+        sink = sinks[f"sink-ds-{data_source.id}-low"]
+        self.assertEqual(sink["batch"], {"max_events": 10000, "timeout_secs": 10})
+        self.assertEqual(sink["buffer"]["type"], "memory")
+        self.assertTrue(
+            sink["query_settings"]["async_insert_settings"]["enabled"]
+        )
+
+        # Custom options get a dedicated sink on top of the preset
+        sink = sinks[f"sink-stream-{streams[1].id}"]
+        self.assertEqual(sink["batch"]["timeout_secs"], 30)
+        self.assertEqual(sink["buffer"]["type"], "disk")
+        self.assertEqual(sink["compression"], "zstd")
+
+    @patch("dingolytics.triggers.streams.schedule_stream_provisioning")
+    def test_update_vector_config_many_streams(self, _):
+        data_source = self.factory.create_data_source(
+            type="clickhouse", options={
+                "dbname": "default",
+                "url": "http://localhost:8123",
+            }
+        )
+        streams = [
+            self.factory.create_stream(
+                db_table=f"stream_{i}", data_source=data_source
+            )
+            for i in range(100)
+        ]
+        vector_config = update_vector_config(streams, clean=True)
+        # Sinks and routes depend on data sources, not on streams
+        self.assertEqual(len(vector_config.config["transforms"]), 4)
+        self.assertEqual(len(vector_config.config["sinks"]), 3)
+        router = vector_config.config["transforms"]["http_router"]
+        self.assertEqual(len(router["route"]), 2)
+        # Each stream is a single entry of the lookup object
+        lookup = vector_config.config["transforms"]["http_lookup"]
+        for stream in streams:
+            self.assertEqual(
+                lookup["source"].count(f'"/ingest/{stream.ingest_key}"'), 1
+            )
+
+    @skipUnless(which("vector"), "Vector is not installed")
+    def test_validate_vector_config(self):
+        data_source = self.factory.create_data_source(
+            type="clickhouse", options={
+                "dbname": "default",
+                "url": "http://localhost:8123",
+            }
+        )
+        streams = [
+            self.factory.create_stream(
+                db_table=f"stream_{i}", data_source=data_source
+            )
+            for i in range(3)
+        ]
+        vector_config = update_vector_config(streams, clean=True)
+        result = run(
+            ["vector", "validate", "--no-environment", str(vector_config.config_path)],
+            capture_output=True, text=True,
+        )
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+
+    def test_vector_api_address(self):
+        vector_config = VectorConfig("vector.yaml")
+        self.assertEqual(vector_config.config["api"]["address"], "127.0.0.1:8686")
+        vector_config = VectorConfig("vector.yaml", api_address="0.0.0.0:8686")
+        vector_config.clean()
+        self.assertEqual(vector_config.config["api"]["address"], "0.0.0.0:8686")
+
+    def test_update_vector_config_skips_unchanged(self):
+        update_vector_config([], clean=True)
+        vector_config = get_vector_config()
+        with patch.object(vector_config, "save") as save:
+            update_vector_config([], clean=True)
+            save.assert_not_called()
+
+    def test_vector_config_diff(self):
+        vector_config = update_vector_config([], clean=True)
+        current_config = vector_config.read()
+        self.assertFalse(vector_config.diff(current_config))
+
+        data_source = self.factory.create_data_source(
+            type="clickhouse", options={
+                "dbname": "default",
+                "url": "http://localhost:8123",
+            }
+        )
+        stream = self.factory.create_stream(
+            db_table="stream_1", data_source=data_source
+        )
+        vector_config = update_vector_config([stream], clean=True)
+        diff = vector_config.diff(current_config)
+        self.assertEqual(diff.added, {"sinks": [
+            f"sink-dlq-ds-{data_source.id}",
+            f"sink-ds-{data_source.id}-medium",
+        ]})
+        self.assertEqual(diff.changed, {"transforms": [
+            "http_dead_letters", "http_lookup", "http_router",
+        ]})
+        self.assertEqual(diff.removed, {})
+        # Saved atomically without leaving temporary files behind:
+        self.assertEqual(
+            list(vector_config.config_path.parent.glob(".*")), []
+        )
+
+    @patch("dingolytics.tasks.sync_vector_config.sync_vector_config_task.schedule")
+    def test_schedule_vector_config_sync_debounces(self, schedule):
+        schedule_vector_config_sync()
+        schedule_vector_config_sync()
+        schedule.assert_called_once_with(delay=settings.S.VECTOR_CONFIG_SYNC_DELAY)
@@ -0,0 +1,99 @@
+import json
+from datetime import datetime
+
+from dingolytics.ingest.dlq import (
+    dead_letter_row,
+    get_dead_letter_stats,
+    replay_dead_letters,
+)
+from dingolytics.ingest.gateway import StreamTarget
+from dingolytics.ingest.schema import RowCoercer
+from dingolytics.presets import TableSchema
+
+
+class FakeClickHouseDLQ:
+    """Local ClickHouse stand-in serving a dead-letter table."""
+
+    def __init__(self, payloads):
+        self.rows = [
+            (f"id-{i}", datetime(2024, 1, 1, 0, 0, i), json.dumps(payload))
+            for i, payload in enumerate(payloads)
+        ]
+        self.inserts = []
+        self.deleted = []
+        self.queries = []
+
+    def query(self, target, sql, parameters=None):
+        self.queries.append((sql, parameters))
+        if sql.startswith("SELECT source"):
+            return [("gateway", "app: Unexpected dict", 3, None, None)]
+        rows = [row for row in self.rows if row[1] < parameters["until"]]
+        if "timestamp" in parameters:
+            last_key = parameters["timestamp"], parameters["id"]
+            rows = [row for row in rows if (row[1], row[0]) > last_key]
+        return rows[:parameters["limit"]]
+
+    def insert(self, target, column_names, columns):
+        self.inserts.append((target.table, column_names, columns))
+
+    def command(self, target, sql, parameters=None):
+        self.deleted.extend(parameters["ids"])
+
+
+TARGET = StreamTarget(
+    stream_id=1, data_source_id=1, table="app_events", options={}
+)
+COERCER = RowCoercer(TableSchema.from_types("app_events", {
+    "app": "String",
+    "user_id": "UInt32",
+}))
+
+
+def test_dead_letter_row():
+    assert dead_letter_row(1, "gateway", "app: Invalid", {"app": 1}) == {
+        "stream_id": 1,
+        "source": "gateway",
+        "reason": "app: Invalid",
+        "payload": '{"app": 1}',
+    }
+
+
+def test_dead_letter_stats():
+    writer = FakeClickHouseDLQ([])
+    stats = get_dead_letter_stats(TARGET, writer)
+    assert stats["total"] == 3
+    assert "FROM app_events_dlq" in writer.queries[0][0]
+
+
+def test_replay_dead_letters():
+    writer = FakeClickHouseDLQ([
+        {"app": "a", "user_id": "1"},
+        {"app": "b", "user_id": -1},
+        {"app": "c"},
+        {"app": "d", "user_id": 4},
+        {"app": "e", "user_id": 5},
+    ])
+    delays = []
+    result = replay_dead_letters(
+        TARGET, writer, COERCER,
+        batch_size=2, max_rows=4, rows_per_second=1000000,
+        until=datetime(2025, 1, 1), sleep=delays.append,
+    )
+    assert result.to_dict() == {"replayed": 3, "rejected": 1, "batches": 2}
+    assert writer.inserts == [
+        ("app_events", ["app", "user_id"], [["a"], [1]]),
+        ("app_events", ["app"], [["c"]]),
+        ("app_events", ["app", "user_id"], [["d"], [4]]),
+    ]
+    # Rows rejected again are kept
+    assert writer.deleted == ["id-0", "id-2", "id-3"]
+    assert all(delay <= 0.01 for delay in delays)
+
+
+def test_replay_dead_letters_until():
+    writer = FakeClickHouseDLQ([{"app": "a"}, {"app": "b"}])
+    result = replay_dead_letters(
+        TARGET, writer, COERCER, until=datetime(2024, 1, 1, 0, 0, 1),
+    )
+    assert result.replayed == 1
+    assert writer.deleted == ["id-0"]
@@ -0,0 +1,269 @@
+import json
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from pytest import fixture, raises
+
+from dingolytics.ingest.gateway import (
+    ClickHouseWriter,
+    DiskSpool,
+    IngestBackpressure,
+    IngestGateway,
+    StreamCache,
+    StreamNotFound,
+    StreamTarget,
+    create_app,
+)
+
+COLUMNS = {
+    "app": "String",
+    "event": "String",
+    "ip_addr_v4": "Nullable(IPv4)",
+}
+
+
+class FakeClickHouseWriter:
+    """Local ClickHouse stand-in recording inserted blocks."""
+
+    def __init__(self):
+        self.inserts = []
+        self.fail = False
+        self.fail_tables = set()
+
+    def get_columns(self, target):
+        return COLUMNS
+
+    def insert(self, target, column_names, columns):
+        if self.fail or target.table in self.fail_tables:
+            raise ConnectionError("ClickHouse is not available")
+        self.inserts.append((target.table, column_names, columns))
+
+
+@fixture
+def target():
+    return StreamTarget(
+        stream_id=1, data_source_id=1, table="app_events", options={}
+    )
+
+
+@fixture
+def writer():
+    return FakeClickHouseWriter()
+
+
+@fixture
+def gateway(target, writer, tmp_path):
+    return IngestGateway(
+        streams=StreamCache(loader=lambda: {"key": target}),
+        writer=writer,
+        spool=DiskSpool(tmp_path / "spool"),
+        batch_rows=3,
+        flush_interval=60,
+        max_pending_rows=5,
+        spool_max_attempts=2,
+    )
+
+
+def test_ingest_unknown_key(gateway):
+    with raises(StreamNotFound):
+        gateway.ingest("unknown", {"app": "a"})
+
+
+def test_ingest_flushes_full_batches_as_columns(gateway, writer):
+    gateway.ingest("key", {"app": "a", "event": "e1", "unknown": 1})
+    gateway.flush()
+    assert writer.inserts == []
+
+    gateway.ingest("key", [
+        {"app": "a", "event": "e2"},
+        {"event": "e3"},
+    ], ip_addr="10.0.0.1")
+    gateway.flush()
+    # Rows are grouped by present columns, so defaults apply to the rest
+    assert writer.inserts == [
+        ("app_events", ["app", "event"], [["a"], ["e1"]]),
+        (
+            "app_events",
+            ["app", "event", "ip_addr_v4"],
+            [["a"], ["e2"], ["10.0.0.1"]],
+        ),
+        ("app_events", ["event", "ip_addr_v4"], [["e3"], ["10.0.0.1"]]),
+    ]
+    assert gateway.pending_rows == 0
+
+
+def test_ingest_overrides_client_ip_addr(gateway, writer):
+    gateway.ingest("key", {"event": "e1", "ip_addr_v4": "10.0.0.2"}, ip_addr="10.0.0.1")
+    gateway.flush(force=True)
+    assert writer.inserts == [
+        ("app_events", ["event", "ip_addr_v4"], [["e1"], ["10.0.0.1"]]),
+    ]
+
+
+def test_writer_describes_columns_again(target):
+    client = MagicMock()
+    client.query.return_value = SimpleNamespace(result_rows=[("app", "String")])
+    writer = ClickHouseWriter(columns_ttl=60)
+    with patch.object(writer, "_get_client", return_value=client), \
+            patch("dingolytics.ingest.gateway.time.monotonic") as monotonic:
+        monotonic.return_value = 0
+        columns = writer.get_columns(target)
+        assert writer.get_columns(target) is columns
+        monotonic.return_value = 61
+        assert writer.get_columns(target) is not columns
+
+        # Altered tables are described again once an insert fails
+        client.insert.side_effect = ConnectionError
+        with raises(ConnectionError):
+            writer.insert(target, ["app"], [["a"]])
+        assert client.query.call_count == 2
+        writer.get_columns(target)
+        assert client.query.call_count == 3
+
+
+def test_ingest_flushes_expired_batches(gateway, writer):
+    gateway.flush_interval = 0
+    gateway.ingest("key", {"app": "a", "event": "e1"})
+    gateway.flush()
+    assert len(writer.inserts) == 1
+
+
+def test_ingest_rejects_invalid_rows(gateway, writer):
+    result = gateway.ingest("key", [
+        {"app": "a", "event": "e1"},
+        {"app": "a", "ip_addr_v4": "not an address"},
+        "not an object",
+    ])
+    assert result.to_dict() == {
+        "accepted": 1,
+        "rejected": 2,
+        "errors": [
+            {
+                "index": 1,
+                "column": "ip_addr_v4",
+                "message": "Expected 4 octets in 'not an address'",
+            },
+            {"index": 2, "column": None, "message": "Event must be an object"},
+        ],
+    }
+    assert gateway.stats == {
+        (1, "accepted"): 1,
+        (1, "rejected"): 2,
+        (1, "rejected", "ip_addr_v4"): 1,
+        (1, "rejected", None): 1,
+    }
+    gateway.flush(force=True)
+    assert writer.inserts == [
+        ("app_events", ["app", "event"], [["a"], ["e1"]]),
+        # Rejected rows are kept in the dead-letter table
+        ("app_events_dlq", ["payload", "reason", "source", "stream_id"], [
+            ['{"app": "a", "ip_addr_v4": "not an address"}', '"not an object"'],
+            [
+                "ip_addr_v4: Expected 4 octets in 'not an address'",
+                "Event must be an object",
+            ],
+            ["gateway", "gateway"],
+            [1, 1],
+        ]),
+    ]
+
+
+def test_ingest_backpressure(gateway):
+    gateway.batch_rows = 10
+    gateway.ingest("key", [{"app": "a"}] * 5)
+    with raises(IngestBackpressure):
+        gateway.ingest("key", {"app": "a"})
+    gateway.flush(force=True)
+    assert gateway.ingest("key", {"app": "a"}).accepted == 1
+
+
+def test_ingest_spools_failed_batches(gateway, writer):
+    writer.fail = True
+    gateway.ingest("key", {"app": "a", "event": "e1"})
+    gateway.flush(force=True)
+    assert len(gateway.spool.paths()) == 1
+
+    writer.fail = False
+    gateway.retry_spool()
+    assert gateway.spool.paths() == []
+    assert writer.inserts == [("app_events", ["app", "event"], [["a"], ["e1"]])]
+
+
+def test_ingest_spool_gives_up_after_max_attempts(gateway, writer):
+    gateway.spool_retry_interval = 0
+    writer.fail = True
+    gateway.ingest("key", {"app": "a", "event": "e1"})
+    gateway.flush(force=True)
+    gateway.retry_spool()
+    assert len(gateway.spool.paths()) == 1
+    gateway.retry_spool()
+    assert gateway.spool.paths() == []
+    assert len(list(gateway.spool.failed_path.glob("*.json"))) == 1
+
+
+def test_ingest_spool_backs_off_per_table(gateway, writer, target):
+    other = StreamTarget(
+        stream_id=2, data_source_id=1, table="other_events", options={}
+    )
+    gateway.streams.loader = lambda: {"key": target, "other": other}
+    writer.fail = True
+    gateway.ingest("key", {"app": "a", "event": "e1"})
+    gateway.flush(force=True)
+    gateway.ingest("key", {"app": "a", "event": "e2"})
+    gateway.flush(force=True)
+    gateway.ingest("other", {"app": "a", "event": "e3"})
+    gateway.flush(force=True)
+
+    # Failing batches don't hold back the batches of other tables
+    writer.fail = False
+    writer.fail_tables = {"app_events"}
+    gateway.retry_spool()
+    assert writer.inserts == [("other_events", ["app", "event"], [["a"], ["e3"]])]
+    records = [gateway.spool.load(path) for path in gateway.spool.paths()]
+    assert [r["attempts"] for r in records] == [2, 1]
+    assert records[0]["retry_at"] > 0
+
+    # Batches are not retried before their backoff expires
+    writer.fail_tables = set()
+    gateway.retry_spool()
+    assert len(writer.inserts) == 1
+
+    for path in gateway.spool.paths():
+        record = gateway.spool.load(path)
+        record["retry_at"] = 0
+        gateway.spool.put(record, path=path)
+    gateway.retry_spool()
+    assert gateway.spool.paths() == []
+    assert [insert[2][1] for insert in writer.inserts[1:]] == [["e1"], ["e2"]]
+
+
+def test_stream_cache_throttles_reload_on_unknown_keys(target):
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return {"key": target}
+
+    streams = StreamCache(loader=loader, ttl=60, min_reload=60)
+    assert streams.resolve("key") is target
+    assert streams.resolve("unknown") is None
+    assert streams.resolve("unknown") is None
+    assert len(loads) == 1
+    assert streams.get_target(1, "app_events") is target
+
+
+def test_gateway_app(gateway, writer):
+    client = create_app(gateway).test_client()
+    rv = client.post("/ingest/key", data=json.dumps({"app": "a"}))
+    assert rv.status_code == 200
+    assert rv.json == {"accepted": 1, "rejected": 0}
+
+    rv = client.post("/ingest/unknown", data=json.dumps({"app": "a"}))
+    assert rv.status_code == 404
+
+    rv = client.post("/ingest/key", data="[1, 2]")
+    assert rv.status_code == 200
+    assert rv.json["rejected"] == 2
+
+    rv = client.post("/ingest/key", data="1")
+    assert rv.status_code == 400
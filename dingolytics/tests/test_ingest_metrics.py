@@ -0,0 +1,135 @@
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from dingolytics.ingest.metrics import (
+    QUERY_LOG_DELAY,
+    StreamMetricsCollector,
+    get_stream_metrics,
+)
+
+
+class FakeClickHouse:
+    def __init__(self):
+        self.queries = []
+
+    def query(self, target, sql, parameters=None):
+        self.queries.append((target.data_source_id, sql, parameters))
+        if "system.parts" in sql:
+            return [("events", 1000, 4096, 3, 5)]
+        return [("events", 9, 1, 100, 2000)]
+
+
+def make_stream(stream_id, data_source_id=1, db_table="events", **kwargs):
+    data_source = SimpleNamespace(
+        id=data_source_id, type="clickhouse",
+        options=SimpleNamespace(to_dict=lambda: {"dbname": "analytics"}),
+    )
+    return SimpleNamespace(
+        id=stream_id, data_source_id=data_source_id, data_source=data_source,
+        db_table=db_table, db_table_preset=kwargs.get("preset", "app_events"),
+        ingest_volume=None, ingest_options=kwargs.get("ingest_options"),
+    )
+
+
+def test_collect_stream_metrics(redis):
+    writer = FakeClickHouse()
+    collector = StreamMetricsCollector(redis, writer, interval=10)
+    streams = [
+        make_stream(1),
+        make_stream(2, db_table="other"),
+        make_stream(3, data_source_id=2),
+        make_stream(4, db_table="_dlq", preset="_dlq"),
+    ]
+    with patch("dingolytics.ingest.metrics.time.time", return_value=1000):
+        samples = collector.collect(streams)
+
+    # Internal streams are skipped, ClickHouse is queried twice
+    # per data source and Redis once for reads and once for writes
+    assert sorted(samples) == [1, 2, 3]
+    assert len(writer.queries) == 4
+    assert len(redis.commands) == 2
+    _, _, parameters = writer.queries[1]
+    assert parameters == {
+        "start": 1000 - QUERY_LOG_DELAY - 10,
+        "end": 1000 - QUERY_LOG_DELAY,
+        "tables": ["analytics.events", "analytics.other"],
+    }
+
+    sample = samples[1]
+    assert (sample.rows, sample.bytes, sample.parts) == (1000, 4096, 3)
+    assert sample.lag_seconds == 5
+    assert sample.inserted_rows == 100
+    assert sample.events_per_second == 10
+    assert sample.bytes_per_second == 200
+    assert sample.error_rate == 0.1
+    # No inserts into the other table within the window
+    assert samples[2].rows == 0 and samples[2].events_per_second == 0
+
+
+def test_collect_stream_metrics_window(redis):
+    writer = FakeClickHouse()
+    collector = StreamMetricsCollector(redis, writer, interval=10)
+    streams = [make_stream(1)]
+    with patch("dingolytics.ingest.metrics.time.time", return_value=1000):
+        collector.collect(streams)
+
+    # The window continues from the end of the previous one
+    with patch("dingolytics.ingest.metrics.time.time", return_value=1025):
+        sample = collector.collect(streams)[1]
+    assert sample.window_start == 1000 - QUERY_LOG_DELAY
+    assert sample.window_end == 1025 - QUERY_LOG_DELAY
+    assert sample.events_per_second == 4
+
+    # Sampled again within the same second, nothing to collect
+    writer.queries.clear()
+    with patch("dingolytics.ingest.metrics.time.time", return_value=1025):
+        assert collector.collect(streams) == {}
+    assert writer.queries == []
+
+    assert [
+        item["window_end"] for item in get_stream_metrics(redis, 1)
+    ] == [1015, 990]
+    assert len(get_stream_metrics(redis, 1, limit=1)) == 1
+
+
+def test_collect_vector_sink_metrics(redis):
+    writer = FakeClickHouse()
+    collector = StreamMetricsCollector(
+        redis, writer, vector_api_url="http://vector:8686/graphql"
+    )
+    streams = [make_stream(1), make_stream(2, ingest_options={"a": 1})]
+
+    def response(sent_events, sent_bytes):
+        node = {
+            "componentId": "sink-ds-1-medium",
+            "metrics": {
+                "receivedEventsTotal": {"receivedEventsTotal": sent_events},
+                "sentEventsTotal": {"sentEventsTotal": sent_events},
+                "sentBytesTotal": {"sentBytesTotal": sent_bytes},
+            },
+        }
+        source = {"componentId": "http_server", "metrics": None}
+        return {"data": {"components": {"edges": [
+            {"node": node}, {"node": source},
+        ]}}}
+
+    with patch("dingolytics.ingest.metrics.requests.post") as post:
+        post.return_value.json.return_value = response(100, 1000)
+        with patch("dingolytics.ingest.metrics.time.time", return_value=1000):
+            samples = collector.collect(streams)
+        assert samples[1].sink.sent_events_total == 100
+        assert samples[1].sink.events_per_second is None
+        # Stream with custom tuning has a sink of its own
+        assert samples[2].sink is None
+
+        post.return_value.json.return_value = response(300, 5000)
+        with patch("dingolytics.ingest.metrics.time.time", return_value=1020):
+            samples = collector.collect(streams)
+        assert samples[1].sink.events_per_second == 10
+        assert samples[1].sink.bytes_per_second == 200
+
+        # Counters are reset on Vector restart
+        post.return_value.json.return_value = response(10, 100)
+        with patch("dingolytics.ingest.metrics.time.time", return_value=1040):
+            samples = collector.collect(streams)
+        assert samples[1].sink.events_per_second is None
@@ -0,0 +1,79 @@
+from unittest.mock import patch
+
+from tests import BaseTestCase
+from dingolytics.ingest.provisioning import (
+    STREAM_FAILED,
+    STREAM_PENDING,
+    STREAM_READY,
+)
+from dingolytics.tasks.provision_stream import provision_stream_task
+from redash import models
+
+
+@patch("dingolytics.tasks.provision_stream.schedule_vector_config_sync")
+@patch("redash.query_runner.clickhouse.ClickHouse.run_query")
+class TestProvisionStream(BaseTestCase):
+    def create_stream(self, **kwargs):
+        data_source = self.factory.create_data_source(type="clickhouse")
+        with patch("dingolytics.triggers.streams.schedule_stream_provisioning"):
+            return self.factory.create_stream(
+                data_source=data_source, db_table="events", **kwargs
+            )
+
+    def test_provision_stream(self, run_query, schedule_vector_config_sync):
+        run_query.return_value = ("{}", None)
+        stream = self.create_stream(db_table_options={
+            "rollups": ["per_minute"],
+        })
+        self.assertEqual(STREAM_PENDING, stream.provisioning_state)
+
+        provision_stream_task.call_local(stream.id, task=None)
+        self.assertEqual(STREAM_READY, stream.provisioning_state)
+        queries = [call.args[0] for call in run_query.call_args_list]
+        self.assertEqual([
+            "CREATE TABLE IF NOT EXISTS events (",
+            "CREATE TABLE IF NOT EXISTS events_dlq (",
+            "CREATE TABLE IF NOT EXISTS events_per_minute (",
+            "CREATE MATERIALIZED VIEW IF NOT EXISTS events_per_minute_mv "
+            "TO events_per_minute AS",
+        ], [query.split("\n")[0] for query in queries])
+        schedule_vector_config_sync.assert_called_once()
+
+        # Ready streams are not provisioned again
+        provision_stream_task.call_local(stream.id, task=None)
+        self.assertEqual(4, run_query.call_count)
+
+    def test_provision_stream_failed(
+        self, run_query, schedule_vector_config_sync
+    ):
+        run_query.return_value = (None, "Connection refused")
+        stream = self.create_stream()
+        with self.assertRaises(Exception):
+            provision_stream_task.call_local(stream.id, task=None)
+        self.assertEqual(STREAM_FAILED, stream.provisioning_state)
+        self.assertEqual("Connection refused", stream.provisioning_error)
+        schedule_vector_config_sync.assert_not_called()
+
+
+@patch("dingolytics.triggers.streams.schedule_stream_provisioning")
+class TestScheduleStreamProvisioning(BaseTestCase):
+    def add_stream(self):
+        stream = models.Stream(
+            name="events",
+            data_source=self.factory.create_data_source(type="clickhouse"),
+            db_table="events",
+        )
+        models.db.session.add(stream)
+        models.db.session.flush()
+        return stream
+
+    def test_schedules_after_commit(self, schedule_stream_provisioning):
+        stream = self.add_stream()
+        schedule_stream_provisioning.assert_not_called()
+        models.db.session.commit()
+        schedule_stream_provisioning.assert_called_once_with(stream.id)
+
+    def test_skips_rolled_back_streams(self, schedule_stream_provisioning):
+        self.add_stream()
+        models.db.session.rollback()
+        schedule_stream_provisioning.assert_not_called()
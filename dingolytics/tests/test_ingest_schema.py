@@ -0,0 +1,84 @@
+from pytest import mark, raises
+
+from dingolytics.ingest.schema import (
+    RowCoercer,
+    RowRejected,
+    get_preset_coercer,
+    get_vrl_coercion,
+)
+from dingolytics.presets import TableSchema
+
+SCHEMA = TableSchema.from_types("events", {
+    "app": "LowCardinality(String)",
+    "user_id": "Nullable(UInt32)",
+    "score": "Float64",
+    "is_mobile": "Bool",
+    "ip_addr_v4": "Nullable(IPv4)",
+    "timestamp": "DateTime64(3)",
+    "day": "Date",
+    "tags": "Array(String)",
+})
+
+
+def test_coerce_row():
+    coercer = RowCoercer(SCHEMA)
+    row = coercer.coerce({
+        "app": {"name": "web"},
+        "user_id": "42",
+        "score": 1,
+        "is_mobile": "true",
+        "ip_addr_v4": None,
+        "timestamp": "2024-01-02T03:04:05.678Z",
+        "day": 86400,
+        "tags": ["a", "b"],
+        "unknown": "skipped",
+    })
+    assert row == {
+        "app": '{"name":"web"}',
+        "user_id": 42,
+        "score": 1.0,
+        "is_mobile": True,
+        "ip_addr_v4": None,
+        "timestamp": 1704164645678,
+        "day": 1,
+        "tags": ["a", "b"],
+    }
+
+
+def test_coerce_row_null_uses_default():
+    # NULL of non-nullable column is skipped, so ClickHouse uses default
+    assert RowCoercer(SCHEMA).coerce({"app": None, "timestamp": None}) == {}
+
+
+@mark.parametrize("row,column", [
+    ({"user_id": -1}, "user_id"),
+    ({"user_id": 1.5}, "user_id"),
+    ({"user_id": "abc"}, "user_id"),
+    ({"score": [1]}, "score"),
+    ({"is_mobile": 2}, "is_mobile"),
+    ({"ip_addr_v4": "::1"}, "ip_addr_v4"),
+    ({"timestamp": "yesterday"}, "timestamp"),
+    ([{"app": "web"}], None),
+])
+def test_coerce_row_rejected(row, column):
+    with raises(RowRejected) as exc:
+        RowCoercer(SCHEMA).coerce(row)
+    assert exc.value.column == column
+
+
+def test_preset_coercer():
+    coercer = get_preset_coercer("clickhouse", "app_events")
+    assert coercer is get_preset_coercer("clickhouse", "app_events")
+    assert coercer.coerce({"app": "web", "is_mobile": True}) == {
+        "app": "web", "is_mobile": 1,
+    }
+    assert get_preset_coercer("clickhouse", "unknown") is None
+
+
+def test_vrl_coercion():
+    source = get_vrl_coercion(SCHEMA)
+    assert '."app" = to_string!(."app")' in source
+    assert 'if ."user_id" < 0 || ."user_id" > 4294967295 {' in source
+    assert '"%Y-%m-%d %H:%M:%S%.3f"' in source
+    # Arrays are passed as is
+    assert '."tags"' not in source
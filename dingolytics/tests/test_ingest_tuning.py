@@ -0,0 +1,26 @@
+import pytest
+from pydantic import ValidationError
+
+from dingolytics.ingest.vector import (
+    VECTOR_INGEST_VOLUMES,
+    VectorClickHouseTuning,
+    get_ingest_tuning,
+)
+
+
+@pytest.mark.parametrize("volume", sorted(VECTOR_INGEST_VOLUMES))
+def test_presets_buffer_holds_batch(volume):
+    tuning = VECTOR_INGEST_VOLUMES[volume]
+    if tuning.buffer_type == "memory" and tuning.batch_max_events:
+        assert tuning.buffer_max_events >= tuning.batch_max_events
+
+
+def test_tuning_rejects_buffer_smaller_than_batch():
+    with pytest.raises(ValidationError):
+        VectorClickHouseTuning(batch_max_events=1000, buffer_max_events=100)
+    with pytest.raises(ValidationError):
+        get_ingest_tuning("low", {"buffer_max_events": 100})
+    # Disk buffers are sized in bytes
+    VectorClickHouseTuning(
+        batch_max_events=1000, buffer_max_events=100, buffer_type="disk"
+    )
@@ -1,4 +1,12 @@
-from dingolytics.presets import PresetLoader
+from pytest import mark, raises
+
+from dingolytics.presets import (
+    PresetLoader,
+    default_presets,
+    render_rollup_queries,
+    render_table_query,
+)
+from dingolytics.presets.schema import parse_table_schema
 
 
 def test_presets_loader(presets_dir):
@@ -7,3 +15,96 @@ def test_presets_loader(presets_dir):
     assert len(presets) == 1
     assert presets["fakedb"]
     assert presets["fakedb"]["dummy"]
+
+
+def test_presets_loader_schema(presets_dir):
+    presets = PresetLoader(base_path=presets_dir)
+    presets.load_all()
+    # Not a CREATE TABLE statement:
+    assert presets.get_schema("fakedb", "dummy") is None
+    assert default_presets().get_schema("clickhouse", "app_events")
+
+
+def test_parse_table_schema():
+    schema = parse_table_schema("events", """
+        CREATE TABLE ${db_table} (
+          `app` LowCardinality(String),
+          attrs Map(String, Nullable(String)) DEFAULT map(),
+          user_id Nullable(UInt64) CODEC(ZSTD(1)),
+          timestamp DateTime64(3, 'UTC') DEFAULT now64(),
+          day Date MATERIALIZED toDate(timestamp),
+          INDEX app_idx app TYPE set(100) GRANULARITY 4,
+        ) ENGINE = MergeTree()
+        ORDER BY (timestamp, app);
+    """)
+    assert [
+        (c.name, c.base_type, c.args, c.nullable, c.has_default, c.is_insertable)
+        for c in schema.columns
+    ] == [
+        ("app", "String", [], False, False, True),
+        ("attrs", "Map", ["String", "Nullable(String)"], False, True, True),
+        ("user_id", "UInt64", [], True, False, True),
+        ("timestamp", "DateTime64", ["3", "'UTC'"], False, True, True),
+        ("day", "Date", [], False, False, False),
+    ]
+
+
+def test_table_options():
+    presets = default_presets()
+    options = presets.get_table_options("clickhouse", "app_events", {
+        "ttl_days": 90,
+        "ttl_moves": [{"after_days": 7, "volume": "cold"}],
+        "rollups": ["per_minute"],
+    })
+    assert options.partition_by == "month"
+    query = render_table_query(
+        presets["clickhouse"]["app_events"], "events", options
+    )
+    assert "PARTITION BY toYYYYMM(timestamp)\n" in query
+    assert query.endswith(
+        "TTL toDateTime(timestamp) + INTERVAL 7 DAY TO VOLUME 'cold', "
+        "toDateTime(timestamp) + INTERVAL 90 DAY DELETE;"
+    )
+    # Defaults are overridden by stream options
+    options = presets.get_table_options(
+        "clickhouse", "app_events", {"partition_by": None}
+    )
+    query = render_table_query(
+        presets["clickhouse"]["app_events"], "events", options
+    )
+    assert "PARTITION BY" not in query and "TTL" not in query
+
+
+@mark.parametrize("options", [
+    {"partition_by": "year"},
+    {"ttl_days": 0},
+    {"ttl_days": 7, "ttl_moves": [{"after_days": 30, "disk": "s3"}]},
+    {"ttl_moves": [{"after_days": 1}]},
+    {"ttl_moves": [{"after_days": 1, "volume": "x' DELETE"}]},
+    {"rollups": ["per_hour"]},
+    {"codec": "zstd"},
+])
+def test_table_options_invalid(options):
+    with raises(ValueError):
+        default_presets().get_table_options("clickhouse", "app_events", options)
+
+
+def test_render_rollup_queries():
+    presets = default_presets()
+    rollups = presets.get_rollups("clickhouse", "app_events")
+    options = presets.get_table_options("clickhouse", "app_events", {
+        "rollups": ["per_minute"], "rollup_ttl_days": 365,
+    })
+    create_table, create_view = render_rollup_queries(
+        rollups["per_minute"], "events", "per_minute", options
+    )
+    assert create_table.startswith(
+        "CREATE TABLE IF NOT EXISTS events_per_minute ("
+    )
+    assert "PARTITION BY toYYYYMM(minute)" in create_table
+    assert "TTL toDateTime(minute) + INTERVAL 365 DAY DELETE" in create_table
+    assert create_view.startswith(
+        "CREATE MATERIALIZED VIEW IF NOT EXISTS events_per_minute_mv "
+        "TO events_per_minute"
+    )
+    assert "FROM events\n" in create_view
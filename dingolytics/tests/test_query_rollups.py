@@ -0,0 +1,146 @@
+from datetime import datetime, timezone
+
+from pytest import mark
+
+from dingolytics.presets import default_presets
+from dingolytics.queries.rollups import (
+    RollupTable,
+    parse_ttl_days,
+    rewrite_query,
+)
+
+ROLLUPS = {
+    "events": [RollupTable(
+        table="events_per_minute",
+        source_table="events",
+        spec=default_presets().get_rollup_spec(
+            "clickhouse", "app_events", "per_minute"
+        ),
+    )],
+}
+
+
+def test_rewrite_query():
+    query = (
+        "/* Query ID: 1 */\n"
+        "SELECT toStartOfHour(timestamp) AS hour, app, count() AS events_count,"
+        " uniq(user_id)\n"
+        "FROM events\n"
+        "WHERE timestamp >= toStartOfDay(now()) - INTERVAL 7 DAY\n"
+        "  AND app = 'web -- timestamp' AND event IN ('open', 'close')\n"
+        "GROUP BY hour, app\n"
+        "HAVING count() > 10\n"
+        "ORDER BY hour DESC\n"
+        "LIMIT 100;"
+    )
+    rewritten, rollup = rewrite_query(query, ROLLUPS)
+    assert rollup.table == "events_per_minute"
+    assert rewritten == (
+        "/* Query ID: 1 */\n"
+        "SELECT toStartOfHour(minute) AS hour, app, "
+        "sum(events) AS events_count, "
+        "uniqMerge(users) AS `uniq(user_id)`\n"
+        "FROM events_per_minute\n"
+        "WHERE minute >= toStartOfDay(now()) - INTERVAL 7 DAY\n"
+        "  AND app = 'web -- timestamp' AND event IN ('open', 'close')\n"
+        "GROUP BY hour, app\n"
+        "HAVING sum(events) > 10\n"
+        "ORDER BY hour DESC\n"
+        "LIMIT 100"
+    )
+
+
+def test_rewrite_query_keeps_database():
+    rewritten, _ = rewrite_query(
+        "SELECT toDate(timestamp, 'UTC') AS day, count(*) FROM analytics.events "
+        "WHERE timestamp < '2024-01-02' GROUP BY day",
+        ROLLUPS, database="analytics",
+    )
+    assert rewritten == (
+        "SELECT toDate(minute, 'UTC') AS day, sum(events) AS `count(*)`\n"
+        "FROM analytics.events_per_minute\n"
+        "WHERE minute < '2024-01-02'\n"
+        "GROUP BY day"
+    )
+
+
+@mark.parametrize("query", [
+    # Opt-out
+    "SELECT count() FROM events -- no_rollup",
+    # Not a stream table with rollups, or another database
+    "SELECT count() FROM other",
+    "SELECT count() FROM other_db.events",
+    # Not an aggregate over rollup measures
+    "SELECT app FROM events GROUP BY app",
+    "SELECT * FROM events",
+    "SELECT countIf(app = 'web') FROM events",
+    "SELECT count(DISTINCT path) FROM events",
+    "SELECT sum(is_mobile) FROM events",
+    # Columns and granularity not covered by the rollup
+    "SELECT path, count() FROM events GROUP BY path",
+    "SELECT count() FROM events WHERE path = '/'",
+    "SELECT toStartOfSecond(timestamp) AS t, count() FROM events GROUP BY t",
+    "SELECT max(timestamp), count() FROM events",
+    # Time filters not aligned to minutes
+    "SELECT count() FROM events WHERE timestamp >= now() - INTERVAL 1 DAY",
+    "SELECT count() FROM events WHERE timestamp > toStartOfDay(now())",
+    "SELECT count() FROM events WHERE timestamp < '2024-01-01 10:00:30'",
+    "SELECT count() FROM events "
+    "WHERE timestamp >= toStartOfHour(now()) - INTERVAL 30 SECOND",
+    # Unsupported queries
+    "SELECT count() FROM events AS e",
+    "SELECT count() FROM events FINAL",
+    "SELECT count() FROM events JOIN users USING (user_id)",
+    "SELECT count() FROM (SELECT * FROM events)",
+    "SELECT count() FROM events WHERE app IN (SELECT app FROM apps)",
+    "SELECT count() FROM events SETTINGS max_threads = 1",
+    "SELECT app, count() FROM events GROUP BY app WITH TOTALS",
+    "WITH 1 AS x SELECT count() FROM events",
+    # Aliases shadowing rollup or stream columns
+    "SELECT count() AS events FROM events",
+    "SELECT toDate(timestamp) AS app, count() FROM events GROUP BY app",
+])
+def test_rewrite_query_not_covered(query):
+    assert rewrite_query(query, ROLLUPS) is None
+
+
+NOW = datetime(2024, 3, 1, 12, 30, tzinfo=timezone.utc)
+EXPIRING_ROLLUPS = {
+    "events": [ROLLUPS["events"][0].copy(
+        update={"ttl_days": 365, "source_ttl_days": 30}
+    )],
+}
+
+
+@mark.parametrize("where, covered", [
+    ("timestamp >= toStartOfDay(now()) - INTERVAL 7 DAY", True),
+    ("timestamp >= today() - INTERVAL 28 DAY AND app = 'web'", True),
+    ("app = 'web' AND timestamp >= '2024-02-20'", True),
+    # Older than the stream table keeps
+    ("timestamp >= toStartOfDay(now()) - INTERVAL 30 DAY", False),
+    ("timestamp >= toStartOfMonth(now()) - INTERVAL 1 MONTH", False),
+    ("timestamp >= '2024-01-01'", False),
+    # No lower bound of time
+    ("timestamp < toStartOfDay(now())", False),
+    ("app = 'web'", False),
+    ("timestamp >= toStartOfDay(now()) - INTERVAL 7 DAY OR app = 'web'", False),
+])
+def test_rewrite_query_within_retention(where, covered):
+    query = f"SELECT count() FROM events WHERE {where}"
+    result = rewrite_query(query, EXPIRING_ROLLUPS, now=NOW)
+    assert (result is not None) == covered
+
+
+@mark.parametrize("engine_full, ttl_days", [
+    ("MergeTree ORDER BY timestamp SETTINGS index_granularity = 8192", None),
+    (
+        "MergeTree ORDER BY timestamp "
+        "TTL toDateTime(timestamp) + toIntervalDay(7) TO VOLUME 'cold', "
+        "toDateTime(timestamp) + toIntervalDay(90) "
+        "SETTINGS index_granularity = 8192",
+        90,
+    ),
+    ("MergeTree ORDER BY t TTL toDateTime(t) + toIntervalDay(7) TO DISK 's3'", None),
+])
+def test_parse_ttl_days(engine_full, ttl_days):
+    assert parse_ttl_days(engine_full) == ttl_days
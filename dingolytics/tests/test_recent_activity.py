@@ -0,0 +1,105 @@
+import datetime
+
+from dingolytics.auditlog.recent import RecentActivity
+
+TODAY = datetime.date(2024, 1, 10)
+
+
+def event_row(object_id, day, user_id=2, action="execute", object_type="query"):
+    return {
+        "org_id": 1,
+        "user_id": user_id,
+        "action": action,
+        "object_type": object_type,
+        "object_id": object_id,
+        "additional_properties": {},
+        "created_at": datetime.datetime.combine(day, datetime.time(12)),
+    }
+
+
+def test_record_counts_by_org_and_user(redis):
+    recent = RecentActivity(redis)
+    counted = recent.record([
+        event_row(1, TODAY),
+        event_row(2, TODAY),
+        event_row(2, TODAY, user_id=3),
+        event_row(3, TODAY, action="view"),
+        event_row(4, TODAY, object_type="dashboard"),
+        event_row(None, TODAY),
+    ], today=TODAY)
+    assert counted == 3
+    assert recent.get(1, "query") == ["2", "1"]
+    assert recent.get(1, "query", user_id=2) == ["2", "1"]
+    assert recent.get(1, "query", user_id=3) == ["2"]
+    assert recent.get(1, "query", limit=1) == ["2"]
+
+
+def test_record_skips_days_out_of_window(redis):
+    recent = RecentActivity(redis, days=7)
+    counted = recent.record([
+        event_row(1, TODAY - datetime.timedelta(days=7)),
+        event_row(2, TODAY - datetime.timedelta(days=8)),
+    ], today=TODAY)
+    assert counted == 1
+    assert recent.get(1, "query") == ["1"]
+
+
+def test_expire_subtracts_days_out_of_window(redis):
+    recent = RecentActivity(redis, days=7)
+    old_day = TODAY - datetime.timedelta(days=7)
+    recent.record([
+        event_row(1, old_day),
+        event_row(1, old_day),
+        event_row(1, TODAY),
+        event_row(2, old_day),
+    ], today=TODAY)
+    assert recent.get(1, "query") == ["1", "2"]
+
+    # Nothing to expire yet
+    assert recent.expire(today=TODAY) == 0
+
+    next_day = TODAY + datetime.timedelta(days=1)
+    assert recent.expire(today=next_day) == 1
+    assert recent.get(1, "query") == ["1"]
+    assert redis.data["recent:1:query"] == {"1": 1}
+    assert not any(key.endswith(f"{old_day:%Y%m%d}") for key in redis.data)
+    assert recent.expire(today=next_day) == 0
+
+
+def test_clear(redis):
+    redis.data["other"] = {}
+    recent = RecentActivity(redis)
+    recent.record([event_row(1, TODAY)], today=TODAY)
+    recent.clear()
+    assert list(redis.data) == ["other"]
+
+
+def test_rebuild_replaces_feed(redis):
+    recent = RecentActivity(redis, days=7)
+    old_day = TODAY - datetime.timedelta(days=7)
+    recent.record([event_row(1, TODAY), event_row(3, TODAY, user_id=3)], today=TODAY)
+
+    counted = recent.rebuild(
+        lambda: {(1, 2, "query", "2", old_day): 2}, today=TODAY
+    )
+    assert counted == 2
+    assert recent.get(1, "query") == ["2"]
+    assert recent.get(1, "query", user_id=2) == ["2"]
+    assert recent.get(1, "query", user_id=3) == []
+    assert not any(key.startswith("recent-rebuild") for key in redis.data)
+
+    # Days rebuilt expire as recorded ones
+    assert recent.expire(today=TODAY + datetime.timedelta(days=1)) == 1
+    assert recent.get(1, "query") == []
+
+
+def test_rebuild_keeps_events_recorded_meanwhile(redis):
+    recent = RecentActivity(redis)
+
+    def get_counts():
+        recent.record([event_row(1, TODAY)], today=TODAY)
+        return {(1, 2, "query", "2", TODAY): 2}
+
+    recent.rebuild(get_counts, today=TODAY)
+    assert recent.get(1, "query") == ["2", "1"]
+    assert recent.get(1, "query", user_id=2) == ["2", "1"]
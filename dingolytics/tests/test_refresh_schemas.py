@@ -0,0 +1,29 @@
+from types import SimpleNamespace
+
+from dingolytics.tasks.refresh_schemas import get_cluster_key, get_refresh_lanes
+from redash.query_runner import run_concurrently
+
+
+def data_source(id, type="pg", **options):
+    return SimpleNamespace(id=id, type=type, options=options)
+
+
+def test_get_cluster_key():
+    assert get_cluster_key(data_source(1, host="db", port=5432)) == "pg:db:5432"
+    assert get_cluster_key(
+        data_source(2, "clickhouse", url="http://ch:8123")
+    ) == "clickhouse:ch:8123"
+    assert get_cluster_key(data_source(3, "sqlite", dbpath="/tmp/db")) == "sqlite:3"
+
+
+def test_get_refresh_lanes_bounds_lanes_per_cluster():
+    data_sources = [data_source(i, host="db") for i in range(1, 6)] + [
+        data_source(6, host="other"),
+    ]
+    lanes = get_refresh_lanes(data_sources, concurrency=2)
+    assert lanes == [[1, 3, 5], [2, 4], [6]]
+
+
+def test_run_concurrently_keeps_order():
+    assert run_concurrently(lambda x: x * 2, [3, 1, 2], max_workers=3) == [6, 2, 4]
+    assert run_concurrently(lambda x: x, [], max_workers=3) == []
@@ -1,15 +1,17 @@
 import logging
-from string import Template
 from sqlalchemy import event
 from dingolytics.models.streams import Stream
-from dingolytics.ingest import sync_vector_config_to_streams
+from dingolytics.ingest.provisioning import schedule_stream_provisioning
 from dingolytics.presets import default_presets
+from redash.models.base import after_commit, on_commit
 
 logger = logging.getLogger(__name__)
 
 
 @event.listens_for(Stream, "after_insert")
 def after_insert_stream(mapper, connection, target: Stream) -> None:
+    # No remote calls here: tables are created by a background task,
+    # once the transaction is committed.
     if not target.db_table_query:
         data_source = target.data_source
         db_table_preset = target.db_table_preset
@@ -21,17 +23,10 @@ def after_insert_stream(mapper, connection, target: Stream) -> None:
             logger.exception(exc)
             return
     if target.db_table_query:
-        create_table_for_stream(target)
-        sync_vector_config_to_streams()
+        on_commit(target, "stream_provisioning", target.id)
 
 
-def create_table_for_stream(target: Stream) -> None:
-    data_source = target.data_source
-    db_table = target.db_table
-    sql = Template(target.db_table_query).substitute(db_table=db_table)
-    query_runner = data_source.query_runner
-    data, error = query_runner.run_query(sql, None)
-    logger.info(
-        "Created table for stream %s: %s data=%s error=%s",
-        target.id, db_table, data, error
-    )
+@after_commit("stream_provisioning", on_rollback=False)
+def _schedule_provisioning(stream_ids: set[int]) -> None:
+    for stream_id in sorted(stream_ids):
+        schedule_stream_provisioning(stream_id)
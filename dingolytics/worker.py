@@ -8,35 +8,61 @@ from redash.app import create_app
 from redash.settings import get_settings
 
 # Discover all tasks by importing them:
-from .tasks.auditlog_events import record_auditlog_event_task  # noqa: F401
+from .tasks.auditlog_events import (
+    cleanup_auditlog_events_task,  # noqa: F401
+    deliver_auditlog_events_task,  # noqa: F401
+    expire_recent_activity_task,  # noqa: F401
+    flush_auditlog_events_task,  # noqa: F401
+    record_auditlog_event_task,  # noqa: F401
+    schedule_auditlog_flush_task,  # noqa: F401
+)
 from .tasks.check_alerts_for_query import check_alerts_for_query_task  # noqa: F401
 from .tasks.check_connection import check_connection_task  # noqa: F401
 from .tasks.cleanup_results import cleanup_unused_results_task  # noqa: F401
+from .tasks.collect_stream_metrics import (
+    collect_stream_metrics_task,  # noqa: F401
+    schedule_stream_metrics_task,  # noqa: F401
+)
 from .tasks.empty_schedules import empty_schedules_task  # noqa: F401
 from .tasks.failure_reports import send_aggregated_failure_reports_task  # noqa: F401
 from .tasks.get_schema import get_schema_task  # noqa: F401
+from .tasks.provision_stream import provision_stream_task  # noqa: F401
 from .tasks.refresh_queries import refresh_queries_task  # noqa: F401
 from .tasks.refresh_schemas import (
     refresh_all_schemas_task,  # noqa: F401
     refresh_schema_task,  # noqa: F401
+    refresh_schemas_task,  # noqa: F401
 )
+from .tasks.replay_dead_letters import replay_dead_letters_task  # noqa: F401
 from .tasks.run_query import run_query_task  # noqa: F401
 from .tasks.sync_user import sync_user_details_task  # noqa: F401
+from .tasks.sync_vector_config import sync_vector_config_task  # noqa: F401
 
 __all__ = [
     # Discovered tasks
     "check_alerts_for_query_task",
+    "cleanup_auditlog_events_task",
     "check_connection_task",
     "cleanup_unused_results_task",
+    "collect_stream_metrics_task",
+    "deliver_auditlog_events_task",
     "empty_schedules_task",
+    "expire_recent_activity_task",
+    "flush_auditlog_events_task",
     "get_schema_task",
+    "provision_stream_task",
     "record_auditlog_event_task",
     "refresh_queries_task",
     "refresh_all_schemas_task",
     "refresh_schema_task",
+    "refresh_schemas_task",
+    "replay_dead_letters_task",
     "run_query_task",
+    "schedule_auditlog_flush_task",
+    "schedule_stream_metrics_task",
     "send_aggregated_failure_reports_task",
     "sync_user_details_task",
+    "sync_vector_config_task",
 
     # Main entry point
     "main",
@@ -16,6 +16,7 @@ help() {
   echo "run_periodic -- start Huey periodic jobs runner with optional code reloading"
   echo "run_worker -- start a Huey workers with optional code reloading"
   echo "run_server -- start Flask / gunicorn server"
+  echo "run_ingest -- start native ingest gateway, alternative to Vector"
   echo ""
   echo "For live code reloading set ENVIRONMENT=development"
   echo ""
@@ -64,6 +65,13 @@ run_server() {
   fi
 }
 
+run_ingest() {
+  echo "Starting ingest gateway (${ENVIRONMENT}) ..."
+  exec gunicorn -b 0.0.0.0:8180 --name ingest \
+    -w${INGEST_WORKERS:-1} -k gthread --threads ${INGEST_THREADS:-8} \
+    "dingolytics.ingest.gateway:create_app()"
+}
+
 case "$1" in
   help)
     shift
@@ -88,6 +96,10 @@ case "$1" in
     shift
     run_periodic
     ;;
+  run_ingest)
+    shift
+    run_ingest
+    ;;
   *)
     exec "$@"
     ;;
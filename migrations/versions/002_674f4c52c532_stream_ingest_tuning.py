@@ -0,0 +1,25 @@
+"""
+Revision ID: 002_674f4c52c532
+Revises: 001_74f95d883b60
+Create Date: 2026-10-19 10:12:41.503215
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = '002_674f4c52c532'
+down_revision = '001_74f95d883b60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('streams', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('ingest_volume', sa.String(length=32), server_default='medium', nullable=False))
+        batch_op.add_column(sa.Column('ingest_options', postgresql.JSONB(astext_type=sa.Text()), server_default='{}', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('streams', schema=None) as batch_op:
+        batch_op.drop_column('ingest_options')
+        batch_op.drop_column('ingest_volume')
@@ -0,0 +1,23 @@
+"""
+Revision ID: 003_5e1c7a9b2d40
+Revises: 002_674f4c52c532
+Create Date: 2026-10-19 14:02:17.318044
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = '003_5e1c7a9b2d40'
+down_revision = '002_674f4c52c532'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('streams', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('db_table_options', postgresql.JSONB(astext_type=sa.Text()), server_default='{}', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('streams', schema=None) as batch_op:
+        batch_op.drop_column('db_table_options')
@@ -0,0 +1,26 @@
+"""
+Revision ID: 004_8a2f6d3c1b97
+Revises: 003_5e1c7a9b2d40
+Create Date: 2026-10-19 15:31:08.614229
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '004_8a2f6d3c1b97'
+down_revision = '003_5e1c7a9b2d40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('streams', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('provisioning_state', sa.String(length=32), server_default='ready', nullable=False))
+        batch_op.add_column(sa.Column('provisioning_error', sa.Text(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_streams_provisioning_state'), ['provisioning_state'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('streams', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_streams_provisioning_state'))
+        batch_op.drop_column('provisioning_error')
+        batch_op.drop_column('provisioning_state')
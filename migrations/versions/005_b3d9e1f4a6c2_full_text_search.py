@@ -0,0 +1,56 @@
+"""
+Revision ID: 005_b3d9e1f4a6c2
+Revises: 004_8a2f6d3c1b97
+Create Date: 2026-10-19 18:12:44.530417
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = '005_b3d9e1f4a6c2'
+down_revision = '004_8a2f6d3c1b97'
+branch_labels = None
+depends_on = None
+
+QUERIES_SEARCH_VECTOR = (
+    "setweight(to_tsvector('pg_catalog.simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('pg_catalog.simple', id::text), 'B') || "
+    "setweight(to_tsvector('pg_catalog.simple', coalesce(description, '')), 'C') || "
+    "setweight(to_tsvector('pg_catalog.simple', left(coalesce(query, ''), 100000)), 'D')"
+)
+DASHBOARDS_SEARCH_VECTOR = (
+    "setweight(to_tsvector('pg_catalog.simple', coalesce(name, '')), 'A')"
+)
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # Left over by installs which had the search vector maintained by a trigger
+    op.execute("DROP TRIGGER IF EXISTS queries_search_vector_trigger ON queries")
+    op.execute("DROP FUNCTION IF EXISTS queries_search_vector_update()")
+
+    with op.batch_alter_table('queries', schema=None) as batch_op:
+        batch_op.drop_column('search_vector')
+        batch_op.add_column(sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed(QUERIES_SEARCH_VECTOR, persisted=True), nullable=True))
+        batch_op.create_index('ix_queries_search_vector', ['search_vector'], unique=False, postgresql_using='gin')
+        batch_op.create_index('ix_queries_name_trgm', ['name'], unique=False, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+        batch_op.create_index('ix_queries_description_trgm', ['description'], unique=False, postgresql_using='gin', postgresql_ops={'description': 'gin_trgm_ops'})
+
+    with op.batch_alter_table('dashboards', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed(DASHBOARDS_SEARCH_VECTOR, persisted=True), nullable=True))
+        batch_op.create_index('ix_dashboards_search_vector', ['search_vector'], unique=False, postgresql_using='gin')
+        batch_op.create_index('ix_dashboards_name_trgm', ['name'], unique=False, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    with op.batch_alter_table('dashboards', schema=None) as batch_op:
+        batch_op.drop_index('ix_dashboards_name_trgm')
+        batch_op.drop_index('ix_dashboards_search_vector')
+        batch_op.drop_column('search_vector')
+
+    with op.batch_alter_table('queries', schema=None) as batch_op:
+        batch_op.drop_index('ix_queries_description_trgm')
+        batch_op.drop_index('ix_queries_name_trgm')
+        batch_op.drop_index('ix_queries_search_vector')
+        batch_op.drop_column('search_vector')
+        batch_op.add_column(sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
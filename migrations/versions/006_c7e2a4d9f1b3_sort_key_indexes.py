@@ -0,0 +1,40 @@
+"""
+Revision ID: 006_c7e2a4d9f1b3
+Revises: 005_b3d9e1f4a6c2
+Create Date: 2026-10-19 21:05:17.284903
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '006_c7e2a4d9f1b3'
+down_revision = '005_b3d9e1f4a6c2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('queries', schema=None) as batch_op:
+        batch_op.create_index('ix_queries_created_at_id', ['created_at', 'id'], unique=False)
+        batch_op.create_index('ix_queries_lower_name_id', [sa.text('lower(name)'), 'id'], unique=False)
+
+    with op.batch_alter_table('dashboards', schema=None) as batch_op:
+        batch_op.create_index('ix_dashboards_created_at_id', ['created_at', 'id'], unique=False)
+        batch_op.create_index('ix_dashboards_lower_name_id', [sa.text('lower(name)'), 'id'], unique=False)
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.create_index('ix_users_created_at_id', ['created_at', 'id'], unique=False)
+        batch_op.create_index('ix_users_name_id', ['name', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index('ix_users_name_id')
+        batch_op.drop_index('ix_users_created_at_id')
+
+    with op.batch_alter_table('dashboards', schema=None) as batch_op:
+        batch_op.drop_index('ix_dashboards_lower_name_id')
+        batch_op.drop_index('ix_dashboards_created_at_id')
+
+    with op.batch_alter_table('queries', schema=None) as batch_op:
+        batch_op.drop_index('ix_queries_lower_name_id')
+        batch_op.drop_index('ix_queries_created_at_id')
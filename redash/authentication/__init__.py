@@ -7,9 +7,16 @@ from urllib.parse import urlsplit, urlunsplit
 
 from flask import jsonify, redirect, request, url_for, session
 from flask_login import LoginManager, login_user, logout_user, user_logged_in
-from dingolytics.tasks.auditlog_events import record_auditlog_event_task
-from redash import models, settings
+from dingolytics.auditlog import record_event as record_auditlog_event
+from redash import models, settings, statsd_client
 from redash.authentication import jwt_auth
+from redash.authentication.api_key_cache import (
+    PRINCIPAL_API_KEY,
+    PRINCIPAL_NONE,
+    PRINCIPAL_QUERY,
+    PRINCIPAL_USER,
+    api_key_cache,
+)
 from redash.authentication.org_resolving import current_org
 from sqlalchemy.orm.exc import NoResultFound
 from werkzeug.exceptions import Unauthorized
@@ -111,33 +118,109 @@ def hmac_load_user_from_request(request):
     return None
 
 
-def get_user_from_api_key(api_key, query_id):
-    if not api_key:
-        return None
-
-    user = None
-
+def _resolve_api_key(api_key, query_id, org):
+    """Look up the principal of the API key, return it with the user."""
     # TODO: once we switch all api key storage into the ApiKey model, this code will be much simplified
-    org = current_org._get_current_object()
     try:
         user = models.User.get_by_api_key_and_org(api_key, org)
         if user.is_disabled:
-            user = None
+            return None, {"type": PRINCIPAL_NONE}
+        return user, {"type": PRINCIPAL_USER, "id": user.id}
     except models.NoResultFound:
-        try:
-            api_key = models.ApiKey.get_by_api_key(api_key)
-            user = models.ApiUser(api_key, api_key.org, [])
-        except models.NoResultFound:
-            if query_id:
-                query = models.Query.get_by_id_and_org(query_id, org)
-                if query and query.api_key == api_key:
-                    user = models.ApiUser(
-                        api_key,
-                        query.org,
-                        list(query.groups.keys()),
-                        name="ApiKey: Query {}".format(query.id),
-                    )
+        pass
+
+    try:
+        api_key_object = models.ApiKey.get_by_api_key(api_key)
+        user = models.ApiUser(api_key_object, api_key_object.org, [])
+        return user, {"type": PRINCIPAL_API_KEY, "id": api_key_object.id}
+    except models.NoResultFound:
+        pass
+
+    if query_id:
+        query = models.Query.get_by_id_and_org(query_id, org)
+        if query and query.api_key == api_key:
+            user = models.ApiUser(
+                api_key,
+                query.org,
+                list(query.groups.keys()),
+                name="ApiKey: Query {}".format(query.id),
+            )
+            return user, {"type": PRINCIPAL_QUERY, "id": query.id}
+
+    return None, {"type": PRINCIPAL_NONE}
+
+
+def _load_principal(principal, api_key, org):
+    """
+    Load the user of a cached principal.
 
+    Returns `False` if the principal is stale, e.g. the key of a user was
+    changed by another process.
+    """
+    if principal["type"] == PRINCIPAL_NONE:
+        return None
+    if principal["type"] == PRINCIPAL_USER:
+        user = models.User.query.get(principal["id"])
+        if (
+            user is None
+            or user.api_key != api_key
+            or user.org_id != org.id
+            or user.is_disabled
+        ):
+            return False
+        return user
+    if principal["type"] == PRINCIPAL_API_KEY:
+        api_key_object = models.ApiKey.query.get(principal["id"])
+        if (
+            api_key_object is None
+            or api_key_object.api_key != api_key
+            or not api_key_object.active
+        ):
+            return False
+        return models.ApiUser(api_key_object, api_key_object.org, [])
+    if principal["type"] == PRINCIPAL_QUERY:
+        query = models.Query.query.get(principal["id"])
+        if query is None or query.api_key != api_key or query.org_id != org.id:
+            return False
+        data_source_id = query.data_source_id
+        groups = {}
+        if data_source_id is not None:
+            groups = models.DataSource.get_groups_by_id([data_source_id])[
+                data_source_id
+            ]
+        return models.ApiUser(
+            api_key,
+            org,
+            list(groups.keys()),
+            name="ApiKey: Query {}".format(principal["id"]),
+        )
+    return False
+
+
+def get_user_from_api_key(api_key, query_id):
+    if not api_key:
+        return None
+
+    started_at = time.time()
+    org = current_org._get_current_object()
+    user = False
+    principal = api_key_cache.get(api_key, org.id, query_id)
+    if principal is not None:
+        user = _load_principal(principal, api_key, org)
+    if user is False:
+        if principal is not None:
+            api_key_cache.invalidate(api_key)
+        user, principal = _resolve_api_key(api_key, query_id, org)
+        api_key_cache.set(api_key, org.id, query_id, principal)
+        result = "miss"
+    else:
+        result = "hit"
+
+    statsd_client.incr("auth.api_key.cache_{}".format(result))
+    statsd_client.timing(
+        "auth.api_key.{}".format(principal["type"]),
+        (time.time() - started_at) * 1000,
+    )
     return user
 
 
@@ -202,7 +285,7 @@ def jwt_token_load_user_from_request(request):
 
 
 def log_user_logged_in(app, user):
-    record_auditlog_event_task({
+    record_auditlog_event({
         "org_id": user.org_id,
         "user_id": user.id,
         "action": "login",
@@ -0,0 +1,180 @@
+"""
+Cache of principals authenticated by API keys.
+
+An API key resolves to a user, an `ApiKey` object or a query, and each
+resolution costs up to three lookups. Principals are cached by the key,
+the organization and the query in a small in-process LRU, in front of a
+Redis hash per key, so that keys can be invalidated with a single `DEL`.
+Failed lookups are cached too, for a shorter time.
+
+Only identifiers are cached: users, `ApiKey` objects and queries are
+still loaded by primary key and checked against the key, and query
+groups are read through the data source groups cache. Entries are
+invalidated once transactions regenerating or deactivating keys,
+disabling users or moving queries to other data sources commit, the
+in-process entries of other processes expire after `AUTH_CACHE_LOCAL_TTL`
+seconds.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import inspect
+from sqlalchemy.event import listens_for
+
+from redash import models, redis_connection, settings
+from redash.models.base import after_commit, on_commit
+from redash.utils import json_dumps, json_loads
+
+API_KEY_CACHE_KEY = "auth:api_key:{}"
+
+PRINCIPAL_NONE = "none"
+PRINCIPAL_USER = "user"
+PRINCIPAL_API_KEY = "api_key"
+PRINCIPAL_QUERY = "query"
+
+
+def _digest(api_key):
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+
+class ApiKeyCache:
+    """
+    Two-level cache of API key principals.
+
+    Attributes:
+        redis: Redis connection, with responses decoded.
+        local_size: Maximum number of in-process entries.
+    """
+
+    def __init__(self, redis, local_size=1024):
+        self.redis = redis
+        self.local_size = local_size
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, api_key, org_id, query_id=None):
+        """Get the cached principal, or `None` if not cached."""
+        if settings.S.AUTH_CACHE_TTL <= 0:
+            return None
+        digest, field = _digest(api_key), f"{org_id}:{query_id or ''}"
+        now = time.time()
+        with self._lock:
+            entry = self._local.get((digest, field))
+            if entry is not None:
+                if entry["expires_at"] > now:
+                    self._local.move_to_end((digest, field))
+                    return entry["principal"]
+                del self._local[(digest, field)]
+
+        value = self.redis.hget(API_KEY_CACHE_KEY.format(digest), field)
+        if value is None:
+            return None
+        entry = json_loads(value)
+        if entry["expires_at"] <= now:
+            return None
+        self._set_local(digest, field, entry["principal"], now)
+        return entry["principal"]
+
+    def set(self, api_key, org_id, query_id, principal):
+        """Cache the principal, a dict with `type` and its identifiers."""
+        ttl = settings.S.AUTH_CACHE_TTL
+        if ttl <= 0:
+            return
+        if principal["type"] == PRINCIPAL_NONE:
+            ttl = min(ttl, settings.S.AUTH_CACHE_NEGATIVE_TTL)
+        digest, field = _digest(api_key), f"{org_id}:{query_id or ''}"
+        now = time.time()
+        key = API_KEY_CACHE_KEY.format(digest)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(
+            key, field,
+            json_dumps({"principal": principal, "expires_at": now + ttl}),
+        )
+        pipe.expire(key, settings.S.AUTH_CACHE_TTL)
+        pipe.execute()
+        self._set_local(digest, field, principal, now)
+
+    def invalidate(self, *api_keys):
+        digests = {_digest(api_key) for api_key in api_keys if api_key}
+        if not digests:
+            return
+        with self._lock:
+            for key in [k for k in self._local if k[0] in digests]:
+                del self._local[key]
+        self.redis.delete(*[API_KEY_CACHE_KEY.format(d) for d in digests])
+
+    def clear_local(self):
+        with self._lock:
+            self._local.clear()
+
+    def _set_local(self, digest, field, principal, now):
+        ttl = settings.S.AUTH_CACHE_LOCAL_TTL
+        if ttl <= 0:
+            return
+        if principal["type"] == PRINCIPAL_NONE:
+            ttl = min(ttl, settings.S.AUTH_CACHE_NEGATIVE_TTL)
+        with self._lock:
+            self._local[(digest, field)] = {
+                "principal": principal,
+                "expires_at": now + ttl,
+            }
+            self._local.move_to_end((digest, field))
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+
+
+api_key_cache = ApiKeyCache(redis_connection)
+
+
+def _get_changed_keys(target, *attributes):
+    """Get current and previous API keys if any of the attributes changed."""
+    state = inspect(target)
+    history = state.attrs.api_key.history
+    changed = any(
+        state.attrs[attribute].history.has_changes() for attribute in attributes
+    )
+    if not changed and not history.deleted:
+        return []
+    return [target.api_key, *history.deleted]
+
+
+def _invalidate_on_commit(target, api_keys):
+    api_keys = [api_key for api_key in api_keys if api_key]
+    if api_keys:
+        on_commit(target, "api_keys", *api_keys)
+
+
+@after_commit("api_keys")
+def _invalidate_api_keys(api_keys):
+    api_key_cache.invalidate(*api_keys)
+
+
+@listens_for(models.User, "after_update")
+def invalidate_user_api_key(mapper, connection, target):
+    _invalidate_on_commit(
+        target, _get_changed_keys(target, "api_key", "disabled_at", "org_id")
+    )
+
+
+@listens_for(models.ApiKey, "after_update")
+def invalidate_api_key(mapper, connection, target):
+    _invalidate_on_commit(
+        target, _get_changed_keys(target, "api_key", "active", "org_id")
+    )
+
+
+@listens_for(models.Query, "after_update")
+def invalidate_query_api_key(mapper, connection, target):
+    _invalidate_on_commit(
+        target,
+        _get_changed_keys(target, "api_key", "data_source_id", "org_id"),
+    )
+
+
+@listens_for(models.User, "after_delete")
+@listens_for(models.ApiKey, "after_delete")
+@listens_for(models.Query, "after_delete")
+def invalidate_deleted_api_key(mapper, connection, target):
+    _invalidate_on_commit(target, [target.api_key])
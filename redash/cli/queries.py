@@ -1,4 +1,4 @@
-from click import argument
+from click import argument, option
 from flask.cli import AppGroup
 from sqlalchemy.orm.exc import NoResultFound
 
@@ -62,3 +62,160 @@ def remove_tag(query_id, tag):
     models.db.session.commit()
 
     print("Tag removed.")
+
+
+@manager.command()
+def backfill_recent():
+    """Rebuild the recent activity feed from stored events."""
+    from dingolytics.auditlog import backfill_recent_activity
+
+    counted = backfill_recent_activity()
+    print("Counted {} events.".format(counted))
+
+
+BENCHMARK_WORDS = [
+    "revenue", "users", "orders", "sessions", "churn", "funnel", "retention",
+    "events", "売上", "ユーザー",
+]
+
+
+@manager.command()
+@option(
+    "--org", "organization", default="default",
+    help="The organization to generate queries for (leave blank for 'default').",
+)
+@option("--count", default=100000, help="Number of queries to generate.")
+@option("--repeat", default=5, help="Number of runs of every search.")
+@option(
+    "--term", "terms", multiple=True,
+    help="Search term, may be repeated. Defaults to a few typical ones.",
+)
+def benchmark_search(organization, count, repeat, terms):
+    """
+    Time searches of queries among generated ones.
+
+    Queries are generated for the first data source of the organization,
+    in a transaction which is rolled back at the end.
+    """
+    import statistics
+    import time
+
+    from redash import models
+
+    org = models.Organization.get_by_slug(organization)
+    data_source = models.DataSource.query.filter(models.DataSource.org == org).first()
+    user = models.User.query.filter(models.User.org == org).first()
+    if data_source is None or user is None:
+        print("The organization needs a data source and a user.")
+        exit(1)
+    group_ids = list(data_source.groups)
+
+    words = "ARRAY[{}]".format(", ".join("'{}'".format(w) for w in BENCHMARK_WORDS))
+    word = "({})[1 + (i / {{}}) % {}]".format(words, len(BENCHMARK_WORDS))
+    models.db.session.execute(
+        models.db.text(
+            "INSERT INTO queries (org_id, data_source_id, user_id, name, "
+            "description, query, query_hash, api_key, version, is_archived, "
+            "is_draft, schedule_failures, created_at, updated_at) "
+            "SELECT :org_id, :data_source_id, :user_id, "
+            f"{word.format(1)} || ' ' || {word.format(7)} || ' ' || i, "
+            f"'Report on ' || {word.format(3)} || ' ' || md5(i::text), "
+            f"'SELECT * FROM ' || {word.format(5)} || ' WHERE id = ' || i, "
+            "md5(i::text), md5(i::text), 1, false, false, 0, now(), now() "
+            "FROM generate_series(1, :count) AS i"
+        ),
+        {
+            "org_id": org.id,
+            "data_source_id": data_source.id,
+            "user_id": user.id,
+            "count": count,
+        },
+    )
+    models.db.session.execute(models.db.text("ANALYZE queries"))
+    print("Generated {} queries.".format(count))
+
+    try:
+        for term in terms or ["revenue", "churn -users", "rev", "ユーザー", "42"]:
+            for multi_byte_search in (False, True):
+                timings = []
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    found = models.Query.search(
+                        term, group_ids, user_id=user.id, limit=20,
+                        multi_byte_search=multi_byte_search,
+                    ).all()
+                    timings.append((time.perf_counter() - started) * 1000)
+                print(
+                    "{!r} (multi-byte: {}): {} found, median {:.1f} ms".format(
+                        term, multi_byte_search, len(found),
+                        statistics.median(timings),
+                    )
+                )
+    finally:
+        models.db.session.rollback()
+
+
+BENCHMARK_TEMPLATES = {
+    "static": "SELECT count(*) FROM events WHERE created_at > now() - interval '1 day'",
+    "parameters": (
+        "SELECT date_trunc('{{ period }}', created_at) AS day, count(*) "
+        "FROM events WHERE created_at BETWEEN '{{ range.start }}' "
+        "AND '{{ range.end }}' AND org_id IN ({{ org_ids }}) GROUP BY 1"
+    ),
+    "sections": (
+        "SELECT * FROM events WHERE true "
+        "{{#app}}AND app = '{{ app }}'{{/app}} "
+        "{{#event}}AND event = '{{ event }}'{{/event}} "
+    ) * 20 + "LIMIT {{ limit }}",
+}
+BENCHMARK_CONTEXT = {
+    "period": "day",
+    "range": {"start": "2024-01-01", "end": "2024-02-01"},
+    "org_ids": "1, 2, 3",
+    "app": "web",
+    "event": "signup",
+    "limit": 100,
+}
+
+
+@manager.command()
+@option("--count", default=10000, help="Number of renders of every template.")
+def benchmark_templates(count):
+    """
+    Time rendering query templates, as executions of endpoints do.
+
+    Every render also gets the template parameters. Templates are either
+    parsed on every call, as before templates were compiled, or compiled
+    once and cached.
+    """
+    import time
+
+    import pystache
+
+    from redash.models.parameterized_query import (
+        _collect_key_names,
+        compile_template,
+    )
+    from redash.utils import mustache_render
+
+    def parse_every_call(template):
+        parameters = _collect_key_names(pystache.parse(template))
+        return parameters, mustache_render(template, BENCHMARK_CONTEXT)
+
+    def compiled(template):
+        compiled = compile_template(template)
+        return compiled.parameters, compiled.render(BENCHMARK_CONTEXT)
+
+    for name, template in BENCHMARK_TEMPLATES.items():
+        timings = []
+        for render in (parse_every_call, compiled):
+            compile_template.cache_clear()
+            started = time.perf_counter()
+            for _ in range(count):
+                render(template)
+            timings.append((time.perf_counter() - started) * 1e6 / count)
+        print(
+            "{}: parsed every call {:.1f} us, compiled {:.1f} us ({:.1f}x)".format(
+                name, timings[0], timings[1], timings[0] / timings[1]
+            )
+        )
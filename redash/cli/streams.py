@@ -0,0 +1,137 @@
+import json
+from sys import exit
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy.orm.exc import NoResultFound
+
+manager = AppGroup(help="Streams management commands.")
+
+
+def get_stream(stream_id):
+    from redash import models
+
+    try:
+        return models.Stream.get_by_id(stream_id)
+    except NoResultFound:
+        print("Stream not found.")
+        exit(1)
+
+
+@manager.command()
+@click.argument("stream_id", type=int)
+def dlq_stats(stream_id):
+    """Count rejected events of a stream by source and reason."""
+    from dingolytics.ingest import get_stream_dead_letter_stats
+
+    stats = get_stream_dead_letter_stats(get_stream(stream_id))
+    print(json.dumps(stats, indent=2, default=str))
+
+
+@manager.command()
+@click.argument("stream_id", type=int)
+@click.option(
+    "--batch-size", default=1000, show_default=True,
+    help="Number of dead letters to read and insert at once.",
+)
+@click.option(
+    "--max-rows", type=int, default=None,
+    help="Stop after that many dead letters (default: all).",
+)
+@click.option(
+    "--rows-per-second", type=float, default=None,
+    help="Limit the replay throughput (default: no limit).",
+)
+def replay_dlq(stream_id, batch_size, max_rows, rows_per_second):
+    """
+    Replay dead letters of a stream into the stream table, e.g. after
+    fixing the table schema. Rows rejected again are kept.
+    """
+    from dingolytics.ingest import replay_stream_dead_letters
+
+    result = replay_stream_dead_letters(
+        get_stream(stream_id),
+        batch_size=batch_size,
+        max_rows=max_rows,
+        rows_per_second=rows_per_second,
+    )
+    print(
+        "Replayed {replayed} rows, {rejected} rejected again "
+        "in {batches} batches.".format(**result)
+    )
+
+
+@manager.command()
+@click.option(
+    "--count", default=1000, show_default=True,
+    help="Number of streams to generate.",
+)
+@click.option(
+    "--repeat", default=5, show_default=True,
+    help="Number of runs of the config generation.",
+)
+def benchmark_vector_config(count, repeat):
+    """
+    Time generating the Vector config of generated streams.
+
+    Streams of a single ClickHouse data source are generated without
+    being saved. The config is written to a temporary directory, and
+    validated when Vector is installed.
+    """
+    import shutil
+    import statistics
+    import subprocess
+    import tempfile
+    import time
+
+    from dingolytics.ingest.vector import (
+        VECTOR_HTTP_LOOKUP,
+        VECTOR_HTTP_ROUTER,
+        VectorConfig,
+        update_vector_config,
+    )
+    from redash import models
+
+    data_source = models.DataSource(
+        id=1, name="Benchmark", type="clickhouse",
+        options={"url": "http://localhost:8123", "dbname": "default"},
+    )
+    streams = [
+        models.Stream(
+            id=i, name=f"Stream {i}", data_source=data_source,
+            db_table=f"stream_{i}", db_table_preset="app_events",
+            ingest_key=f"key{i:08d}", ingest_volume="medium",
+            ingest_options={}, db_table_options={},
+        )
+        for i in range(1, count + 1)
+    ]
+
+    with tempfile.TemporaryDirectory() as config_dir:
+        timings = []
+        for _ in range(repeat):
+            vector_config = VectorConfig(f"{config_dir}/vector.yaml")
+            started = time.perf_counter()
+            update_vector_config(streams, clean=True, vector_config=vector_config)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        config = vector_config.config
+        print(
+            "{} streams: median {:.1f} ms, {} transforms, {} sinks, "
+            "{} route conditions, {} KiB lookup".format(
+                count, statistics.median(timings), len(config["transforms"]),
+                len(config["sinks"]),
+                len(config["transforms"][VECTOR_HTTP_ROUTER]["route"]),
+                len(config["transforms"][VECTOR_HTTP_LOOKUP]["source"]) // 1024,
+            )
+        )
+
+        if shutil.which("vector") is None:
+            print("Vector is not installed, the config isn't validated.")
+            return
+        result = subprocess.run(
+            ["vector", "validate", "--no-environment", str(vector_config.config_path)],
+            capture_output=True, text=True,
+        )
+        print(result.stdout + result.stderr)
+        if result.returncode:
+            exit(result.returncode)
@@ -1,11 +1,12 @@
 from flask import request
 from flask_login import login_required, current_user
 
+from dingolytics.auditlog import get_usage_stats
 from redash import models, redis_connection
 from redash.authentication import current_org
 from redash.handlers import routes
 from redash.handlers.base import json_response, record_event
-from redash.permissions import require_super_admin
+from redash.permissions import require_admin, require_super_admin
 from redash.serializers import QuerySerializer
 from redash.utils import json_loads
 from redash.monitor import rq_status
@@ -52,3 +53,14 @@ def queries_rq_status():
     )
 
     return json_response(rq_status())
+
+
+@routes.route("/api/admin/usage", methods=["GET"])
+@require_admin
+@login_required
+def usage_stats():
+    days = min(max(request.args.get("days", 30, type=int), 1), 365)
+    return json_response({
+        "days": days,
+        "usage": get_usage_stats(current_org.id, days=days),
+    })
@@ -6,8 +6,12 @@ from dingolytics.api import (
     EndpointDetailsResource,
     EndpointListResource,
     EndpointPublicResultsResource,
+    StreamDeadLettersReplayResource,
+    StreamDeadLettersResource,
     StreamResource,
     StreamListResource,
+    StreamMetricsResource,
+    StreamProvisionResource,
 )
 from redash.handlers.alerts import (
     AlertListResource,
@@ -26,6 +30,7 @@ from redash.handlers.dashboards import (
     DashboardFavoriteListResource,
     DashboardListResource,
     DashboardResource,
+    DashboardResultsResource,
     DashboardShareResource,
     DashboardTagsResource,
     PublicDashboardResource,
@@ -155,6 +160,11 @@ api.add_org_resource(
     "/api/dashboards/<dashboard_id>",
     endpoint="dashboard"
 )
+api.add_org_resource(
+    DashboardResultsResource,
+    "/api/dashboards/<dashboard_id>/results",
+    endpoint="dashboard_results",
+)
 api.add_org_resource(
     PublicDashboardResource,
     "/api/dashboards/public/<token>",
@@ -216,6 +226,22 @@ api.add_org_resource(
     StreamResource,
     "/api/streams/<stream_id>",
 )
+api.add_org_resource(
+    StreamProvisionResource,
+    "/api/streams/<stream_id>/provision",
+)
+api.add_org_resource(
+    StreamMetricsResource,
+    "/api/streams/<stream_id>/metrics",
+)
+api.add_org_resource(
+    StreamDeadLettersResource,
+    "/api/streams/<stream_id>/dlq",
+)
+api.add_org_resource(
+    StreamDeadLettersReplayResource,
+    "/api/streams/<stream_id>/dlq/replay",
+)
 
 api.add_org_resource(
     GroupListResource,
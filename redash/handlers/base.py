@@ -1,20 +1,30 @@
+import base64
+import binascii
+import datetime
+import decimal
+import hashlib
+import json
 import time
 
 from inspect import isclass
+from typing import Any, NamedTuple, Optional
 from flask import Blueprint, current_app, request
 
 from flask_login import current_user, login_required
 from flask_restful import Resource, abort
 from flask_sqlalchemy.query import Query
-from dingolytics.tasks.auditlog_events import record_auditlog_event_task
-from redash import settings
+from dingolytics.auditlog import record_event as record_auditlog_event
+from redash import redis_connection, settings
 from redash.authentication import current_org
 from redash.models import db
 from redash.utils import json_dumps
+from redis.exceptions import RedisError
 from sqlalchemy.orm.exc import NoResultFound
-from sqlalchemy import cast
+from sqlalchemy import Column, and_, cast, false, or_
 from sqlalchemy.dialects import postgresql
-from sqlalchemy_utils.functions import sort_query
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, ColumnElement, Executable
+from sqlalchemy.sql.functions import Function
 
 routes = Blueprint(
     "redash", __name__, template_folder=settings.fix_assets_path("templates")
@@ -61,7 +71,7 @@ def record_event(org, user, options):
     if "timestamp" not in options:
         options["timestamp"] = int(time.time())
 
-    record_auditlog_event_task(options)
+    record_auditlog_event(options)
 
 
 def require_fields(req, fields):
@@ -80,27 +90,194 @@ def get_object_or_404(fn, *args, **kwargs):
     return rv
 
 
-def paginate(query_set: Query, page, page_size, serializer, **kwargs):
-    count = query_set.count()
+class SortKey(NamedTuple):
+    expression: ColumnElement
+    descending: bool
+    nullable: bool = True
 
+    def order_by(self):
+        order = self.expression.desc() if self.descending else self.expression.asc()
+        return order.nullslast() if self.nullable else order
+
+    def after(self, value):
+        """
+        Filter values sorted after the given one, nulls are sorted last,
+        so nothing is sorted after a null.
+        """
+        if value is None:
+            return None
+        if self.descending:
+            after = self.expression < value
+        else:
+            after = self.expression > value
+        if self.nullable:
+            after = or_(after, self.expression.is_(None))
+        return after
+
+    def equals(self, value):
+        if value is None:
+            return self.expression.is_(None)
+        return self.expression == value
+
+
+class Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element, compiler, **kwargs):
+    return "EXPLAIN (FORMAT JSON) {}".format(
+        compiler.process(element.statement, **kwargs)
+    )
+
+
+def _encode_cursor_value(value):
+    # Unlike `json_dumps`, keep microseconds, they matter for comparisons
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    raise TypeError(type(value))
+
+
+def encode_cursor(values) -> str:
+    data = json.dumps(list(values), default=_encode_cursor_value)
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(data)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        abort(400, message="Invalid cursor.")
+    return values
+
+
+def keyset_filter(sort_keys: list[SortKey], values: list):
+    """Filter results sorted after the ones with the given sort key values."""
+    clauses = []
+    for i, (sort_key, value) in enumerate(zip(sort_keys, values)):
+        after = sort_key.after(value)
+        if after is not None:
+            previous = [key.equals(v) for key, v in zip(sort_keys[:i], values[:i])]
+            clauses.append(and_(*previous, after))
+    return or_(false(), *clauses)
+
+
+def estimate_count(query_set: Query) -> int:
+    """Estimate number of results from the query plan."""
+    plan = db.session.execute(Explain(query_set.order_by(None).statement)).scalar()
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def count_results(query_set: Query) -> tuple[int, bool]:
+    """
+    Count results, return the count and whether it is approximate.
+
+    Counting stops past `PAGINATION_EXACT_COUNT_LIMIT` results, then the
+    planner's estimate is returned instead, and cached for
+    `PAGINATION_COUNT_CACHE_TTL` seconds so that it doesn't change, nor
+    is counted again, while paging.
+    """
+    limit = settings.S.PAGINATION_EXACT_COUNT_LIMIT
+    if limit <= 0:
+        return query_set.order_by(None).count(), False
+
+    statement = query_set.order_by(None).statement
+    compiled = statement.compile(dialect=db.engine.dialect)
+    key = "pagination:count:{}".format(
+        hashlib.sha1(
+            json_dumps([str(compiled), compiled.params], sort_keys=True).encode()
+        ).hexdigest()
+    )
+    try:
+        cached = redis_connection.get(key)
+    except RedisError:
+        cached = None
+    if cached is not None:
+        return int(cached), True
+
+    count = query_set.order_by(None).limit(limit + 1).count()
+    if count <= limit:
+        return count, False
+
+    estimate = max(estimate_count(query_set), count)
+    try:
+        redis_connection.set(key, estimate, ex=settings.S.PAGINATION_COUNT_CACHE_TTL)
+    except RedisError:
+        pass
+    return estimate, True
+
+
+def paginate(
+    query_set: Query, page, page_size, serializer,
+    sort_keys: Optional[list[SortKey]] = None, **kwargs: Any,
+):
+    """
+    Get a page of results.
+
+    Pages are selected by number, or by the `cursor` request argument,
+    which is returned as `next_cursor` with every page of results sorted
+    by `order_results`. Cursors select the results sorted after the last
+    result of the previous page, which is cheap however deep the page.
+    """
     if page < 1:
         abort(400, message="Page must be positive integer.")
 
-    if (page - 1) * page_size + 1 > count > 0:
-        abort(400, message="Page is out of range.")
-
     if page_size > 250 or page_size < 1:
         abort(400, message="Page size is out of range (1-250).")
 
-    results = query_set.paginate(page=page, per_page=page_size)
+    count, approximate = count_results(query_set)
+
+    cursor = request.args.get("cursor")
+    if cursor:
+        if not sort_keys:
+            abort(400, message="Results can't be paged with a cursor.")
+        values = decode_cursor(cursor, len(sort_keys))
+        query_set = query_set.filter(keyset_filter(sort_keys, values))
+        offset = 0
+    else:
+        if not approximate and (page - 1) * page_size + 1 > count > 0:
+            abort(400, message="Page is out of range.")
+        offset = (page - 1) * page_size
+
+    next_cursor = None
+    if sort_keys:
+        rows = (
+            query_set.add_columns(*[key.expression for key in sort_keys])
+            .offset(offset)
+            .limit(page_size + 1)
+            .all()
+        )
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = encode_cursor(rows[-1][1:])
+        results = [row[0] for row in rows]
+    else:
+        results = query_set.offset(offset).limit(page_size).all()
 
     # support for old function based serializers
     if isclass(serializer):
-        items = serializer(results.items, **kwargs).serialize()
+        items = serializer(results, **kwargs).serialize()
     else:
-        items = [serializer(result) for result in results.items]
+        items = [serializer(result) for result in results]
 
-    return {"count": count, "page": page, "page_size": page_size, "results": items}
+    response = {
+        "count": count,
+        "page": page,
+        "page_size": page_size,
+        "results": items,
+        "next_cursor": next_cursor,
+    }
+    if approximate:
+        response["count_is_approximate"] = True
+    return response
 
 
 def org_scoped_rule(rule):
@@ -123,27 +300,68 @@ def filter_by_tags(result_set, column):
     return result_set
 
 
+def _is_nullable(expression) -> bool:
+    if hasattr(expression, "__clause_element__"):
+        expression = expression.__clause_element__()
+    # e.g. `lower(name)`, which is null only when the name is
+    if isinstance(expression, Function) and expression.name in ("lower", "upper"):
+        expression = list(expression.clauses)[0]
+    return not isinstance(expression, Column) or expression.nullable
+
+
+def get_sort_key(query_set: Query, order: str) -> SortKey:
+    """
+    Get the sort key of an order, e.g. `-created_at`.
+
+    Orders name an attribute of the queried model, or a column of a
+    joined table, as `<table>-<column>`. Columns of joined tables are
+    nullable, as they may be outer joined.
+    """
+    descending = order.startswith("-")
+    name = order.lstrip("-")
+    if "-" in name:
+        table, column = name.split("-", 1)
+        expression = db.metadata.tables[table].c[column]
+        nullable = True
+    else:
+        model = query_set.column_descriptions[0]["entity"]
+        expression = getattr(model, name)
+        nullable = _is_nullable(expression)
+    return SortKey(expression, descending, nullable=nullable)
+
+
 def order_results(results, default_order, allowed_orders, fallback=True):
     """
     Orders the given results with the sort order as requested in the
     "order" request query parameter or the given default order.
-    """
-    return results
-
-    # TODO: Figure out how to make this work with SQLAlchemy 1.4
 
+    Returns the ordered results and their sort keys, to be passed to
+    `paginate`. The id is the last sort key, so that the order is stable.
+    When no order is selected, results are returned as is, without sort
+    keys.
+    """
     # See if a particular order has been requested
     requested_order = request.args.get("order", "").strip()
 
     # and if not (and no fallback is wanted) return results as is
     if not requested_order and not fallback:
-        return results
+        return results, None
 
     # and if it matches a long-form for related fields, falling
     # back to the default order
     selected_order = allowed_orders.get(requested_order, None)
-    if selected_order is None and fallback:
+    if selected_order is None:
+        if not fallback:
+            return results, None
         selected_order = default_order
+
+    sort_key = get_sort_key(results, selected_order)
+    sort_keys = [sort_key]
+    model = results.column_descriptions[0]["entity"]
+    if sort_key.expression is not model.id:
+        sort_keys.append(SortKey(model.id, sort_key.descending, nullable=False))
+
     # The query may already have an ORDER BY statement attached
     # so we clear it here and apply the selected order
-    return sort_query(results.order_by(None), selected_order)
+    results = results.order_by(None).order_by(*[key.order_by() for key in sort_keys])
+    return results, sort_keys
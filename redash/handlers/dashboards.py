@@ -1,7 +1,10 @@
-from flask import request, url_for
+from collections import defaultdict
+
+from flask import Response, request, stream_with_context, url_for
 from funcy import project, partial
 
 from flask_restful import abort
+from dingolytics.tasks.run_query import enqueue_query
 from redash import models
 from redash.handlers.base import (
     BaseResource,
@@ -12,15 +15,21 @@ from redash.handlers.base import (
 )
 from redash.permissions import (
     can_modify,
+    get_accessible_query_ids,
     require_admin_or_owner,
+    require_any_of_permission,
     require_object_modify_permission,
     require_permission,
+    view_only,
 )
 from redash.security import csp_allows_embeding
 from redash.serializers import (
     DashboardSerializer,
     public_dashboard,
+    serialize_query_result,
 )
+from redash.settings import parse_boolean
+from redash.utils import json_dumps, json_loads, utcnow
 from sqlalchemy.orm.exc import StaleDataError
 
 
@@ -70,7 +79,9 @@ class DashboardListResource(BaseResource):
         # order results according to passed order parameter,
         # special-casing search queries where the database
         # provides an order by search rank
-        ordered_results = order_results(results, fallback=not bool(search_term))
+        ordered_results, sort_keys = order_results(
+            results, fallback=not bool(search_term)
+        )
 
         page = request.args.get("page", 1, type=int)
         page_size = request.args.get("page_size", 25, type=int)
@@ -80,6 +91,7 @@ class DashboardListResource(BaseResource):
             page=page,
             page_size=page_size,
             serializer=DashboardSerializer,
+            sort_keys=sort_keys,
         )
 
         if search_term:
@@ -138,7 +150,9 @@ class MyDashboardsResource(BaseResource):
         # order results according to passed order parameter,
         # special-casing search queries where the database
         # provides an order by search rank
-        ordered_results = order_results(results, fallback=not bool(search_term))
+        ordered_results, sort_keys = order_results(
+            results, fallback=not bool(search_term)
+        )
 
         page = request.args.get("page", 1, type=int)
         page_size = request.args.get("page_size", 25, type=int)
@@ -146,7 +160,8 @@ class MyDashboardsResource(BaseResource):
             ordered_results,
             page,
             page_size,
-            DashboardSerializer
+            DashboardSerializer,
+            sort_keys=sort_keys,
         )
 
 
@@ -297,6 +312,170 @@ class DashboardResource(BaseResource):
         return d
 
 
+def _get_row_limit(limits):
+    """Get the row limit of a query shared by widgets, `None` for all rows."""
+    if not limits or None in limits:
+        return None
+    return max(limits)
+
+
+class DashboardResultsResource(BaseResource):
+    @require_any_of_permission(("view_query", "execute_query"))
+    def get(self, dashboard_id):
+        """
+        Stream the latest results of all visualization widgets of a
+        dashboard as newline-delimited JSON, one line per query.
+
+        :qparam number max_age: Results older than `max_age` seconds, or
+                                missing, are stale
+        :qparam boolean refresh: Execute queries of stale results, if
+                                 they have no parameters
+
+        Queries shared by widgets are sent once, with IDs of their widgets.
+        Rows are limited to the largest `row_limit` option of the widgets,
+        widgets without the option get all rows.
+
+        :>json number query_id: Query ID
+        :>json array widget_ids: IDs of widgets showing the query results
+        :>json boolean stale: Whether the result is stale
+        :>json boolean truncated: Whether rows are limited
+        :>json object query_result: Latest query result, if any
+        :>json object job: Refresh job, if the result is refreshed
+        """
+        dashboard = get_object_or_404(
+            models.Dashboard.get_by_id_and_org, dashboard_id, self.current_org
+        )
+        max_age = request.args.get("max_age", type=int)
+        refresh = parse_boolean(request.args.get("refresh", "false"))
+        is_api_user = self.current_user.is_api_user()
+
+        widgets = [w for w in dashboard.get_widgets() if w.visualization_id is not None]
+        queries = {w.visualization.query_rel.id: w.visualization.query_rel for w in widgets}
+        accessible_ids = get_accessible_query_ids(
+            list(queries.values()), self.current_user, view_only
+        )
+        widget_ids = defaultdict(list)
+        row_limits = defaultdict(list)
+        for w in widgets:
+            query_id = w.visualization.query_id
+            if query_id in accessible_ids:
+                widget_ids[query_id].append(w.id)
+                row_limits[query_id].append(
+                    json_loads(w.options or "{}").get("row_limit")
+                )
+
+        # Queries with the same text and data source share their result
+        result_ids = defaultdict(list)
+        for query_id in widget_ids:
+            result_id = queries[query_id].latest_query_data_id
+            if result_id is not None:
+                result_ids[result_id].append(query_id)
+        with_result_ids = {
+            query_id for query_ids in result_ids.values() for query_id in query_ids
+        }
+        now = utcnow()
+        stale_ids = set(widget_ids) - with_result_ids
+        if max_age is not None:
+            stale_ids.update(
+                query_id for query_id in with_result_ids
+                if (now - queries[query_id].latest_query_data.retrieved_at)
+                .total_seconds() > max_age
+            )
+        jobs = self._refresh(queries, stale_ids) if refresh else {}
+
+        def line(query_id, query_result=None):
+            row_limit = _get_row_limit(row_limits[query_id])
+            item = {
+                "query_id": query_id,
+                "widget_ids": widget_ids[query_id],
+                "stale": query_id in stale_ids,
+                "truncated": False,
+                "query_result": None,
+            }
+            if query_result is not None:
+                result = serialize_query_result(query_result, is_api_user)
+                rows = (result.get("data") or {}).get("rows")
+                if rows is not None and row_limit is not None and len(rows) > row_limit:
+                    result["data"] = dict(result["data"], rows=rows[:row_limit])
+                    item["truncated"] = True
+                item["query_result"] = result
+            if query_id in jobs:
+                item["job"] = jobs[query_id]
+            return json_dumps(item) + "\n"
+
+        def generate():
+            for query_id in widget_ids:
+                if query_id not in with_result_ids:
+                    yield line(query_id)
+            if not result_ids:
+                return
+            query_results = (
+                models.QueryResult.query.filter(
+                    models.QueryResult.id.in_(list(result_ids))
+                )
+                .execution_options(stream_results=True)
+                .yield_per(10)
+            )
+            for query_result in query_results:
+                for query_id in result_ids[query_result.id]:
+                    if is_api_user and (
+                        queries[query_id].query_hash != query_result.query_hash
+                    ):
+                        yield line(query_id)
+                    else:
+                        yield line(query_id, query_result)
+
+        return Response(
+            stream_with_context(generate()), mimetype="application/x-ndjson"
+        )
+
+    def _refresh(self, queries, query_ids):
+        """Execute queries without parameters, return jobs by query ID."""
+        data_sources = {
+            ds.id: ds
+            for ds in models.DataSource.query.filter(
+                models.DataSource.id.in_(
+                    {queries[query_id].data_source_id for query_id in query_ids}
+                )
+            )
+        }
+        paused = models.DataSource.get_pause_reasons(list(data_sources.values()))
+        jobs = {}
+        for query_id in query_ids:
+            query = queries[query_id]
+            data_source = data_sources.get(query.data_source_id)
+            parameterized = query.parameterized
+            if (
+                data_source is None
+                or data_source.id in paused
+                or parameterized.missing_params
+            ):
+                continue
+            query_text = data_source.query_runner.apply_auto_limit(
+                parameterized.text, query.options.get("apply_auto_limit", False)
+            )
+            task = enqueue_query(
+                query=query_text,
+                data_source=data_source,
+                user_id=self.current_user.id,
+                is_api_key=self.current_user.is_api_user(),
+                metadata={
+                    "Username": repr(self.current_user)
+                    if self.current_user.is_api_user()
+                    else self.current_user.email,
+                    "query_id": query_id,
+                },
+            )
+            jobs[query_id] = {
+                "id": f"huey:{task.id}",
+                "updated_at": utcnow(),
+                "status": 1,  # QUEUED
+                "error": None,
+                "result": None,
+            }
+        return jobs
+
+
 class PublicDashboardResource(BaseResource):
     decorators = BaseResource.decorators + [csp_allows_embeding]
 
@@ -407,12 +586,16 @@ class DashboardFavoriteListResource(BaseResource):
         # order results according to passed order parameter,
         # special-casing search queries where the database
         # provides an order by search rank
-        favorites = order_results(favorites, fallback=not bool(search_term))
+        favorites, sort_keys = order_results(
+            favorites, fallback=not bool(search_term)
+        )
 
         page = request.args.get("page", 1, type=int)
         page_size = request.args.get("page_size", 25, type=int)
         # TODO: we don't need to check for favorite status here
-        response = paginate(favorites, page, page_size, DashboardSerializer)
+        response = paginate(
+            favorites, page, page_size, DashboardSerializer, sort_keys=sort_keys
+        )
 
         self.record_event(
             {
@@ -191,13 +191,42 @@ class DataSourceListResource(BaseResource):
 
 class DataSourceSchemaResource(BaseResource):
     def get(self, data_source_id):
+        """
+        Get the data source schema.
+
+        :qparam since: Only tables changed since the timestamp, with names
+            of removed tables, as of `updated_at` of the previous response.
+            All tables, with `full` set, if changes are no longer logged
+        :qparam q: Only tables with names containing the string
+        :qparam number page: Page of tables to return, all by default
+        :qparam number page_size: Number of tables to return per page
+        """
         data_source = get_object_or_404(
             models.DataSource.get_by_id_and_org, data_source_id, self.current_org
         )
         require_access(data_source, self.current_user, view_only)
         refresh = request.args.get("refresh") is not None
+        since = request.args.get("since", type=float)
+        search = request.args.get("q")
+        page = request.args.get("page", type=int)
+        page_size = request.args.get("page_size", 100, type=int)
+        updated_at = time.time()
         schema = {}
 
+        if since is not None and not refresh:
+            full = not data_source.has_schema_changes_since(since)
+            if full:
+                changed, removed = data_source.get_cached_schema() or [], []
+            else:
+                changed, removed = data_source.get_schema_changes(since)
+            return {
+                "schema": changed,
+                "removed": removed,
+                "full": full,
+                "updated_at": updated_at,
+                "refresh": data_source.get_schema_refresh(),
+            }
+
         if not refresh:
             schema = data_source.get_cached_schema()
 
@@ -218,7 +247,28 @@ class DataSourceSchemaResource(BaseResource):
                     }
                 }
 
-        return {"schema": schema}
+        response = {
+            "updated_at": updated_at,
+            "refresh": data_source.get_schema_refresh(),
+        }
+        if search:
+            search = search.lower()
+            schema = [t for t in schema if search in t["name"].lower()]
+        if page is None:
+            return dict(response, schema=schema)
+
+        if page < 1:
+            abort(400, message="Page must be positive integer.")
+        if page_size > 1000 or page_size < 1:
+            abort(400, message="Page size is out of range (1-1000).")
+        offset = (page - 1) * page_size
+        return dict(
+            response,
+            schema=schema[offset:offset + page_size],
+            count=len(schema),
+            page=page,
+            page_size=page_size,
+        )
 
 
 class DataSourcePauseResource(BaseResource):
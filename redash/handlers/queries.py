@@ -155,7 +155,9 @@ class BaseQueryListResource(BaseResource):
         # order results according to passed order parameter,
         # special-casing search queries where the database
         # provides an order by search rank
-        ordered_results = order_results(results, fallback=not bool(search_term))
+        ordered_results, sort_keys = order_results(
+            results, fallback=not bool(search_term)
+        )
 
         page = request.args.get("page", 1, type=int)
         page_size = request.args.get("page_size", 25, type=int)
@@ -165,6 +167,7 @@ class BaseQueryListResource(BaseResource):
             page=page,
             page_size=page_size,
             serializer=QuerySerializer,
+            sort_keys=sort_keys,
             with_stats=True,
             with_last_modified_by=False,
         )
@@ -311,7 +314,9 @@ class MyQueriesResource(BaseResource):
         # order results according to passed order parameter,
         # special-casing search queries where the database
         # provides an order by search rank
-        ordered_results = order_results(results, fallback=not bool(search_term))
+        ordered_results, sort_keys = order_results(
+            results, fallback=not bool(search_term)
+        )
 
         page = request.args.get("page", 1, type=int)
         page_size = request.args.get("page_size", 25, type=int)
@@ -320,6 +325,7 @@ class MyQueriesResource(BaseResource):
             page,
             page_size,
             QuerySerializer,
+            sort_keys=sort_keys,
             with_stats=True,
             with_last_modified_by=False,
         )
@@ -530,7 +536,9 @@ class QueryFavoriteListResource(BaseResource):
         # order results according to passed order parameter,
         # special-casing search queries where the database
         # provides an order by search rank
-        ordered_favorites = order_results(favorites, fallback=not bool(search_term))
+        ordered_favorites, sort_keys = order_results(
+            favorites, fallback=not bool(search_term)
+        )
 
         page = request.args.get("page", 1, type=int)
         page_size = request.args.get("page_size", 25, type=int)
@@ -539,6 +547,7 @@ class QueryFavoriteListResource(BaseResource):
             page,
             page_size,
             QuerySerializer,
+            sort_keys=sort_keys,
             with_stats=True,
             with_last_modified_by=False,
         )
@@ -135,9 +135,9 @@ class UserListResource(BaseResource):
         if pending is not None:
             pending = parse_boolean(pending)
 
-        users = self.get_users(disabled, pending, search_term)
+        users, sort_keys = self.get_users(disabled, pending, search_term)
 
-        return paginate(users, page, page_size, serialize_user)
+        return paginate(users, page, page_size, serialize_user, sort_keys=sort_keys)
 
     @require_admin
     def post(self):
@@ -29,6 +29,7 @@ from .base import Column, GFKBase, db, gfk_type, key_type, primary_key
 from .datasources import DataSource, DataSourceGroup  # noqa
 from .mixins import BelongsToOrgMixin, TimestampMixin
 from .organizations import Organization
+from .search import search_match, search_vector_expression, trigram_index
 from .types import EncryptedConfiguration, MutableDict, MutableList
 from .users import AccessPermission, AnonymousUser, ApiUser, Group, User  # noqa
 
@@ -258,8 +259,26 @@ class Dashboard(TimestampMixin, BelongsToOrgMixin, db.Model):
     options = Column(
         MutableDict.as_mutable(postgresql.JSON), server_default="{}", default={}
     )
+    search_vector = db.deferred(
+        Column(
+            postgresql.TSVECTOR,
+            db.Computed(
+                search_vector_expression(("coalesce(name, '')", "A")), persisted=True
+            ),
+            nullable=True,
+        )
+    )
 
     __tablename__ = "dashboards"
+    __table_args__ = (
+        db.Index(
+            "ix_dashboards_search_vector", "search_vector", postgresql_using="gin"
+        ),
+        trigram_index("ix_dashboards_name_trgm", "name"),
+        # Sort keys of the lists, see `order_results`
+        db.Index("ix_dashboards_created_at_id", "created_at", "id"),
+        db.Index("ix_dashboards_lower_name_id", db.text("lower(name)"), "id"),
+    )
     __mapper_args__ = {"version_id_col": version}
 
     def __str__(self):
@@ -271,12 +290,11 @@ class Dashboard(TimestampMixin, BelongsToOrgMixin, db.Model):
 
     @classmethod
     def all(cls, org, group_ids, user_id):
-        query = (
-            Dashboard.query.options(
-                joinedload(Dashboard.user).load_only(
-                    "id", "name", "details", "email"
-                )
-            ).distinct(cls.lowercase_name, Dashboard.created_at, Dashboard.slug)
+        # Dashboards are joined with their widgets to check permissions,
+        # the ids are selected apart so that the results can be ordered
+        # by any column
+        dashboard_ids = (
+            db.session.query(Dashboard.id)
             .outerjoin(Widget)
             .outerjoin(Visualization)
             .outerjoin(Query)
@@ -292,6 +310,9 @@ class Dashboard(TimestampMixin, BelongsToOrgMixin, db.Model):
                 Dashboard.org == org,
             )
         )
+        query = Dashboard.query.options(
+            joinedload(Dashboard.user).load_only("id", "name", "details", "email")
+        ).filter(Dashboard.id.in_(dashboard_ids))
 
         query = query.filter(
             or_(Dashboard.user_id == user_id, Dashboard.is_draft == False)
@@ -301,14 +322,21 @@ class Dashboard(TimestampMixin, BelongsToOrgMixin, db.Model):
 
     @classmethod
     def search(cls, org, groups_ids, user_id, search_term):
-        # TODO: switch to FTS
-        return cls.all(org, groups_ids, user_id).filter(
-            cls.name.ilike("%{}%".format(search_term))
+        # Names are matched as substrings too, as they always were
+        match, rank = search_match(cls.search_vector, search_term, (cls.name,))
+        return (
+            cls.all(org, groups_ids, user_id)
+            .filter(match)
+            .order_by(rank.desc(), cls.id.desc())
         )
 
     @classmethod
     def search_by_user(cls, term, user, limit=None):
-        return cls.by_user(user).filter(cls.name.ilike("%{}%".format(term))).limit(limit)
+        return (
+            cls.search(user.org, user.group_ids, user.id, term)
+            .filter(Dashboard.user_id == user.id)
+            .limit(limit)
+        )
 
     @classmethod
     def all_tags(cls, org, user):
@@ -347,6 +375,28 @@ class Dashboard(TimestampMixin, BelongsToOrgMixin, db.Model):
     def get_by_slug_and_org(cls, slug, org):
         return cls.query.filter(cls.slug == slug, cls.org == org).one()
 
+    def get_widgets(self):
+        """
+        Get widgets with their visualizations, queries and latest result
+        metadata loaded with one query.
+        """
+        return (
+            Widget.query.filter(Widget.dashboard_id == self.id)
+            .options(
+                joinedload(Widget.visualization)
+                .joinedload(Visualization.query_rel)
+                .options(
+                    joinedload(Query.user),
+                    joinedload(Query.last_modified_by),
+                    joinedload(Query.latest_query_data).load_only(
+                        "runtime", "retrieved_at"
+                    ),
+                )
+            )
+            .order_by(Widget.id)
+            .all()
+        )
+
     @hybrid_property
     def lowercase_name(self):
         "Optional property useful for sorting purposes."
@@ -450,8 +500,9 @@ class Event(db.Model):
             "created_at": self.created_at.isoformat(),
         }
 
-    @classmethod
-    def record(cls, event):
+    @staticmethod
+    def get_row(event):
+        """Get column values of a raw event, consuming the event dict."""
         org_id = event.pop("org_id")
         user_id = event.pop("user_id", None)
         action = event.pop("action")
@@ -460,18 +511,104 @@ class Event(db.Model):
 
         created_at = datetime.datetime.utcfromtimestamp(event.pop("timestamp"))
 
-        event = cls(
-            org_id=org_id,
-            user_id=user_id,
-            action=action,
-            object_type=object_type,
-            object_id=object_id,
-            additional_properties=event,
-            created_at=created_at,
-        )
+        return {
+            "org_id": org_id,
+            "user_id": user_id,
+            "action": action,
+            "object_type": object_type,
+            "object_id": object_id,
+            "additional_properties": event,
+            "created_at": created_at,
+        }
+
+    @classmethod
+    def record(cls, event):
+        event = cls(**cls.get_row(event))
         db.session.add(event)
         return event
 
+    @classmethod
+    def get_usage(cls, org_id, days=30):
+        """Count events and users by day, action and object type."""
+        day = db.func.date(cls.created_at).label("day")
+        rows = (
+            db.session.query(
+                day,
+                cls.action,
+                cls.object_type,
+                db.func.count(cls.id),
+                db.func.count(db.distinct(cls.user_id)),
+            )
+            .filter(
+                cls.org_id == org_id,
+                cls.created_at > db.func.now() - datetime.timedelta(days=days),
+            )
+            .group_by(day, cls.action, cls.object_type)
+            .order_by(day, cls.action, cls.object_type)
+        )
+        return [
+            {
+                "day": day.isoformat(),
+                "action": action,
+                "object_type": object_type,
+                "events": events,
+                "users": users,
+            }
+            for day, action, object_type, events, users in rows
+        ]
+
+    @classmethod
+    def get_daily_counts(cls, actions, days=7):
+        """
+        Count events per object and day, for the recent activity feed.
+
+        `actions` are the counted actions by object type.
+        """
+        day = db.func.date(cls.created_at).label("day")
+        rows = (
+            db.session.query(
+                cls.org_id,
+                cls.user_id,
+                cls.object_type,
+                cls.object_id,
+                day,
+                db.func.count(cls.id),
+            )
+            .filter(
+                or_(
+                    *[
+                        and_(cls.object_type == object_type, cls.action.in_(names))
+                        for object_type, names in actions.items()
+                    ]
+                ),
+                cls.object_id != None,
+                cls.created_at >= db.func.current_date() - days,
+            )
+            .group_by(cls.org_id, cls.user_id, cls.object_type, cls.object_id, day)
+        )
+        return {tuple(row[:5]): row[5] for row in rows}
+
+    @classmethod
+    def delete_older_than(cls, days, batch_size=10000):
+        """Delete a batch of events older than the days, return the count."""
+        ids = (
+            db.session.query(cls.id)
+            .filter(cls.created_at < db.func.now() - datetime.timedelta(days=days))
+            .limit(batch_size)
+            .subquery()
+        )
+        return cls.query.filter(cls.id.in_(db.select(ids.c.id))).delete(
+            synchronize_session=False
+        )
+
+    @classmethod
+    def record_many(cls, events):
+        """Insert raw events with a single `executemany`, return the rows."""
+        rows = [cls.get_row(dict(event)) for event in events]
+        if rows:
+            db.session.execute(cls.__table__.insert(), rows)
+        return rows
+
 
 @generic_repr("id", "created_by_id", "org_id", "active")
 class ApiKey(TimestampMixin, GFKBase, db.Model):
@@ -2,9 +2,9 @@ import functools
 
 from flask_sqlalchemy import SQLAlchemy
 from flask_sqlalchemy.query import Query as BaseQuery
-from sqlalchemy.orm import object_session
+from sqlalchemy.event import listens_for
+from sqlalchemy.orm import Session, object_session
 from sqlalchemy.pool import NullPool
-# from sqlalchemy_searchable import make_searchable, vectorizer, SearchQueryMixin
 from sqlalchemy.dialects import postgresql
 
 from redash import settings
@@ -39,27 +39,6 @@ db = SQLAlchemy(
 )
 
 
-# Listen to a few database events to set up functions, trigger updates
-# and indexes for the full text search
-# make_searchable(db.metadata, options={"regconfig": "pg_catalog.simple"})
-
-
-# class SearchBaseQuery(BaseQuery, SearchQueryMixin):
-#     """
-#     The SQA query class to use when full text search is wanted.
-#     """
-
-
-# @vectorizer(db.Integer)
-# def integer_vectorizer(column):
-#     return db.func.cast(column, db.Text)
-
-
-# @vectorizer(postgresql.UUID)
-# def uuid_vectorizer(column):
-#     return db.func.cast(column, db.Text)
-
-
 Column = functools.partial(db.Column, nullable=False)
 
 # AccessPermission and Change use a 'generic foreign key' approach to refer to
@@ -104,6 +83,55 @@ class GFKBase(object):
         self.object_id = value.id
 
 
+# Handlers of values collected during a transaction by name, see `on_commit`,
+# and whether they also run on rollback
+_commit_handlers = {}
+
+
+def after_commit(name, on_rollback=True):
+    """
+    Register the handler of values collected with `on_commit`.
+
+    Unless `on_rollback` is false, the handler also runs when the
+    transaction is rolled back.
+    """
+    def decorator(func):
+        _commit_handlers[name] = (func, on_rollback)
+        return func
+    return decorator
+
+
+def on_commit(target, name, *values):
+    """
+    Collect values for the `name` handler, called with all of them once
+    the transaction of the `target` session ends.
+
+    Caches are invalidated this way rather than at flush, when other
+    transactions can still read and cache the previous rows. Handlers run
+    on rollback too, as the transaction may have cached its own changes.
+    """
+    session = target if isinstance(target, Session) else object_session(target)
+    if session is None:
+        _commit_handlers[name][0](set(values))
+        return
+    pending = session.info.setdefault("on_commit", {})
+    pending.setdefault(name, set()).update(values)
+
+
+@listens_for(Session, "after_commit")
+def _run_commit_handlers(session):
+    for name, values in session.info.pop("on_commit", {}).items():
+        _commit_handlers[name][0](values)
+
+
+@listens_for(Session, "after_rollback")
+def _run_rollback_handlers(session):
+    for name, values in session.info.pop("on_commit", {}).items():
+        func, on_rollback = _commit_handlers[name]
+        if on_rollback:
+            func(values)
+
+
 key_definitions = settings.D.database_key_definitions((db.Integer, {}))
 
 
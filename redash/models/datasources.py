@@ -1,11 +1,15 @@
 import logging
+import time
 
+from flask import g, has_request_context
+from sqlalchemy.event import listens_for
 from sqlalchemy_utils.types.encrypted.encrypted_type import FernetEngine
 from sqlalchemy_utils.models import generic_repr
 
 from redash import redis_connection, settings
 from redash.query_runner import (
     BaseQueryRunner,
+    NotSupported,
     get_configuration_schema_for_query_runner_type,
     get_query_runner,
     with_ssh_tunnel,
@@ -13,7 +17,7 @@ from redash.query_runner import (
 from redash.utils import json_dumps, json_loads
 from redash.utils.configuration import ConfigurationContainer
 
-from .base import db, Column, key_type, primary_key
+from .base import after_commit, db, Column, key_type, on_commit, primary_key
 from .mixins import BelongsToOrgMixin
 from .organizations import Organization
 from .types import EncryptedConfiguration
@@ -22,6 +26,20 @@ from .users import Group
 logger = logging.getLogger(__name__)
 
 
+DATA_SOURCE_GROUPS_KEY = "data_source:{}:groups"
+
+
+def _groups_key(data_source_id):
+    return DATA_SOURCE_GROUPS_KEY.format(data_source_id)
+
+
+def _get_request_groups_cache():
+    """Get groups of data sources cached for the request, if any."""
+    if not has_request_context():
+        return {}
+    return g.setdefault("data_source_groups", {})
+
+
 @generic_repr("id", "name", "type", "org_id", "created_at")
 class DataSource(BelongsToOrgMixin, db.Model):
     id = primary_key("DataSource")
@@ -95,6 +113,8 @@ class DataSource(BelongsToOrgMixin, db.Model):
             data_source=data_source, group=data_source.org.default_group
         )
         db.session.add_all([data_source, data_source_group])
+        # So that it has an id, and its groups can be read
+        db.session.flush()
         return data_source
 
     @classmethod
@@ -121,13 +141,51 @@ class DataSource(BelongsToOrgMixin, db.Model):
         res = db.session.delete(self)
         db.session.commit()
 
+        redis_connection.delete(
+            self._schema_fingerprints_key,
+            self._schema_changes_key,
+            self._schema_metadata_key,
+        )
         redis_connection.delete(self._schema_key)
 
         return res
 
     def get_cached_schema(self):
-        cache = redis_connection.get(self._schema_key)
-        return json_loads(cache) if cache else None
+        values = redis_connection.hvals(self._schema_key)
+        if not values and not redis_connection.hexists(
+            self._schema_refresh_key, "refreshed_at"
+        ):
+            return None
+        return self._with_metadata(values)
+
+    def has_schema_changes_since(self, since):
+        """Check whether changes since the timestamp are still logged."""
+        return since >= time.time() - settings.S.SCHEMA_CHANGES_TTL
+
+    def get_schema_changes(self, since):
+        """
+        Get tables changed and names of tables removed since the timestamp,
+        see `has_schema_changes_since`.
+        """
+        names = redis_connection.zrangebyscore(
+            self._schema_changes_key, "({}".format(since), "+inf"
+        )
+        values = redis_connection.hmget(self._schema_key, names) if names else []
+        removed = [name for name, value in zip(names, values) if value is None]
+        return (
+            self._with_metadata([value for value in values if value is not None]),
+            sorted(removed),
+        )
+
+    def _with_metadata(self, values):
+        """Load cached tables, sorted by name, with their metadata."""
+        tables = [json_loads(value) for value in values]
+        if tables:
+            cache = redis_connection.get(self._schema_metadata_key)
+            metadata = json_loads(cache) if cache else {}
+            for table in tables:
+                table.update(metadata.get(table["name"]) or {})
+        return sorted(tables, key=lambda t: t["name"])
 
     def get_schema(self, refresh=False):
         out_schema = None
@@ -135,20 +193,125 @@ class DataSource(BelongsToOrgMixin, db.Model):
             out_schema = self.get_cached_schema()
 
         if out_schema is None:
-            query_runner = self.query_runner
-            schema = query_runner.get_schema(get_stats=refresh)
+            started_at = time.time()
+            try:
+                self._refresh_schema(get_stats=refresh)
+            except Exception as exc:
+                self._record_schema_refresh(started_at, error=str(exc))
+                raise
+            self._record_schema_refresh(started_at)
+            out_schema = self.get_cached_schema() or []
 
+        return out_schema
+
+    def _refresh_schema(self, get_stats=False):
+        """
+        Refresh the schema cache, only tables changed since the previous
+        refresh when the query runner fingerprints tables.
+
+        Table metadata, e.g. row counts, changes without the definition,
+        so it's fetched in bulk on every refresh and cached separately.
+        """
+        query_runner = self.query_runner
+        try:
+            metadata = query_runner.get_tables_metadata()
+        except NotSupported:
+            self._store_schema(query_runner.get_schema(get_stats=get_stats))
+            return
+
+        fingerprints = {
+            name: table.pop("fingerprint") for name, table in metadata.items()
+        }
+
+        stored = redis_connection.hgetall(self._schema_fingerprints_key)
+        changed = [
+            name for name, fingerprint in fingerprints.items()
+            if stored.get(name) != fingerprint
+        ]
+        tables = query_runner.get_tables_schema(changed) if changed else []
+        fetched = {table["name"] for table in tables}
+        removed = [name for name in stored if name not in fingerprints]
+        # Tables dropped while fetching columns are retried next time
+        removed.extend(name for name in changed if name not in fetched)
+        self._store_schema(
+            tables,
+            removed=removed,
+            fingerprints={name: fingerprints[name] for name in fetched},
+            metadata=metadata,
+        )
+        logger.info(
+            "Refreshed schema of data source %s: %s tables, %s changed, "
+            "%s removed", self.id, len(fingerprints), len(fetched), len(removed),
+        )
+
+    def _store_schema(self, tables, removed=None, fingerprints=None, metadata=None):
+        """
+        Store tables in the schema cache. Without `removed`, the tables
+        replace the schema, otherwise they're updated and `removed` are
+        deleted. Changes, including changes of the table metadata, are
+        logged for `get_schema_changes` and expire after
+        `SCHEMA_CHANGES_TTL`. `metadata` of tables replaces the cached one.
+        """
+        values = {}
+        for table in tables:
             try:
-                out_schema = self._sort_schema(schema)
+                table = self._sort_schema([table])[0]
             except Exception:
                 logging.exception(
                     "Error sorting schema columns for data_source {}".format(self.id)
                 )
-                out_schema = schema
-            finally:
-                redis_connection.set(self._schema_key, json_dumps(out_schema))
-
-        return out_schema
+            values[table["name"]] = json_dumps(table)
+
+        if removed is None:
+            previous = redis_connection.hgetall(self._schema_key)
+            removed = set(previous) - set(values)
+        else:
+            names = list(values)
+            previous = dict(zip(
+                names,
+                redis_connection.hmget(self._schema_key, names) if names else [],
+            ))
+            removed = set(removed)
+        changed = {
+            name for name, value in values.items() if previous.get(name) != value
+        }
+        # Metadata, e.g. row counts, changes without the table definition,
+        # and is logged as a change of the table as well
+        cache = redis_connection.get(self._schema_metadata_key)
+        previous_metadata = json_loads(cache) if cache else {}
+        metadata_changed = {
+            name for name in set(metadata or {}) | set(previous_metadata)
+            if (metadata or {}).get(name) != previous_metadata.get(name)
+        } - removed
+
+        now = time.time()
+        pipe = redis_connection.pipeline()
+        if removed:
+            pipe.hdel(self._schema_key, *removed)
+        if changed:
+            pipe.hset(self._schema_key, mapping={n: values[n] for n in changed})
+        if changed or removed or metadata_changed:
+            pipe.zadd(
+                self._schema_changes_key,
+                {name: now for name in changed | removed | metadata_changed},
+            )
+            pipe.expire(self._schema_changes_key, settings.S.SCHEMA_CHANGES_TTL)
+        pipe.zremrangebyscore(
+            self._schema_changes_key,
+            "-inf", "({}".format(now - settings.S.SCHEMA_CHANGES_TTL),
+        )
+        if metadata:
+            pipe.set(self._schema_metadata_key, json_dumps(metadata))
+        else:
+            pipe.delete(self._schema_metadata_key)
+        if fingerprints is None:
+            pipe.delete(self._schema_fingerprints_key)
+        else:
+            if removed:
+                pipe.hdel(self._schema_fingerprints_key, *removed)
+            if fingerprints:
+                pipe.hset(self._schema_fingerprints_key, mapping=fingerprints)
+        pipe.execute()
 
     def _sort_schema(self, schema):
         def sort_key(x):
@@ -156,21 +319,75 @@ class DataSource(BelongsToOrgMixin, db.Model):
                 return x["name"]
             return x
         return [
-            {
-                "name": i["name"],
-                "columns": sorted(i["columns"], key=sort_key)
-            }
+            dict(i, columns=sorted(i["columns"], key=sort_key))
             for i in sorted(schema, key=sort_key)
         ]
 
     @property
     def _schema_key(self):
-        return "data_source:schema:{}".format(self.id)
+        return "data_source:schema:{}:tables".format(self.id)
+
+    @property
+    def _schema_fingerprints_key(self):
+        return "data_source:schema:{}:fingerprints".format(self.id)
+
+    @property
+    def _schema_metadata_key(self):
+        return "data_source:schema:{}:metadata".format(self.id)
+
+    @property
+    def _schema_changes_key(self):
+        return "data_source:schema:{}:changes".format(self.id)
+
+    @property
+    def _schema_refresh_key(self):
+        return "data_source:schema:{}:refresh".format(self.id)
+
+    def _record_schema_refresh(self, started_at, error=None):
+        finished_at = time.time()
+        mapping = {"runtime": finished_at - started_at}
+        if error is None:
+            mapping.update(refreshed_at=finished_at, error="")
+        else:
+            mapping.update(failed_at=finished_at, error=error)
+        redis_connection.hset(self._schema_refresh_key, mapping=mapping)
+
+    def get_schema_refresh(self):
+        """
+        Get the last schema refresh: when the schema was last refreshed,
+        its staleness in seconds, the runtime and the error of the last
+        attempt.
+        """
+        values = redis_connection.hgetall(self._schema_refresh_key)
+        refreshed_at = values.get("refreshed_at")
+        return {
+            "refreshed_at": float(refreshed_at) if refreshed_at else None,
+            "staleness": (
+                time.time() - float(refreshed_at) if refreshed_at else None
+            ),
+            "runtime": float(values["runtime"]) if "runtime" in values else None,
+            "failed_at": (
+                float(values["failed_at"]) if values.get("failed_at") else None
+            ),
+            "error": values.get("error") or None,
+        }
 
     @property
     def _pause_key(self):
         return "ds:{}:pause".format(self.id)
 
+    @classmethod
+    def get_pause_reasons(cls, data_sources):
+        """Get pause reasons of paused data sources with one request."""
+        if not data_sources:
+            return {}
+        values = redis_connection.mget([ds._pause_key for ds in data_sources])
+        return {
+            ds.id: reason
+            for ds, reason in zip(data_sources, values)
+            if reason is not None
+        }
+
     @property
     def paused(self):
         return redis_connection.exists(self._pause_key)
@@ -200,6 +417,8 @@ class DataSource(BelongsToOrgMixin, db.Model):
             DataSourceGroup.data_source == self,
         ).delete()
         db.session.commit()
+        # Bulk deletes skip the mapper events below
+        self.invalidate_groups(self.id)
 
     def update_group_permission(self, group, view_only):
         dsg = DataSourceGroup.query.filter(
@@ -226,16 +445,59 @@ class DataSource(BelongsToOrgMixin, db.Model):
     def get_by_name(cls, name):
         return cls.query.filter(cls.name == name).one()
 
-    # XXX Examine call sites to see if a regular SQLA collection
-    # would work better
+    @classmethod
+    def get_groups_by_id(cls, data_source_ids):
+        """
+        Get `groups` of many data sources.
+
+        Groups are cached for the request and, for `PERMISSIONS_CACHE_TTL`
+        seconds, in Redis; missing ones are loaded with one query.
+        """
+        ids = set(data_source_ids)
+        request_cache = _get_request_groups_cache()
+        groups = {i: request_cache[i] for i in ids if i in request_cache}
+        missing = [i for i in ids if i not in groups]
+
+        ttl = settings.S.PERMISSIONS_CACHE_TTL
+        if missing and ttl > 0:
+            values = redis_connection.mget([_groups_key(i) for i in missing])
+            for data_source_id, value in zip(missing, values):
+                if value is not None:
+                    groups[data_source_id] = {
+                        int(group_id): view_only
+                        for group_id, view_only in json_loads(value).items()
+                    }
+            missing = [i for i in missing if i not in groups]
+
+        if missing:
+            loaded = {data_source_id: {} for data_source_id in missing}
+            rows = db.session.query(
+                DataSourceGroup.data_source_id,
+                DataSourceGroup.group_id,
+                DataSourceGroup.view_only,
+            ).filter(DataSourceGroup.data_source_id.in_(missing))
+            for data_source_id, group_id, view_only in rows:
+                loaded[data_source_id][group_id] = view_only
+            if ttl > 0:
+                pipe = redis_connection.pipeline(transaction=False)
+                for data_source_id, value in loaded.items():
+                    pipe.set(_groups_key(data_source_id), json_dumps(value), ex=ttl)
+                pipe.execute()
+            groups.update(loaded)
+
+        request_cache.update(groups)
+        return groups
+
+    @classmethod
+    def invalidate_groups(cls, data_source_id):
+        _get_request_groups_cache().pop(data_source_id, None)
+        redis_connection.delete(_groups_key(data_source_id))
+
     @property
     def groups(self):
-        groups = DataSourceGroup.query.filter(
-            DataSourceGroup.data_source == self
-        )
-        return dict([
-            (group.group_id, group.view_only) for group in groups
-        ])
+        if self.id is None:
+            return {}
+        return self.get_groups_by_id([self.id])[self.id]
 
 
 @generic_repr("id", "data_source_id", "group_id", "view_only")
@@ -249,3 +511,17 @@ class DataSourceGroup(db.Model):
     view_only = Column(db.Boolean, default=False)
 
     __tablename__ = "data_source_groups"
+
+
+@listens_for(DataSourceGroup, "after_insert")
+@listens_for(DataSourceGroup, "after_update")
+@listens_for(DataSourceGroup, "after_delete")
+def invalidate_data_source_groups(mapper, connection, target):
+    _get_request_groups_cache().pop(target.data_source_id, None)
+    on_commit(target, "data_source_groups", target.data_source_id)
+
+
+@after_commit("data_source_groups")
+def _invalidate_groups(data_source_ids):
+    for data_source_id in data_source_ids:
+        DataSource.invalidate_groups(data_source_id)
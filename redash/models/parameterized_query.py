@@ -1,11 +1,55 @@
+import threading
+from collections import OrderedDict
+
 import pystache
-from functools import partial
+from functools import lru_cache, partial
 from numbers import Number
+from redash import redis_connection
 from redash.utils import mustache_render, json_loads
 from redash.permissions import require_access, view_only
 from funcy import distinct
 from dateutil.parser import parse
 
+DROPDOWN_VALUES_KEY = "query:{}:dropdown_values:{}"
+DROPDOWN_VALUES_TTL = 3600 * 24
+
+DROPDOWN_VALUE_SETS_MAX_SIZE = 256
+
+
+class _ValueSetCache(object):
+    """Bounded cache of the least recently used dropdown values sets."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+            return item
+
+    def set(self, key, item):
+        with self._lock:
+            self._items[key] = item
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+# Dropdown values sets by query ID as (latest_query_data_id, values) pairs,
+# an entry is replaced as soon as the dropdown query has a newer result.
+_dropdown_value_sets = _ValueSetCache(DROPDOWN_VALUE_SETS_MAX_SIZE)
+
 
 def _pluck_name_and_value(default_column, row):
     row = {k.lower(): v for k, v in row.items()}
@@ -15,27 +59,66 @@ def _pluck_name_and_value(default_column, row):
     return {"name": row[name_column], "value": str(row[value_column])}
 
 
-def _load_result(query_id, org):
+def _load_query(query_id, org):
     from redash import models
 
     query = models.Query.get_by_id_and_org(query_id, org)
 
     if query.data_source:
-        query_result = models.QueryResult.get_by_id_and_org(
-            query.latest_query_data_id, org
-        )
-        return query_result.data
+        return query
     else:
         raise QueryDetachedFromDataSourceError(query_id)
 
 
-def dropdown_values(query_id, org):
-    data = _load_result(query_id, org)
+def _load_result(query_id, org, latest_query_data_id=None):
+    from redash import models
+
+    if latest_query_data_id is None:
+        latest_query_data_id = _load_query(query_id, org).latest_query_data_id
+
+    query_result = models.QueryResult.get_by_id_and_org(latest_query_data_id, org)
+    return query_result.data
+
+
+def _pluck_dropdown_values(data):
     first_column = data["columns"][0]["name"]
     pluck = partial(_pluck_name_and_value, first_column)
     return list(map(pluck, data["rows"]))
 
 
+def dropdown_values(query_id, org):
+    return _pluck_dropdown_values(_load_result(query_id, org))
+
+
+def dropdown_value_set(query_id, org):
+    """
+    Values of a query-backed dropdown as a set, for validating parameters.
+
+    The set is cached per dropdown query result in process and in Redis,
+    so only the query row is loaded while its latest result is unchanged.
+    """
+    query = _load_query(query_id, org)
+    result_id = query.latest_query_data_id
+
+    cached = _dropdown_value_sets.get(query.id)
+    if cached and cached[0] == result_id:
+        return cached[1]
+
+    key = DROPDOWN_VALUES_KEY.format(query.id, result_id)
+    values = frozenset(redis_connection.smembers(key))
+    if not values:
+        data = _load_result(query.id, org, latest_query_data_id=result_id)
+        values = frozenset(v["value"] for v in _pluck_dropdown_values(data))
+        if values:
+            pipe = redis_connection.pipeline()
+            pipe.sadd(key, *values)
+            pipe.expire(key, DROPDOWN_VALUES_TTL)
+            pipe.execute()
+
+    _dropdown_value_sets.set(query.id, (result_id, values))
+    return values
+
+
 def join_parameter_list_values(parameters, schema):
     updated_parameters = {}
     for (key, value) in parameters.items():
@@ -67,10 +150,33 @@ def _collect_key_names(nodes):
     return distinct(keys)
 
 
+class CompiledTemplate(object):
+    """
+    Query template parsed once and reused for rendering.
+
+    Templates without any mustache tags are returned as is, without
+    going through the renderer at all.
+    """
+
+    def __init__(self, template):
+        self.template = template
+        self.parsed = pystache.parse(template)
+        self.parameters = tuple(_collect_key_names(self.parsed))
+        self.is_static = all(isinstance(node, str) for node in self.parsed._parse_tree)
+
+    def render(self, context):
+        if self.is_static:
+            return self.template
+        return mustache_render(self.parsed, context)
+
+
+@lru_cache(maxsize=1024)
+def compile_template(template):
+    return CompiledTemplate(template)
+
+
 def _collect_query_parameters(query):
-    nodes = pystache.parse(query)
-    keys = _collect_key_names(nodes)
-    return keys
+    return list(compile_template(query).parameters)
 
 
 def _parameter_names(parameter_values):
@@ -113,7 +219,7 @@ def _is_date_range(obj):
 
 def _is_value_within_options(value, dropdown_options, allow_list=False):
     if isinstance(value, list):
-        return allow_list and set(map(str, value)).issubset(set(dropdown_options))
+        return allow_list and set(map(str, value)).issubset(dropdown_options)
     return str(value) in dropdown_options
 
 
@@ -133,12 +239,16 @@ class ParameterizedQuery(object):
             raise InvalidParameterError(invalid_parameter_names)
         else:
             self.parameters.update(parameters)
-            self.query = mustache_render(
-                self.template, join_parameter_list_values(parameters, self.schema)
+            self.query = self.compiled.render(
+                join_parameter_list_values(parameters, self.schema)
             )
 
         return self
 
+    @property
+    def compiled(self):
+        return compile_template(self.template)
+
     def _valid(self, name, value):
         if not self.schema:
             return True
@@ -166,7 +276,7 @@ class ParameterizedQuery(object):
             ),
             "query": lambda value: _is_value_within_options(
                 value,
-                [v["value"] for v in dropdown_values(query_id, self.org)],
+                dropdown_value_set(query_id, self.org),
                 allow_multiple_values,
             ),
             "date": _is_date,
@@ -188,8 +298,8 @@ class ParameterizedQuery(object):
 
     @property
     def missing_params(self):
-        query_parameters = set(_collect_query_parameters(self.template))
-        return set(query_parameters) - set(_parameter_names(self.parameters))
+        query_parameters = set(self.compiled.parameters)
+        return query_parameters - set(_parameter_names(self.parameters))
 
     @property
     def text(self):
@@ -0,0 +1,136 @@
+"""
+Full text search of queries and dashboards.
+
+Searchable models have a weighted `search_vector` column, computed by
+Postgres from the searched columns and indexed with GIN. Search terms
+are parsed into a `tsquery` of word prefixes and matches are ranked by
+`ts_rank`. The `simple` configuration doesn't split CJK text into words,
+so names and descriptions also have trigram indexes, which serve
+substring matching with `ilike`.
+"""
+import re
+from typing import Optional
+
+from sqlalchemy import DDL, event, false, func, literal, or_
+
+from .base import db
+
+SEARCH_REGCONFIG = "pg_catalog.simple"
+
+# Positions in a tsvector are capped anyway, longer texts only make
+# indexing slower and may exceed the tsvector size limit
+SEARCH_MAX_TEXT_LENGTH = 100000
+
+_TOKEN_RE = re.compile(r'"[^"]*"?|[()]|[^\s()"]+')
+
+event.listen(
+    db.metadata, "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+
+
+def search_vector_expression(*weighted: tuple[str, str]) -> str:
+    """
+    Get the SQL expression of a search vector.
+
+    Arguments are `(text expression, weight)` pairs, e.g.
+    `("coalesce(name, '')", "A")`.
+    """
+    return " || ".join(
+        f"setweight(to_tsvector('{SEARCH_REGCONFIG}', {expression}), '{weight}')"
+        for expression, weight in weighted
+    )
+
+
+def trigram_index(name: str, column: str) -> db.Index:
+    return db.Index(
+        name, column,
+        postgresql_using="gin", postgresql_ops={column: "gin_trgm_ops"},
+    )
+
+
+def parse_search_query(term: str) -> str:
+    """
+    Parse a search term into `tsquery` text.
+
+    Words match as prefixes and all of them must match, unless separated
+    by `or`. Words prefixed with `-` must not match, double quotes match
+    a phrase and parentheses group words. Returns an empty string when
+    there is nothing to search.
+    """
+    expression, _ = _parse_group(_TOKEN_RE.findall(term), 0)
+    return expression or ""
+
+
+def _parse_group(
+    tokens: list[str], pos: int, nested: bool = False
+) -> tuple[Optional[str], int]:
+    clauses = []
+    terms = []
+    negate = False
+    while pos < len(tokens):
+        token = tokens[pos]
+        pos += 1
+        if token == ")":
+            if nested:
+                break
+            continue
+        if token.lower() == "or" and not negate:
+            if terms:
+                clauses.append(" & ".join(terms))
+                terms = []
+            continue
+        if token.startswith("-"):
+            negate = True
+            token = token[1:]
+            if not token:
+                continue
+        if token == "(":
+            expression, pos = _parse_group(tokens, pos, nested=True)
+            expression = expression and f"({expression})"
+        else:
+            expression = _to_lexeme(token)
+        if expression:
+            terms.append(f"!{expression}" if negate else expression)
+        negate = False
+    if terms:
+        clauses.append(" & ".join(terms))
+    return " | ".join(clauses) or None, pos
+
+
+def _to_lexeme(token: str) -> Optional[str]:
+    phrase = token.startswith('"')
+    text = token.strip('"').strip()
+    if not text:
+        return None
+    # Quoted, so that operators in the text are searched as is
+    quoted = "'{}'".format(text.replace("\\", "\\\\").replace("'", "''"))
+    return quoted if phrase else f"{quoted}:*"
+
+
+def substring_pattern(term: str) -> str:
+    """Get the `ilike` pattern matching the term anywhere."""
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def search_match(search_vector, term: str, substring_columns=()):
+    """
+    Get the filter and the rank expression of a search.
+
+    Rows match when the search vector matches the parsed term or, for
+    any of `substring_columns`, when the column contains the term.
+    """
+    clauses = []
+    rank = literal(0.0)
+    tsquery_text = parse_search_query(term)
+    if tsquery_text:
+        tsquery = func.to_tsquery(SEARCH_REGCONFIG, tsquery_text)
+        clauses.append(search_vector.op("@@", is_comparison=True)(tsquery))
+        rank = func.ts_rank(search_vector, tsquery)
+    if term.strip():
+        pattern = substring_pattern(term.strip())
+        clauses.extend(
+            column.ilike(pattern, escape="\\") for column in substring_columns
+        )
+    return or_(false(), *clauses), rank
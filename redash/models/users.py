@@ -9,13 +9,14 @@ from flask import url_for, request_started
 from flask_login import current_user, AnonymousUserMixin, UserMixin
 from passlib.apps import custom_app_context as pwd_context
 # from sqlalchemy.exc import DBAPIError
+from sqlalchemy import cast, column, values
 from sqlalchemy.dialects import postgresql
 
 from sqlalchemy_utils import EmailType
 from sqlalchemy_utils.models import generic_repr
 
-from redash import redis_connection
-from redash.utils import generate_token, utcnow, dt_from_timestamp
+from redash import redis_connection, settings
+from redash.utils import generate_token, json_dumps, utcnow, dt_from_timestamp
 
 from .base import db, Column, GFKBase, key_type, primary_key
 from .mixins import TimestampMixin, BelongsToOrgMixin
@@ -25,33 +26,84 @@ logger = logging.getLogger(__name__)
 
 
 LAST_ACTIVE_KEY = "users:last_active_at"
+LAST_ACTIVE_SYNC_BATCH_SIZE = 1000
+
+# Remove fields only if they still hold the given values, i.e. were not
+# updated since read. ARGV holds field and value pairs.
+_REMOVE_SYNCED_SCRIPT = """
+local removed = 0
+for i = 1, #ARGV, 2 do
+    if redis.call('HGET', KEYS[1], ARGV[i]) == ARGV[i + 1] then
+        removed = removed + redis.call('HDEL', KEYS[1], ARGV[i])
+    end
+end
+return removed
+"""
+
+# user_id -> time.monotonic() of the last active_at written to Redis
+_active_at_written = {}
 
 
 def sync_last_active_at():
     """
-    Update User model with the active_at timestamp from Redis. We first fetch
-    all the user_ids to update, and then fetch the timestamp to minimize the
-    time between fetching the value and updating the DB. This is because there
-    might be a more recent update we skip otherwise.
+    Update User model with the active_at timestamps from Redis, with a
+    bulk update per batch of users. Synced timestamps are removed from
+    Redis only if they didn't change meanwhile, so that more recent
+    updates are synced next time. Returns number of users synced.
     """
-    user_ids = redis_connection.hkeys(LAST_ACTIVE_KEY)
-    for user_id in user_ids:
-        timestamp = redis_connection.hget(LAST_ACTIVE_KEY, user_id)
-        active_at = dt_from_timestamp(timestamp)
-        user = User.query.filter(User.id == user_id).first()
-        if user:
-            user.active_at = active_at
-        redis_connection.hdel(LAST_ACTIVE_KEY, user_id)
-    db.session.commit()
+    timestamps = redis_connection.hgetall(LAST_ACTIVE_KEY)
+    items = list(timestamps.items())
+    remove_synced = redis_connection.register_script(_REMOVE_SYNCED_SCRIPT)
+    for i in range(0, len(items), LAST_ACTIVE_SYNC_BATCH_SIZE):
+        batch = items[i:i + LAST_ACTIVE_SYNC_BATCH_SIZE]
+        active = values(
+            column("id", db.Integer), column("active_at", db.Text), name="active"
+        ).data(
+            [
+                (int(user_id), json_dumps(dt_from_timestamp(timestamp)))
+                for user_id, timestamp in batch
+            ]
+        )
+        db.session.execute(
+            User.__table__.update()
+            .where(User.id == active.c.id)
+            .values(
+                details=db.func.jsonb_set(
+                    User.details,
+                    "{active_at}",
+                    cast(active.c.active_at, postgresql.JSONB),
+                )
+            )
+        )
+        db.session.commit()
+        remove_synced(
+            keys=[LAST_ACTIVE_KEY], args=list(itertools.chain.from_iterable(batch))
+        )
+    return len(items)
+
+
+def reset_active_at_throttle():
+    _active_at_written.clear()
 
 
 def update_user_active_at(sender, *args, **kwargs):
     """
     Used as a Flask request_started signal callback that adds
-    the current user's details to Redis
+    the current user's details to Redis, at most once per
+    `USER_ACTIVE_AT_INTERVAL` seconds for every user of the process.
     """
     if current_user.is_authenticated and not current_user.is_api_user():
-        redis_connection.hset(LAST_ACTIVE_KEY, current_user.id, int(time.time()))
+        user_id = current_user.id
+        now = time.monotonic()
+        interval = settings.S.USER_ACTIVE_AT_INTERVAL
+        if now - _active_at_written.get(user_id, -interval) < interval:
+            return
+        if len(_active_at_written) >= 10000:
+            for written_id, written_at in list(_active_at_written.items()):
+                if now - written_at >= interval:
+                    _active_at_written.pop(written_id, None)
+        _active_at_written[user_id] = now
+        redis_connection.hset(LAST_ACTIVE_KEY, user_id, int(time.time()))
 
 
 def init_app(app):
@@ -109,7 +161,12 @@ class User(
     )
 
     __tablename__ = "users"
-    __table_args__ = (db.Index("users_org_id_email", "org_id", "email", unique=True),)
+    __table_args__ = (
+        db.Index("users_org_id_email", "org_id", "email", unique=True),
+        # Sort keys of the list, see `order_results`
+        db.Index("ix_users_created_at_id", "created_at", "id"),
+        db.Index("ix_users_name_id", "name", "id"),
+    )
 
     def __str__(self):
         return "%s (%s)" % (self.name, self.email)
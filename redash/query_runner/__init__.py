@@ -1,4 +1,5 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import ExitStack
 from dateutil import parser
 from functools import wraps
@@ -108,6 +109,22 @@ def find_last_keyword_idx(parsed_query):
             return i
     return -1
 
+
+def run_concurrently(func, items, max_workers=None):
+    """
+    Call `func` for each of `items` in threads, return results in order.
+
+    Meant for independent catalog queries, e.g. of the schema, bounded
+    by the `SCHEMA_CATALOG_CONCURRENCY` setting.
+    """
+    items = list(items)
+    max_workers = max_workers or settings.S.SCHEMA_CATALOG_CONCURRENCY
+    if len(items) < 2 or max_workers < 2:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as pool:
+        return list(pool.map(func, items))
+
+
 class InterruptException(Exception):
     pass
 
@@ -239,6 +256,19 @@ class BaseQueryRunner(object):
     def get_schema(self, get_stats=False):
         raise NotSupported()
 
+    def get_tables_metadata(self):
+        """
+        Get metadata of tables by name, fetched in bulk: the `fingerprint`,
+        which changes whenever the table definition changes, for
+        incremental schema refresh, and other keys added to the schema,
+        e.g. row counts.
+        """
+        raise NotSupported()
+
+    def get_tables_schema(self, table_names):
+        """Get schema of the tables only, see `get_tables_metadata`."""
+        raise NotSupported()
+
     def _handle_run_query_error(self, error):
         if error is None:
             return
@@ -286,10 +316,15 @@ class BaseSQLQueryRunner(BaseQueryRunner):
         return []
 
     def _get_tables_stats(self, tables_dict):
-        for t in tables_dict.keys():
-            if isinstance(tables_dict[t], dict):
-                res = self._run_query_internal("select count(*) as cnt from %s" % t)
-                tables_dict[t]["size"] = res[0]["cnt"]
+        tables = [t for t in tables_dict.keys() if isinstance(tables_dict[t], dict)]
+
+        def count(table):
+            res = self._run_query_internal("select count(*) as cnt from %s" % table)
+            return res[0]["cnt"]
+
+        # Tables are counted independently, in parallel
+        for table, size in zip(tables, run_concurrently(count, tables)):
+            tables_dict[table]["size"] = size
 
     @property
     def supports_auto_limit(self):
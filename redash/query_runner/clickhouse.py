@@ -1,5 +1,6 @@
 import logging
 import re
+import time
 from typing import Any, Optional, Tuple
 from urllib.parse import urlparse, ParseResult as URL
 from uuid import uuid4
@@ -22,11 +23,23 @@ from redash.utils import json_dumps, json_loads
 
 logger = logging.getLogger(__name__)
 
+# Rollup tables by data source URL and database, with expiration time
+ROLLUPS_CACHE_TTL = 60
+_rollups_cache = {}
+
+SYSTEM_DATABASES = "'system', 'information_schema', 'INFORMATION_SCHEMA'"
+# Tables per `system.columns` query of incremental schema refresh
+SCHEMA_TABLES_BATCH_SIZE = 500
+
 
 def split_multi_query(query):
     return [st for st in split_sql_statements(query) if st != ""]
 
 
+def _quote(value: str) -> str:
+    return "'{}'".format(value.replace("\\", "\\\\").replace("'", "\\'"))
+
+
 class ClickHouse(BaseSQLQueryRunner):
     noop_query = "SELECT 1"
 
@@ -49,10 +62,15 @@ class ClickHouse(BaseSQLQueryRunner):
                     "title": "Verify SSL certificate",
                     "default": True,
                 },
+                "route_to_rollups": {
+                    "type": "boolean",
+                    "title": "Route aggregate queries to stream rollups",
+                    "default": False,
+                },
             },
             "order": ["url", "user", "password", "dbname"],
             "required": ["dbname"],
-            "extra_options": ["timeout", "verify"],
+            "extra_options": ["timeout", "verify", "route_to_rollups"],
             "secret": ["password"],
         }
 
@@ -88,6 +106,8 @@ class ClickHouse(BaseSQLQueryRunner):
         self, query: str, user: Any
     ) -> Tuple[Optional[str], Optional[str]]:
         queries = split_multi_query(query)
+        if self.configuration.get("route_to_rollups"):
+            queries = self._route_to_rollups(query, queries)
 
         if not queries:
             data = None
@@ -119,15 +139,94 @@ class ClickHouse(BaseSQLQueryRunner):
 
         return data, error
 
+    def _route_to_rollups(self, query: str, queries: list) -> list:
+        """
+        Rewrite queries to read stream rollups where rollups cover them,
+        unless the query has a `no_rollup` comment, see
+        `dingolytics.queries.rollups`.
+        """
+        from dingolytics.queries.rollups import (
+            has_no_rollup_hint,
+            rewrite_query,
+        )
+
+        if has_no_rollup_hint(query):
+            return queries
+        results = []
+        for query in queries:
+            try:
+                result = rewrite_query(
+                    query, self._get_rollups(),
+                    self.configuration.get("dbname"),
+                )
+            except Exception:
+                logger.exception("Failed to route query to rollup")
+                result = None
+            if result is None:
+                results.append(query)
+                continue
+            rewritten, rollup = result
+            logger.info(
+                "Routed query from %s to rollup %s: %r -> %r",
+                rollup.source_table, rollup.table, query, rewritten
+            )
+            results.append(rewritten)
+        return results
+
+    def _get_rollups(self) -> dict:
+        """Get rollup tables of the database by source table, cached."""
+        from dingolytics.presets import default_presets
+        from dingolytics.queries.rollups import (
+            ROLLUP_COMMENT_PREFIX,
+            RollupTable,
+            parse_rollup_comment,
+            parse_ttl_days,
+        )
+
+        key = (self.configuration.get("url"), self.configuration.get("dbname"))
+        expires_at, rollups = _rollups_cache.get(key, (0, {}))
+        if expires_at > time.monotonic():
+            return rollups
+
+        rollups = {}
+        try:
+            # Rollup tables, and tables which expire for their retention
+            result = self._clickhouse_query(
+                "SELECT name, comment, engine_full FROM system.tables "
+                "WHERE database = currentDatabase() "
+                f"AND (startsWith(comment, '{ROLLUP_COMMENT_PREFIX}') "
+                "OR position(engine_full, ' TTL ') > 0)"
+            )
+        except Exception as exc:
+            logger.warning("Failed to get rollup tables: %s", exc)
+            result = {"rows": []}
+        ttl_days = {
+            row["name"]: parse_ttl_days(row["engine_full"])
+            for row in result["rows"]
+        }
+        presets = default_presets()
+        for row in result["rows"]:
+            preset, rollup = parse_rollup_comment(row["comment"]) or ("", "")
+            spec = presets.get_rollup_spec(self.type(), preset, rollup)
+            suffix = f"_{rollup}"
+            if spec is None or not row["name"].endswith(suffix):
+                continue
+            source_table = row["name"][:-len(suffix)]
+            rollups.setdefault(source_table, []).append(RollupTable(
+                table=row["name"], source_table=source_table, spec=spec,
+                ttl_days=ttl_days.get(row["name"]),
+                source_ttl_days=ttl_days.get(source_table),
+            ))
+        _rollups_cache[key] = (time.monotonic() + ROLLUPS_CACHE_TTL, rollups)
+        return rollups
+
     def _get_tables(self, schema):
-        system_databases = ', '.join([f"'{db}'" for db in (
-            "system",
-            "information_schema",
-            "INFORMATION_SCHEMA",
-        )])
+        return self._get_columns(schema, f"database NOT IN ({SYSTEM_DATABASES})")
+
+    def _get_columns(self, schema: dict, condition: str) -> list:
         query = (
-            "SELECT database, table, name FROM system.columns"
-            f" WHERE database NOT IN ({system_databases})"
+            "SELECT database, table, name, type FROM system.columns "
+            f"WHERE {condition} ORDER BY database, table, position"
         )
         results, error = self.run_query(query, None)
         if error is not None:
@@ -136,8 +235,64 @@ class ClickHouse(BaseSQLQueryRunner):
         for row in results["rows"]:
             table_name = "{}.{}".format(row["database"], row["table"])
             if table_name not in schema:
-                schema[table_name] = {"name": table_name, "columns": []}
+                schema[table_name] = {
+                    "name": table_name, "columns": [], "column_types": {}
+                }
+            # Columns are names, as of the other query runners, with types
+            # by name next to them
             schema[table_name]["columns"].append(row["name"])
+            schema[table_name]["column_types"][row["name"]] = row["type"]
+        return list(schema.values())
+
+    def get_tables_metadata(self) -> dict:
+        """
+        Get engines, keys and sizes of tables with one query.
+
+        Tables are fingerprinted by metadata modification time and a hash
+        of the `CREATE` query, so that any `ALTER` changes the fingerprint.
+        Sizes are totals of active parts, for `MergeTree` tables only.
+        """
+        result = self._clickhouse_query(
+            "SELECT concat(t.database, '.', t.name) AS table_name, "
+            "concat(toString(toUnixTimestamp(t.metadata_modification_time)), "
+            "':', toString(cityHash64(t.create_table_query))) AS fingerprint, "
+            "t.engine AS engine, t.sorting_key AS sorting_key, "
+            "t.partition_key AS partition_key, t.primary_key AS primary_key, "
+            "p.rows AS rows, p.bytes AS bytes, p.parts AS parts "
+            "FROM system.tables AS t "
+            "LEFT JOIN ("
+            "SELECT database, table, sum(rows) AS rows, "
+            "sum(bytes_on_disk) AS bytes, count() AS parts "
+            "FROM system.parts WHERE active GROUP BY database, table"
+            ") AS p ON p.database = t.database AND p.table = t.name "
+            f"WHERE t.database NOT IN ({SYSTEM_DATABASES}) AND NOT t.is_temporary"
+        )
+        metadata = {}
+        for row in result["rows"]:
+            table = {
+                "fingerprint": row["fingerprint"],
+                "engine": row["engine"],
+            }
+            for key in ("sorting_key", "partition_key", "primary_key"):
+                if row[key]:
+                    table[key] = row[key]
+            if row["engine"].endswith("MergeTree"):
+                table.update(
+                    rows=int(row["rows"] or 0),
+                    bytes=int(row["bytes"] or 0),
+                    parts=int(row["parts"] or 0),
+                )
+            metadata[row["table_name"]] = table
+        return metadata
+
+    def get_tables_schema(self, table_names: list) -> list:
+        schema = {}
+        for i in range(0, len(table_names), SCHEMA_TABLES_BATCH_SIZE):
+            names = ", ".join(
+                _quote(name)
+                for name in table_names[i:i + SCHEMA_TABLES_BATCH_SIZE]
+            )
+            self._get_columns(schema, f"concat(database, '.', table) IN ({names})")
         return list(schema.values())
 
     def _send_query(
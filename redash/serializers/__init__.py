@@ -10,7 +10,7 @@ from rq.job import JobStatus
 from rq.timeouts import JobTimeoutException
 
 from redash import models
-from redash.permissions import has_access, view_only
+from redash.permissions import get_accessible_query_ids, view_only
 from redash.utils import json_loads
 from redash.models.parameterized_query import ParameterizedQuery
 
@@ -222,10 +222,22 @@ def serialize_dashboard(obj, with_widgets=False, user=None, with_favorite_state=
     widgets = []
 
     if with_widgets:
-        for w in obj.widgets:
+        dashboard_widgets = obj.get_widgets()
+        accessible_ids = set()
+        if user:
+            accessible_ids = get_accessible_query_ids(
+                [
+                    w.visualization.query_rel
+                    for w in dashboard_widgets
+                    if w.visualization_id is not None
+                ],
+                user,
+                view_only,
+            )
+        for w in dashboard_widgets:
             if w.visualization_id is None:
                 widgets.append(serialize_widget(w))
-            elif user and has_access(w.visualization.query_rel, user, view_only):
+            elif w.visualization.query_id in accessible_ids:
                 widgets.append(serialize_widget(w))
             else:
                 widget = project(
@@ -68,6 +68,17 @@ class Settings(BaseSettings):
     INVITATION_TOKEN_MAX_AGE: int = 3600 * 24 * 7
     SCHEMAS_REFRESH_SCHEDULE: int = 30
     SCHEMA_RUN_TABLE_SIZE_CALCULATIONS: bool = False
+    SCHEMA_REFRESH_CONCURRENCY: int = 2
+    SCHEMA_CATALOG_CONCURRENCY: int = 4
+    # Schema changes are logged for clients refreshing at least that often
+    SCHEMA_CHANGES_TTL: int = 3600 * 24
+    PERMISSIONS_CACHE_TTL: int = 30
+    PAGINATION_EXACT_COUNT_LIMIT: int = 10000
+    PAGINATION_COUNT_CACHE_TTL: int = 60
+    USER_ACTIVE_AT_INTERVAL: int = 60
+    AUTH_CACHE_TTL: int = 300
+    AUTH_CACHE_NEGATIVE_TTL: int = 30
+    AUTH_CACHE_LOCAL_TTL: int = 5
     SCHEDULED_QUERY_TIME_LIMIT: int = -1
     ADHOC_QUERY_TIME_LIMIT: int = -1
     JOB_EXPIRY_TIME: int = 3600 * 12
@@ -80,6 +91,31 @@ class Settings(BaseSettings):
 
     # Vector settings
     VECTOR_INGEST_URL: str = "http://localhost:8180"
+    VECTOR_CONFIG_SYNC_DELAY: int = 5
+    VECTOR_API_URL: str = "http://vector:8686/graphql"
+    # Stream tables provisioning
+    STREAM_PROVISIONING_DELAY: int = 2
+    STREAM_PROVISIONING_RETRIES: int = 5
+    STREAM_PROVISIONING_RETRY_DELAY: int = 30
+
+    # Stream metrics settings, see `dingolytics.ingest.metrics`
+    STREAM_METRICS_ENABLED: bool = True
+    STREAM_METRICS_INTERVAL: int = 10
+    STREAM_METRICS_RETENTION: int = 360
+
+    # Audit log settings, see `dingolytics.auditlog`
+    AUDITLOG_STREAM_MAXLEN: int = 100000
+    AUDITLOG_BATCH_SIZE: int = 500
+    AUDITLOG_FLUSH_INTERVAL: int = 5
+    AUDITLOG_WEBHOOK_RETRIES: int = 5
+    AUDITLOG_WEBHOOK_RETRY_DELAY: int = 30
+    # Insert events into the `_internal_audit_events` ClickHouse stream
+    AUDITLOG_CLICKHOUSE_ENABLED: bool = False
+    # Days of events kept in Postgres, 0 to keep all of them
+    AUDITLOG_POSTGRES_RETENTION_DAYS: int = 0
+    AUDITLOG_CLEANUP_BATCH_SIZE: int = 10000
+    # Days counted by the recent activity feed, besides the current one
+    RECENT_ACTIVITY_DAYS: int = 7
 
     # Format settings
     FORMAT_DATE: str = "DD/MM/YY"
@@ -188,6 +188,9 @@ def json_dumps(data, *args, **kwargs):
 
 
 def mustache_render(template, context=None, **kwargs):
+    # Renderers keep the context of the render in progress, so they are
+    # not shared. Templates may be `pystache.parse` results, which makes
+    # rendering cheap whatever the renderer.
     renderer = pystache.Renderer(escape=lambda u: u)
     return renderer.render(template, context, **kwargs)
 
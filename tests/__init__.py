@@ -6,7 +6,9 @@ from unittest import TestCase
 from dingolytics.defaults import workers
 from redash import limiter, redis_connection
 from redash.app import create_app
+from redash.authentication.api_key_cache import api_key_cache
 from redash.models import db
+from redash.models.users import reset_active_at_throttle
 from redash.utils import json_dumps
 from tests.factories import Factory, user_factory
 
@@ -48,6 +50,8 @@ class BaseTestCase(TestCase):
         db.engine.dispose()
         self.app_ctx.pop()
         redis_connection.flushdb()
+        api_key_cache.clear_local()
+        reset_active_at_throttle()
         workers.default.immediate = False
 
     def make_request(
@@ -1,9 +1,11 @@
+from flask import g
+from mock import patch
 from tests import BaseTestCase
 
 from redash.models import ApiKey, Dashboard, AccessPermission, db
 from redash.permissions import ACCESS_TYPE_MODIFY
 from redash.serializers import serialize_dashboard
-from redash.utils import json_loads
+from redash.utils import json_dumps, json_loads
 
 
 class TestDashboardListResource(BaseTestCase):
@@ -95,6 +97,119 @@ class TestDashboardResourceGet(BaseTestCase):
         rv = self.make_request("get", "/api/dashboards/-1")
         self.assertEqual(rv.status_code, 404)
 
+    def test_get_dashboard_runs_bounded_number_of_queries(self):
+        def create_dashboard(widgets_count):
+            dashboard = self.factory.create_dashboard()
+            for _ in range(widgets_count):
+                data_source = self.factory.create_data_source(
+                    group=self.factory.org.default_group
+                )
+                query = self.factory.create_query(data_source=data_source)
+                self.factory.create_widget(
+                    dashboard=dashboard,
+                    visualization=self.factory.create_visualization(query_rel=query),
+                )
+            db.session.commit()
+            return dashboard
+
+        def count_queries(dashboard):
+            db.session.expire_all()
+            with self.app.test_request_context():
+                result = serialize_dashboard(
+                    dashboard, with_widgets=True, user=self.factory.user,
+                    with_favorite_state=False,
+                )
+                return len(result["widgets"]), g.get("queries_count", 0)
+
+        small = count_queries(create_dashboard(2))
+        large = count_queries(create_dashboard(20))
+
+        self.assertEqual(small[0], 2)
+        self.assertEqual(large[0], 20)
+        self.assertEqual(large[1], small[1])
+        self.assertLessEqual(large[1], 8)
+
+
+class TestDashboardResultsResource(BaseTestCase):
+    def get_lines(self, dashboard, args=""):
+        rv = self.make_request(
+            "get", "/api/dashboards/{}/results{}".format(dashboard.id, args)
+        )
+        self.assertEqual(rv.status_code, 200)
+        return [json_loads(line) for line in rv.data.decode().splitlines()]
+
+    def test_returns_results_once_per_query(self):
+        dashboard = self.factory.create_dashboard()
+        query = self.factory.create_query()
+        query.latest_query_data = self.factory.create_query_result(
+            data=json_dumps({"columns": [], "rows": [{"a": 1}, {"a": 2}, {"a": 3}]})
+        )
+        vis = self.factory.create_visualization(query_rel=query)
+        w1 = self.factory.create_widget(
+            dashboard=dashboard, visualization=vis, options='{"row_limit": 1}'
+        )
+        w2 = self.factory.create_widget(
+            dashboard=dashboard, visualization=vis, options='{"row_limit": 2}'
+        )
+        w3 = self.factory.create_widget(dashboard=dashboard)
+        db.session.commit()
+
+        lines = {line["query_id"]: line for line in self.get_lines(dashboard)}
+
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[query.id]["widget_ids"], [w1.id, w2.id])
+        self.assertEqual(len(lines[query.id]["query_result"]["data"]["rows"]), 2)
+        self.assertTrue(lines[query.id]["truncated"])
+        self.assertFalse(lines[query.id]["stale"])
+        other = lines[w3.visualization.query_id]
+        self.assertIsNone(other["query_result"])
+        self.assertTrue(other["stale"])
+
+    def test_returns_results_shared_by_queries(self):
+        dashboard = self.factory.create_dashboard()
+        query_result = self.factory.create_query_result()
+        queries = [self.factory.create_query() for _ in range(2)]
+        for query in queries:
+            query.latest_query_data = query_result
+            self.factory.create_widget(
+                dashboard=dashboard,
+                visualization=self.factory.create_visualization(query_rel=query),
+            )
+        db.session.commit()
+
+        lines = {line["query_id"]: line for line in self.get_lines(dashboard)}
+
+        self.assertEqual(set(lines), {query.id for query in queries})
+        for line in lines.values():
+            self.assertEqual(line["query_result"]["id"], query_result.id)
+            self.assertFalse(line["stale"])
+
+    def test_skips_restricted_widgets(self):
+        dashboard = self.factory.create_dashboard()
+        restricted_ds = self.factory.create_data_source(
+            group=self.factory.create_group()
+        )
+        query = self.factory.create_query(data_source=restricted_ds)
+        self.factory.create_widget(
+            dashboard=dashboard,
+            visualization=self.factory.create_visualization(query_rel=query),
+        )
+        db.session.commit()
+
+        self.assertEqual(self.get_lines(dashboard), [])
+
+    @patch("redash.handlers.dashboards.enqueue_query")
+    def test_refreshes_stale_results(self, enqueue_query):
+        enqueue_query.return_value.id = "task"
+        widget = self.factory.create_widget()
+        db.session.commit()
+
+        lines = self.get_lines(widget.dashboard, "?refresh=true")
+
+        self.assertEqual(lines[0]["job"]["id"], "huey:task")
+        self.assertEqual(lines[0]["job"]["status"], 1)
+        self.assertEqual(enqueue_query.call_args.kwargs["query"], "SELECT 1")
+
 
 class TestDashboardResourcePost(BaseTestCase):
     def test_update_dashboard(self):
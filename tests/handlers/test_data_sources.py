@@ -24,6 +24,48 @@ class TestDataSourceGetSchema(BaseTestCase):
         )
         self.assertEqual(response.status_code, 404)
 
+    def test_filters_and_paginates_tables(self):
+        schema = [
+            {"name": "events", "columns": ["id"]},
+            {"name": "events_per_minute", "columns": ["minute"]},
+            {"name": "users", "columns": ["id"]},
+        ]
+        with patch.object(PostgreSQL, "get_schema", return_value=schema):
+            response = self.make_request(
+                "get",
+                "/api/data_sources/{}/schema?q=EVENTS&page=2&page_size=1".format(
+                    self.factory.data_source.id
+                ),
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["count"], 2)
+        self.assertEqual(
+            response.json["schema"], [{"name": "events_per_minute", "columns": ["minute"]}]
+        )
+
+    def test_returns_changes_since(self):
+        with patch.object(
+            PostgreSQL, "get_schema", return_value=[{"name": "events", "columns": []}]
+        ):
+            self.factory.data_source.get_schema(refresh=True)
+        response = self.make_request(
+            "get",
+            "/api/data_sources/{}/schema?since=0".format(self.factory.data_source.id),
+        )
+        self.assertEqual(response.json["schema"], [{"name": "events", "columns": []}])
+        self.assertEqual(response.json["removed"], [])
+        # Changes as old are no longer logged
+        self.assertTrue(response.json["full"])
+
+        response = self.make_request(
+            "get",
+            "/api/data_sources/{}/schema?since={}".format(
+                self.factory.data_source.id, response.json["updated_at"]
+            ),
+        )
+        self.assertEqual(response.json["schema"], [])
+        self.assertFalse(response.json["full"])
+
 
 class TestDataSourceListGet(BaseTestCase):
     def test_returns_each_data_source_once(self):
@@ -1,8 +1,22 @@
+import datetime
+
 from werkzeug.exceptions import BadRequest
+from sqlalchemy import column, select
+from sqlalchemy.dialects import postgresql
 
-from redash.handlers.base import paginate
+from redash import models
+from redash.app import create_app
+from redash.handlers.base import (
+    SortKey,
+    count_results,
+    decode_cursor,
+    encode_cursor,
+    get_sort_key,
+    keyset_filter,
+    paginate,
+)
 from unittest import TestCase
-from mock import MagicMock
+from mock import MagicMock, patch
 
 
 class DummyResults(object):
@@ -14,29 +28,165 @@ dummy_results = DummyResults()
 
 class TestPaginate(TestCase):
     def setUp(self):
+        self.app = create_app()
         self.query_set = MagicMock()
-        self.query_set.count = MagicMock(return_value=102)
-        self.query_set.paginate = MagicMock(return_value=dummy_results)
+        self.query_set.offset.return_value.limit.return_value.all.return_value = (
+            dummy_results.items
+        )
+        patcher = patch(
+            "redash.handlers.base.count_results", return_value=(102, False)
+        )
+        self.count_results = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def paginate(self, *args, url="/", **kwargs):
+        with self.app.test_request_context(url):
+            return paginate(self.query_set, *args, **kwargs)
 
     def test_returns_paginated_results(self):
-        page = paginate(self.query_set, 1, 25, lambda x: x)
+        page = self.paginate(1, 25, lambda x: x)
         self.assertEqual(page["page"], 1)
         self.assertEqual(page["page_size"], 25)
         self.assertEqual(page["count"], 102)
         self.assertEqual(page["results"], dummy_results.items)
+        self.assertIsNone(page["next_cursor"])
+        self.query_set.offset.assert_called_with(0)
 
     def test_raises_error_for_bad_page(self):
-        self.assertRaises(
-            BadRequest, lambda: paginate(self.query_set, -1, 25, lambda x: x)
+        self.assertRaises(BadRequest, lambda: self.paginate(-1, 25, lambda x: x))
+        self.assertRaises(BadRequest, lambda: self.paginate(6, 25, lambda x: x))
+
+    def test_allows_any_page_with_approximate_count(self):
+        self.count_results.return_value = (102, True)
+        page = self.paginate(6, 25, lambda x: x)
+        self.assertTrue(page["count_is_approximate"])
+        self.query_set.offset.assert_called_with(125)
+
+    def test_raises_error_for_bad_page_size(self):
+        self.assertRaises(BadRequest, lambda: self.paginate(1, 251, lambda x: x))
+        self.assertRaises(BadRequest, lambda: self.paginate(1, -1, lambda x: x))
+
+    def test_returns_next_cursor_of_sorted_results(self):
+        sort_keys = [SortKey(column("name"), False), SortKey(column("id"), False)]
+        rows = [(i, "name", i) for i in range(26)]
+        query_set = self.query_set.add_columns.return_value
+        query_set.offset.return_value.limit.return_value.all.return_value = rows
+
+        page = self.paginate(1, 25, lambda x: x, sort_keys=sort_keys)
+        self.assertEqual(page["results"], list(range(25)))
+        self.assertEqual(decode_cursor(page["next_cursor"], 2), ["name", 24])
+        query_set.offset.return_value.limit.assert_called_with(26)
+
+    def test_pages_with_cursor(self):
+        sort_keys = [SortKey(column("name"), False), SortKey(column("id"), False)]
+        query_set = self.query_set.filter.return_value.add_columns.return_value
+        query_set.offset.return_value.limit.return_value.all.return_value = [
+            (25, "name", 25)
+        ]
+
+        page = self.paginate(
+            1, 25, lambda x: x, sort_keys=sort_keys,
+            url="/?cursor={}".format(encode_cursor(["name", 24])),
         )
+        self.assertEqual(page["results"], [25])
+        self.assertIsNone(page["next_cursor"])
+        query_set.offset.assert_called_with(0)
+
+    def test_raises_error_for_bad_cursor(self):
+        sort_keys = [SortKey(column("id"), False)]
         self.assertRaises(
-            BadRequest, lambda: paginate(self.query_set, 6, 25, lambda x: x)
+            BadRequest,
+            lambda: self.paginate(1, 25, lambda x: x, url="/?cursor=WzFd"),
         )
+        for cursor in ("x", encode_cursor([1, 2])):
+            self.assertRaises(
+                BadRequest,
+                lambda: self.paginate(
+                    1, 25, lambda x: x, sort_keys=sort_keys,
+                    url="/?cursor={}".format(cursor),
+                ),
+            )
 
-    def test_raises_error_for_bad_page_size(self):
-        self.assertRaises(
-            BadRequest, lambda: paginate(self.query_set, 1, 251, lambda x: x)
+
+class TestCountResults(TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.query_set = MagicMock()
+        self.query_set.order_by.return_value.statement = (
+            select(column("id")).where(column("id") > 1)
         )
-        self.assertRaises(
-            BadRequest, lambda: paginate(self.query_set, 1, -1, lambda x: x)
+        self.count = self.query_set.order_by.return_value.limit.return_value.count
+
+    def count_results(self, estimate, cached=None):
+        with self.app.app_context(), patch(
+            "redash.handlers.base.redis_connection"
+        ) as redis, patch(
+            "redash.handlers.base.estimate_count", return_value=estimate
+        ) as estimate_count:
+            redis.get.return_value = cached
+            return count_results(self.query_set), redis, estimate_count
+
+    def test_counts_few_results(self):
+        self.count.return_value = 102
+        count, redis, estimate_count = self.count_results(estimate=120)
+        self.assertEqual((102, False), count)
+        self.query_set.order_by.return_value.limit.assert_called_with(10001)
+        estimate_count.assert_not_called()
+        redis.set.assert_not_called()
+
+    def test_estimates_many_results(self):
+        self.count.return_value = 10001
+        count, redis, _ = self.count_results(estimate=120000)
+        self.assertEqual((120000, True), count)
+        self.assertEqual(120000, redis.set.call_args[0][1])
+
+    def test_returns_cached_estimate(self):
+        count, _, estimate_count = self.count_results(estimate=130000, cached="120000")
+        self.assertEqual((120000, True), count)
+        self.count.assert_not_called()
+        estimate_count.assert_not_called()
+
+
+class TestKeysetFilter(TestCase):
+    def compile(self, clause):
+        return str(
+            clause.compile(
+                dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+            )
+        )
+
+    def test_filters_after_values(self):
+        sort_keys = [
+            SortKey(column("name"), True),
+            SortKey(column("id"), True, nullable=False),
+        ]
+        self.assertEqual(
+            "name < 'a' OR name IS NULL OR name = 'a' AND id < 2",
+            self.compile(keyset_filter(sort_keys, ["a", 2])),
+        )
+        self.assertEqual(
+            "name IS NULL AND id < 2",
+            self.compile(keyset_filter(sort_keys, [None, 2])),
+        )
+
+    def test_sort_keys_of_not_null_columns(self):
+        app = create_app()
+        with app.app_context():
+            query_set = models.Query.query
+            for order in ("-created_at", "lowercase_name", "id"):
+                sort_key = get_sort_key(query_set, order)
+                self.assertFalse(sort_key.nullable)
+                self.assertNotIn("NULLS LAST", self.compile(sort_key.order_by()))
+            self.assertTrue(get_sort_key(query_set, "-query_results-runtime").nullable)
+            sort_key = get_sort_key(query_set, "-created_at")
+            self.assertEqual(
+                "queries.created_at < '2024-01-01'",
+                self.compile(sort_key.after("2024-01-01")),
+            )
+
+    def test_cursor_keeps_microseconds(self):
+        value = datetime.datetime(2024, 1, 1, 12, 0, 0, 123456)
+        self.assertEqual(
+            ["2024-01-01T12:00:00.123456", 1],
+            decode_cursor(encode_cursor([value, 1]), 2),
         )
@@ -1,5 +1,4 @@
 from tests import BaseTestCase
-from unittest import skip
 from redash import models
 from redash.models import db
 
@@ -59,7 +58,6 @@ class TestQueryResourceGet(BaseTestCase):
         )
         self.assertEqual(rv.status_code, 200)
 
-    @skip("Search is disabled for now.")
     def test_query_search(self):
         names = ["Harder", "Better", "Faster", "Stronger"]
         for name in names:
@@ -258,6 +256,25 @@ class TestQueryListResourceGet(BaseTestCase):
             [q1.id, q2.id, q3.id]
         )
 
+    def test_pages_with_cursor(self):
+        queries = [self.factory.create_query(name="Query {}".format(i)) for i in range(5)]
+
+        ids = []
+        rv = self.make_request("get", "/api/queries?order=name&page_size=2")
+        while True:
+            self.assertEqual(rv.json["count"], 5)
+            ids.extend(result["id"] for result in rv.json["results"])
+            if not rv.json["next_cursor"]:
+                break
+            rv = self.make_request(
+                "get",
+                "/api/queries?order=name&page_size=2&cursor={}".format(
+                    rv.json["next_cursor"]
+                ),
+            )
+
+        self.assertEqual([q.id for q in queries], ids)
+
     def test_filters_with_tags(self):
         q1 = self.factory.create_query(tags=["test"])
         self.factory.create_query()
@@ -267,7 +284,6 @@ class TestQueryListResourceGet(BaseTestCase):
         assert len(rv.json["results"]) == 1
         assert set([result["id"] for result in rv.json["results"]]) == set([q1.id])
 
-    @skip("Search is disabled for now.")
     def test_search_term(self):
         q1 = self.factory.create_query(name="Sales")
         q2 = self.factory.create_query(name="Q1 sales")
@@ -371,7 +387,6 @@ class TestQueryArchiveResourceGet(BaseTestCase):
             [q1.id, q2.id]
         )
 
-    @skip("Search is disabled for now.")
     def test_search_term(self):
         q1 = self.factory.create_query(name="Sales", is_archived=True)
         q2 = self.factory.create_query(name="Q1 sales", is_archived=True)
@@ -384,6 +399,21 @@ class TestQueryArchiveResourceGet(BaseTestCase):
         )
 
 
+class TestQueryRecentResourceGet(BaseTestCase):
+    def test_returns_queries_modified_by_user(self):
+        q1 = self.factory.create_query()
+        q2 = self.factory.create_query()
+        self.factory.create_query(user=self.factory.create_user())
+        db.session.commit()
+        q1.name = "Updated"
+        db.session.commit()
+
+        rv = self.make_request("get", "/api/queries/recent")
+
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual([q1.id, q2.id], [result["id"] for result in rv.json])
+
+
 class QueryRefreshTest(BaseTestCase):
     def setUp(self):
         super(QueryRefreshTest, self).setUp()
@@ -1,3 +1,5 @@
+from unittest.mock import patch
+
 from tests import BaseTestCase
 
 
@@ -22,3 +24,149 @@ class TestStreamListResource(BaseTestCase):
         )
         self.assertEqual(200, rv.status_code)
         # self.assertIsNone(DataSource.query.get(data_source.id))
+
+    def test_create_stream_with_invalid_ingest_tuning(self):
+        data_source = self.factory.create_data_source(type="clickhouse")
+        admin = self.factory.create_admin()
+        data = {
+            "data_source_id": data_source.id,
+            "name": "Test stream",
+            "db_table": "default_stream",
+            "ingest_volume": "huge",
+        }
+        rv = self.make_request("post", "/api/streams", data=data, user=admin)
+        self.assertEqual(400, rv.status_code)
+
+        data.update(ingest_volume="low", ingest_options={"buffer_type": "tape"})
+        rv = self.make_request("post", "/api/streams", data=data, user=admin)
+        self.assertEqual(400, rv.status_code)
+
+    def test_create_stream_with_invalid_table_options(self):
+        data_source = self.factory.create_data_source(type="clickhouse")
+        admin = self.factory.create_admin()
+        data = {
+            "data_source_id": data_source.id,
+            "name": "Test stream",
+            "db_table": "default_stream",
+            "db_table_options": {"partition_by": "year"},
+        }
+        rv = self.make_request("post", "/api/streams", data=data, user=admin)
+        self.assertEqual(400, rv.status_code)
+
+        data.update(db_table_options={"rollups": ["unknown"]})
+        rv = self.make_request("post", "/api/streams", data=data, user=admin)
+        self.assertEqual(400, rv.status_code)
+
+
+class TestStreamResource(BaseTestCase):
+    @patch("dingolytics.api.streams.schedule_vector_config_sync")
+    def test_update_stream_ingest_tuning(self, schedule_vector_config_sync):
+        stream = self.factory.create_stream()
+        admin = self.factory.create_admin()
+        data = {"ingest_volume": "high", "ingest_options": {"async_insert": True}}
+        rv = self.make_request(
+            "post", "/api/streams/{}".format(stream.id), data=data, user=admin,
+        )
+        self.assertEqual(200, rv.status_code)
+        self.assertEqual("high", rv.json["ingest_volume"])
+        self.assertEqual({"async_insert": True}, rv.json["ingest_options"])
+        schedule_vector_config_sync.assert_called_once()
+
+
+class TestStreamProvisionResource(BaseTestCase):
+    @patch("dingolytics.tasks.provision_stream.provision_stream_task")
+    def test_retry_provisioning(self, provision_stream_task):
+        stream = self.factory.create_stream()
+        stream.provisioning_state = "failed"
+        stream.provisioning_error = "Connection refused"
+        admin = self.factory.create_admin()
+        rv = self.make_request(
+            "post", "/api/streams/{}/provision".format(stream.id), user=admin,
+        )
+        self.assertEqual(200, rv.status_code)
+        self.assertEqual("pending", rv.json["provisioning_state"])
+        self.assertIsNone(rv.json["provisioning_error"])
+        provision_stream_task.assert_called_once_with(stream.id)
+
+    @patch("dingolytics.tasks.provision_stream.provision_stream_task")
+    def test_ready_stream_is_not_provisioned(self, provision_stream_task):
+        stream = self.factory.create_stream()
+        stream.provisioning_state = "ready"
+        admin = self.factory.create_admin()
+        rv = self.make_request(
+            "post", "/api/streams/{}/provision".format(stream.id), user=admin,
+        )
+        self.assertEqual(200, rv.status_code)
+        provision_stream_task.assert_not_called()
+
+
+class TestStreamMetricsResource(BaseTestCase):
+    @patch("dingolytics.api.streams.get_stream_metrics")
+    def test_get_stream_with_latest_metrics(self, get_stream_metrics):
+        get_stream_metrics.return_value = [{"rows": 10}]
+        stream = self.factory.create_stream()
+        rv = self.make_request("get", "/api/streams/{}".format(stream.id))
+        self.assertEqual(200, rv.status_code)
+        self.assertEqual({"rows": 10}, rv.json["metrics"])
+        get_stream_metrics.assert_called_once_with(stream.id, limit=1)
+
+    @patch("dingolytics.api.streams.get_stream_metrics")
+    def test_get_stream_metrics(self, get_stream_metrics):
+        get_stream_metrics.return_value = [{"rows": 10}, {"rows": 5}]
+        stream = self.factory.create_stream()
+        rv = self.make_request(
+            "get", "/api/streams/{}/metrics?limit=2".format(stream.id),
+        )
+        self.assertEqual(200, rv.status_code)
+        self.assertEqual(2, len(rv.json["metrics"]))
+        get_stream_metrics.assert_called_once_with(stream.id, limit=2)
+
+        rv = self.make_request(
+            "get", "/api/streams/{}/metrics?limit=0".format(stream.id),
+        )
+        self.assertEqual(400, rv.status_code)
+
+
+class TestStreamDeadLettersResource(BaseTestCase):
+    @patch("dingolytics.api.streams.get_stream_dead_letter_stats")
+    def test_get_dead_letter_stats(self, get_stream_dead_letter_stats):
+        get_stream_dead_letter_stats.return_value = {"total": 0, "reasons": []}
+        stream = self.factory.create_stream()
+        rv = self.make_request(
+            "get", "/api/streams/{}/dlq".format(stream.id),
+        )
+        self.assertEqual(200, rv.status_code)
+        self.assertEqual({"total": 0, "reasons": []}, rv.json)
+
+    @patch("dingolytics.api.streams.get_stream_dead_letter_stats")
+    def test_get_dead_letter_stats_hides_backend_errors(
+        self, get_stream_dead_letter_stats
+    ):
+        get_stream_dead_letter_stats.side_effect = Exception("secret details")
+        stream = self.factory.create_stream()
+        rv = self.make_request(
+            "get", "/api/streams/{}/dlq".format(stream.id),
+        )
+        self.assertEqual(502, rv.status_code)
+        self.assertNotIn("secret details", rv.json["message"])
+
+    @patch("dingolytics.tasks.replay_dead_letters.replay_dead_letters_task")
+    def test_replay_dead_letters(self, replay_dead_letters_task):
+        replay_dead_letters_task.return_value.id = "task-id"
+        stream = self.factory.create_stream()
+        admin = self.factory.create_admin()
+        rv = self.make_request(
+            "post", "/api/streams/{}/dlq/replay".format(stream.id),
+            data={"batch_size": 100, "rows_per_second": 500}, user=admin,
+        )
+        self.assertEqual(200, rv.status_code)
+        self.assertEqual("huey:task-id", rv.json["job"]["id"])
+        replay_dead_letters_task.assert_called_once_with(
+            stream.id, batch_size=100, rows_per_second=500
+        )
+
+        rv = self.make_request(
+            "post", "/api/streams/{}/dlq/replay".format(stream.id),
+            data={"max_rows": -1}, user=admin,
+        )
+        self.assertEqual(400, rv.status_code)
@@ -79,3 +79,40 @@ class TestDashboardsByUser(BaseTestCase):
         results = Dashboard.all(self.factory.org, usr.group_ids, usr.id)
 
         self.assertEqual(2, results.count(), "The incorrect number of dashboards were returned")
+
+
+class TestDashboardSearch(BaseTestCase):
+    def search(self, term):
+        return list(
+            Dashboard.search(
+                self.factory.org,
+                self.factory.user.group_ids,
+                self.factory.user.id,
+                term,
+            )
+        )
+
+    def test_finds_words_and_substrings(self):
+        d1 = self.factory.create_dashboard(name="Weekly revenue")
+        d2 = self.factory.create_dashboard(name="売上ダッシュボード")
+        d3 = self.factory.create_dashboard(name="Users")
+
+        self.assertEqual([d1], self.search("revenue weekly"))
+        self.assertEqual([d2], self.search("ダッシュ"))
+        self.assertEqual([d3], self.search("sers"))
+
+    def test_ranks_by_match(self):
+        d1 = self.factory.create_dashboard(name="Revenue by month, revenue by week")
+        d2 = self.factory.create_dashboard(name="Costs and revenue")
+        self.factory.create_dashboard(name="Costs")
+
+        self.assertEqual([d1, d2], self.search("revenue"))
+
+    def test_search_by_user(self):
+        d1 = self.factory.create_dashboard(name="Revenue")
+        self.factory.create_dashboard(
+            name="Revenue", user=self.factory.create_user()
+        )
+
+        dashboards = list(Dashboard.search_by_user("revenue", self.factory.user))
+        self.assertEqual([d1], dashboards)
@@ -1,7 +1,11 @@
+import time
+
 import mock
+from flask import g
 from mock import patch
 from tests import BaseTestCase
 
+from redash import models, redis_connection
 from redash.models import DataSource, Query, QueryResult
 from redash.utils.configuration import ConfigurationContainer
 
@@ -47,6 +51,113 @@ class DataSourceTest(BaseTestCase):
             self.assertEqual(new_return_value, schema)
             self.assertEqual(patched_get_schema.call_count, 2)
 
+    def test_get_schema_records_refresh(self):
+        with mock.patch(
+            "redash.query_runner.pg.PostgreSQL.get_schema"
+        ) as patched_get_schema:
+            patched_get_schema.return_value = []
+            self.factory.data_source.get_schema(refresh=True)
+
+        refresh = self.factory.data_source.get_schema_refresh()
+        self.assertIsNotNone(refresh["refreshed_at"])
+        self.assertGreaterEqual(refresh["staleness"], 0)
+        self.assertIsNone(refresh["error"])
+
+    def test_get_schema_records_failed_refresh(self):
+        with mock.patch(
+            "redash.query_runner.pg.PostgreSQL.get_schema"
+        ) as patched_get_schema:
+            patched_get_schema.side_effect = Exception("Connection refused")
+            with self.assertRaises(Exception):
+                self.factory.data_source.get_schema(refresh=True)
+
+        refresh = self.factory.data_source.get_schema_refresh()
+        self.assertIsNone(refresh["refreshed_at"])
+        self.assertIsNotNone(refresh["failed_at"])
+        self.assertEqual(refresh["error"], "Connection refused")
+
+    def test_get_schema_refreshes_changed_tables_only(self):
+        with mock.patch(
+            "redash.query_runner.pg.PostgreSQL.get_tables_metadata"
+        ) as metadata, mock.patch(
+            "redash.query_runner.pg.PostgreSQL.get_tables_schema"
+        ) as get_tables_schema:
+            metadata.return_value = {
+                "a": {"fingerprint": "1"},
+                "b": {"fingerprint": "1"},
+            }
+            get_tables_schema.return_value = [
+                {"name": "a", "columns": ["y", "x"]},
+                {"name": "b", "columns": ["z"]},
+            ]
+            self.factory.data_source.get_schema(refresh=True)
+            since = time.time()
+
+            metadata.return_value = {
+                "a": {"fingerprint": "2", "rows": 10},
+                "c": {"fingerprint": "1", "rows": 20},
+            }
+            get_tables_schema.return_value = [
+                {"name": "a", "columns": ["x"]},
+                {"name": "c", "columns": ["w"]},
+            ]
+            schema = self.factory.data_source.get_schema(refresh=True)
+
+        self.assertEqual(get_tables_schema.call_args.args[0], ["a", "c"])
+        self.assertEqual(
+            schema,
+            [
+                {"name": "a", "columns": ["x"], "rows": 10},
+                {"name": "c", "columns": ["w"], "rows": 20},
+            ],
+        )
+        changed, removed = self.factory.data_source.get_schema_changes(since)
+        self.assertEqual([t["name"] for t in changed], ["a", "c"])
+        self.assertEqual(removed, ["b"])
+
+    def test_logs_table_metadata_changes(self):
+        with mock.patch(
+            "redash.query_runner.pg.PostgreSQL.get_tables_metadata"
+        ) as metadata, mock.patch(
+            "redash.query_runner.pg.PostgreSQL.get_tables_schema"
+        ) as get_tables_schema:
+            metadata.return_value = {
+                "a": {"fingerprint": "1", "rows": 10},
+                "b": {"fingerprint": "1", "rows": 10},
+            }
+            get_tables_schema.return_value = [
+                {"name": "a", "columns": ["x"]},
+                {"name": "b", "columns": ["y"]},
+            ]
+            self.factory.data_source.get_schema(refresh=True)
+            since = time.time()
+
+            metadata.return_value = {
+                "a": {"fingerprint": "1", "rows": 20},
+                "b": {"fingerprint": "1", "rows": 10},
+            }
+            self.factory.data_source.get_schema(refresh=True)
+
+        changed, removed = self.factory.data_source.get_schema_changes(since)
+        self.assertEqual(changed, [{"name": "a", "columns": ["x"], "rows": 20}])
+        self.assertEqual(removed, [])
+
+    def test_trims_old_schema_changes(self):
+        data_source = self.factory.data_source
+        redis_connection.zadd(data_source._schema_changes_key, {"old": 1})
+        with mock.patch(
+            "redash.query_runner.pg.PostgreSQL.get_schema"
+        ) as get_schema:
+            get_schema.return_value = [{"name": "events", "columns": []}]
+            data_source.get_schema(refresh=True)
+
+        self.assertEqual(
+            redis_connection.zrange(data_source._schema_changes_key, 0, -1),
+            ["events"],
+        )
+        self.assertFalse(data_source.has_schema_changes_since(1))
+        self.assertTrue(data_source.has_schema_changes_since(time.time() - 60))
+
     def test_schema_sorter(self):
         input_data = [
             {"name": "zoo", "columns": ["is_zebra", "is_snake", "is_cow"]},
@@ -105,6 +216,67 @@ class TestDataSourceCreate(BaseTestCase):
         )
         self.assertIn(self.factory.org.default_group.id, data_source.groups)
 
+    def test_unsaved_data_source_has_no_groups(self):
+        data_source = DataSource(org=self.factory.org, name="test", type="pg")
+        models.db.session.add(data_source)
+        self.assertEqual({}, data_source.groups)
+        self.assertIsNone(data_source.id)
+
+
+class TestDataSourceGroups(BaseTestCase):
+    def test_caches_groups_per_request(self):
+        data_source = self.factory.data_source
+        with self.app.test_request_context():
+            data_source.groups
+            queries_count = g.get("queries_count", 0)
+            data_source.groups
+            self.assertEqual(g.get("queries_count", 0), queries_count)
+
+    def test_caches_groups_in_redis(self):
+        data_source = self.factory.data_source
+        groups = data_source.groups
+        with mock.patch.object(models.db.session, "query") as query:
+            self.assertEqual(data_source.groups, groups)
+            query.assert_not_called()
+
+    def test_invalidates_groups_on_changes(self):
+        data_source = self.factory.data_source
+        group = self.factory.create_group()
+        self.assertNotIn(group.id, data_source.groups)
+
+        data_source.add_group(group)
+        models.db.session.commit()
+        self.assertEqual(data_source.groups[group.id], False)
+
+        data_source.update_group_permission(group, True)
+        models.db.session.commit()
+        self.assertEqual(data_source.groups[group.id], True)
+
+        data_source.remove_group(group)
+        self.assertNotIn(group.id, data_source.groups)
+
+    def test_invalidates_groups_on_commit(self):
+        data_source = self.factory.data_source
+        group = self.factory.create_group()
+        groups_key = "data_source:{}:groups".format(data_source.id)
+        data_source.groups
+
+        data_source.add_group(group)
+        models.db.session.flush()
+        # Other transactions still see the committed groups
+        self.assertIsNotNone(redis_connection.get(groups_key))
+
+        models.db.session.commit()
+        self.assertIsNone(redis_connection.get(groups_key))
+        self.assertIn(group.id, data_source.groups)
+
+    def test_all_groups_for_query_ids(self):
+        query = self.factory.create_query()
+        self.assertEqual(
+            models.Query.all_groups_for_query_ids([query.id]),
+            list(self.factory.data_source.groups.items()),
+        )
+
 
 class TestDataSourceIsPaused(BaseTestCase):
     def test_returns_false_by_default(self):
@@ -131,6 +303,12 @@ class TestDataSourceIsPaused(BaseTestCase):
     def test_reason_is_none_by_default(self):
         self.assertEqual(self.factory.data_source.pause_reason, None)
 
+    def test_get_pause_reasons(self):
+        other = self.factory.create_data_source()
+        self.factory.data_source.pause("Reason")
+        reasons = DataSource.get_pause_reasons([self.factory.data_source, other])
+        self.assertEqual(reasons, {self.factory.data_source.id: "Reason"})
+
 
 class TestDataSourceDelete(BaseTestCase):
     def test_deletes_the_data_source(self):
@@ -7,8 +7,14 @@ from redash.models.parameterized_query import (
     ParameterizedQuery,
     InvalidParameterError,
     QueryDetachedFromDataSourceError,
+    _ValueSetCache,
+    _dropdown_value_sets,
+    compile_template,
+    dropdown_value_set,
     dropdown_values,
 )
+from redash.utils import json_dumps
+from tests import BaseTestCase
 
 
 class TestParameterizedQuery(TestCase):
@@ -163,8 +169,8 @@ class TestParameterizedQuery(TestCase):
         self.assertEqual("foo 'qux','baz'", query.text)
 
     @patch(
-        "redash.models.parameterized_query.dropdown_values",
-        return_value=[{"value": "1"}],
+        "redash.models.parameterized_query.dropdown_value_set",
+        return_value=frozenset(["1"]),
     )
     def test_validation_accepts_integer_values_for_dropdowns(self, _):
         schema = [{"name": "bar", "type": "query", "queryId": 1}]
@@ -174,7 +180,10 @@ class TestParameterizedQuery(TestCase):
 
         self.assertEqual("foo 1", query.text)
 
-    @patch("redash.models.parameterized_query.dropdown_values")
+    @patch(
+        "redash.models.parameterized_query.dropdown_value_set",
+        return_value=frozenset(),
+    )
     def test_raises_on_invalid_query_parameters(self, _):
         schema = [{"name": "bar", "type": "query", "queryId": 1}]
         query = ParameterizedQuery("foo", schema)
@@ -183,8 +192,8 @@ class TestParameterizedQuery(TestCase):
             query.apply({"bar": 7})
 
     @patch(
-        "redash.models.parameterized_query.dropdown_values",
-        return_value=[{"value": "baz"}],
+        "redash.models.parameterized_query.dropdown_value_set",
+        return_value=frozenset(["baz"]),
     )
     def test_raises_on_unlisted_query_value_parameters(self, _):
         schema = [{"name": "bar", "type": "query", "queryId": 1}]
@@ -194,8 +203,8 @@ class TestParameterizedQuery(TestCase):
             query.apply({"bar": "shlomo"})
 
     @patch(
-        "redash.models.parameterized_query.dropdown_values",
-        return_value=[{"value": "baz"}],
+        "redash.models.parameterized_query.dropdown_value_set",
+        return_value=frozenset(["baz"]),
     )
     def test_validates_query_parameters(self, _):
         schema = [{"name": "bar", "type": "query", "queryId": 1}]
@@ -247,6 +256,24 @@ class TestParameterizedQuery(TestCase):
 
         self.assertTrue(query.is_safe)
 
+    def test_reuses_compiled_template(self):
+        template = "SELECT {{param}} FROM {{table}}"
+        self.assertIs(compile_template(template), compile_template(template))
+        self.assertEqual(("param", "table"), compile_template(template).parameters)
+
+    @patch("redash.models.parameterized_query.mustache_render")
+    def test_skips_rendering_for_regular_query(self, mustache_render):
+        query = ParameterizedQuery("SELECT 1").apply({})
+        self.assertEqual("SELECT 1", query.text)
+        mustache_render.assert_not_called()
+
+    def test_renders_compiled_template(self):
+        query = ParameterizedQuery("SELECT {{param}} FROM {{table}}")
+        query.apply({"param": "a", "table": "b"})
+        self.assertEqual("SELECT a FROM b", query.text)
+        query.apply({"param": "c", "table": "d"})
+        self.assertEqual("SELECT c FROM d", query.text)
+
     @patch(
         "redash.models.parameterized_query._load_result",
         return_value={
@@ -287,3 +314,46 @@ class TestParameterizedQuery(TestCase):
     def test_dropdown_values_raises_when_query_is_detached_from_data_source(self, _):
         with pytest.raises(QueryDetachedFromDataSourceError):
             dropdown_values(1, None)
+
+
+class TestDropdownValueSet(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        _dropdown_value_sets.clear()
+
+    def _create_result(self, ids):
+        data = {"columns": [{"name": "id"}], "rows": [{"id": i} for i in ids]}
+        return self.factory.create_query_result(data=json_dumps(data))
+
+    def test_caches_values_per_query_result(self):
+        query = self.factory.create_query(latest_query_data=self._create_result([1, 2]))
+        values = dropdown_value_set(query.id, query.org)
+        self.assertEqual(frozenset(["1", "2"]), values)
+
+        with patch("redash.models.parameterized_query._load_result") as load_result:
+            self.assertIs(values, dropdown_value_set(query.id, query.org))
+            _dropdown_value_sets.clear()
+            self.assertEqual(values, dropdown_value_set(query.id, query.org))
+            load_result.assert_not_called()
+
+    def test_invalidates_values_on_new_query_result(self):
+        query = self.factory.create_query(latest_query_data=self._create_result([1, 2]))
+        dropdown_value_set(query.id, query.org)
+
+        query.latest_query_data = self._create_result([3])
+        self.db.session.commit()
+
+        self.assertEqual(frozenset(["3"]), dropdown_value_set(query.id, query.org))
+
+
+class TestValueSetCache(TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = _ValueSetCache(2)
+        cache.set(1, "a")
+        cache.set(2, "b")
+        cache.get(1)
+        cache.set(3, "c")
+        self.assertEqual(2, len(cache))
+        self.assertEqual("a", cache.get(1))
+        self.assertIsNone(cache.get(2))
+        self.assertEqual("c", cache.get(3))
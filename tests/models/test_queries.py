@@ -1,4 +1,3 @@
-from unittest import skip
 from tests import BaseTestCase
 import datetime
 from redash.models import Query, QueryResult, Group, Event, db
@@ -30,7 +29,6 @@ class QueryTest(BaseTestCase):
             [("tag1", 3), ("tag2", 2), ("tag3", 1)],
         )
 
-    @skip("Search is disabled for now.")
     def test_search_finds_in_name(self):
         q1 = self.factory.create_query(name="Testing seåřċħ")
         q2 = self.factory.create_query(name="Testing seåřċħing")
@@ -41,7 +39,6 @@ class QueryTest(BaseTestCase):
         self.assertIn(q2, queries)
         self.assertNotIn(q3, queries)
 
-    @skip("Search is disabled for now.")
     def test_search_finds_in_description(self):
         q1 = self.factory.create_query(description="Testing seåřċħ")
         q2 = self.factory.create_query(description="Testing seåřċħing")
@@ -66,7 +63,6 @@ class QueryTest(BaseTestCase):
         self.assertIn(q2, queries)
         self.assertNotIn(q3, queries)
 
-    @skip("Search is disabled for now.")
     def test_search_by_id_returns_query(self):
         q1 = self.factory.create_query(description="Testing search")
         q2 = self.factory.create_query(description="Testing searching")
@@ -78,7 +74,6 @@ class QueryTest(BaseTestCase):
         self.assertNotIn(q1, queries)
         self.assertNotIn(q2, queries)
 
-    @skip("Search is disabled for now.")
     def test_search_by_number(self):
         q = self.factory.create_query(description="Testing search 12345")
         db.session.flush()
@@ -86,7 +81,6 @@ class QueryTest(BaseTestCase):
 
         self.assertIn(q, queries)
 
-    @skip("Search is disabled for now.")
     def test_search_respects_groups(self):
         other_group = Group(org=self.factory.org, name="Other Group")
         db.session.add(other_group)
@@ -114,7 +108,6 @@ class QueryTest(BaseTestCase):
         self.assertNotIn(q2, queries)
         self.assertNotIn(q3, queries)
 
-    @skip("Search is disabled for now.")
     def test_returns_each_query_only_once(self):
         other_group = self.factory.create_group()
         second_group = self.factory.create_group()
@@ -141,13 +134,11 @@ class QueryTest(BaseTestCase):
         db.session.flush()
         self.assertNotEqual(q.updated_at, one_day_ago)
 
-    @skip("Search is disabled for now.")
     def test_search_is_case_insensitive(self):
         q = self.factory.create_query(name="Testing search")
 
         self.assertIn(q, Query.search("testing", [self.factory.default_group.id]))
 
-    @skip("Search is disabled for now.")
     def test_search_query_parser_or(self):
         q1 = self.factory.create_query(name="Testing")
         q2 = self.factory.create_query(name="search")
@@ -158,7 +149,6 @@ class QueryTest(BaseTestCase):
         self.assertIn(q1, queries)
         self.assertIn(q2, queries)
 
-    @skip("Search is disabled for now.")
     def test_search_query_parser_negation(self):
         q1 = self.factory.create_query(name="Testing")
         q2 = self.factory.create_query(name="search")
@@ -167,7 +157,6 @@ class QueryTest(BaseTestCase):
         self.assertIn(q1, queries)
         self.assertNotIn(q2, queries)
 
-    @skip("FIX: emails are not parsed for search queries")
     def test_search_query_parser_parenthesis(self):
         q1 = self.factory.create_query(name="Testing search")
         q2 = self.factory.create_query(name="Testing searching")
@@ -180,7 +169,6 @@ class QueryTest(BaseTestCase):
         self.assertIn(q2, queries)
         self.assertIn(q3, queries)
 
-    @skip("Search is disabled for now.")
     def test_search_query_parser_hyphen(self):
         q1 = self.factory.create_query(name="Testing search")
         q2 = self.factory.create_query(name="Testing-search")
@@ -189,7 +177,6 @@ class QueryTest(BaseTestCase):
         self.assertIn(q1, queries)
         self.assertIn(q2, queries)
 
-    @skip("FIX: emails are not parsed for search queries")
     def test_search_query_parser_emails(self):
         q1 = self.factory.create_query(name="janedoe@example.com")
         q2 = self.factory.create_query(name="johndoe@example.com")
@@ -206,6 +193,43 @@ class QueryTest(BaseTestCase):
         self.assertNotIn(q1, queries)
         self.assertIn(q2, queries)
 
+    def test_search_ranks_name_matches_first(self):
+        q1 = self.factory.create_query(query_text="SELECT * FROM revenue")
+        q2 = self.factory.create_query(description="Monthly revenue")
+        q3 = self.factory.create_query(name="Revenue")
+        db.session.flush()
+
+        queries = list(Query.search("revenue", [self.factory.default_group.id]))
+        self.assertEqual([q3, q2, q1], queries)
+
+    def test_search_without_multi_byte_search_matches_words(self):
+        q1 = self.factory.create_query(name="日本語の名前テスト")
+        q2 = self.factory.create_query(name="Testing search")
+
+        queries = list(
+            Query.search(
+                "テスト", [self.factory.default_group.id], multi_byte_search=False
+            )
+        )
+        self.assertNotIn(q1, queries)
+
+        queries = list(
+            Query.search(
+                "sear", [self.factory.default_group.id], multi_byte_search=False
+            )
+        )
+        self.assertIn(q2, queries)
+
+    def test_search_by_user(self):
+        q1 = self.factory.create_query(name="Testing search")
+        q2 = self.factory.create_query(
+            name="Testing search", user=self.factory.create_user()
+        )
+
+        queries = list(Query.search_by_user("testing", self.factory.user))
+        self.assertIn(q1, queries)
+        self.assertNotIn(q2, queries)
+
     def test_past_scheduled_queries(self):
         query = self.factory.create_query()
         one_day_ago = (utcnow() - datetime.timedelta(days=1)).strftime("%Y-%m-%d")
@@ -292,6 +316,27 @@ class QueryRecentTest(BaseTestCase):
         self.assertNotIn(q1, recent)
         self.assertNotIn(q2, recent)
 
+    def test_recent_from_activity_feed(self):
+        q1 = self.factory.create_query()
+        q2 = self.factory.create_query()
+        q3 = self.factory.create_query(is_archived=True)
+        db.session.flush()
+        recent = mock.Mock()
+        recent.get.return_value = [str(q3.id), str(q2.id), str(q1.id)]
+        with mock.patch(
+            "dingolytics.auditlog.get_recent_activity", return_value=recent
+        ):
+            queries = Query.recent(
+                [self.factory.default_group.id],
+                user_id=self.factory.user.id,
+                org_id=self.factory.org.id,
+            ).all()
+
+        self.assertEqual(queries, [q2, q1])
+        recent.get.assert_called_once_with(
+            self.factory.org.id, "query", user_id=self.factory.user.id, limit=100
+        )
+
     def test_respects_groups(self):
         q1 = self.factory.create_query()
         ds = self.factory.create_data_source(group=self.factory.create_group())
@@ -0,0 +1,44 @@
+from unittest import TestCase
+
+from redash.models.search import parse_search_query, substring_pattern
+
+
+class TestParseSearchQuery(TestCase):
+    def test_words_match_as_prefixes(self):
+        self.assertEqual("'testing':* & 'search':*", parse_search_query("testing search"))
+
+    def test_or(self):
+        self.assertEqual(
+            "'testing':* | 'search':* & 'query':*",
+            parse_search_query("testing OR search query"),
+        )
+
+    def test_negation(self):
+        self.assertEqual("'testing':* & !'search':*", parse_search_query("testing -search"))
+        self.assertEqual("!('a':* | 'b':*)", parse_search_query("-(a or b)"))
+
+    def test_phrase(self):
+        self.assertEqual("'testing search' & 'x':*", parse_search_query('"testing search" x'))
+
+    def test_parentheses(self):
+        self.assertEqual(
+            "('testing':* & 'search':*) | 'finding':*",
+            parse_search_query("(testing search) or finding"),
+        )
+        self.assertEqual("'a':* & ('b':*)", parse_search_query("a (b"))
+        self.assertEqual("'a':* & 'b':*", parse_search_query("a ) b"))
+
+    def test_quotes_operators(self):
+        self.assertEqual(
+            "'it''s':* & 'a&b|!c:*':* & '\\\\':*",
+            parse_search_query("it's a&b|!c:* \\"),
+        )
+
+    def test_nothing_to_search(self):
+        for term in ("", "  ", "or", "-", "()", '""', "or or"):
+            self.assertEqual("", parse_search_query(term))
+
+
+class TestSubstringPattern(TestCase):
+    def test_escapes_wildcards(self):
+        self.assertEqual("%100\\%\\_a\\\\%", substring_pattern("100%_a\\"))
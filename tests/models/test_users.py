@@ -1,3 +1,5 @@
+import mock
+
 from tests import BaseTestCase, authenticated_user
 
 from redash import redis_connection
@@ -109,8 +111,37 @@ class TestUserDetail(BaseTestCase):
             timestamp = dt_from_timestamp(
                 redis_connection.hget(LAST_ACTIVE_KEY, user.id)
             )
-            sync_last_active_at()
+            self.assertEqual(1, sync_last_active_at())
 
+            db.session.expire_all()
             user_reloaded = User.query.filter(User.id == user.id).first()
             self.assertIn("active_at", user_reloaded.details)
-            self.assertEqual(user_reloaded.active_at, timestamp)
+            self.assertEqual(
+                user_reloaded,
+                User.query.filter(User.active_at == timestamp).first(),
+            )
+            self.assertFalse(redis_connection.exists(LAST_ACTIVE_KEY))
+
+    def test_throttles_updates(self):
+        with authenticated_user(self.client) as user:
+            self.client.get("/default/")
+            redis_connection.delete(LAST_ACTIVE_KEY)
+            self.client.get("/default/")
+            self.assertIsNone(redis_connection.hget(LAST_ACTIVE_KEY, user.id))
+
+    def test_sync_keeps_newer_updates(self):
+        user = self.factory.create_user()
+        redis_connection.hset(LAST_ACTIVE_KEY, user.id, 1700000000)
+        get_script = redis_connection.register_script
+
+        def register_script(script):
+            # The user is active again while the sync is running
+            redis_connection.hset(LAST_ACTIVE_KEY, user.id, 1700000060)
+            return get_script(script)
+
+        with mock.patch.object(redis_connection, "register_script", register_script):
+            sync_last_active_at()
+
+        self.assertEqual(
+            "1700000060", redis_connection.hget(LAST_ACTIVE_KEY, user.id)
+        )
@@ -1,10 +1,13 @@
 import json
 import time
 from unittest import TestCase, skip
-# from unittest.mock import Mock, patch
+from unittest.mock import patch
+# from unittest.mock import Mock
 
 from redash.query_runner import TYPE_INTEGER
 from redash.query_runner.clickhouse import ClickHouse, split_multi_query
+from dingolytics.presets import default_presets
+from dingolytics.queries.rollups import RollupTable
 
 split_multi_query_samples = [
     # Regular query
@@ -112,3 +115,93 @@ SELECT * FROM test;
                 ],
             },
         )
+
+    @patch.object(ClickHouse, "_clickhouse_query")
+    def test_route_to_rollup(self, clickhouse_query):
+        clickhouse_query.return_value = {"columns": [], "rows": []}
+        spec = default_presets().get_rollup_spec(
+            "clickhouse", "app_events", "per_minute"
+        )
+        rollups = {"events": [RollupTable(
+            table="events_per_minute", source_table="events", spec=spec,
+        )]}
+        query_runner = ClickHouse({
+            "url": "http://clickhouse-tests:8123",
+            "dbname": "default",
+            "route_to_rollups": True,
+        })
+        with patch.object(ClickHouse, "_get_rollups", return_value=rollups):
+            query_runner.run_query("SELECT count() FROM events", None)
+            query_runner.run_query(
+                "SELECT count() FROM events -- no_rollup", None
+            )
+        self.assertEqual(
+            [call.args[0] for call in clickhouse_query.call_args_list],
+            [
+                "SELECT sum(events) AS `count()`\nFROM events_per_minute",
+                "SELECT count() FROM events",
+            ],
+        )
+
+    @patch.object(ClickHouse, "run_query")
+    @patch.object(ClickHouse, "_clickhouse_query")
+    def test_incremental_schema(self, clickhouse_query, run_query):
+        clickhouse_query.return_value = {"columns": [], "rows": [
+            {
+                "table_name": "default.events",
+                "fingerprint": "1700000000:42",
+                "engine": "MergeTree",
+                "sorting_key": "timestamp",
+                "partition_key": "",
+                "primary_key": "timestamp",
+                "rows": 100,
+                "bytes": 2048,
+                "parts": 2,
+            },
+            {
+                "table_name": "default.events_view",
+                "fingerprint": "1700000000:43",
+                "engine": "View",
+                "sorting_key": "",
+                "partition_key": "",
+                "primary_key": "",
+                "rows": 0,
+                "bytes": 0,
+                "parts": 0,
+            },
+        ]}
+        run_query.return_value = (json.dumps({"columns": [], "rows": [
+            {"database": "default", "table": "events", "name": "id",
+             "type": "UInt64"},
+            {"database": "default", "table": "events", "name": "timestamp",
+             "type": "DateTime"},
+        ]}), None)
+        query_runner = ClickHouse({"url": "http://clickhouse-tests:8123"})
+
+        self.assertEqual(query_runner.get_tables_metadata(), {
+            "default.events": {
+                "fingerprint": "1700000000:42",
+                "engine": "MergeTree",
+                "sorting_key": "timestamp",
+                "primary_key": "timestamp",
+                "rows": 100,
+                "bytes": 2048,
+                "parts": 2,
+            },
+            "default.events_view": {
+                "fingerprint": "1700000000:43",
+                "engine": "View",
+            },
+        })
+        self.assertEqual(
+            query_runner.get_tables_schema(["default.events", "default.it's"]),
+            [{
+                "name": "default.events",
+                "columns": ["id", "timestamp"],
+                "column_types": {"id": "UInt64", "timestamp": "DateTime"},
+            }],
+        )
+        self.assertIn(
+            "IN ('default.events', 'default.it\\'s')",
+            run_query.call_args.args[0],
+        )
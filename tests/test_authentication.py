@@ -11,6 +11,7 @@ from redash.authentication import (
     hmac_load_user_from_request,
     sign,
 )
+from redash.authentication.api_key_cache import api_key_cache
 from redash.authentication.google_oauth import create_and_login_user, verify_profile
 from sqlalchemy.orm.exc import NoResultFound
 from tests import BaseTestCase
@@ -88,6 +89,88 @@ class TestApiKeyAuthentication(BaseTestCase):
             self.assertEqual(404, rv.status_code)
 
 
+class TestApiKeyAuthenticationCache(BaseTestCase):
+    def setUp(self):
+        super(TestApiKeyAuthenticationCache, self).setUp()
+        self.query = self.factory.create_query(api_key="10")
+        self.user = self.factory.create_user(api_key="user_key")
+        models.db.session.flush()
+        self.query_url = "/{}/api/queries/{}".format(
+            self.factory.org.slug, self.query.id
+        )
+
+    def load_user(self, api_key):
+        with self.app.test_client() as c:
+            c.get(self.query_url, query_string={"api_key": api_key})
+            return api_key_load_user_from_request(request)
+
+    def test_caches_principals(self):
+        for api_key in ["10", "user_key", "whatever"]:
+            expected = self.load_user(api_key)
+            with patch("redash.authentication._resolve_api_key") as resolve:
+                user = self.load_user(api_key)
+            resolve.assert_not_called()
+            self.assertEqual(getattr(expected, "id", None), getattr(user, "id", None))
+
+    def test_query_principal_groups(self):
+        user = self.load_user("10")
+        cached = self.load_user("10")
+        self.assertEqual(user.group_ids, cached.group_ids)
+        self.assertEqual(user.name, cached.name)
+
+    def test_regenerated_user_api_key(self):
+        self.assertEqual(self.user.id, self.load_user("user_key").id)
+        self.user.regenerate_api_key()
+        models.db.session.flush()
+        self.assertIsNone(self.load_user("user_key"))
+        self.assertEqual(self.user.id, self.load_user(self.user.api_key).id)
+
+    def test_disabled_user(self):
+        self.assertEqual(self.user.id, self.load_user("user_key").id)
+        self.user.disable()
+        models.db.session.flush()
+        self.assertIsNone(self.load_user("user_key"))
+
+    def test_stale_principal_of_another_process(self):
+        self.assertEqual(self.user.id, self.load_user("user_key").id)
+        with patch.object(api_key_cache, "invalidate"):
+            self.user.regenerate_api_key()
+            models.db.session.flush()
+        self.assertIsNone(self.load_user("user_key"))
+
+    def test_deactivated_api_key(self):
+        dashboard = self.factory.create_dashboard()
+        api_key = self.factory.create_api_key(object=dashboard)
+        models.db.session.flush()
+        self.assertIsNotNone(self.load_user(api_key.api_key))
+        api_key.active = False
+        models.db.session.flush()
+        self.assertIsNone(self.load_user(api_key.api_key))
+
+    def test_regenerated_query_api_key(self):
+        self.assertIsNotNone(self.load_user("10"))
+        self.query.regenerate_api_key()
+        models.db.session.flush()
+        self.assertIsNone(self.load_user("10"))
+
+    def test_stale_query_principal(self):
+        self.assertIsNotNone(self.load_user("10"))
+        with patch.object(api_key_cache, "invalidate"):
+            self.query.regenerate_api_key()
+            models.db.session.commit()
+        self.assertIsNone(self.load_user("10"))
+
+    def test_invalidates_principals_on_commit(self):
+        self.assertEqual(self.user.id, self.load_user("user_key").id)
+        with patch.object(api_key_cache, "invalidate") as invalidate:
+            self.user.regenerate_api_key()
+            models.db.session.flush()
+            invalidate.assert_not_called()
+            models.db.session.commit()
+            invalidate.assert_called_once()
+            self.assertIn("user_key", invalidate.call_args.args)
+
+
 class TestHMACAuthentication(BaseTestCase):
     #
     # This is a bad way to write these tests, but the way Flask works doesn't make it easy to write them properly...
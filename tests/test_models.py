@@ -1,5 +1,6 @@
 import calendar
 import datetime
+import time
 from unittest import TestCase
 from dateutil.parser import parse as date_parse
 
@@ -548,6 +549,56 @@ class TestEvents(BaseTestCase):
 
         self.assertDictEqual(event.additional_properties, additional_properties)
 
+    def test_usage(self):
+        raw_event, user, _ = self.raw_event()
+        raw_event["timestamp"] = time.time()
+        models.Event.record_many(
+            [raw_event, raw_event, dict(raw_event, action="list")]
+        )
+        db.session.flush()
+
+        usage = models.Event.get_usage(self.factory.org.id)
+        self.assertEqual(
+            [(u["action"], u["events"], u["users"]) for u in usage],
+            [("list", 1, 1), ("view", 2, 1)],
+        )
+
+    def test_daily_counts(self):
+        raw_event, user, _ = self.raw_event()
+        raw_event.update(timestamp=time.time(), object_type="query", action="execute")
+        models.Event.record_many(
+            [raw_event, raw_event, dict(raw_event, action="view")]
+        )
+        db.session.flush()
+
+        counts = models.Event.get_daily_counts({"query": ["execute"]})
+        (key, count), = counts.items()
+        self.assertEqual(key[:4], (self.factory.org.id, user.id, "query", "1"))
+        self.assertEqual(count, 2)
+
+    def test_delete_older_than(self):
+        raw_event, _, _ = self.raw_event()
+        models.Event.record_many([raw_event, dict(raw_event, timestamp=time.time())])
+        db.session.flush()
+
+        self.assertEqual(models.Event.delete_older_than(30, batch_size=10), 1)
+        self.assertEqual(models.Event.query.count(), 1)
+
+    def test_records_many_events(self):
+        raw_event, user, created_at = self.raw_event()
+        raw_event["ip"] = "127.0.0.1"
+
+        rows = models.Event.record_many([raw_event, dict(raw_event, action="list")])
+        db.session.flush()
+        events = models.Event.query.order_by(models.Event.id).all()
+        self.assertEqual(len(rows), 2)
+        self.assertEqual([e.action for e in events], ["view", "list"])
+        self.assertEqual(events[0].user, user)
+        self.assertEqual(events[0].created_at, created_at)
+        self.assertEqual(events[0].additional_properties, {"ip": "127.0.0.1"})
+        # Raw events are left as they were
+        self.assertIn("action", raw_event)
+
 
 def _set_up_dashboard_test(d):
     d.g1 = d.factory.create_group(name="First", permissions=["create", "view"])
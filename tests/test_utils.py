@@ -1,6 +1,9 @@
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from unittest import TestCase
 
+import pystache
+
 from redash.app import create_app
 from redash.utils import (
     build_url,
@@ -8,6 +11,7 @@ from redash.utils import (
     filter_none,
     json_dumps,
     generate_token,
+    mustache_render,
     render_template,
 )
 
@@ -92,3 +96,18 @@ class TestRenderTemplate(TestCase):
             ]
             self.assertIn('Failure Unit Test',html)
             self.assertIn('Failure Unit Test',text)
+
+
+class TestMustacheRender(TestCase):
+    def test_renders_parsed_template_concurrently(self):
+        template = pystache.parse("SELECT {{a}}{{#b}}, {{b}}{{/b}}")
+
+        def render(i):
+            return mustache_render(template, {"a": i, "b": i})
+
+        with ThreadPoolExecutor(8) as executor:
+            rendered = list(executor.map(render, range(1, 500)))
+
+        self.assertEqual(
+            ["SELECT {0}, {0}".format(i) for i in range(1, 500)], rendered
+        )